@@ -1,8 +1,11 @@
+import time
+from functools import partial
 from fastapi import APIRouter, Depends, HTTPException
-from typing import List, Dict, Any
+from fastapi.responses import JSONResponse, StreamingResponse
+from typing import Any, Awaitable, Callable, Dict, List, Optional
 from models.ai_request import (
-    AIAnalyzeRequest, AIUpdateRequest, AIRewriteRequest, AIAppendRequest, AIDependenciesRequest,
-    MultiAIAnalyzeRequest, MultiAIUpdateRequest, MultiAIRewriteRequest, MultiAIAppendRequest, MultiAIDependenciesRequest
+    AIBaseRequest, AIAnalyzeRequest, AIUpdateRequest, AIProcessRequest, AIRewriteRequest, AIAppendRequest, AIDependenciesRequest,
+    MultiAIFileRequest, MultiAIAnalyzeRequest, MultiAIUpdateRequest, MultiAIRewriteRequest, MultiAIAppendRequest, MultiAIDependenciesRequest
 )
 from services.ai_service import (
     ai_analyze, ai_reply, ai_rewrite, ai_append, ai_analyze_dependencies,
@@ -10,14 +13,67 @@ from services.ai_service import (
 )
 from utils.version_control import version_control
 from utils.file_utils import get_file_path
+from services.resilience import llm_deadline
+from services.telemetry import llm_project
+from services.task_executor import register_batch, cancel_batch, summarize_results
+from services.jobs import get_job_manager
+from services.job_store import FINISHED_STATUSES
+from utils.streaming import format_ndjson, NDJSON_MEDIA_TYPE, SSE_HEADERS
 
 router = APIRouter()
 
+def _executor_options(request: MultiAIFileRequest, cancel_event) -> Dict[str, Any]:
+    return {
+        "max_concurrency": request.max_concurrency,
+        "file_timeout": request.file_timeout_seconds,
+        "cancel_event": cancel_event,
+        "fail_fast": request.fail_fast,
+    }
+
+def _with_request_path(record: Dict[str, Any], request: MultiAIFileRequest) -> Dict[str, Any]:
+    # 結果にはサーバー上の絶対パスではなくリクエストで指定されたパスを載せる
+    return {**record, "file_path": request.file_paths[record["index"]]}
+
+def _with_request_paths(records: List[Dict[str, Any]], request: MultiAIFileRequest) -> List[Dict[str, Any]]:
+    return [_with_request_path(record, request) for record in records]
+
+def _ndjson_response(request: MultiAIFileRequest, run: Callable[..., Awaitable[Any]]) -> StreamingResponse:
+    """
+    ファイルごとの結果を完了した順に1行ずつ返し、最後に集計を返すNDJSONレスポンス
+
+    各行は {"type": "file", ...} で、最終行は {"type": "summary", ...}（途中で失敗した場合は {"type": "error", "detail": ...}）です。
+    """
+    async def records():
+        summary = {**summarize_results([]), "total": len(request.file_paths)}
+        started_at = time.monotonic()
+        try:
+            with register_batch(request.batch_id) as cancel_event:
+                # 締め切りとプロジェクトは処理の開始時に各ファイルのタスクへ引き継がれる
+                with llm_deadline(request.deadline_seconds), llm_project(request.project_id):
+                    results = await run(stream=True, **_executor_options(request, cancel_event))
+                try:
+                    async for record in results:
+                        summary[record["status"]] += 1
+                        yield format_ndjson({"type": "file", **_with_request_path(record, request)})
+                finally:
+                    await results.aclose()
+            yield format_ndjson({"type": "summary", **summary, "elapsed": round(time.monotonic() - started_at, 4)})
+        except Exception as e:
+            yield format_ndjson({"type": "error", "detail": str(e)})
+
+    return StreamingResponse(records(), media_type=NDJSON_MEDIA_TYPE, headers=SSE_HEADERS)
+
+def _submit_job(kind: str, request: AIBaseRequest, total: int) -> JSONResponse:
+    # 処理をジョブとして登録し、完了を待たずにジョブIDを返す
+    job = get_job_manager().submit(kind, request.model_dump(), total=total)
+    return JSONResponse(status_code=202, content={"message": "ジョブを受け付けました", "job_id": job["id"], "status": job["status"]})
+
 @router.post("/ai-analyze", response_model=Dict[str, Any])
 async def analyze_file(request: AIAnalyzeRequest):
     try:
         file_path = get_file_path(request.project_id, request.file_path, "")
-        result = await ai_analyze(file_path, request.version_control, request.analysis_depth)
+        with llm_deadline(request.deadline_seconds), llm_project(request.project_id):
+            result = await ai_analyze(file_path, request.version_control, request.analysis_depth, use_cache=request.use_cache)
         return {"message": "ファイルが正常に分析されました", "result": result}
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
@@ -26,8 +82,14 @@ async def analyze_file(request: AIAnalyzeRequest):
 async def multi_analyze_files(request: MultiAIAnalyzeRequest):
     try:
         file_paths = [get_file_path(request.project_id, file_path, "") for file_path in request.file_paths]
-        result = await multi_ai_analyze(file_paths, request.version_control, request.analysis_depth, request.execution_mode)
-        return {"message": "ファイルが正常に分析されました", "result": result}
+        if request.background:
+            return _submit_job("multi_ai_analyze", request, total=len(file_paths))
+        run = partial(multi_ai_analyze, file_paths, request.version_control, request.analysis_depth, request.execution_mode, use_cache=request.use_cache)
+        if request.stream:
+            return _ndjson_response(request, run)
+        with llm_deadline(request.deadline_seconds), llm_project(request.project_id), register_batch(request.batch_id) as cancel_event:
+            result = await run(**_executor_options(request, cancel_event))
+        return {"message": "ファイルが正常に分析されました", "result": _with_request_paths(result, request), "summary": summarize_results(result)}
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
@@ -35,7 +97,8 @@ async def multi_analyze_files(request: MultiAIAnalyzeRequest):
 async def update_file(request: AIUpdateRequest):
     try:
         file_path = get_file_path(request.project_id, request.file_path, "")
-        result = await ai_reply(file_path, request.version_control, request.change_type, request.feature_request)
+        with llm_deadline(request.deadline_seconds), llm_project(request.project_id):
+            result = await ai_reply(file_path, request.version_control, request.change_type, request.feature_request, use_cache=request.use_cache)
         return {"message": "ファイルが正常に更新されました", "result": result}
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
@@ -44,16 +107,25 @@ async def update_file(request: AIUpdateRequest):
 async def multi_update_files(request: MultiAIUpdateRequest):
     try:
         file_paths = [get_file_path(request.project_id, file_path, "") for file_path in request.file_paths]
-        result = await multi_ai_reply(file_paths, request.version_control, request.change_type, request.execution_mode, request.feature_request)
-        return {"message": "複数のファイルが正常に更新されました", "result": result}
+        if request.background:
+            return _submit_job("multi_ai_reply", request, total=len(file_paths))
+        run = partial(multi_ai_reply, file_paths, request.version_control, request.change_type, request.execution_mode, request.feature_request, use_cache=request.use_cache)
+        if request.stream:
+            return _ndjson_response(request, run)
+        with llm_deadline(request.deadline_seconds), llm_project(request.project_id), register_batch(request.batch_id) as cancel_event:
+            result = await run(**_executor_options(request, cancel_event))
+        return {"message": "複数のファイルが正常に更新されました", "result": _with_request_paths(result, request), "summary": summarize_results(result)}
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 @router.post("/ai-process", response_model=Dict[str, Any])
-async def update_file(request: AIUpdateRequest):
+async def update_file(request: AIProcessRequest):
     try:
         file_path = get_file_path(request.project_id, request.file_path, "")
-        result = await ai_process(file_path, request.version_control, request.change_type, request.feature_request)
+        if request.background:
+            return _submit_job("ai_process", request, total=1)
+        with llm_deadline(request.deadline_seconds), llm_project(request.project_id):
+            result = await ai_process(file_path, request.version_control, request.change_type, request.feature_request, use_cache=request.use_cache, edit_mode=request.edit_mode)
         return {"message": "ファイルが正常に更新されました", "result": result}
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
@@ -62,8 +134,14 @@ async def update_file(request: AIUpdateRequest):
 async def multi_update_files(request: MultiAIUpdateRequest):
     try:
         file_paths = [get_file_path(request.project_id, file_path, "") for file_path in request.file_paths]
-        result = await multi_ai_process(file_paths, request.version_control, request.change_type, request.execution_mode, request.feature_request)
-        return {"message": "複数のファイルが正常に更新されました", "result": result}
+        if request.background:
+            return _submit_job("multi_ai_process", request, total=len(file_paths))
+        run = partial(multi_ai_process, file_paths, request.version_control, request.change_type, request.execution_mode, request.feature_request, use_cache=request.use_cache, edit_mode=request.edit_mode)
+        if request.stream:
+            return _ndjson_response(request, run)
+        with llm_deadline(request.deadline_seconds), llm_project(request.project_id), register_batch(request.batch_id) as cancel_event:
+            result = await run(**_executor_options(request, cancel_event))
+        return {"message": "複数のファイルが正常に更新されました", "result": _with_request_paths(result, request), "summary": summarize_results(result)}
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
@@ -71,7 +149,8 @@ async def multi_update_files(request: MultiAIUpdateRequest):
 async def rewrite_file(request: AIRewriteRequest):
     try:
         file_path = get_file_path(request.project_id, request.file_path, "")
-        result = await ai_rewrite(file_path, request.version_control, request.rewrite_style)
+        with llm_deadline(request.deadline_seconds), llm_project(request.project_id):
+            result = await ai_rewrite(file_path, request.version_control, request.rewrite_style, use_cache=request.use_cache)
         return {"message": "ファイルが正常に書き直されました", "result": result}
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
@@ -80,8 +159,14 @@ async def rewrite_file(request: AIRewriteRequest):
 async def multi_rewrite_files(request: MultiAIRewriteRequest):
     try:
         file_paths = [get_file_path(request.project_id, file_path, "") for file_path in request.file_paths]
-        result = await multi_ai_rewrite(file_paths, request.version_control, request.rewrite_style, request.execution_mode)
-        return {"message": "複数のファイルが正常に書き直されました", "result": result}
+        if request.background:
+            return _submit_job("multi_ai_rewrite", request, total=len(file_paths))
+        run = partial(multi_ai_rewrite, file_paths, request.version_control, request.rewrite_style, request.execution_mode, use_cache=request.use_cache)
+        if request.stream:
+            return _ndjson_response(request, run)
+        with llm_deadline(request.deadline_seconds), llm_project(request.project_id), register_batch(request.batch_id) as cancel_event:
+            result = await run(**_executor_options(request, cancel_event))
+        return {"message": "複数のファイルが正常に書き直されました", "result": _with_request_paths(result, request), "summary": summarize_results(result)}
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
@@ -89,7 +174,8 @@ async def multi_rewrite_files(request: MultiAIRewriteRequest):
 async def append_to_file(request: AIAppendRequest):
     try:
         file_path = get_file_path(request.project_id, request.file_path, "")
-        result = await ai_append(file_path, request.version_control, request.append_location)
+        with llm_deadline(request.deadline_seconds), llm_project(request.project_id):
+            result = await ai_append(file_path, request.version_control, request.append_location, use_cache=request.use_cache)
         return {"message": "コンテンツが正常に追加されました", "result": result}
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
@@ -98,8 +184,14 @@ async def append_to_file(request: AIAppendRequest):
 async def multi_append_to_files(request: MultiAIAppendRequest):
     try:
         file_paths = [get_file_path(request.project_id, file_path, "") for file_path in request.file_paths]
-        result = await multi_ai_append(file_paths, request.version_control, request.append_location, request.execution_mode)
-        return {"message": "複数のファイルにコンテンツが正常に追加されました", "result": result}
+        if request.background:
+            return _submit_job("multi_ai_append", request, total=len(file_paths))
+        run = partial(multi_ai_append, file_paths, request.version_control, request.append_location, request.execution_mode, use_cache=request.use_cache)
+        if request.stream:
+            return _ndjson_response(request, run)
+        with llm_deadline(request.deadline_seconds), llm_project(request.project_id), register_batch(request.batch_id) as cancel_event:
+            result = await run(**_executor_options(request, cancel_event))
+        return {"message": "複数のファイルにコンテンツが正常に追加されました", "result": _with_request_paths(result, request), "summary": summarize_results(result)}
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
@@ -107,7 +199,8 @@ async def multi_append_to_files(request: MultiAIAppendRequest):
 async def analyze_dependencies(request: AIDependenciesRequest):
     try:
         file_paths = [get_file_path(request.project_id, file_path, "") for file_path in request.file_paths]
-        result = await ai_analyze_dependencies(file_paths, request.version_control, request.analysis_scope)
+        with llm_deadline(request.deadline_seconds), llm_project(request.project_id):
+            result = await ai_analyze_dependencies(file_paths, request.version_control, request.analysis_scope, use_cache=request.use_cache)
         return {"message": "依存関係が正常に分析されました", "result": result}
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
@@ -116,7 +209,47 @@ async def analyze_dependencies(request: AIDependenciesRequest):
 async def multi_analyze_dependencies(request: MultiAIDependenciesRequest):
     try:
         file_paths = [get_file_path(request.project_id, file_path, "") for file_path in request.file_paths]
-        result = await multi_ai_analyze_dependencies(file_paths, request.version_control, request.analysis_scope, request.execution_mode)
+        if request.background:
+            return _submit_job("multi_ai_dependencies", request, total=1)
+        with llm_deadline(request.deadline_seconds), llm_project(request.project_id):
+            result = await multi_ai_analyze_dependencies(file_paths, request.version_control, request.analysis_scope, request.execution_mode, use_cache=request.use_cache)
         return {"message": "複数のファイルの依存関係が正常に分析されました", "result": result}
     except Exception as e:
-        raise HTTPException(status_code=500, detail=str(e))
\ No newline at end of file
+        raise HTTPException(status_code=500, detail=str(e))
+
+@router.post("/multi-ai-cancel/{batch_id}", response_model=Dict[str, Any])
+async def cancel_multi_ai_batch(batch_id: str):
+    if not cancel_batch(batch_id):
+        raise HTTPException(status_code=404, detail=f"実行中のバッチが見つかりません: {batch_id}")
+    return {"message": "バッチの中止を要求しました", "batch_id": batch_id}
+
+def _job_status(job: Dict[str, Any]) -> Dict[str, Any]:
+    return {key: value for key, value in job.items() if key not in ("params", "result")}
+
+@router.get("/jobs", response_model=Dict[str, Any])
+async def list_jobs(status: Optional[str] = None, limit: int = 50):
+    manager = get_job_manager()
+    return {"jobs": [_job_status(job) for job in manager.store.list(status, limit)], "stats": manager.get_stats()}
+
+@router.get("/jobs/{job_id}", response_model=Dict[str, Any])
+async def get_job(job_id: str):
+    job = get_job_manager().store.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"ジョブが見つかりません: {job_id}")
+    return _job_status(job)
+
+@router.get("/jobs/{job_id}/result", response_model=Dict[str, Any])
+async def get_job_result(job_id: str):
+    job = get_job_manager().store.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"ジョブが見つかりません: {job_id}")
+    if job["status"] not in FINISHED_STATUSES:
+        raise HTTPException(status_code=409, detail=f"ジョブはまだ完了していません: {job['status']}")
+    return {"job_id": job_id, "status": job["status"], "error": job["error"], **(job["result"] or {})}
+
+@router.post("/jobs/{job_id}/cancel", response_model=Dict[str, Any])
+async def cancel_job(job_id: str):
+    status = await get_job_manager().cancel(job_id)
+    if status is None:
+        raise HTTPException(status_code=404, detail=f"ジョブが見つかりません: {job_id}")
+    return {"message": "ジョブの中止を要求しました", "job_id": job_id, "status": status}
@@ -1,12 +1,29 @@
 import os
 import json
-from fastapi import APIRouter, HTTPException
+import asyncio
+from typing import Optional
+from fastapi import APIRouter, HTTPException, Request, Response
+from fastapi.responses import StreamingResponse
 from models.code_execution import CodeExecution
-from services.anthropic_service import generate_text_anthropic
-from services.gemini_service import generate_text_gemini
-from services.openai_service import generate_text_gpt4o
-from services.file_service import save_file, load_file, get_directory_structure, get_generated_dirs
+from services.anthropic_service import generate_text_anthropic, stream_text_anthropic
+from services.gemini_service import generate_text_gemini, stream_text_gemini
+from services.openai_service import generate_text_gpt4o, stream_text_gpt4o
+from services.llm_cache import llm_cache
+from services.llm_router import llm_router
+from services.rate_limiter import llm_scheduler
+from services.resilience import get_breaker_stats
+from services.singleflight import llm_singleflight
+from services.telemetry import llm_telemetry
+from services.llm_transcript import get_transcript_store
+from services.dependency_index import get_dependency_index
+from services.git_history import git_history, find_repository_root
+from utils.file_utils import get_file_path
+from config.settings import LLM_TRANSCRIPT_MODE
+from services.file_service import save_file, load_file, get_directory_structure, get_generated_dirs, get_lazy_structure, structure_index, generated_dirs_index, structure_etag
+from services.workspace_index import get_workspace_index_stats
 from utils.file_operations import execute_python
+from utils.streaming import format_sse, SSE_HEADERS
+from api.websocket import send_to_frontend
 import shutil
 import subprocess
 
@@ -85,16 +102,182 @@ async def hello():
     return {"message": "hello"}
 
 @router.post("/generate_claude")
-async def generate_text(prompt: str):
-    return await generate_text_anthropic(prompt)
+async def generate_text(prompt: str, use_cache: bool = True):
+    return await generate_text_anthropic(prompt, use_cache=use_cache)
 
 @router.post("/generate_gemini")
-async def generate_text_gemini_route(prompt: str):
-    return await generate_text_gemini(prompt)
+async def generate_text_gemini_route(prompt: str, use_cache: bool = True):
+    return await generate_text_gemini(prompt, use_cache=use_cache)
 
 @router.post("/generate_gpt4o")
-async def generate_text_gpt4o_route(prompt: str):
-    return await generate_text_gpt4o(prompt)
+async def generate_text_gpt4o_route(prompt: str, use_cache: bool = True):
+    return await generate_text_gpt4o(prompt, use_cache=use_cache)
+
+async def stream_as_sse(chunks, forward_ws: bool):
+    """
+    テキストチャンクのストリームをSSEに変換し、必要に応じてWebSocketにも転送するジェネレータ
+    """
+    try:
+        async for chunk in chunks:
+            if forward_ws:
+                await send_to_frontend(chunk, message_type="llm_stream")
+            yield format_sse({"text": chunk})
+        if forward_ws:
+            await send_to_frontend("", message_type="llm_stream_end")
+        yield format_sse({}, event="done")
+    except Exception as e:
+        logger.error(f"ストリーミング生成中にエラーが発生: {str(e)}")
+        if forward_ws:
+            # トークンを集めているフロントエンドが待ち続けないよう、エラーを伝えてからストリームを終える
+            await send_to_frontend(str(e), message_type="llm_stream_error")
+            await send_to_frontend("", message_type="llm_stream_end")
+        yield format_sse({"detail": str(e)}, event="error")
+
+@router.post("/generate_claude/stream")
+async def generate_text_stream(prompt: str, use_cache: bool = True, forward_ws: bool = False):
+    return StreamingResponse(
+        stream_as_sse(stream_text_anthropic(prompt, use_cache=use_cache), forward_ws),
+        media_type="text/event-stream",
+        headers=SSE_HEADERS
+    )
+
+@router.post("/generate_gemini/stream")
+async def generate_text_gemini_stream_route(prompt: str, use_cache: bool = True, forward_ws: bool = False):
+    return StreamingResponse(
+        stream_as_sse(stream_text_gemini(prompt, use_cache=use_cache), forward_ws),
+        media_type="text/event-stream",
+        headers=SSE_HEADERS
+    )
+
+@router.post("/generate_gpt4o/stream")
+async def generate_text_gpt4o_stream_route(prompt: str, use_cache: bool = True, forward_ws: bool = False):
+    return StreamingResponse(
+        stream_as_sse(stream_text_gpt4o(prompt, use_cache=use_cache), forward_ws),
+        media_type="text/event-stream",
+        headers=SSE_HEADERS
+    )
+
+@router.get("/llm_cache/stats")
+async def get_llm_cache_stats_route():
+    return llm_cache.get_stats()
+
+@router.get("/llm_router/stats")
+async def get_llm_router_stats_route():
+    return {"providers": llm_router.get_stats()}
+
+@router.get("/llm_scheduler/stats")
+async def get_llm_scheduler_stats_route():
+    return {"limiters": llm_scheduler.get_stats()}
+
+@router.get("/llm_telemetry/summary")
+async def get_llm_telemetry_summary_route(recent: int = 0):
+    summary = llm_telemetry.summary()
+    if recent > 0:
+        summary["recent"] = list(llm_telemetry.recent)[-recent:]
+    return summary
+
+@router.get("/llm_transcript/stats")
+async def get_llm_transcript_stats_route():
+    if LLM_TRANSCRIPT_MODE == "off":
+        return {"mode": LLM_TRANSCRIPT_MODE}
+    return {"mode": LLM_TRANSCRIPT_MODE, **get_transcript_store().get_stats()}
+
+@router.get("/llm_singleflight/stats")
+async def get_llm_singleflight_stats_route():
+    return llm_singleflight.get_stats()
+
+@router.get("/llm_breakers/stats")
+async def get_llm_breakers_stats_route():
+    return {"breakers": get_breaker_stats()}
+
+@router.get("/dependency_graph/{project_id}")
+async def get_dependency_graph_route(project_id: str, file_path: Optional[str] = None, depth: int = 1):
+    """
+    静的解析によるimport関係の索引から、LLMを使わずに依存関係を返す
+
+    file_path を省略した場合は索引の概要と循環importを、指定した場合はそのファイルがimportする・されるファイルを返します（depth が0以下なら推移的にすべて）。
+    """
+    try:
+        root = get_file_path(project_id, "", "")
+    except FileNotFoundError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    index = await asyncio.to_thread(get_dependency_index, root)
+    if file_path is None:
+        return {**index.get_stats(), "cycles": index.cycles()}
+    if not index.has_file(file_path):
+        raise HTTPException(status_code=404, detail=f"索引にないファイルです: {file_path}")
+    depth = depth if depth > 0 else None
+    return {
+        "file_path": file_path,
+        "dependencies": index.dependencies(file_path, depth),
+        "dependents": index.dependents(file_path, depth),
+    }
+
+def _history_target(project_id: str, file_path: Optional[str]):
+    # プロジェクトからの相対パスを、リポジトリのルートからの "/" 区切りのパスにする
+    try:
+        root = get_file_path(project_id, "", "")
+    except FileNotFoundError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    repo_path = find_repository_root(root)
+    if repo_path is None:
+        raise HTTPException(status_code=404, detail=f"プロジェクトはGitで管理されていません: {project_id}")
+    path = os.path.normpath(os.path.join(root, file_path or ""))
+    if os.path.commonpath([os.path.abspath(root), os.path.abspath(path)]) != os.path.abspath(root):
+        raise HTTPException(status_code=400, detail=f"プロジェクトの外のパスです: {file_path}")
+    relative = os.path.relpath(path, repo_path).replace(os.sep, "/")
+    return repo_path, None if relative == "." else relative
+
+@router.get("/history/{project_id}")
+async def get_history_route(project_id: str, file_path: Optional[str] = None, cursor: Optional[str] = None, limit: Optional[int] = None):
+    """
+    プロジェクト（file_path を指定した場合はそのファイル・ディレクトリ）のコミット履歴を新しい順に1ページ分返す
+
+    次のページは、返された next_cursor を cursor に指定して取得します。
+    """
+    repo_path, path = _history_target(project_id, file_path)
+    try:
+        return await git_history.log(repo_path, path, cursor, limit)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+@router.get("/history/{project_id}/blame")
+async def get_blame_route(project_id: str, file_path: str, revision: Optional[str] = None):
+    """
+    revision（省略時は HEAD）の時点のファイルの各行を最後に変更したコミットを返す
+    """
+    repo_path, path = _history_target(project_id, file_path)
+    try:
+        return await git_history.blame(repo_path, path, revision)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except FileNotFoundError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+
+@router.get("/history/{project_id}/diff")
+async def get_history_diff_route(project_id: str, base: str, target: Optional[str] = None, file_path: Optional[str] = None):
+    """
+    base から target（省略時は HEAD）までの差分を返す（file_path を指定した場合はそのファイル・ディレクトリだけ）
+    """
+    repo_path, path = _history_target(project_id, file_path)
+    try:
+        return await git_history.diff(repo_path, base, target, path)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+@router.get("/workspace_index/stats")
+async def get_workspace_index_stats_route():
+    return get_workspace_index_stats()
+
+@router.get("/history_cache/stats")
+async def get_history_cache_stats_route():
+    return git_history.get_stats()
+
+@router.delete("/llm_cache")
+async def clear_llm_cache_route():
+    llm_cache.clear()
+    logger.info("LLMキャッシュをクリアしました")
+    return {"message": "LLMキャッシュをクリアしました"}
 
 @router.post("/execute")
 async def execute_python_route(code_execution: CodeExecution):
@@ -104,22 +287,63 @@ async def execute_python_route(code_execution: CodeExecution):
 async def load_file_route(filename: str):
     return await load_file(filename)
 
+def _not_modified(request: Request, etag: str) -> Optional[Response]:
+    # If-None-Match のいずれかが現在のETagと一致すれば、本文なしの304を返す
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match is None:
+        return None
+    tags = [tag.strip().removeprefix("W/") for tag in if_none_match.split(",")]
+    if "*" in tags or etag in tags:
+        return Response(status_code=304, headers={"ETag": etag})
+    return None
+
 @router.get("/directory_structure")
-async def get_directory_structure_route(path_type: str):
+async def get_directory_structure_route(path_type: str, request: Request, response: Response):
+    """
+    ディレクトリ構造を共有の索引から返す（ETagが If-None-Match と一致すれば304）
+    """
     logger.info(f"ディレクトリ構造の取得リクエストを受信: path_type={path_type}")
     try:
-        result = await get_directory_structure(path_type)
+        # 索引の解決（監視が無効な場合は走査し直し）は1回だけにして、ETagと本文の両方に使う
+        # 初回の走査や監視の開始でイベントループを止めないよう、スレッドで解決する
+        index = await asyncio.to_thread(structure_index, path_type)
+        etag = structure_etag(index)
+        not_modified = _not_modified(request, etag)
+        if not_modified is not None:
+            return not_modified
+        result = await get_directory_structure(path_type, index)
+        response.headers["ETag"] = etag
         logger.info(f"ディレクトリ構造の取得に成功: path_type={path_type}")
         return result
     except Exception as e:
         logger.error(f"ディレクトリ構造の取得中にエラーが発生: path_type={path_type}, エラー={str(e)}")
         raise HTTPException(status_code=500, detail="ディレクトリ構造の取得に失敗しました")
 
+@router.get("/structure")
+async def get_lazy_structure_route(path_type: str, path: str = "", depth: int = 1, cursor: Optional[str] = None, limit: Optional[int] = None):
+    """
+    フォルダを開くたびに必要な分だけ返すディレクトリ構造（ファイルの内容は読まない）
+
+    path のフォルダの子を depth 階層まで名前順に limit 件ずつ返します。続きは next_cursor を cursor に指定して取得します。
+    """
+    try:
+        return await get_lazy_structure(path_type, path, depth, cursor, limit)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except FileNotFoundError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+
 @router.get("/generated-dirs")
-async def get_generated_dirs_route():
+async def get_generated_dirs_route(request: Request, response: Response):
     logger.info("生成されたディレクトリの取得を開始します")
     try:
-        result = await get_generated_dirs()
+        index = await asyncio.to_thread(generated_dirs_index)
+        etag = structure_etag(index)
+        not_modified = _not_modified(request, etag)
+        if not_modified is not None:
+            return not_modified
+        result = await get_generated_dirs(index)
+        response.headers["ETag"] = etag
         logger.info(f"生成されたディレクトリの取得に成功しました: {result}")
         return result
     except Exception as e:
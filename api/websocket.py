@@ -29,16 +29,21 @@ async def websocket_endpoint(websocket: WebSocket):
         active_connections.remove(websocket)
         logger.info(f"WebSocket接続が閉じられました。残りの接続数: {len(active_connections)}")
 
-async def send_to_frontend(message: str):
-    logger.info(f"フロントエンドへの送信を開始: {message}")
+# トークン単位で大量に送られるため、送信のたびのログを DEBUG にするメッセージの種類
+QUIET_MESSAGE_TYPES = ("llm_stream", "llm_stream_end")
+
+async def send_to_frontend(message: str, message_type: str = "zoltraak_output"):
+    # LLMのストリーミングは1トークンごとに呼ばれるので、INFOで本文を出さない
+    log_level = logging.DEBUG if message_type in QUIET_MESSAGE_TYPES else logging.INFO
+    logger.log(log_level, f"フロントエンドへの送信を開始: {message}")
     for connection in active_connections:
         try:
             await connection.send_json({
-                "type": "zoltraak_output",
+                "type": message_type,
                 "content": message
             })
             logger.debug(f"フロントエンドに送信成功: {message}")
         except Exception as e:
             logger.error(f"フロントエンドへの送信中にエラーが発生: {str(e)}", exc_info=True)
     
-    logger.info(f"フロントエンドへの送信完了。送信先の接続数: {len(active_connections)}")
\ No newline at end of file
+    logger.log(log_level, f"フロントエンドへの送信完了。送信先の接続数: {len(active_connections)}")
\ No newline at end of file
@@ -5,4 +5,129 @@ load_dotenv()
 
 ANTHROPIC_API_KEY = os.getenv("ANTHROPIC_API_KEY")
 GEMINI_API_KEY = os.getenv("GEMINI_API_KEY")
-OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
\ No newline at end of file
+OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
+
+# LLMレスポンスキャッシュの設定
+LLM_CACHE_ENABLED = os.getenv("LLM_CACHE_ENABLED", "true").lower() == "true"
+LLM_CACHE_DIR = os.getenv("LLM_CACHE_DIR", os.path.join(os.path.expanduser("~"), ".babel_cache", "llm"))
+LLM_CACHE_TTL_SECONDS = int(os.getenv("LLM_CACHE_TTL_SECONDS", str(7 * 24 * 60 * 60)))
+LLM_CACHE_MEMORY_ENTRIES = int(os.getenv("LLM_CACHE_MEMORY_ENTRIES", "256"))
+LLM_CACHE_MAX_BYTES = int(os.getenv("LLM_CACHE_MAX_BYTES", str(256 * 1024 * 1024)))
+# 実行中の同一リクエストへの相乗り（シングルフライト）
+LLM_SINGLEFLIGHT_ENABLED = os.getenv("LLM_SINGLEFLIGHT_ENABLED", "true").lower() == "true"
+
+# LLMプロバイダー共通のHTTPコネクションプール設定
+LLM_HTTP_MAX_CONNECTIONS = int(os.getenv("LLM_HTTP_MAX_CONNECTIONS", "200"))
+LLM_HTTP_MAX_KEEPALIVE_CONNECTIONS = int(os.getenv("LLM_HTTP_MAX_KEEPALIVE_CONNECTIONS", "100"))
+LLM_HTTP_KEEPALIVE_EXPIRY = float(os.getenv("LLM_HTTP_KEEPALIVE_EXPIRY", "60"))
+LLM_HTTP_CONNECT_TIMEOUT = float(os.getenv("LLM_HTTP_CONNECT_TIMEOUT", "10"))
+LLM_HTTP_TIMEOUT = float(os.getenv("LLM_HTTP_TIMEOUT", "600"))
+GEMINI_BASE_URL = os.getenv("GEMINI_BASE_URL", "https://generativelanguage.googleapis.com")
+# モックLLMサーバー（services/mock_llm_server.py）などに接続先を切り替える場合に指定する（未指定ならSDKの既定値）
+ANTHROPIC_BASE_URL = os.getenv("ANTHROPIC_BASE_URL") or None
+OPENAI_BASE_URL = os.getenv("OPENAI_BASE_URL") or None
+
+# プロバイダールーターの設定（既定はAnthropicのみ。複数プロバイダーへの振り分けとヘッジは明示的に指定した場合だけ有効）
+LLM_ROUTER_PROVIDERS = [p.strip() for p in os.getenv("LLM_ROUTER_PROVIDERS", "anthropic").split(",") if p.strip()]
+LLM_ROUTER_WINDOW_SIZE = int(os.getenv("LLM_ROUTER_WINDOW_SIZE", "100"))
+LLM_ROUTER_WINDOW_SECONDS = float(os.getenv("LLM_ROUTER_WINDOW_SECONDS", "300"))
+LLM_ROUTER_MIN_SAMPLES = int(os.getenv("LLM_ROUTER_MIN_SAMPLES", "5"))
+LLM_ROUTER_ERROR_THRESHOLD = float(os.getenv("LLM_ROUTER_ERROR_THRESHOLD", "0.5"))
+LLM_HEDGE_OPERATIONS = [op.strip() for op in os.getenv("LLM_HEDGE_OPERATIONS", "").split(",") if op.strip()]
+LLM_HEDGE_DEFAULT_DELAY = float(os.getenv("LLM_HEDGE_DEFAULT_DELAY", "30"))
+# ファイル全体を出力する操作。出力トークンの上限が小さいプロバイダーには振り分けない
+LLM_WHOLE_FILE_OPERATIONS = [op.strip() for op in os.getenv("LLM_WHOLE_FILE_OPERATIONS", "ai_process,ai_rewrite").split(",") if op.strip()]
+
+# プロバイダーごとのレート制限（RPM: 1分あたりのリクエスト数, TPM: 1分あたりのトークン数）
+LLM_RATE_LIMITS = {
+    "anthropic": {"rpm": int(os.getenv("ANTHROPIC_RPM", "50")), "tpm": int(os.getenv("ANTHROPIC_TPM", "40000"))},
+    "openai": {"rpm": int(os.getenv("OPENAI_RPM", "500")), "tpm": int(os.getenv("OPENAI_TPM", "30000"))},
+    "gemini": {"rpm": int(os.getenv("GEMINI_RPM", "360")), "tpm": int(os.getenv("GEMINI_TPM", "4000000"))},
+}
+LLM_AIMD_INCREASE = float(os.getenv("LLM_AIMD_INCREASE", "0.05"))
+LLM_AIMD_DECREASE = float(os.getenv("LLM_AIMD_DECREASE", "0.5"))
+LLM_AIMD_MIN_FACTOR = float(os.getenv("LLM_AIMD_MIN_FACTOR", "0.05"))
+LLM_RATE_LIMIT_MAX_REQUEUE = int(os.getenv("LLM_RATE_LIMIT_MAX_REQUEUE", "3"))
+
+# LLM呼び出しのリトライ・サーキットブレーカー・デッドラインの設定
+LLM_RETRY_MAX_ATTEMPTS = int(os.getenv("LLM_RETRY_MAX_ATTEMPTS", "4"))
+LLM_RETRY_BASE_DELAY = float(os.getenv("LLM_RETRY_BASE_DELAY", "1"))
+LLM_RETRY_MAX_DELAY = float(os.getenv("LLM_RETRY_MAX_DELAY", "30"))
+LLM_BREAKER_FAILURE_THRESHOLD = int(os.getenv("LLM_BREAKER_FAILURE_THRESHOLD", "5"))
+LLM_BREAKER_RESET_TIMEOUT = float(os.getenv("LLM_BREAKER_RESET_TIMEOUT", "30"))
+LLM_DEFAULT_DEADLINE = float(os.getenv("LLM_DEFAULT_DEADLINE", "600"))
+
+# LLM呼び出しのテレメトリ（レイテンシの分位点を計算する直近の件数）
+LLM_TELEMETRY_WINDOW_SIZE = int(os.getenv("LLM_TELEMETRY_WINDOW_SIZE", "1000"))
+
+# プロバイダーとのやり取りの記録・再生（off / record / replay）
+# replay時の待ち時間は記録時のレイテンシ × LLM_REPLAY_TIME_SCALE（1で記録どおり、0で待たない）
+LLM_TRANSCRIPT_MODE = os.getenv("LLM_TRANSCRIPT_MODE", "off").lower()
+LLM_TRANSCRIPT_PATH = os.getenv("LLM_TRANSCRIPT_PATH", os.path.join(os.path.expanduser("~"), ".babel_cache", "transcripts", "llm_transcript.sqlite3"))
+LLM_REPLAY_TIME_SCALE = float(os.getenv("LLM_REPLAY_TIME_SCALE", "1.0"))
+
+# 1回のLLM呼び出しに送るプロンプトの上限（概算トークン数）と、超過時に分割するチャンクの大きさ
+LLM_CONTEXT_TOKEN_BUDGET = int(os.getenv("LLM_CONTEXT_TOKEN_BUDGET", "100000"))
+LLM_CHUNK_TOKENS = int(os.getenv("LLM_CHUNK_TOKENS", "24000"))
+
+# 複数ファイル処理（multi-ai-*）の同時実行数と1ファイルあたりのタイムアウト（秒、0で無制限）
+MULTI_AI_MAX_CONCURRENCY = int(os.getenv("MULTI_AI_MAX_CONCURRENCY", "8"))
+MULTI_AI_FILE_TIMEOUT = float(os.getenv("MULTI_AI_FILE_TIMEOUT", "0"))
+
+# バックグラウンドジョブ（ジョブストアの保存先・同時に実行するジョブ数・ストアを確認する間隔（秒））
+JOB_STORE_PATH = os.getenv("JOB_STORE_PATH", os.path.join(os.path.expanduser("~"), ".babel_cache", "jobs", "jobs.sqlite3"))
+JOB_WORKERS = int(os.getenv("JOB_WORKERS", "2"))
+JOB_POLL_INTERVAL = float(os.getenv("JOB_POLL_INTERVAL", "5"))
+# 実行中のジョブの生存時刻を更新する間隔（秒）と、更新が途絶えたジョブを停止したプロセスのものとみなして失敗扱いにするまでの時間（秒）
+JOB_HEARTBEAT_INTERVAL = float(os.getenv("JOB_HEARTBEAT_INTERVAL", "10"))
+JOB_LEASE_SECONDS = float(os.getenv("JOB_LEASE_SECONDS", "60"))
+
+# ファイル間のimport関係の索引（ファイル変更の監視で差分更新するか・索引に含めるファイルの上限サイズ・依存関係分析に含める近傍の深さ）
+DEPENDENCY_INDEX_ENABLED = os.getenv("DEPENDENCY_INDEX_ENABLED", "true").lower() == "true"
+DEPENDENCY_INDEX_WATCH = os.getenv("DEPENDENCY_INDEX_WATCH", "true").lower() == "true"
+DEPENDENCY_INDEX_MAX_FILE_BYTES = int(os.getenv("DEPENDENCY_INDEX_MAX_FILE_BYTES", str(1024 * 1024)))
+DEPENDENCY_CONTEXT_DEPTH = int(os.getenv("DEPENDENCY_CONTEXT_DEPTH", "1"))
+
+# ディレクトリツリーの走査・描画の上限（深さ・エントリ数・テキストのバイト数、0で無制限）とキャッシュするツリーの数
+TREE_MAX_DEPTH = int(os.getenv("TREE_MAX_DEPTH", "8"))
+TREE_MAX_ENTRIES = int(os.getenv("TREE_MAX_ENTRIES", "5000"))
+TREE_MAX_BYTES = int(os.getenv("TREE_MAX_BYTES", "65536"))
+TREE_CACHE_SIZE = int(os.getenv("TREE_CACHE_SIZE", "32"))
+
+# 遅延型のディレクトリ構造（1ページの既定・最大の件数、一度に展開する深さの上限、一覧をキャッシュするディレクトリの数）
+STRUCTURE_PAGE_SIZE = int(os.getenv("STRUCTURE_PAGE_SIZE", "200"))
+STRUCTURE_MAX_PAGE_SIZE = int(os.getenv("STRUCTURE_MAX_PAGE_SIZE", "2000"))
+STRUCTURE_MAX_DEPTH = int(os.getenv("STRUCTURE_MAX_DEPTH", "5"))
+STRUCTURE_LISTING_CACHE_SIZE = int(os.getenv("STRUCTURE_LISTING_CACHE_SIZE", "4096"))
+
+# プロジェクトごとのディレクトリ構造の索引（ファイル変更の監視で差分更新するか、描画した構造をキャッシュする件数）
+WORKSPACE_INDEX_WATCH = os.getenv("WORKSPACE_INDEX_WATCH", "true").lower() == "true"
+WORKSPACE_INDEX_RENDER_CACHE_SIZE = int(os.getenv("WORKSPACE_INDEX_RENDER_CACHE_SIZE", "16"))
+
+# 生成されたスクリプトの実行（作業ディレクトリの保存先と残す件数（0で削除しない）・同時実行数・実時間のタイムアウト（秒）・CPU時間（秒）とメモリ（MB）の上限（0で無制限）・保持する出力の上限）
+CODE_EXEC_WORKSPACE_DIR = os.getenv("CODE_EXEC_WORKSPACE_DIR", os.path.join(os.path.expanduser("~"), ".babel_cache", "executions"))
+CODE_EXEC_KEEP_RUNS = int(os.getenv("CODE_EXEC_KEEP_RUNS", "50"))
+CODE_EXEC_MAX_CONCURRENCY = int(os.getenv("CODE_EXEC_MAX_CONCURRENCY", "2"))
+CODE_EXEC_TIMEOUT = float(os.getenv("CODE_EXEC_TIMEOUT", "120"))
+CODE_EXEC_CPU_SECONDS = int(os.getenv("CODE_EXEC_CPU_SECONDS", "60"))
+CODE_EXEC_MEMORY_MB = int(os.getenv("CODE_EXEC_MEMORY_MB", "1024"))
+CODE_EXEC_MAX_OUTPUT_BYTES = int(os.getenv("CODE_EXEC_MAX_OUTPUT_BYTES", str(1024 * 1024)))
+
+# /ai-process の編集方式（script: ファイル全体を書き込むスクリプトを生成して実行 / diff: 変更箇所だけを受け取って適用）と、
+# diff方式で変更箇所を探すときに一致とみなす類似度の下限
+AI_PROCESS_EDIT_MODE = os.getenv("AI_PROCESS_EDIT_MODE", "script").lower()
+PATCH_FUZZY_THRESHOLD = float(os.getenv("PATCH_FUZZY_THRESHOLD", "0.85"))
+
+# version_control のコミット（近い時刻の変更をまとめる時間枠（秒）と、1回の git add に渡すパスの数）
+VERSION_CONTROL_COMMIT_WINDOW = float(os.getenv("VERSION_CONTROL_COMMIT_WINDOW", "0.5"))
+VERSION_CONTROL_ADD_BATCH_SIZE = int(os.getenv("VERSION_CONTROL_ADD_BATCH_SIZE", "100"))
+
+# gitの操作方法（gitpython: リポジトリを開いたまま保持してプロセス内で操作 / subprocess: 操作ごとにgitコマンドを起動）と、開いたまま保持するリポジトリの数
+GIT_BACKEND = os.getenv("GIT_BACKEND", "gitpython").lower()
+GIT_REPO_CACHE_SIZE = int(os.getenv("GIT_REPO_CACHE_SIZE", "64"))
+
+# 履歴API（1ページの既定・最大のコミット数、blame・差分の結果をキャッシュする件数、差分のパッチの最大バイト数）
+GIT_HISTORY_PAGE_SIZE = int(os.getenv("GIT_HISTORY_PAGE_SIZE", "50"))
+GIT_HISTORY_MAX_PAGE_SIZE = int(os.getenv("GIT_HISTORY_MAX_PAGE_SIZE", "500"))
+GIT_HISTORY_CACHE_SIZE = int(os.getenv("GIT_HISTORY_CACHE_SIZE", "128"))
+GIT_HISTORY_MAX_DIFF_BYTES = int(os.getenv("GIT_HISTORY_MAX_DIFF_BYTES", str(1024 * 1024)))
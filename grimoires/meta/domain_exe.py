@@ -5,7 +5,9 @@ from tqdm import tqdm
 import concurrent.futures
 import importlib
 
-from utils.utils import generate_response, normal
+from utils.utils import generate_response, normal, UsageTracker, DEFAULT_MAX_RETRIES
+from utils.batch import run_batch
+from utils.transcript import TranscriptSession
 
 logger = logging.getLogger(__name__)
 logging.basicConfig(level=logging.ERROR, format='%(asctime)s - %(levelname)s - %(message)s')
@@ -18,45 +20,104 @@ def import_modules(saas_name):
     constraints = importlib.import_module(f"{saas_name}.def_constraints").constraints
     return concept, dir_frontend, files, root_dir, constraints
 
-def create_file(directory, filename, prompt, file_number, concept, dir_frontend, constraints, root_dir, progress_bar, total_files):
+def build_shared_prefix(concept, dir_frontend, constraints):
+    """
+    全ファイルで共通のプロンプト前半部分（コンセプト・ディレクトリ構成・制約）を組み立てる関数
+    """
+    return f"{concept}\n{dir_frontend}\n{constraints}\n"
+
+def create_file(directory, filename, prompt, file_number, shared_prefix, root_dir, progress_bar, total_files, usage_tracker=None, max_retries=DEFAULT_MAX_RETRIES, transcript=None):
     file_path = os.path.join(root_dir, directory)
     os.makedirs(file_path, exist_ok=True)  # ディレクトリが存在しない場合は作成
     file_path = os.path.join(file_path, filename)
+    model = "claude-3-5-sonnet-20240620"
+    file_prompt = f"上記の内容をもとにして{prompt}"
+    max_tokens = 8192
+    temperature = 0.5
+
+    # 生成に失敗しても既存のファイルを空にしないよう、応答を受け取ってから書き込む
+    response = generate_response(model, file_prompt, max_tokens, temperature,
+                                 cached_prefix=shared_prefix, usage_tracker=usage_tracker, max_retries=max_retries,
+                                 transcript=transcript)
+    formatted_response = normal(response)
     with open(file_path, "w", encoding="utf-8") as f:
-        model = "claude-3-5-sonnet-20240620"
-        full_prompt = f'''
-        {concept}\n{dir_frontend}\n{constraints}\n上記の内容をもとにして{prompt}
-        '''
-        max_tokens = 8192
-        temperature = 0.5
-        
-        response = generate_response(model, full_prompt, max_tokens, temperature)
-        formatted_response = normal(response)
         f.write(formatted_response)
     
     progress_bar.update(1)
     print(f"{file_number}枚目/{total_files}が完了しました。")
 
-def main(saas_name):
+def main(saas_name, batch=False, poll_interval=30, max_retries=DEFAULT_MAX_RETRIES, skip_existing=False, transcript=None):
     concept, dir_frontend, files, root_dir, constraints = import_modules(saas_name)
+    shared_prefix = build_shared_prefix(concept, dir_frontend, constraints)
+    usage_tracker = UsageTracker()
     
     os.makedirs(root_dir, exist_ok=True)
 
+    tasks = [(directory, filename, prompt, i+1) for i, (directory, filename, prompt) in enumerate(files)]
+    if skip_existing:
+        # 前回の実行で生成済みのファイルは飛ばし、未生成・失敗したファイルだけを生成する
+        tasks = [task for task in tasks if not os.path.exists(os.path.join(root_dir, task[0], task[1]))]
+
+    if batch:
+        # 全ファイルを1つのMessage Batchesジョブとして送信する（結果は非同期で回収）
+        failures = run_batch(tasks, shared_prefix, root_dir, "claude-3-5-sonnet-20240620", 8192, 0.5,
+                             poll_interval=poll_interval, usage_tracker=usage_tracker)
+        print(f"トークン使用量: {usage_tracker.summary()}")
+        if failures:
+            print(f"{len(failures)}ファイルの生成に失敗しました。再実行すると失敗分のみ再送信します。")
+        return
+
     # プログレスバーの初期化
-    progress_bar = tqdm(total=len(files), unit="files")
+    progress_bar = tqdm(total=len(tasks), unit="files")
+    failures = []
+
+    def run_task(task):
+        directory, filename, prompt, file_number = task
+        try:
+            create_file(directory, filename, prompt, file_number, shared_prefix, root_dir, progress_bar, len(files), usage_tracker, max_retries, transcript)
+        except Exception as e:
+            # 1ファイルの失敗で全体を止めず、失敗したファイルを記録して残りの生成を続ける
+            logger.error(f"{os.path.join(directory, filename)} の生成に失敗しました: {str(e)}")
+            failures.append((os.path.join(directory, filename), str(e)))
+
+    # 最初の1ファイルを先に生成して共通部分をキャッシュに書き込み、残りはキャッシュを読む形で並列実行する
+    if tasks:
+        run_task(tasks[0])
 
     # 並列実行のためのスレッドプールを作成
     with concurrent.futures.ThreadPoolExecutor() as executor:
-        futures = [executor.submit(create_file, directory, filename, prompt, i+1, concept, dir_frontend, constraints, root_dir, progress_bar, len(files)) 
-                   for i, (directory, filename, prompt) in enumerate(files)]
+        futures = [executor.submit(run_task, task) for task in tasks[1:]]
         for future in concurrent.futures.as_completed(futures):
             future.result()
 
     progress_bar.close()
+    print(f"トークン使用量: {usage_tracker.summary()}")
+    if failures:
+        print(f"{len(failures)}ファイルの生成に失敗しました。--skip-existing を付けて再実行すると失敗分のみ生成します。")
+        for path, reason in failures:
+            print(f"  {path}: {reason}")
 
 if __name__ == "__main__":
     parser = argparse.ArgumentParser(description="SaaSアプリケーション生成スクリプト")
     parser.add_argument("-s", "--saas_name", required=True, help="SaaS名を指定してください")
+    parser.add_argument("--batch", action="store_true", help="Message Batches APIで一括生成します（中断後の再実行で再開可能）")
+    parser.add_argument("--poll-interval", type=float, default=30, help="バッチの状態確認間隔（秒）")
+    parser.add_argument("--max-retries", type=int, default=DEFAULT_MAX_RETRIES, help="一時的なエラーに対する再試行回数（指数バックオフ）")
+    parser.add_argument("--skip-existing", action="store_true", help="生成済みのファイルを飛ばし、未生成・失敗したファイルのみ生成します")
+    parser.add_argument("--record", metavar="PATH", help="APIとのやり取りをトランスクリプトに記録します")
+    parser.add_argument("--replay", metavar="PATH", help="APIを呼ばずにトランスクリプトから応答を再生します")
+    parser.add_argument("--replay-time-scale", type=float, default=1.0, help="再生時の待ち時間の倍率（1で記録どおり、0で待たない）")
     args = parser.parse_args()
+    if args.record and args.replay:
+        parser.error("--record と --replay は同時に指定できません")
+    if args.batch and (args.record or args.replay):
+        parser.error("--batch モードでは記録・再生は使えません")
+
+    transcript = None
+    if args.record:
+        transcript = TranscriptSession(args.record, "record")
+    elif args.replay:
+        transcript = TranscriptSession(args.replay, "replay", args.replay_time_scale)
     
-    main(args.saas_name)
+    main(args.saas_name, batch=args.batch, poll_interval=args.poll_interval,
+         max_retries=args.max_retries, skip_existing=args.skip_existing, transcript=transcript)
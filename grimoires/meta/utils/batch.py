@@ -0,0 +1,148 @@
+import json
+import logging
+import os
+import time
+
+import anthropic
+
+from utils.utils import normal
+
+logger = logging.getLogger(__name__)
+
+STATE_FILENAME = ".batch_state.json"
+
+
+def custom_id_for(file_number):
+    """
+    バッチ内で各ファイルのリクエストを識別するIDを返す関数
+    """
+    return f"file-{file_number:04d}"
+
+
+def load_state(state_path):
+    if not os.path.exists(state_path):
+        return None
+    with open(state_path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def save_state(state_path, state):
+    # 書き込み途中でプロセスが落ちても壊れないよう、一時ファイル経由で置き換える
+    tmp_path = state_path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(state, f, ensure_ascii=False, indent=2)
+    os.replace(tmp_path, state_path)
+
+
+def build_batch_requests(tasks, shared_prefix, model, max_tokens, temperature):
+    """
+    Message Batches API に送信するリクエストの一覧を組み立てる関数
+
+    引数:
+        tasks (list): (directory, filename, prompt, file_number) のリスト
+        shared_prefix (str): 全ファイル共通のプロンプト前半部分（キャッシュ対象ブロックとして送信）
+    """
+    return [
+        {
+            "custom_id": custom_id_for(file_number),
+            "params": {
+                "model": model,
+                "max_tokens": max_tokens,
+                "temperature": temperature,
+                "messages": [
+                    {
+                        "role": "user",
+                        "content": [
+                            {"type": "text", "text": shared_prefix, "cache_control": {"type": "ephemeral"}},
+                            {"type": "text", "text": f"上記の内容をもとにして{prompt}"},
+                        ]
+                    }
+                ],
+            },
+        }
+        for _, _, prompt, file_number in tasks
+    ]
+
+
+def run_batch(tasks, shared_prefix, root_dir, model, max_tokens, temperature, poll_interval=30, usage_tracker=None):
+    """
+    全ファイルのプロンプトを1つのバッチジョブとして送信し、結果をファイルに書き出す関数
+
+    バッチIDと書き込み済みのファイルは root_dir/.batch_state.json に保存されるため、
+    ポーリング中にプロセスが終了しても同じコマンドを再実行すれば続きから再開できます。
+    失敗したファイルは次回の実行で新しいバッチとして再送信されます。
+    全てのファイルを書き込み終えると状態ファイルを削除するため、次回の実行では全てのファイルを生成し直します。
+
+    戻り値:
+        list: 失敗したファイルの (custom_id, 理由) のリスト
+    """
+    client = anthropic.Anthropic(
+        api_key=os.environ.get("ANTHROPIC_API_KEY")  # 環境変数からAPI keyを取得
+    )
+    state_path = os.path.join(root_dir, STATE_FILENAME)
+    state = load_state(state_path) or {"batch_id": None, "written": []}
+    files = {custom_id_for(file_number): (directory, filename) for directory, filename, _, file_number in tasks}
+
+    # 書き込み済みでも、その後に削除されたファイルは生成し直す
+    state["written"] = [
+        custom_id for custom_id in state["written"]
+        if custom_id in files and os.path.exists(os.path.join(root_dir, *files[custom_id]))
+    ]
+    pending = [task for task in tasks if custom_id_for(task[3]) not in state["written"]]
+    if not pending:
+        # 前回の実行が状態ファイルを削除する前に終了していた場合
+        os.remove(state_path)
+        print("全てのファイルが生成済みです。")
+        return []
+
+    if state["batch_id"] is None:
+        batch = client.messages.batches.create(
+            requests=build_batch_requests(pending, shared_prefix, model, max_tokens, temperature)
+        )
+        state["batch_id"] = batch.id
+        save_state(state_path, state)
+        print(f"バッチを送信しました: {batch.id}（{len(pending)}ファイル）")
+    else:
+        print(f"保存済みのバッチを再開します: {state['batch_id']}")
+
+    batch_id = state["batch_id"]
+    while True:
+        batch = client.messages.batches.retrieve(batch_id)
+        counts = batch.request_counts
+        print(f"バッチ状況: 処理中 {counts.processing} / 成功 {counts.succeeded} / エラー {counts.errored}")
+        if batch.processing_status == "ended":
+            break
+        time.sleep(poll_interval)
+
+    failures = []
+    # 結果はJSONLとしてストリームされるので、受信した順にファイルへ書き出す
+    for entry in client.messages.batches.results(batch_id):
+        custom_id = entry.custom_id
+        if custom_id in state["written"] or custom_id not in files:
+            continue
+        if entry.result.type != "succeeded":
+            failures.append((custom_id, entry.result.type))
+            continue
+
+        message = entry.result.message
+        if usage_tracker is not None:
+            usage_tracker.add(message.usage)
+        directory, filename = files[custom_id]
+        file_dir = os.path.join(root_dir, directory)
+        os.makedirs(file_dir, exist_ok=True)
+        with open(os.path.join(file_dir, filename), "w", encoding="utf-8") as f:
+            f.write(normal(message.content[0].text.strip()))
+        state["written"].append(custom_id)
+        save_state(state_path, state)
+        print(f"{os.path.join(directory, filename)} を書き込みました。")
+
+    if all(custom_id in state["written"] for custom_id in files):
+        # 今回の生成は完了したので、次回の実行が最初から生成し直せるよう状態を消す
+        os.remove(state_path)
+    else:
+        # このバッチの結果は回収し終えたので、失敗分は次回の実行で新しいバッチとして送信する
+        state["batch_id"] = None
+        save_state(state_path, state)
+    for custom_id, reason in failures:
+        logger.error(f"バッチ内のリクエストが失敗しました: {custom_id} ({reason})")
+    return failures
@@ -0,0 +1,149 @@
+"""
+Message Batches API のローカル代替サーバー
+
+テストやオフラインでの動作確認用に、Anthropic の Message Batches API のうち
+domain_exe.py の --batch モードが使うエンドポイントだけを実装します。
+
+使い方:
+    python -m utils.batch_stub_server --port 8010
+    ANTHROPIC_BASE_URL=http://127.0.0.1:8010 python domain_exe.py -s sample --batch
+"""
+import argparse
+import json
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+class BatchStubServer(ThreadingHTTPServer):
+    """
+    受け付けたバッチを保持し、polls_until_ended 回の状態確認の後に完了させるサーバー
+
+    fail_custom_ids に含まれる custom_id は errored として返します。
+    """
+
+    def __init__(self, address, polls_until_ended=1, fail_custom_ids=()):
+        super().__init__(address, BatchStubHandler)
+        self.polls_until_ended = polls_until_ended
+        self.fail_custom_ids = set(fail_custom_ids)
+        self.batches = {}
+        self.lock = threading.Lock()
+
+    @property
+    def base_url(self):
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}"
+
+
+class BatchStubHandler(BaseHTTPRequestHandler):
+    def log_message(self, format, *args):
+        pass
+
+    def _send_json(self, status, data):
+        body = json.dumps(data, ensure_ascii=False).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _batch_object(self, batch):
+        ended = batch["polls"] > self.server.polls_until_ended
+        succeeded = sum(1 for r in batch["requests"] if r["custom_id"] not in self.server.fail_custom_ids)
+        total = len(batch["requests"])
+        return {
+            "id": batch["id"],
+            "type": "message_batch",
+            "processing_status": "ended" if ended else "in_progress",
+            "request_counts": {
+                "processing": 0 if ended else total,
+                "succeeded": succeeded if ended else 0,
+                "errored": total - succeeded if ended else 0,
+                "canceled": 0,
+                "expired": 0,
+            },
+            "created_at": batch["created_at"],
+            "expires_at": batch["created_at"],
+            "ended_at": batch["created_at"] if ended else None,
+            "archived_at": None,
+            "cancel_initiated_at": None,
+            "results_url": f"{self.server.base_url}/v1/messages/batches/{batch['id']}/results" if ended else None,
+        }
+
+    def _result_line(self, request):
+        custom_id = request["custom_id"]
+        if custom_id in self.server.fail_custom_ids:
+            result = {"type": "errored", "error": {"type": "error", "error": {"type": "api_error", "message": "stub failure"}}}
+        else:
+            prompt = request["params"]["messages"][0]["content"][-1]["text"]
+            result = {
+                "type": "succeeded",
+                "message": {
+                    "id": f"msg_{uuid.uuid4().hex}",
+                    "type": "message",
+                    "role": "assistant",
+                    "model": request["params"]["model"],
+                    "content": [{"type": "text", "text": f"```\n// {custom_id}\n// {prompt[:40]}\n```"}],
+                    "stop_reason": "end_turn",
+                    "stop_sequence": None,
+                    "usage": {"input_tokens": 10, "output_tokens": 10,
+                              "cache_creation_input_tokens": 0, "cache_read_input_tokens": 0},
+                },
+            }
+        return json.dumps({"custom_id": custom_id, "result": result}, ensure_ascii=False)
+
+    def do_POST(self):
+        if self.path.rstrip("/") != "/v1/messages/batches":
+            self._send_json(404, {"type": "error", "error": {"type": "not_found_error", "message": self.path}})
+            return
+        length = int(self.headers.get("Content-Length", 0))
+        body = json.loads(self.rfile.read(length) or b"{}")
+        batch = {
+            "id": f"msgbatch_{uuid.uuid4().hex}",
+            "requests": body.get("requests", []),
+            "created_at": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+            "polls": 0,
+        }
+        with self.server.lock:
+            self.server.batches[batch["id"]] = batch
+        self._send_json(200, self._batch_object(batch))
+
+    def do_GET(self):
+        parts = self.path.split("?")[0].strip("/").split("/")
+        if len(parts) < 4 or parts[:3] != ["v1", "messages", "batches"] or parts[3] not in self.server.batches:
+            self._send_json(404, {"type": "error", "error": {"type": "not_found_error", "message": self.path}})
+            return
+        batch = self.server.batches[parts[3]]
+        if len(parts) == 5 and parts[4] == "results":
+            body = "\n".join(self._result_line(request) for request in batch["requests"]).encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", "application/binary")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+            return
+        with self.server.lock:
+            batch["polls"] += 1
+        self._send_json(200, self._batch_object(batch))
+
+
+def start_server(port=0, polls_until_ended=1, fail_custom_ids=()):
+    """
+    バックグラウンドスレッドでスタブサーバーを起動して返す関数（テスト用）
+    """
+    server = BatchStubServer(("127.0.0.1", port), polls_until_ended, fail_custom_ids)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    return server
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Message Batches API のローカル代替サーバー")
+    parser.add_argument("--port", type=int, default=8010, help="待ち受けポート")
+    parser.add_argument("--polls", type=int, default=1, help="完了までに必要な状態確認の回数")
+    args = parser.parse_args()
+
+    server = BatchStubServer(("127.0.0.1", args.port), args.polls)
+    print(f"バッチスタブサーバーを起動しました: {server.base_url}")
+    server.serve_forever()
@@ -0,0 +1,60 @@
+import importlib.util
+import os
+import time
+from types import SimpleNamespace
+
+# grimoires/meta/utils はリポジトリ直下の utils パッケージと名前が衝突するため、ストア本体はファイルパスから読み込む
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+
+
+def _load_transcript_store():
+    spec = importlib.util.spec_from_file_location(
+        "transcript_store", os.path.join(REPO_ROOT, "services", "transcript_store.py")
+    )
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+class TranscriptSession:
+    """
+    domain_exe の呼び出しをトランスクリプトに記録（record）、またはトランスクリプトから再生（replay）するクラス
+
+    バックエンドの LLM_TRANSCRIPT_MODE と同じ形式のストアを使うため、記録したファイルはどちらでも扱えます。
+    再生時は記録時のレイテンシに time_scale を掛けた時間だけ待ってから応答を返します。
+    """
+
+    def __init__(self, path, mode, time_scale=1.0):
+        if mode not in ("record", "replay"):
+            raise ValueError(f"不明なモードです: {mode}")
+        module = _load_transcript_store()
+        self.make_request_key = module.make_request_key
+        self.store = module.TranscriptStore(path)
+        self.mode = mode
+        self.time_scale = time_scale
+
+    def key(self, model, max_tokens, temperature, prompt):
+        return self.make_request_key("anthropic", model, temperature, max_tokens, prompt)
+
+    def replay(self, model, max_tokens, temperature, prompt):
+        """
+        記録済みの応答を (テキスト, usage) で返す。記録がなければ LookupError
+        """
+        entry = self.store.next_for(self.key(model, max_tokens, temperature, prompt))
+        if entry is None:
+            raise LookupError("トランスクリプトに記録されていないリクエストです")
+        time.sleep(entry["latency"] * self.time_scale)
+        input_tokens, output_tokens, cached_tokens = entry["usage"]
+        usage = SimpleNamespace(input_tokens=input_tokens, output_tokens=output_tokens,
+                                cache_read_input_tokens=cached_tokens, cache_creation_input_tokens=0)
+        return entry["response"]["generated_text"], usage
+
+    def record(self, model, max_tokens, temperature, prompt, text, usage, latency):
+        self.store.append(self.key(model, max_tokens, temperature, prompt), "anthropic", model,
+                          "domain_exe.create_file", False, latency, {
+                              "request": {"provider": "anthropic", "model": model, "temperature": temperature,
+                                          "max_tokens": max_tokens, "prompt": prompt},
+                              "response": {"generated_text": text},
+                              "usage": [getattr(usage, "input_tokens", 0) or 0, getattr(usage, "output_tokens", 0) or 0,
+                                        getattr(usage, "cache_read_input_tokens", 0) or 0],
+                          })
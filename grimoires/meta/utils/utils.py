@@ -1,8 +1,56 @@
 import os
+import threading
+import time
 import anthropic
 
 
-def generate_response(model, prompt, max_tokens, temperature):
+class UsageTracker:
+    """
+    1回の実行で消費したトークン数（プロンプトキャッシュの読み書きを含む）と呼び出しのレイテンシを集計するクラス
+    """
+
+    FIELDS = ("input_tokens", "output_tokens", "cache_creation_input_tokens", "cache_read_input_tokens")
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.totals = {field: 0 for field in self.FIELDS}
+        self.requests = 0
+        self.latencies = []
+
+    def add(self, usage, latency=None):
+        with self._lock:
+            self.requests += 1
+            for field in self.FIELDS:
+                self.totals[field] += getattr(usage, field, None) or 0
+            if latency is not None:
+                self.latencies.append(latency)
+
+    def latency_percentile(self, percentile):
+        with self._lock:
+            latencies = sorted(self.latencies)
+        if not latencies:
+            return None
+        return latencies[min(len(latencies) - 1, int(round(percentile / 100 * (len(latencies) - 1))))]
+
+    def summary(self) -> str:
+        return (
+            f"リクエスト数: {self.requests}, "
+            f"キャッシュ書き込み: {self.totals['cache_creation_input_tokens']} tokens, "
+            f"キャッシュ読み込み: {self.totals['cache_read_input_tokens']} tokens, "
+            f"通常入力: {self.totals['input_tokens']} tokens, "
+            f"出力: {self.totals['output_tokens']} tokens"
+            + (
+                f", レイテンシ p50: {self.latency_percentile(50):.1f}秒 / p95: {self.latency_percentile(95):.1f}秒"
+                if self.latencies else ""
+            )
+        )
+
+
+# 429/5xx/接続エラー時にSDKが行う指数バックオフ（ジッター付き）の再試行回数
+DEFAULT_MAX_RETRIES = 4
+
+
+def generate_response(model, prompt, max_tokens, temperature, cached_prefix=None, usage_tracker=None, max_retries=DEFAULT_MAX_RETRIES, transcript=None):
     """
     Anthropic APIを使用してプロンプトに対する応答を生成する関数。
 
@@ -11,36 +59,63 @@ def generate_response(model, prompt, max_tokens, temperature):
         prompt (str): 応答を生成するためのプロンプト
         max_tokens (int): 生成する最大トークン数
         temperature (float): 生成の温度パラメータ
+        cached_prefix (str): 複数リクエストで共通の前半部分。指定するとプロンプトキャッシュの対象ブロックとして送信する
+        usage_tracker (UsageTracker): トークン使用量を集計するオブジェクト
+        max_retries (int): 一時的なエラー（429/5xx/接続エラー）に対する再試行回数
+        transcript (TranscriptSession): 指定すると呼び出しを記録、または記録から再生する
 
     戻り値:
         str: 生成された応答テキスト
     """
+    if transcript is not None and transcript.mode == "replay":
+        started_at = time.monotonic()
+        text, usage = transcript.replay(model, max_tokens, temperature, (cached_prefix or "") + prompt)
+        if usage_tracker is not None:
+            usage_tracker.add(usage, time.monotonic() - started_at)
+        return text.strip()
+
     client = anthropic.Anthropic(
-        api_key=os.environ.get("ANTHROPIC_API_KEY")  # 環境変数からAPI keyを取得
+        api_key=os.environ.get("ANTHROPIC_API_KEY"),  # 環境変数からAPI keyを取得
+        max_retries=max_retries
     )
     # print(prompt)
 
+    content = []
+    if cached_prefix:
+        # 共通の前半部分をキャッシュ可能なブロックとして先頭に置き、2回目以降は読み込みトークンとして課金させる
+        content.append({
+            "type": "text",
+            "text": cached_prefix,
+            "cache_control": {"type": "ephemeral"}
+        })
+    content.append({
+        "type": "text",
+        "text": prompt
+    })
+
+    started_at = time.monotonic()
     response = client.messages.create(
         model=model,
         max_tokens=max_tokens,
         temperature=temperature,
         extra_headers={"anthropic-beta": 
-            "max-tokens-3-5-sonnet-2024-07-15"
+            "max-tokens-3-5-sonnet-2024-07-15,prompt-caching-2024-07-31"
         },
         messages=[
             {
                 "role": "user",
-                "content": [
-                    {
-                        "type": "text",
-                        "text": prompt
-                    }
-                ]
+                "content": content
             }
         ]
     )
 
     # print(response)
+    latency = time.monotonic() - started_at
+    if usage_tracker is not None:
+        usage_tracker.add(response.usage, latency)
+    if transcript is not None:
+        transcript.record(model, max_tokens, temperature, (cached_prefix or "") + prompt,
+                          response.content[0].text, response.usage, latency)
     
     return response.content[0].text.strip()
 
@@ -1,9 +1,14 @@
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import PlainTextResponse
 from api.routes import router
 from api.websocket import websocket_endpoint
 from utils.logging_config import setup_logging
 from api import ai_operations
+from services.http_client import close_http_client
+from services.telemetry import llm_telemetry
+from services.jobs import get_job_manager
+from services.file_watch import stop_watching as stop_file_watching
 
 app = FastAPI(
     title="AI File Operations API",
@@ -35,6 +40,23 @@ app.add_websocket_route("/ws", websocket_endpoint)
 async def root():
     return {"message": "Welcome to AI File Operations API"}
 
+# Prometheus用のLLMテレメトリ（呼び出し数・トークン数・レイテンシの分位点）
+@app.get("/metrics", response_class=PlainTextResponse)
+async def metrics():
+    return PlainTextResponse(llm_telemetry.prometheus(), media_type="text/plain; version=0.0.4")
+
+# 起動時にバックグラウンドジョブのワーカーを開始する
+@app.on_event("startup")
+async def startup_event():
+    get_job_manager().start()
+
+# 終了時にジョブのワーカーを止め、共有HTTPコネクションプールを閉じ、索引のためのファイル変更の監視を止める
+@app.on_event("shutdown")
+async def shutdown_event():
+    await get_job_manager().stop()
+    await close_http_client()
+    stop_file_watching()
+
 # ロギングの設定
 setup_logging()
 
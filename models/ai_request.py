@@ -1,8 +1,23 @@
-from pydantic import BaseModel
-from typing import List
+from pydantic import BaseModel, model_validator
+from typing import List, Optional
+
+# エンドポイントによって対応しないことがある実行オプション（対応しないモデルで指定されると検証エラーにする）
+OPTIONAL_EXECUTION_FIELDS = ("background", "stream", "max_concurrency", "file_timeout_seconds", "fail_fast", "batch_id")
 
 class AIBaseRequest(BaseModel):
     version_control: bool = False
+    use_cache: bool = True  # Falseの場合はLLMキャッシュを読まずに再生成する
+    deadline_seconds: Optional[float] = None  # リクエスト全体のLLM呼び出しの締め切り（秒）
+
+    @model_validator(mode="before")
+    @classmethod
+    def reject_unsupported_options(cls, data):
+        # 対応しないエンドポイントで指定された場合は、黙って無視せずに検証エラーにする
+        if isinstance(data, dict):
+            unsupported = [field for field in OPTIONAL_EXECUTION_FIELDS if data.get(field) not in (None, False) and field not in cls.model_fields]
+            if unsupported:
+                raise ValueError(f"{', '.join(unsupported)} はこのエンドポイントでは指定できません")
+        return data
 
 class AIAnalyzeRequest(AIBaseRequest):
     project_id: str
@@ -14,6 +29,10 @@ class AIUpdateRequest(AIBaseRequest):
     file_path: str
     change_type: str = "smart"
     feature_request: str  # 機能追加要望を格納するフィールドを追加
+    edit_mode: Optional[str] = None  # /ai-process の編集方式（script / diff、未指定ならAI_PROCESS_EDIT_MODE）
+
+class AIProcessRequest(AIUpdateRequest):
+    background: bool = False  # Trueの場合、ジョブとして登録してジョブIDを即座に返す
 
 class AIRewriteRequest(AIBaseRequest):
     project_id: str
@@ -32,22 +51,32 @@ class AIDependenciesRequest(AIBaseRequest):
 
 class MultiAIBaseRequest(AIBaseRequest):
     file_paths: List[str]
+    background: bool = False  # Trueの場合、ジョブとして登録してジョブIDを即座に返す
     execution_mode: str = "parallel"
 
-class MultiAIAnalyzeRequest(MultiAIBaseRequest):
+class MultiAIFileRequest(MultiAIBaseRequest):
+    # ファイルごとに処理する multi-ai-* のオプション
+    max_concurrency: Optional[int] = None  # parallel時の同時実行数（未指定ならMULTI_AI_MAX_CONCURRENCY）
+    file_timeout_seconds: Optional[float] = None  # 1ファイルあたりのタイムアウト（秒）
+    fail_fast: bool = False  # 最初の失敗で残りのファイルの処理を中止する
+    batch_id: Optional[str] = None  # /multi-ai-cancel/{batch_id} で中止するための識別子
+    stream: bool = False  # Trueの場合、ファイルごとの結果を完了順にNDJSONで返す
+
+class MultiAIAnalyzeRequest(MultiAIFileRequest):
     project_id: str
     analysis_depth: str = "standard"
 
-class MultiAIUpdateRequest(MultiAIBaseRequest):
+class MultiAIUpdateRequest(MultiAIFileRequest):
     project_id: str
     change_type: str = "smart"
     feature_request: str  # 機能追加要望を格納するフィールドを追加
+    edit_mode: Optional[str] = None  # /multi-ai-process の編集方式（script / diff、未指定ならAI_PROCESS_EDIT_MODE）
 
-class MultiAIRewriteRequest(MultiAIBaseRequest):
+class MultiAIRewriteRequest(MultiAIFileRequest):
     project_id: str
     rewrite_style: str = "balanced"
 
-class MultiAIAppendRequest(MultiAIBaseRequest):
+class MultiAIAppendRequest(MultiAIFileRequest):
     project_id: str
     append_location: str = "end"
 
@@ -0,0 +1,69 @@
+# gitバックエンドのベンチマークスクリプト
+# 一時ディレクトリにリポジトリを作り、1回のコミットに含めるファイル数ごとに
+# サブプロセスのバックエンドとプロセス内（gitpython）のバックエンドの所要時間を比較する
+#
+# 使い方:
+#   python scripts/git_backend_benchmark.py --files 1 10 100 --rounds 20
+import argparse
+import asyncio
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from services.git_backend import InProcessGitBackend, SubprocessGitBackend
+
+
+def create_repository(path: str, files: int):
+    os.makedirs(path)
+    for args in (["init", "-q"], ["config", "user.email", "bench@example.com"], ["config", "user.name", "bench"]):
+        subprocess.run(["git", "-C", path, *args], check=True)
+    for i in range(files):
+        with open(os.path.join(path, f"file{i}.py"), "w") as file:
+            file.write("value = 0\n")
+    subprocess.run(["git", "-C", path, "add", "."], check=True)
+    subprocess.run(["git", "-C", path, "commit", "-q", "-m", "init"], check=True)
+
+
+async def measure(backend, repo_path: str, files: int, rounds: int):
+    paths = [os.path.join(repo_path, f"file{i}.py") for i in range(files)]
+    timings = []
+    for round_index in range(rounds):
+        for path in paths:
+            with open(path, "w") as file:
+                file.write(f"value = {round_index + 1}\n")
+        started_at = time.perf_counter()
+        await backend.commit_paths(repo_path, paths, f"benchmark {round_index}")
+        timings.append(time.perf_counter() - started_at)
+    return {
+        "median_ms": round(statistics.median(timings) * 1000, 2),
+        "mean_ms": round(statistics.mean(timings) * 1000, 2),
+        "max_ms": round(max(timings) * 1000, 2),
+    }
+
+
+async def run_benchmark(file_counts, rounds: int):
+    results = []
+    with tempfile.TemporaryDirectory() as directory:
+        for files in file_counts:
+            row = {"files_per_commit": files}
+            for backend in (SubprocessGitBackend(), InProcessGitBackend()):
+                repo_path = os.path.join(directory, f"{backend.name}_{files}")
+                create_repository(repo_path, files)
+                row[backend.name] = await measure(backend, repo_path, files, rounds)
+            row["speedup"] = round(row["subprocess"]["median_ms"] / row["gitpython"]["median_ms"], 2)
+            results.append(row)
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="gitバックエンドのコミットの所要時間の比較")
+    parser.add_argument("--files", type=int, nargs="+", default=[1, 10, 100], help="1回のコミットに含めるファイル数")
+    parser.add_argument("--rounds", type=int, default=20, help="ファイル数ごとのコミット回数")
+    args = parser.parse_args()
+    print(json.dumps(asyncio.run(run_benchmark(args.files, args.rounds)), ensure_ascii=False, indent=2))
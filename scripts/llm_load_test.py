@@ -0,0 +1,74 @@
+# LLM呼び出しの負荷試験スクリプト
+# モックLLMサーバーを起動し、ルーター経由で並列にリクエストを送ってスループットとレイテンシを計測する
+#
+# 使い方:
+#   python scripts/llm_load_test.py --requests 200 --concurrency 50 --latency-median 1.0 --error-429 0.05
+import argparse
+import asyncio
+import json
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from services.mock_llm_server import MockConfig, MockLLMServer
+
+
+async def run_load(requests: int, concurrency: int, operation: str):
+    # 接続先の設定を読み込ませるため、環境変数を設定してからサービスを読み込む
+    from services.llm_router import generate_text
+    from services.telemetry import llm_telemetry
+
+    semaphore = asyncio.Semaphore(concurrency)
+    failures = 0
+
+    async def one(index: int):
+        nonlocal failures
+        async with semaphore:
+            try:
+                await generate_text(f"負荷試験リクエスト {index}", operation=operation, use_cache=False)
+            except Exception:
+                failures += 1
+
+    started_at = time.monotonic()
+    await asyncio.gather(*[one(i) for i in range(requests)])
+    elapsed = time.monotonic() - started_at
+    return {
+        "requests": requests,
+        "failures": failures,
+        "elapsed": round(elapsed, 3),
+        "throughput_rps": round(requests / elapsed, 2),
+        "telemetry": llm_telemetry.summary(),
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="モックLLMサーバーを使った負荷試験")
+    parser.add_argument("--requests", type=int, default=100, help="送信するリクエスト数")
+    parser.add_argument("--concurrency", type=int, default=20, help="同時実行数")
+    parser.add_argument("--operation", default="load_test", help="テレメトリに記録する操作名")
+    parser.add_argument("--latency-median", type=float, default=1.0, help="モックのレイテンシ中央値（秒）")
+    parser.add_argument("--latency-sigma", type=float, default=0.5, help="モックのレイテンシの対数正規分布の形状パラメータ")
+    parser.add_argument("--error-429", type=float, default=0.0, help="モックが429を返す割合")
+    parser.add_argument("--error-5xx", type=float, default=0.0, help="モックが5xxを返す割合")
+    parser.add_argument("--seed", type=int, default=0, help="乱数シード")
+    args = parser.parse_args()
+
+    server = MockLLMServer(MockConfig(
+        latency_median=args.latency_median, latency_sigma=args.latency_sigma,
+        error_429_rate=args.error_429, error_5xx_rate=args.error_5xx, retry_after=0.5, seed=args.seed,
+    )).start()
+    os.environ.update({
+        "ANTHROPIC_BASE_URL": server.base_url,
+        "OPENAI_BASE_URL": f"{server.base_url}/v1",
+        "GEMINI_BASE_URL": server.base_url,
+        "ANTHROPIC_API_KEY": os.environ.get("ANTHROPIC_API_KEY", "mock"),
+        "OPENAI_API_KEY": os.environ.get("OPENAI_API_KEY", "mock"),
+        "GEMINI_API_KEY": os.environ.get("GEMINI_API_KEY", "mock"),
+    })
+    try:
+        result = asyncio.run(run_load(args.requests, args.concurrency, args.operation))
+    finally:
+        server.stop()
+    print(json.dumps(result, ensure_ascii=False, indent=2))
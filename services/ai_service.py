@@ -1,10 +1,23 @@
 import os
-from typing import List
+import shutil
+import tempfile
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, List, Optional, Union
 import asyncio
-from services.anthropic_service import generate_text_anthropic
-from utils.version_control import version_control
+import contextvars
+from services.llm_router import generate_text
+from services.rate_limiter import llm_priority, PRIORITY_BATCH
+from services.map_reduce import fits_budget, map_chunks, map_reduce
+from services.task_executor import iter_file_tasks, run_file_tasks
+from services.dependency_index import find_project_root, get_dependency_index, render_subgraph
+from services.tree_service import get_tree
+from services.code_execution import run_python
+from config.settings import LLM_CHUNK_TOKENS, DEPENDENCY_INDEX_ENABLED, DEPENDENCY_CONTEXT_DEPTH, AI_PROCESS_EDIT_MODE
+from utils.import_graph import is_supported
+from utils.patching import PatchError, apply_edits, parse_edits, unified_diff, verify_content
+from utils.chunking import split_into_chunks, pack_files
+# 引数の version_control（bool）と名前が衝突しないよう別名で読み込む
+from utils.version_control import CommitBatch, commit_batch, find_repository, version_control as record_version
 from utils.process import process
-import subprocess
 import logging
 from utils.file_utils import get_file_path
 
@@ -13,17 +26,64 @@ logger = logging.getLogger(__name__)
 # ベースファイルパスを設定
 BASE_PATH = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
-async def ai_analyze(file_path: str, version_control: bool, analysis_depth: str):
+async def _run_multi(
+    file_paths: List[str],
+    execution_mode: str,
+    worker: Callable[[str], Awaitable[Any]],
+    max_concurrency: Optional[int],
+    file_timeout: Optional[float],
+    cancel_event: Optional[asyncio.Event],
+    fail_fast: bool,
+    stream: bool = False,
+) -> Union[List[Dict[str, Any]], AsyncIterator[Dict[str, Any]]]:
+    # 複数ファイル処理はバッチ扱いとし、単一ファイルの対話的なリクエストを優先させる
+    # parallel は同時実行数の上限付きで並行に、それ以外は1件ずつ順番に処理する
+    # 各ファイルのバージョン管理は、全ファイルの処理が終わってから1回のコミットにまとめる
+    batch = CommitBatch()
+    with llm_priority(PRIORITY_BATCH), commit_batch(batch):
+        # 呼び出し時点のコンテキスト（優先度・締め切り・プロジェクト）を各ファイルの処理に引き継ぐ
+        context = contextvars.copy_context()
+    options = {
+        "max_concurrency": max_concurrency if execution_mode == "parallel" else 1,
+        "timeout": file_timeout, "cancel_event": cancel_event, "fail_fast": fail_fast, "context": context,
+    }
+    # stream の場合は完了した順に結果を返す非同期イテレータを、そうでなければ入力順に並べた結果のリストを返す
+    if stream:
+        return _commit_after(iter_file_tasks(file_paths, worker, **options), batch)
+    try:
+        return await run_file_tasks(file_paths, worker, **options)
+    finally:
+        await batch.flush()
+
+async def _commit_after(records: AsyncIterator[Dict[str, Any]], batch: CommitBatch) -> AsyncIterator[Dict[str, Any]]:
+    try:
+        async for record in records:
+            yield record
+    finally:
+        await records.aclose()
+        await batch.flush()
+
+async def ai_analyze(file_path: str, version_control: bool, analysis_depth: str, use_cache: bool = True):
     full_path = get_file_path("", file_path, "")
     with open(full_path, 'r') as file:
         content = file.read()
     prompt = f"以下のファイル内容を{analysis_depth}の深さで分析してください：\n\n{content}"
-    result = await generate_text_anthropic(prompt)
+    if fits_budget(prompt):
+        result = await generate_text(prompt, operation="ai_analyze", use_cache=use_cache)
+    else:
+        # コンテキストに収まらない場合は構文上の区切りで分割し、部分ごとの分析を統合する
+        result = await map_reduce(
+            split_into_chunks(content, LLM_CHUNK_TOKENS, file_path),
+            lambda index, total, chunk: f"以下はファイル {file_path} の一部（{index}/{total}）です。この部分を{analysis_depth}の深さで分析してください：\n\n{chunk}",
+            lambda texts: f"ファイル {file_path} を分割して分析した結果です。これらを統合し、ファイル全体の{analysis_depth}の深さの分析としてまとめてください：\n\n"
+                          + "\n\n".join(f"## 部分{i + 1}\n{text}" for i, text in enumerate(texts)),
+            operation="ai_analyze", use_cache=use_cache,
+        )
     if version_control:
-        await version_control(file_path, "AI分析")
+        await record_version(file_path, "AI分析")
     return result
 
-async def ai_reply(file_path: str, version_control: bool, change_type: str, feature_request: str):
+async def ai_reply(file_path: str, version_control: bool, change_type: str, feature_request: str, use_cache: bool = True):
     # 機能追加系
     logger.info(f"ai_reply関数が呼び出されました。ファイルパス: {file_path}")
     full_path = get_file_path("", file_path, "")
@@ -31,8 +91,8 @@ async def ai_reply(file_path: str, version_control: bool, change_type: str, feat
         # ディレクトリかどうかをチェック
         if os.path.isdir(full_path):
             logger.info(f"{file_path}はディレクトリです。ディレクトリ用の処理を実行します。")
-            # ディレクトリの場合、直下のツリー構造を取得
-            tree_structure = get_directory_tree(full_path)
+            # ディレクトリの場合、除外ルールと上限を適用したツリー構造を取得
+            tree_structure = get_tree(full_path).text()
             
             # ディレクトリ構造と要望に基づいて返答を生成
             prompt = f"""
@@ -47,7 +107,7 @@ async def ai_reply(file_path: str, version_control: bool, change_type: str, feat
             3. 全体的なアプローチと、それがどのようにして要望を満たすか
             """
             
-            result = await generate_text_anthropic(prompt)
+            result = await generate_text(prompt, operation="ai_reply", use_cache=use_cache)
             return {"result": result, "file_path": file_path, "is_directory": True}
         
         # ファイルの場合
@@ -56,13 +116,13 @@ async def ai_reply(file_path: str, version_control: bool, change_type: str, feat
         logger.debug(f"ファイル {file_path} の内容を読み込みました")
         
         prompt = f"\n\n{content} \n\n に対して、{feature_request}"
-        logger.info(f"Anthropicに送信するプロンプトを生成しました: {prompt[:100]}...")
+        logger.info(f"LLMに送信するプロンプトを生成しました: {prompt[:100]}...")
         
-        result = await generate_text_anthropic(prompt)
-        logger.info("Anthropicからの応答を受信しました")
+        result = await generate_text(prompt, operation="ai_reply", use_cache=use_cache)
+        logger.info("LLMからの応答を受信しました")
         
         if version_control:
-            await version_control(file_path, "AI更新")
+            await record_version(file_path, "AI更新")
             logger.debug(f"ファイル {file_path} のバージョン管理を実行しました")
         
         return {"result": result, "file_path": file_path, "is_directory": False}
@@ -70,113 +130,172 @@ async def ai_reply(file_path: str, version_control: bool, change_type: str, feat
         logger.error(f"ai_reply関数でエラーが発生しました: {str(e)}")
         raise
 
-async def multi_ai_reply(file_paths: List[str], version_control: bool, change_type: str, execution_mode: str, feature_request: str):
-    tasks = [ai_reply(file_path, version_control, change_type, feature_request) for file_path in file_paths]
-    if execution_mode == "parallel":
-        results = await asyncio.gather(*tasks)
-    else:
-        results = []
-        for task in tasks:
-            results.append(await task)
-    return results
+async def multi_ai_reply(file_paths: List[str], version_control: bool, change_type: str, execution_mode: str, feature_request: str, use_cache: bool = True, max_concurrency: Optional[int] = None, file_timeout: Optional[float] = None, cancel_event: Optional[asyncio.Event] = None, fail_fast: bool = False, stream: bool = False):
+    return await _run_multi(
+        file_paths, execution_mode,
+        lambda file_path: ai_reply(file_path, version_control, change_type, feature_request, use_cache=use_cache),
+        max_concurrency, file_timeout, cancel_event, fail_fast, stream,
+    )
 
-async def ai_rewrite(file_path: str, version_control: bool, rewrite_style: str):
+def _code_only(text: str) -> str:
+    # コードブロックがあればその中身だけを、なければ応答全体をコードとして扱う
+    return process(text) if "```" in text else text.strip("\n")
+
+async def ai_rewrite(file_path: str, version_control: bool, rewrite_style: str, use_cache: bool = True):
     full_path = get_file_path("", file_path, "")
     with open(full_path, 'r') as file:
         content = file.read()
     prompt = f"以下のファイル内容を{rewrite_style}のスタイルで書き直してください：\n\n{content}"
-    result = await generate_text_anthropic(prompt)
+    if fits_budget(prompt):
+        result = await generate_text(prompt, operation="ai_rewrite", use_cache=use_cache)
+    else:
+        # 書き直しは部分ごとに独立しているため、分割して並列に書き直した結果を元の順序で連結する
+        chunks = split_into_chunks(content, LLM_CHUNK_TOKENS, file_path)
+        results = await map_chunks(
+            chunks,
+            lambda index, total, chunk: f"以下はファイル {file_path} の一部（{index}/{total}）です。前後の部分は別途書き直すので、この部分だけを{rewrite_style}のスタイルで書き直してください。説明は書かず、書き直したコードだけを1つのコードブロックで出力してください：\n\n{chunk}",
+            operation="ai_rewrite", use_cache=use_cache,
+        )
+        # 各部分の説明やコードブロックの区切りが連結後のファイルに混ざらないよう、コードだけを取り出してから連結する
+        result = {"generated_text": "\n".join(_code_only(r["generated_text"]) for r in results), "chunks": len(chunks)}
     if version_control:
-        await version_control(file_path, "AI書き直し")
+        await record_version(file_path, "AI書き直し")
     return result
 
-async def ai_append(file_path: str, version_control: bool, append_location: str):
+async def ai_append(file_path: str, version_control: bool, append_location: str, use_cache: bool = True):
     full_path = get_file_path("", file_path, "")
     with open(full_path, 'r') as file:
         content = file.read()
     prompt = f"以下のファイル内容の{append_location}に追記してください：\n\n{content}"
-    result = await generate_text_anthropic(prompt)
+    result = await generate_text(prompt, operation="ai_append", use_cache=use_cache)
     if version_control:
-        await version_control(file_path, "AI追記")
+        await record_version(file_path, "AI追記")
     return result
 
-async def ai_analyze_dependencies(file_paths: List[str], version_control: bool, analysis_scope: str):
-    contents = []
-    for file_path in file_paths:
-        full_path = get_file_path("", file_path, "")
-        with open(full_path, 'r') as file:
-            contents.append(file.read())
-    prompt = f"以下のファイル内容の依存関係を{analysis_scope}の範囲で分析してください：\n\n" + "\n\n".join(contents)
-    result = await generate_text_anthropic(prompt)
+def _dependency_context(full_paths: List[str]) -> Optional[Dict[str, Any]]:
+    # 対象がすべて索引の対象（Python / JS / TS）の場合だけ、静的解析した部分グラフを使う
+    if not DEPENDENCY_INDEX_ENABLED or not full_paths or not all(is_supported(path) for path in full_paths):
+        return None
+    root = find_project_root(os.path.commonpath(full_paths))
+    index = get_dependency_index(root)
+    graph = index.subgraph(full_paths, depth=DEPENDENCY_CONTEXT_DEPTH)
+    if len(graph["targets"]) != len(full_paths):
+        return None
+    return {"graph": graph, "text": render_subgraph(index, graph)}
+
+async def ai_analyze_dependencies(file_paths: List[str], version_control: bool, analysis_scope: str, use_cache: bool = True):
+    full_paths = [get_file_path("", file_path, "") for file_path in file_paths]
+    # 索引の初回作成はディレクトリ全体を走査するため、イベントループを止めないよう別スレッドで行う
+    context = await asyncio.to_thread(_dependency_context, full_paths)
+    result = None
+    if context is not None:
+        # ファイル全文の代わりに、import関係の部分グラフと対象ファイルの抜粋だけを渡す
+        prompt = (f"以下は静的解析で得た、対象ファイルと{DEPENDENCY_CONTEXT_DEPTH}段以内でimportする・されるファイルの依存関係グラフと、"
+                  f"対象ファイルのimport文・トップレベルの定義の抜粋です。これをもとに依存関係を{analysis_scope}の範囲で分析してください：\n\n{context['text']}")
+        if fits_budget(prompt):
+            result = await generate_text(prompt, operation="ai_analyze_dependencies", use_cache=use_cache)
+            result = {**result, "dependency_graph": context["graph"]}
+
+    if result is None:
+        result = await _analyze_dependencies_from_contents(file_paths, full_paths, analysis_scope, use_cache)
     if version_control:
         for file_path in file_paths:
-            await version_control(file_path, "AI依存関係分析")
+            await record_version(file_path, "AI依存関係分析")
     return result
 
-async def multi_ai_analyze(file_paths: List[str], version_control: bool, analysis_depth: str, execution_mode: str, ):
-    tasks = [ai_analyze(file_path, version_control, analysis_depth) for file_path in file_paths]
-    if execution_mode == "parallel":
-        results = await asyncio.gather(*tasks)
-    else:
-        results = []
-        for task in tasks:
-            results.append(await task)
-    return results
-
-async def multi_ai_reply(file_paths: List[str], version_control: bool, change_type: str, execution_mode: str, feature_request: str):
-    tasks = [ai_reply(file_path, version_control, change_type, feature_request) for file_path in file_paths]
-    if execution_mode == "parallel":
-        results = await asyncio.gather(*tasks)
-    else:
-        results = []
-        for task in tasks:
-            results.append(await task)
-    return results
-
-async def multi_ai_rewrite(file_paths: List[str], version_control: bool, rewrite_style: str, execution_mode: str):
-    tasks = [ai_rewrite(file_path, version_control, rewrite_style) for file_path in file_paths]
-    if execution_mode == "parallel":
-        results = await asyncio.gather(*tasks)
-    else:
-        results = []
-        for task in tasks:
-            results.append(await task)
-    return results
-
-async def multi_ai_append(file_paths: List[str], version_control: bool, append_location: str, execution_mode: str):
-    tasks = [ai_append(file_path, version_control, append_location) for file_path in file_paths]
-    if execution_mode == "parallel":
-        results = await asyncio.gather(*tasks)
+async def _analyze_dependencies_from_contents(file_paths: List[str], full_paths: List[str], analysis_scope: str, use_cache: bool):
+    # 索引を使えない場合は、ファイルの全文をそのまま（上限を超える場合は分割して）渡す
+    contents = []
+    for full_path in full_paths:
+        with open(full_path, 'r') as file:
+            contents.append(file.read())
+    prompt = f"以下のファイル内容の依存関係を{analysis_scope}の範囲で分析してください：\n\n" + "\n\n".join(contents)
+    if fits_budget(prompt):
+        return await generate_text(prompt, operation="ai_analyze_dependencies", use_cache=use_cache)
     else:
-        results = []
-        for task in tasks:
-            results.append(await task)
-    return results
+        # ファイルを上限に収まるグループにまとめ、グループごとの依存関係を統合する
+        groups = pack_files(list(zip(file_paths, contents)), LLM_CHUNK_TOKENS)
+        return await map_reduce(
+            ["\n\n".join(f"### {name}\n{part}" for name, part in group) for group in groups],
+            lambda index, total, chunk: f"以下はファイル群の一部（{index}/{total}）です。各ファイルが依存しているファイル・モジュールと公開しているものを{analysis_scope}の範囲で列挙してください：\n\n{chunk}",
+            lambda texts: f"ファイル群を分割して依存関係を調べた結果です。これらを統合し、全体の依存関係を{analysis_scope}の範囲で分析してください：\n\n"
+                          + "\n\n".join(f"## グループ{i + 1}\n{text}" for i, text in enumerate(texts)),
+            operation="ai_analyze_dependencies", use_cache=use_cache,
+        )
+
+async def multi_ai_analyze(file_paths: List[str], version_control: bool, analysis_depth: str, execution_mode: str, use_cache: bool = True, max_concurrency: Optional[int] = None, file_timeout: Optional[float] = None, cancel_event: Optional[asyncio.Event] = None, fail_fast: bool = False, stream: bool = False):
+    return await _run_multi(
+        file_paths, execution_mode,
+        lambda file_path: ai_analyze(file_path, version_control, analysis_depth, use_cache=use_cache),
+        max_concurrency, file_timeout, cancel_event, fail_fast, stream,
+    )
 
-async def multi_ai_analyze_dependencies(file_paths: List[str], version_control: bool, analysis_scope: str, execution_mode: str):
-    return await ai_analyze_dependencies(file_paths, version_control, analysis_scope)
+async def multi_ai_reply(file_paths: List[str], version_control: bool, change_type: str, execution_mode: str, feature_request: str, use_cache: bool = True, max_concurrency: Optional[int] = None, file_timeout: Optional[float] = None, cancel_event: Optional[asyncio.Event] = None, fail_fast: bool = False, stream: bool = False):
+    return await _run_multi(
+        file_paths, execution_mode,
+        lambda file_path: ai_reply(file_path, version_control, change_type, feature_request, use_cache=use_cache),
+        max_concurrency, file_timeout, cancel_event, fail_fast, stream,
+    )
 
+async def multi_ai_rewrite(file_paths: List[str], version_control: bool, rewrite_style: str, execution_mode: str, use_cache: bool = True, max_concurrency: Optional[int] = None, file_timeout: Optional[float] = None, cancel_event: Optional[asyncio.Event] = None, fail_fast: bool = False, stream: bool = False):
+    return await _run_multi(
+        file_paths, execution_mode,
+        lambda file_path: ai_rewrite(file_path, version_control, rewrite_style, use_cache=use_cache),
+        max_concurrency, file_timeout, cancel_event, fail_fast, stream,
+    )
 
-async def ai_process(file_path: str, version_control: bool, change_type: str, feature_request: str):
+async def multi_ai_append(file_paths: List[str], version_control: bool, append_location: str, execution_mode: str, use_cache: bool = True, max_concurrency: Optional[int] = None, file_timeout: Optional[float] = None, cancel_event: Optional[asyncio.Event] = None, fail_fast: bool = False, stream: bool = False):
+    return await _run_multi(
+        file_paths, execution_mode,
+        lambda file_path: ai_append(file_path, version_control, append_location, use_cache=use_cache),
+        max_concurrency, file_timeout, cancel_event, fail_fast, stream,
+    )
+
+async def multi_ai_analyze_dependencies(file_paths: List[str], version_control: bool, analysis_scope: str, execution_mode: str, use_cache: bool = True):
+    return await ai_analyze_dependencies(file_paths, version_control, analysis_scope, use_cache=use_cache)
+
+
+def _script_cwd(full_path: str) -> str:
+    # 対象を含むGitリポジトリのルート（リポジトリの外にある場合は対象のディレクトリ）
+    directory = full_path if os.path.isdir(full_path) else os.path.dirname(full_path)
+    repository = find_repository(os.path.join(directory, ""))
+    # find_repository は見つからない場合にサーバーのカレントディレクトリを返すため、対象を含むリポジトリかどうかを確かめる
+    if not os.path.exists(os.path.join(repository, ".git")) or os.path.commonpath([repository, directory]) != repository:
+        return directory
+    return repository
+
+
+async def ai_process(file_path: str, version_control: bool, change_type: str, feature_request: str, use_cache: bool = True, edit_mode: Optional[str] = None):
     # 機能追加系
     full_path = get_file_path("", file_path, "")
+    edit_mode = edit_mode or AI_PROCESS_EDIT_MODE
+    # diff方式はファイル単位の編集なので、ディレクトリはスクリプト方式で扱う
+    if edit_mode == "diff" and os.path.isfile(full_path):
+        result = await _ai_process_diff(file_path, full_path, feature_request, use_cache)
+        if version_control and result["applied"]:
+            logger.info(f"バージョン管理を実行します: {file_path}")
+            await record_version(file_path, "AI更新")
+        return {"result": result, "file_path": file_path, "is_directory": False}
     
     # ディレクトリかどうかをチェック
     if os.path.isdir(full_path):
-        # ディレクトリの場合、直下のツリー構造を取得
-        tree_structure = get_directory_tree(full_path)
+        # ディレクトリの場合、除外ルールと上限を適用したツリー構造を取得
+        tree_structure = get_tree(full_path).text()
         content = tree_structure
     else:
         # ファイルの場合は内容を読み込む
         with open(full_path, 'r') as file:
             content = file.read()
 
+    # スクリプトの中のgit操作が対象のリポジトリに対して行われるよう、リポジトリのルートをカレントディレクトリにして実行する
+    script_cwd = _script_cwd(full_path)
     python_process_prompt = f"""
     ファイルの書き込みはpythonファイルを作成します。
     - 1枚のファイルで書いてください。複数に分けてはいけません。
 
     - ... (他の既存のコードは変更なし)などは書かない。絶対に省略しない
     - 変更前にgit保存。変更後はgit保存しない
+    - スクリプトは {script_cwd} をカレントディレクトリとして実行される
     - python subprocess モジュール使用
     - {full_path}への直接書き込み
     - プログラムは全文出力し、コードブロックで囲うこと。省略は一切しない。
@@ -184,64 +303,102 @@ async def ai_process(file_path: str, version_control: bool, change_type: str, fe
     prompt = f"""\n\n{content} \n\n に対して、{feature_request} を実現するコードを提案してください。
     """ + python_process_prompt
 
-    logger.info(f"Anthropicからテキストを生成します。プロンプト: {prompt[:100]}...")
-    result = await generate_text_anthropic(prompt)
+    logger.info(f"LLMからテキストを生成します。プロンプト: {prompt[:100]}...")
+    result = await generate_text(prompt, operation="ai_process", use_cache=use_cache)
     text = result['generated_text']
-    logger.info("Anthropicからのテキスト生成が完了しました。")
+    logger.info("LLMからのテキスト生成が完了しました。")
 
     logger.info("生成されたテキストを処理します。")
     code = process(text)
 
     logger.info("テスト処理が完了しました。")
     
-    # 現在の日付と時刻を取得
-    import datetime
-    current_datetime = datetime.datetime.now().strftime("%Y%m%d_%H%M%S")
-    
-    # 一時ファイル名を生成
-    temp_file_name = f"../.history/{current_datetime}.py"
-    logger.info(f"一時ファイル名を生成しました: {temp_file_name}")
-    
-    # 一時ファイルにコードを書き込む
-    os.makedirs(os.path.dirname(temp_file_name), exist_ok=True)
-    with open(temp_file_name, 'w') as temp_file:
-        temp_file.write(code)
-    logger.info(f"コードを一時ファイルに書き込みました: {temp_file_name}")
-    
-    # サブプロセスでコードを実行
-    try:
-        logger.info("サブプロセスでコードを実行します。")
-        output = subprocess.check_output(['python', temp_file_name], stderr=subprocess.STDOUT, universal_newlines=True)
-        result = {"generated_text": code, "execution_output": output}
+    # 実行ごとの作業ディレクトリでイベントループを止めずに実行する（出力はジョブの進捗として送られる）
+    logger.info("サブプロセスでコードを実行します。")
+    execution = await run_python(code, label=file_path, cwd=script_cwd)
+    if execution["returncode"] == 0:
+        result = {"generated_text": code, "execution_output": execution["output"]}
         logger.info("コードの実行が成功しました。")
-    except subprocess.CalledProcessError as e:
-        logger.error(f"コードの実行中にエラーが発生しました: {e}")
-        result = {"generated_text": code, "execution_error": e.output}
+    else:
+        logger.error(f"コードの実行中にエラーが発生しました: returncode={execution['returncode']}, limit={execution['limit']}")
+        error = execution["output"]
+        if execution["limit"] == "timeout":
+            error += "\n実行がタイムアウトしました"
+        elif execution["limit"] == "cpu":
+            error += "\nCPU時間の上限を超えました"
+        result = {"generated_text": code, "execution_error": error}
+    result["execution"] = {key: execution[key] for key in ("run_id", "workspace", "returncode", "limit", "elapsed")}
     
     if version_control:
         logger.info(f"バージョン管理を実行します: {file_path}")
-        await version_control(file_path, "AI更新")
+        await record_version(file_path, "AI更新")
 
     logger.info(f"処理が完了しました: {file_path}")
     return {"result": result, "file_path": file_path, "is_directory": os.path.isdir(full_path)}
 
-def get_directory_tree(path, level=0):
-    tree = ""
-    for item in os.listdir(path):
-        item_path = os.path.join(path, item)
-        if os.path.isdir(item_path):
-            tree += "    " * level + f"📁 {item}/\n"
-            tree += get_directory_tree(item_path, level + 1)
-        else:
-            tree += "    " * level + f"📄 {item}\n"
-    return tree
-
-async def multi_ai_process(file_paths: List[str], version_control: bool, change_type: str, execution_mode: str, feature_request: str):
-    tasks = [ai_process(file_path, version_control, change_type, feature_request) for file_path in file_paths]
-    if execution_mode == "parallel":
-        results = await asyncio.gather(*tasks)
-    else:
-        results = []
-        for task in tasks:
-            results.append(await task)
-    return results
\ No newline at end of file
+async def _ai_process_diff(file_path: str, full_path: str, feature_request: str, use_cache: bool) -> Dict[str, Any]:
+    # ファイル全体ではなく変更箇所だけを出力させ、ローカルで適用する（生成されたコードは実行しない）
+    with open(full_path, 'r', encoding='utf-8', newline='') as file:
+        content = file.read()
+    prompt = f"""以下のファイル {os.path.basename(full_path)} に対して、{feature_request} を実現する変更を提案してください。
+
+ファイルの内容:
+{content}
+
+変更はファイル全体ではなく、変更箇所だけを次の形式のブロックで出力してください。
+<<<<<<< SEARCH
+（既存のコードのうち変更する部分。一字一句そのままコピーし、一意に特定できるよう前後の行も含める）
+=======
+（置き換え後のコード）
+>>>>>>> REPLACE
+
+- 複数箇所を変更する場合はブロックを複数出力する
+- 末尾に追加する場合は SEARCH を空にする
+- ブロック以外の説明は不要
+"""
+    logger.info(f"LLMから変更箇所を生成します: {file_path}")
+    generated = await generate_text(prompt, operation="ai_process_diff", use_cache=use_cache)
+    text = generated['generated_text']
+    try:
+        edit_format, edits = parse_edits(text)
+    except PatchError as e:
+        logger.error(f"変更箇所を解釈できませんでした: {file_path}: {str(e)}")
+        return {"generated_text": text, "applied": False, "execution_error": str(e), "edit_report": []}
+
+    updated, report = apply_edits(content, edits)
+    failed = [edit for edit in report if edit["status"] == "failed"]
+    # 一部でも適用できない、または構文として壊れる場合はファイルを変更しない
+    error = f"{len(failed)}件の変更を適用できませんでした" if failed else verify_content(full_path, updated)
+    result = {"generated_text": text, "edit_format": edit_format, "edit_report": report, "applied": error is None}
+    if error is not None:
+        logger.error(f"変更を適用しませんでした: {file_path}: {error}")
+        result["execution_error"] = error
+        return result
+    # 同じファイルへの並行した編集と一時ファイルが重ならないよう、一時ファイルは呼び出しごとに別の名前で作る
+    with tempfile.NamedTemporaryFile('w', encoding='utf-8', newline='', dir=os.path.dirname(full_path), prefix=f".{os.path.basename(full_path)}.", suffix=".tmp", delete=False) as file:
+        file.write(updated)
+        temp_path = file.name
+    try:
+        shutil.copymode(full_path, temp_path)
+        # LLMの応答を待つ間にファイルが変更されていれば、その変更を上書きしないよう適用をやめる
+        with open(full_path, 'r', encoding='utf-8', newline='') as file:
+            current = file.read()
+        if current != content:
+            error = "変更の生成中にファイルが更新されたため適用しませんでした"
+            logger.error(f"変更を適用しませんでした: {file_path}: {error}")
+            result.update({"applied": False, "execution_error": error})
+            return result
+        os.replace(temp_path, full_path)
+    finally:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+    result["diff"] = unified_diff(content, updated, os.path.basename(full_path))
+    logger.info(f"{len(report)}件の変更を適用しました: {file_path}")
+    return result
+
+async def multi_ai_process(file_paths: List[str], version_control: bool, change_type: str, execution_mode: str, feature_request: str, use_cache: bool = True, max_concurrency: Optional[int] = None, file_timeout: Optional[float] = None, cancel_event: Optional[asyncio.Event] = None, fail_fast: bool = False, stream: bool = False, edit_mode: Optional[str] = None):
+    return await _run_multi(
+        file_paths, execution_mode,
+        lambda file_path: ai_process(file_path, version_control, change_type, feature_request, use_cache=use_cache, edit_mode=edit_mode),
+        max_concurrency, file_timeout, cancel_event, fail_fast, stream,
+    )
\ No newline at end of file
@@ -1,28 +1,95 @@
-from anthropic import Anthropic
-import asyncio
+from anthropic import AsyncAnthropic
 import logging
+from config.settings import ANTHROPIC_API_KEY, ANTHROPIC_BASE_URL
+from services.http_client import http_client
+from services.llm_cache import cached_generate, cached_stream
+from services.rate_limiter import llm_scheduler
+from services.resilience import resilient_call, resilient_stream
+from services.telemetry import note_usage, track_llm_call, track_llm_stream
+from services.llm_transcript import transcript_generate, transcript_stream
+from utils.tokens import estimate_tokens
 
 logger = logging.getLogger(__name__)
 
-anthropic_client = Anthropic()
+# レート制限はスケジューラーが待ち行列に戻し、接続エラーなどの一時的な失敗は resilient_call が再試行するため、SDK内部のリトライは無効にする
+anthropic_client = AsyncAnthropic(api_key=ANTHROPIC_API_KEY, base_url=ANTHROPIC_BASE_URL, http_client=http_client, max_retries=0)
+
+ANTHROPIC_MODEL = "claude-3-5-sonnet-20240620"
+ANTHROPIC_MAX_TOKENS = 8192
+ANTHROPIC_TEMPERATURE = 0.7
+
+async def generate_text_anthropic(prompt: str, use_cache: bool = True):
+    logger.debug(f"Anthropicリクエストを受信: prompt={prompt}")
+
+    async def _generate():
+        message = await resilient_call("anthropic", lambda: llm_scheduler.run(
+            "anthropic", ANTHROPIC_API_KEY, estimate_tokens(prompt),
+            lambda: anthropic_client.messages.create(
+                model=ANTHROPIC_MODEL,
+                max_tokens=ANTHROPIC_MAX_TOKENS,
+                temperature=ANTHROPIC_TEMPERATURE,
+                messages=[
+                    {"role": "user", "content": prompt}
+                ],
+                extra_headers={"anthropic-beta":
+"max-tokens-3-5-sonnet-2024-07-15"}
+            )
+        ))
+        llm_scheduler.record_usage("anthropic", ANTHROPIC_API_KEY, message.usage.output_tokens)
+        note_usage(message.usage.input_tokens, message.usage.output_tokens, getattr(message.usage, "cache_read_input_tokens", 0))
+        logger.info("Anthropicでテキスト生成成功")
+        logger.debug(message.content[0].text)
+        return {"generated_text": message.content[0].text}
 
-async def generate_text_anthropic(prompt: str):
-    logger.info(f"Anthropicリクエストを受信: prompt={prompt}")
     try:
-        message = await asyncio.to_thread(
-            anthropic_client.messages.create,
-            model="claude-3-5-sonnet-20240620",
-            max_tokens=8192,
-            temperature=0.7,
+        async with track_llm_call("anthropic", ANTHROPIC_MODEL) as trace:
+            result = await cached_generate(
+                "anthropic", ANTHROPIC_MODEL, ANTHROPIC_TEMPERATURE, ANTHROPIC_MAX_TOKENS,
+                prompt, lambda: transcript_generate("anthropic", ANTHROPIC_MODEL, ANTHROPIC_TEMPERATURE, ANTHROPIC_MAX_TOKENS, prompt, _generate),
+                use_cache=use_cache
+            )
+            trace.mark_result(result)
+            return result
+    except Exception as e:
+        logger.error(f"Anthropicでのテキスト生成中にエラーが発生: {str(e)}")
+        raise
+
+async def stream_text_anthropic(prompt: str, use_cache: bool = True):
+    """
+    Anthropicの生成結果をトークンが届き次第チャンク単位で返す非同期ジェネレータ
+    """
+    logger.debug(f"Anthropicストリーミングリクエストを受信: prompt={prompt}")
+
+    async def _stream(trace):
+        trace.status = "ok"
+        async with anthropic_client.messages.stream(
+            model=ANTHROPIC_MODEL,
+            max_tokens=ANTHROPIC_MAX_TOKENS,
+            temperature=ANTHROPIC_TEMPERATURE,
             messages=[
                 {"role": "user", "content": prompt}
             ],
             extra_headers={"anthropic-beta":
 "max-tokens-3-5-sonnet-2024-07-15"}
-        )
-        logger.info("Anthropicでテキスト生成成功")
-        logger.info(message.content[0].text)
-        return {"generated_text": message.content[0].text}
+        ) as stream:
+            async for text in stream.text_stream:
+                yield text
+            message = await stream.get_final_message()
+        llm_scheduler.record_usage("anthropic", ANTHROPIC_API_KEY, message.usage.output_tokens)
+        trace.add_usage(message.usage.input_tokens, message.usage.output_tokens, getattr(message.usage, "cache_read_input_tokens", 0))
+        logger.info("Anthropicでストリーミング生成成功")
+
+    try:
+        async for chunk in track_llm_stream("anthropic", ANTHROPIC_MODEL, lambda trace: cached_stream(
+            "anthropic", ANTHROPIC_MODEL, ANTHROPIC_TEMPERATURE, ANTHROPIC_MAX_TOKENS,
+            prompt, lambda: transcript_stream(
+                "anthropic", ANTHROPIC_MODEL, ANTHROPIC_TEMPERATURE, ANTHROPIC_MAX_TOKENS,
+                prompt, lambda: resilient_stream("anthropic", lambda: llm_scheduler.stream(
+                    "anthropic", ANTHROPIC_API_KEY, estimate_tokens(prompt), lambda: _stream(trace)
+                )), trace
+            ), use_cache=use_cache
+        )):
+            yield chunk
     except Exception as e:
-        logger.error(f"Anthropicでのテキスト生成中にエラーが発生: {str(e)}")
-        raise
\ No newline at end of file
+        logger.error(f"Anthropicでのストリーミング生成中にエラーが発生: {str(e)}")
+        raise
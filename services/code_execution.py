@@ -1,23 +1,260 @@
 # コード実行サービス
-# 依存: utils.security
-def dummy_code_execution():
-    pass
+# LLMが生成したスクリプトを、実行ごとの作業ディレクトリ・時間とメモリの上限・同時実行数の上限付きでサブプロセスとして実行する
+import asyncio
+import contextvars
+import datetime
+import logging
+import os
+import shutil
+import signal
+import sys
+import time
+import uuid
+import weakref
+from contextlib import contextmanager
+from typing import Any, Awaitable, Callable, Dict, Optional, Set
 
+from config.settings import (
+    CODE_EXEC_WORKSPACE_DIR, CODE_EXEC_KEEP_RUNS, CODE_EXEC_MAX_CONCURRENCY, CODE_EXEC_TIMEOUT, CODE_EXEC_CPU_SECONDS,
+    CODE_EXEC_MEMORY_MB, CODE_EXEC_MAX_OUTPUT_BYTES,
+)
 
-# 追記された内容:
-# # コード実行サービス
-# # 依存: utils.security
-# def dummy_code_execution():
-#     pass
-# 
+try:
+    import resource
+except ImportError:  # Windows では rlimit を使えないため、実時間のタイムアウトだけを適用する
+    resource = None
 
-# 追記された内容:
-# コード実行サービス
-def dummy_code_execution():
-    pass
+logger = logging.getLogger(__name__)
 
+# 実行中の出力を1行ずつ受け取るコールバック（{"run_id", "label", "output"} を受け取る）
+OutputHandler = Callable[[Dict[str, Any]], Awaitable[None]]
 
-# 追記された内容:
-# コード実行サービス
-def dummy_code_execution():
-    pass
+current_output_handler: contextvars.ContextVar = contextvars.ContextVar("code_execution_output", default=None)
+
+
+@contextmanager
+def execution_output(handler: Optional[OutputHandler]):
+    """
+    ブロック内で実行されるスクリプトの出力の送り先を設定するコンテキストマネージャ
+    """
+    token = current_output_handler.set(handler)
+    try:
+        yield
+    finally:
+        current_output_handler.reset(token)
+
+
+def _limit_resources(cpu_seconds: int, memory_mb: int):
+    # 子プロセスで exec の直前に呼ばれる（CPU時間を超えると SIGXCPU、メモリの上限を超えると確保に失敗する）
+    if cpu_seconds:
+        resource.setrlimit(resource.RLIMIT_CPU, (cpu_seconds, cpu_seconds + 1))
+    if memory_mb:
+        limit = memory_mb * 1024 * 1024
+        resource.setrlimit(resource.RLIMIT_AS, (limit, limit))
+
+
+def _children_cpu_seconds() -> float:
+    # 終了を待ち終えた子プロセスが使ったCPU時間の合計
+    usage = resource.getrusage(resource.RUSAGE_CHILDREN)
+    return usage.ru_utime + usage.ru_stime
+
+
+class CodeExecutor:
+    """
+    生成されたPythonスクリプトをイベントループを止めずに実行するサービス
+
+    実行ごとに一意な作業ディレクトリを作ってスクリプトを保存し、cwd を指定しなければそこをカレントディレクトリとして実行します。
+    作業ディレクトリは新しいものから keep_runs 件だけを残し、それより古いものは実行のたびに削除します。
+    同時に実行するスクリプトは max_concurrency 件までで、それを超える実行は空きを待ちます。
+    実時間のタイムアウトを超えたスクリプトはプロセスグループごと終了させます。
+    """
+
+    def __init__(
+        self,
+        workspace_dir: str = CODE_EXEC_WORKSPACE_DIR,
+        keep_runs: int = CODE_EXEC_KEEP_RUNS,
+        max_concurrency: int = CODE_EXEC_MAX_CONCURRENCY,
+        timeout: float = CODE_EXEC_TIMEOUT,
+        cpu_seconds: int = CODE_EXEC_CPU_SECONDS,
+        memory_mb: int = CODE_EXEC_MEMORY_MB,
+        max_output_bytes: int = CODE_EXEC_MAX_OUTPUT_BYTES,
+    ):
+        self.workspace_dir = workspace_dir
+        self.keep_runs = keep_runs
+        self.max_concurrency = max(1, max_concurrency)
+        self.timeout = timeout
+        self.cpu_seconds = cpu_seconds
+        self.memory_mb = memory_mb
+        self.max_output_bytes = max_output_bytes
+        # セマフォはイベントループに結び付くため、ループごとに作る
+        self._semaphores: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, asyncio.Semaphore]" = weakref.WeakKeyDictionary()
+        self._running = 0
+        # 実行中（実行待ちを含む）の作業ディレクトリは古くても削除しない
+        self._active: Set[str] = set()
+        self.stats = {"runs": 0, "succeeded": 0, "failed": 0, "timeouts": 0, "removed_workspaces": 0}
+
+    def _semaphore(self) -> asyncio.Semaphore:
+        loop = asyncio.get_running_loop()
+        semaphore = self._semaphores.get(loop)
+        if semaphore is None:
+            semaphore = self._semaphores[loop] = asyncio.Semaphore(self.max_concurrency)
+        return semaphore
+
+    def create_workspace(self) -> str:
+        # 名前の順が実行を始めた順になるようマイクロ秒までの時刻で始め、並行実行での衝突を避けるため乱数の接尾辞を付ける
+        run_id = f"{datetime.datetime.now().strftime('%Y%m%d_%H%M%S_%f')}_{uuid.uuid4().hex[:8]}"
+        workspace = os.path.join(self.workspace_dir, run_id)
+        os.makedirs(workspace)
+        return workspace
+
+    def cleanup_workspaces(self) -> int:
+        """
+        新しいものから keep_runs 件を超える作業ディレクトリを削除する（戻り値は削除した件数）
+        """
+        if self.keep_runs <= 0:
+            return 0
+        try:
+            # 名前は実行を始めた時刻から始まるため、名前順が古い順になる
+            runs = sorted(entry.name for entry in os.scandir(self.workspace_dir) if entry.is_dir(follow_symlinks=False))
+        except FileNotFoundError:
+            return 0
+        removed = 0
+        for run_id in runs[:max(0, len(runs) - self.keep_runs)]:
+            workspace = os.path.join(self.workspace_dir, run_id)
+            if workspace in self._active:
+                continue
+            shutil.rmtree(workspace, ignore_errors=True)
+            removed += 1
+        if removed:
+            self.stats["removed_workspaces"] += removed
+            logger.info(f"古い作業ディレクトリを{removed}件削除しました: {self.workspace_dir}")
+        return removed
+
+    async def run_python(
+        self,
+        code: str,
+        label: Optional[str] = None,
+        timeout: Optional[float] = None,
+        on_output: Optional[OutputHandler] = None,
+        cwd: Optional[str] = None,
+    ) -> Dict[str, Any]:
+        """
+        Pythonのコードを作業ディレクトリに保存して実行する（cwd を指定した場合はそこをカレントディレクトリとして実行する）
+
+        Returns:
+            {"run_id", "workspace", "returncode", "output", "timed_out", "limit", "truncated", "elapsed"}
+            limit は上限により打ち切られた場合の理由（"timeout" / "cpu"）、それ以外は None
+        """
+        timeout = self.timeout if timeout is None else timeout
+        on_output = on_output or current_output_handler.get()
+        workspace = self.create_workspace()
+        run_id = os.path.basename(workspace)
+        script_path = os.path.join(workspace, "script.py")
+        with open(script_path, "w") as script:
+            script.write(code)
+
+        self._active.add(workspace)
+        try:
+            async with self._semaphore():
+                self._running += 1
+                self.stats["runs"] += 1
+                start = time.monotonic()
+                try:
+                    result = await self._execute(script_path, cwd or workspace, timeout, label, run_id, on_output)
+                finally:
+                    self._running -= 1
+        finally:
+            self._active.discard(workspace)
+            await asyncio.to_thread(self.cleanup_workspaces)
+        result.update({"run_id": run_id, "workspace": workspace, "elapsed": time.monotonic() - start})
+
+        if result["limit"] == "timeout":
+            self.stats["timeouts"] += 1
+        self.stats["succeeded" if result["returncode"] == 0 else "failed"] += 1
+        logger.info(f"スクリプトの実行が終了しました: run_id={run_id}, returncode={result['returncode']}, limit={result['limit']}, elapsed={result['elapsed']:.2f}s")
+        return result
+
+    async def _execute(self, script_path: str, cwd: str, timeout: float, label: Optional[str], run_id: str, on_output: Optional[OutputHandler]) -> Dict[str, Any]:
+        options: Dict[str, Any] = {}
+        if os.name == "posix":
+            # タイムアウト時にスクリプトが起動した子プロセスもまとめて終了させるため、新しいセッションで起動する
+            options["start_new_session"] = True
+            if resource is not None and (self.cpu_seconds or self.memory_mb):
+                options["preexec_fn"] = lambda: _limit_resources(self.cpu_seconds, self.memory_mb)
+        cpu_before = _children_cpu_seconds() if resource is not None else 0.0
+        process = await asyncio.create_subprocess_exec(
+            sys.executable, script_path,
+            cwd=cwd,
+            stdin=asyncio.subprocess.DEVNULL,
+            stdout=asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.STDOUT,
+            **options,
+        )
+        chunks = []
+        size = 0
+        truncated = False
+
+        async def read_output():
+            nonlocal size, truncated
+            while True:
+                line = await process.stdout.readline()
+                if not line:
+                    break
+                text = line.decode("utf-8", errors="replace")
+                # 上限を超えた出力は保持も送信もしないが、パイプが詰まらないよう読み続ける
+                if size + len(line) > self.max_output_bytes:
+                    truncated = True
+                    continue
+                size += len(line)
+                chunks.append(text)
+                if on_output is not None:
+                    try:
+                        await on_output({"run_id": run_id, "label": label, "output": text})
+                    except Exception as e:
+                        logger.error(f"実行中の出力の送信に失敗しました: {str(e)}")
+            await process.wait()
+
+        limit = None
+        try:
+            await asyncio.wait_for(read_output(), timeout or None)
+        except asyncio.TimeoutError:
+            limit = "timeout"
+            logger.warning(f"スクリプトが{timeout}秒以内に終了しなかったため終了させます: run_id={run_id}")
+            self._kill(process)
+            await process.wait()
+        except asyncio.CancelledError:
+            self._kill(process)
+            raise
+        if limit is None and resource is not None and self.cpu_seconds:
+            # SIGKILL はメモリ不足や外部からの終了でも送られるため、CPU時間を使い切っていた場合だけCPU時間の上限とみなす
+            # （他の実行と同時に終了した子プロセスの分が混ざることがあるため、目安として扱う）
+            if process.returncode == -signal.SIGXCPU or (
+                process.returncode == -signal.SIGKILL and _children_cpu_seconds() - cpu_before >= self.cpu_seconds
+            ):
+                limit = "cpu"
+        output = "".join(chunks)
+        if truncated:
+            output += f"\n...（出力が{self.max_output_bytes}バイトを超えたため以降を省略）"
+        return {"returncode": process.returncode, "output": output, "timed_out": limit is not None, "limit": limit, "truncated": truncated}
+
+    @staticmethod
+    def _kill(process: asyncio.subprocess.Process):
+        if process.returncode is not None:
+            return
+        try:
+            if os.name == "posix":
+                os.killpg(process.pid, signal.SIGKILL)
+            else:
+                process.kill()
+        except ProcessLookupError:
+            pass
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {**self.stats, "running": self._running, "max_concurrency": self.max_concurrency, "keep_runs": self.keep_runs}
+
+
+code_executor = CodeExecutor()
+
+
+async def run_python(code: str, **options) -> Dict[str, Any]:
+    return await code_executor.run_python(code, **options)
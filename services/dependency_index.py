@@ -0,0 +1,360 @@
+import logging
+import os
+import threading
+from typing import Any, Dict, Iterable, List, Optional, Set, Tuple
+
+from config.settings import DEPENDENCY_INDEX_WATCH, DEPENDENCY_INDEX_MAX_FILE_BYTES
+from services.file_watch import is_watching, start_watching, subscribe
+from utils.import_graph import ImportRef, is_supported, outline, parse_imports, resolve_import, to_relative
+
+logger = logging.getLogger(__name__)
+
+# 依存関係の索引から除外するディレクトリ
+IGNORED_DIRS = {"node_modules", ".git", "__pycache__", ".venv", "venv", ".next", "dist", "build", ".babel_cache"}
+
+# プロジェクトのルートを示すファイル
+ROOT_MARKERS = (".git", "package.json", "pyproject.toml", "setup.py", "requirements.txt")
+
+
+class _Entry:
+    def __init__(self, mtime: float, refs: List[ImportRef], error: Optional[str] = None):
+        self.mtime = mtime
+        self.refs = refs
+        self.error = error
+
+
+class DependencyIndex:
+    """
+    プロジェクト内のファイル間のimport関係の索引
+
+    ファイルごとのimport指定子（解析結果）を保持し、ファイルの追加・変更・削除のたびにそのファイルだけを解析し直します。
+    指定子からファイルへの解決は軽いため、ファイル構成が変わったときにまとめてやり直します。
+    watchdogのスレッドからも更新されるため、操作はすべてロック内で行います。
+    """
+
+    def __init__(self, root: str):
+        self.root = os.path.abspath(root)
+        self._lock = threading.RLock()
+        self._files: Dict[str, _Entry] = {}
+        self._graph: Optional[Tuple[Dict[str, Dict[str, str]], Dict[str, Dict[str, str]], Dict[str, Set[str]]]] = None
+        self.version = 0
+        self.stats = {"parsed": 0, "events": 0, "refreshes": 0}
+
+    def _relative(self, path: str) -> Optional[str]:
+        path = os.path.abspath(path if os.path.isabs(path) else os.path.join(self.root, path))
+        if os.path.commonpath([self.root, path]) != self.root:
+            return None
+        relative = to_relative(self.root, path)
+        if not is_supported(relative) or any(part in IGNORED_DIRS for part in relative.split("/")[:-1]):
+            return None
+        return relative
+
+    def _walk(self) -> Iterable[Tuple[str, float]]:
+        for directory, dirnames, filenames in os.walk(self.root):
+            dirnames[:] = [name for name in dirnames if name not in IGNORED_DIRS]
+            for filename in filenames:
+                if is_supported(filename):
+                    path = os.path.join(directory, filename)
+                    try:
+                        stat = os.stat(path)
+                    except OSError:
+                        continue
+                    if stat.st_size <= DEPENDENCY_INDEX_MAX_FILE_BYTES:
+                        yield to_relative(self.root, path), stat.st_mtime
+
+    def _parse(self, relative: str, mtime: float):
+        try:
+            with open(os.path.join(self.root, relative), "r", encoding="utf-8", errors="replace") as file:
+                source = file.read()
+            entry = _Entry(mtime, parse_imports(relative, source))
+        except (OSError, SyntaxError, ValueError) as e:
+            entry = _Entry(mtime, [], error=str(e))
+        self._files[relative] = entry
+        self.stats["parsed"] += 1
+
+    def _changed(self):
+        self.version += 1
+        # 解決済みのグラフは破棄し、次の問い合わせで作り直す（解析済みの指定子を解決し直すだけなので安価）
+        self._graph = None
+
+    def refresh(self) -> int:
+        """
+        ディレクトリを走査し、更新日時が変わったファイルだけを解析し直す（戻り値は更新したファイル数）
+        """
+        with self._lock:
+            self.stats["refreshes"] += 1
+            seen = set()
+            updated = 0
+            for relative, mtime in self._walk():
+                seen.add(relative)
+                entry = self._files.get(relative)
+                if entry is None or entry.mtime != mtime:
+                    self._parse(relative, mtime)
+                    updated += 1
+            removed = set(self._files) - seen
+            for relative in removed:
+                del self._files[relative]
+            if updated or removed:
+                self._changed()
+            return updated + len(removed)
+
+    def update_file(self, path: str):
+        with self._lock:
+            relative = self._relative(path)
+            if relative is None:
+                return
+            full_path = os.path.join(self.root, relative)
+            try:
+                stat = os.stat(full_path)
+            except OSError:
+                self.remove_file(path)
+                return
+            if stat.st_size > DEPENDENCY_INDEX_MAX_FILE_BYTES:
+                self.remove_file(path)
+                return
+            self._parse(relative, stat.st_mtime)
+            self._changed()
+
+    def remove_file(self, path: str):
+        with self._lock:
+            relative = self._relative(path)
+            if relative is not None and self._files.pop(relative, None) is not None:
+                self._changed()
+
+    def apply_event(self, event_type: str, src_path: str, dest_path: Optional[str] = None):
+        """
+        ファイル変更イベント（created / modified / deleted / moved）を索引に反映する
+        """
+        with self._lock:
+            self.stats["events"] += 1
+            if event_type == "deleted":
+                self.remove_file(src_path)
+            elif event_type == "moved":
+                self.remove_file(src_path)
+                if dest_path:
+                    self.update_file(dest_path)
+            elif event_type in ("created", "modified"):
+                self.update_file(src_path)
+
+    def _build_graph(self):
+        if self._graph is not None:
+            return self._graph
+        files = self._files
+        edges: Dict[str, Dict[str, str]] = {relative: {} for relative in files}
+        reverse: Dict[str, Dict[str, str]] = {relative: {} for relative in files}
+        external: Dict[str, Set[str]] = {relative: set() for relative in files}
+        for relative, entry in files.items():
+            for spec, kind in entry.refs:
+                target, package = resolve_import(spec, kind, relative, files.__contains__)
+                if target is not None:
+                    # 同じファイルへのimportが複数ある場合は最初に見つかった種類を残す
+                    edges[relative].setdefault(target, kind)
+                    reverse[target].setdefault(relative, kind)
+                elif package is not None:
+                    external[relative].add(package)
+        self._graph = (edges, reverse, external)
+        return self._graph
+
+    def _traverse(self, table: Dict[str, Dict[str, str]], starts: Iterable[str], depth: Optional[int]) -> List[str]:
+        frontier = [start for start in starts if start in table]
+        seen = set(frontier)
+        level = 0
+        while frontier and (depth is None or level < depth):
+            next_frontier = []
+            for relative in frontier:
+                for neighbor in table[relative]:
+                    if neighbor not in seen:
+                        seen.add(neighbor)
+                        next_frontier.append(neighbor)
+            frontier = next_frontier
+            level += 1
+        return sorted(seen - set(starts))
+
+    def has_file(self, path: str) -> bool:
+        relative = self._relative(path)
+        with self._lock:
+            return relative is not None and relative in self._files
+
+    def dependencies(self, path: str, depth: Optional[int] = 1) -> List[str]:
+        """
+        ファイルがimportしているプロジェクト内のファイル（depth=None で推移的にすべて）
+        """
+        with self._lock:
+            return self._traverse(self._build_graph()[0], [self._relative(path)], depth)
+
+    def dependents(self, path: str, depth: Optional[int] = 1) -> List[str]:
+        """
+        ファイルをimportしているプロジェクト内のファイル（depth=None で推移的にすべて）
+        """
+        with self._lock:
+            return self._traverse(self._build_graph()[1], [self._relative(path)], depth)
+
+    def subgraph(self, paths: Iterable[str], depth: int = 1) -> Dict[str, Any]:
+        """
+        指定したファイルと、そこから depth 以内でimportする・されるファイルからなる部分グラフを返す
+        """
+        with self._lock:
+            edges, reverse, external = self._build_graph()
+            targets = [relative for relative in (self._relative(path) for path in paths) if relative in self._files]
+            files = set(targets)
+            files.update(self._traverse(edges, targets, depth))
+            files.update(self._traverse(reverse, targets, depth))
+            return {
+                "targets": targets,
+                "files": sorted(files),
+                "edges": sorted([source, target, kind] for source in files for target, kind in edges[source].items() if target in files),
+                "external": {relative: sorted(external[relative]) for relative in sorted(files) if external[relative]},
+                "errors": {relative: self._files[relative].error for relative in sorted(files) if self._files[relative].error},
+            }
+
+    def cycles(self) -> List[List[str]]:
+        """
+        循環importを強連結成分として返す（Tarjanのアルゴリズム）
+        """
+        with self._lock:
+            edges = self._build_graph()[0]
+            index_of: Dict[str, int] = {}
+            lowlink: Dict[str, int] = {}
+            stack: List[str] = []
+            on_stack: Set[str] = set()
+            components: List[List[str]] = []
+            counter = 0
+
+            for start in sorted(edges):
+                if start in index_of:
+                    continue
+                # 再帰の深さの制限を避けるため、明示的なスタックで深さ優先探索を行う
+                work = [(start, iter(sorted(edges[start])))]
+                index_of[start] = lowlink[start] = counter
+                counter += 1
+                stack.append(start)
+                on_stack.add(start)
+                while work:
+                    node, neighbors = work[-1]
+                    advanced = False
+                    for neighbor in neighbors:
+                        if neighbor not in index_of:
+                            index_of[neighbor] = lowlink[neighbor] = counter
+                            counter += 1
+                            stack.append(neighbor)
+                            on_stack.add(neighbor)
+                            work.append((neighbor, iter(sorted(edges[neighbor]))))
+                            advanced = True
+                            break
+                        if neighbor in on_stack:
+                            lowlink[node] = min(lowlink[node], index_of[neighbor])
+                    if advanced:
+                        continue
+                    work.pop()
+                    if work:
+                        parent = work[-1][0]
+                        lowlink[parent] = min(lowlink[parent], lowlink[node])
+                    if lowlink[node] == index_of[node]:
+                        component = []
+                        while True:
+                            member = stack.pop()
+                            on_stack.discard(member)
+                            component.append(member)
+                            if member == node:
+                                break
+                        if len(component) > 1 or node in edges[node]:
+                            components.append(sorted(component))
+            return sorted(components)
+
+    def outline(self, path: str) -> List[str]:
+        relative = self._relative(path)
+        if relative is None:
+            return []
+        try:
+            with open(os.path.join(self.root, relative), "r", encoding="utf-8", errors="replace") as file:
+                return outline(relative, file.read())
+        except (OSError, SyntaxError, ValueError):
+            return []
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._lock:
+            edges = self._build_graph()[0]
+            return {
+                "root": self.root,
+                "version": self.version,
+                "files": len(self._files),
+                "edges": sum(len(targets) for targets in edges.values()),
+                **self.stats,
+            }
+
+
+def render_subgraph(index: DependencyIndex, graph: Dict[str, Any]) -> str:
+    """
+    部分グラフをLLMに渡すテキストにする関数（対象ファイルはimport文とトップレベルの定義の抜粋を付ける）
+    """
+    lines = ["## ファイル間のimport（静的解析）"]
+    lines += [f"- {source} -> {target} ({kind})" for source, target, kind in graph["edges"]] or ["- なし"]
+    if graph["external"]:
+        lines += ["", "## 外部パッケージ"]
+        lines += [f"- {relative}: {', '.join(packages)}" for relative, packages in graph["external"].items()]
+    if graph["errors"]:
+        lines += ["", "## 解析できなかったファイル"]
+        lines += [f"- {relative}: {error}" for relative, error in graph["errors"].items()]
+    for relative in graph["targets"]:
+        lines += ["", f"## {relative} の抜粋", "```"] + index.outline(relative) + ["```"]
+    return "\n".join(lines)
+
+
+def find_project_root(path: str) -> str:
+    """
+    ファイルの親ディレクトリをたどり、プロジェクトのルート（生成プロジェクトのディレクトリ、またはルートを示すファイルがある場所）を探す
+    """
+    generated_dir = os.path.join(os.path.expanduser("~"), "babel_generated")
+    directory = os.path.abspath(path if os.path.isdir(path) else os.path.dirname(path))
+    start = directory
+    while True:
+        if os.path.dirname(directory) == generated_dir:
+            return directory
+        if any(os.path.exists(os.path.join(directory, marker)) for marker in ROOT_MARKERS):
+            return directory
+        parent = os.path.dirname(directory)
+        if parent == directory:
+            return start
+        directory = parent
+
+
+def _forward_events(index: DependencyIndex):
+    """
+    共有の監視から届くイベントを索引に反映するコールバックを返す関数
+    """
+    def on_event(event_type: str, src_path: str, dest_path: Optional[str], is_directory: bool):
+        if is_directory:
+            if event_type in ("deleted", "moved"):
+                # ディレクトリごとの削除・移動は個々のファイルのイベントが届かないことがあるため走査し直す
+                index.refresh()
+            return
+        index.apply_event(event_type, src_path, dest_path)
+    return on_event
+
+
+_indexes: Dict[str, DependencyIndex] = {}
+_registry_lock = threading.Lock()
+
+
+def get_dependency_index(root: str, watch: bool = DEPENDENCY_INDEX_WATCH) -> DependencyIndex:
+    """
+    プロジェクトごとの索引を返す関数
+
+    初回は全体を走査して索引を作ります。watch が有効な場合は共有の監視（services/file_watch）でファイル変更を受け取って差分だけを反映し、
+    無効な場合は呼び出しごとに更新日時を比べて変わったファイルだけを解析し直します。
+    """
+    root = os.path.abspath(root)
+    with _registry_lock:
+        index = _indexes.get(root)
+        created = index is None
+        if created:
+            index = DependencyIndex(root)
+            _indexes[root] = index
+            subscribe(root, _forward_events(index))
+    watching = is_watching(root)
+    if watch and not watching:
+        # 走査中の変更を取りこぼさないよう、監視を始めてから走査する
+        start_watching(root)
+    if created or not watching:
+        index.refresh()
+    return index
@@ -7,6 +7,8 @@ import logging
 import aiofiles
 from fastapi import HTTPException
 import fnmatch
+from services.tree_service import list_structure
+from services.workspace_index import get_workspace_index
 
 logger = logging.getLogger(__name__)
 
@@ -88,15 +90,20 @@ async def load_file(projectId: str, filename: str):
         logger.error(f"ファイルの読み込み中にエラーが発生: {str(e)}")
         raise HTTPException(status_code=500, detail=str(e))
 
-async def get_generated_dirs():
+# get_directory_structure / get_generated_dirs で索引を指定しなかったことを示す値（None はディレクトリがないことを表す）
+_RESOLVE = object()
+
+async def get_generated_dirs(index=_RESOLVE):
     # ホームディレクトリを取得
     home_dir = os.path.expanduser("~")
     base_path = os.path.join(home_dir, "babel_generated")
     logger.info(f"生成されたディレクトリの取得を開始します。ベースパス: {base_path}")
     try:
         logger.debug("ディレクトリ構造の作成を開始します。")
-        gitignore_patterns = read_gitignore("../../.gitignore")
-        structure = create_structure(base_path, base_path, gitignore_patterns)
+        # アプリディレクトリの判定には直下のフォルダだけが必要なため、直下だけを保持する索引から取得する
+        if index is _RESOLVE:
+            index = await asyncio.to_thread(generated_dirs_index)
+        structure = index.structure(max_depth=1) if index is not None else []
         logger.debug(f"ディレクトリ構造を作成しました: {structure}")
         
         app_dirs = []
@@ -126,7 +133,12 @@ async def get_generated_dirs():
         logger.debug(f"エラーの詳細情報: {e.__class__.__name__}")
         raise HTTPException(status_code=500, detail="ディレクトリの取得に失敗しました")
 
-async def get_directory_structure(path_type: str):
+async def get_directory_structure(path_type: str, index=_RESOLVE):
+    """
+    path_type のディレクトリ構造を返す関数
+
+    ETagを求めるために呼び出し元で structure_index を取得済みの場合は index に渡し、索引を二度解決しないようにします。
+    """
     logger.info(f"ディレクトリ構造の取得を開始します。path_type: {path_type}")
 
     # 現在の作業ディレクトリを取得し、表示する
@@ -142,78 +154,106 @@ async def get_directory_structure(path_type: str):
     # 関数を呼び出して現在のディレクトリを表示
     print_current_directory()
 
-    if path_type == "file_explorer":
-        base_path = "../src/components/generated/"
-    elif path_type == "requirements_definition":
-        base_path = "meta/1_domain_exp"
-    elif path_type == "babel":
-        base_paths = ["../../src", "../../Dockerfile", "../../docker-compose.yml", "../../README.md"]
-    else:
-        # ホームディレクトリのbabel_generatedフォルダから取得するように変更
-        home_dir = os.path.expanduser("~")
-        base_path = os.path.join(home_dir, "babel_generated", path_type)
-        logger.debug(f"base_pathを設定しました: {base_path}")
-
-    logger.info(f"base_pathを設定しました: {base_path if path_type != 'babel' else base_paths}")
+    base_path, _ = structure_root(path_type)
+    logger.info(f"base_pathを設定しました: {base_path}")
 
     try:
-        if path_type == "babel":
-            gitignore_patterns = read_gitignore("../../.gitignore")
-        else:
-            gitignore_path = os.path.join(base_path, ".gitignore")
-            logger.debug(f".gitignoreファイルのパスを設定しました: {gitignore_path}")
-            gitignore_patterns = read_gitignore(gitignore_path)
-            logger.info(f".gitignoreファイルを読み込みました: {gitignore_path}")
-            logger.debug(f"読み込んだgitignoreパターン: {gitignore_patterns}")
-
-        if path_type == "babel":
-            structure = []
-            for base_path in base_paths:
-                logger.debug(f"babelモード: {base_path}を処理中")
-                if os.path.isfile(base_path):
-                    if not should_ignore(os.path.basename(base_path), gitignore_patterns):
-                        content = read_file_content(base_path)
-                        structure.append({
-                            "name": os.path.basename(base_path),
-                            "type": "file",
-                            "path": base_path,
-                        })
-                        # logger.debug(f"ファイルを追加しました: {os.path.basename(base_path)}")
-                else:
-                    structure.extend(create_structure(base_path, base_path, gitignore_patterns))
-                    # logger.debug(f"ディレクトリ構造を追加しました: {base_path}")
-        else:
-            structure = create_structure(base_path, base_path, gitignore_patterns)
-            # logger.debug(f"ディレクトリ構造を作成しました: {base_path}")
-
-        # logger.info(f"{path_type}のディレクトリ構造を正常に作成しました")
-        return {"structure": structure}
+        if index is _RESOLVE:
+            index = await asyncio.to_thread(structure_index, path_type)
+        structure = create_structure(index) if index is not None else []
+        return {"structure": structure, "version": index.version if index is not None else 0}
     except Exception as e:
         # logger.error(f"{path_type}のディレクトリ構造の取得中にエラーが発生しました: {str(e)}", exc_info=True)
         raise HTTPException(status_code=500, detail="ディレクトリ構造の取得に失敗しました")
 
-def create_structure(path, base_path, gitignore_patterns):
-    structure = []
-    for item in os.listdir(path):
-        if should_ignore(item, gitignore_patterns):
-            continue
-        item_path = os.path.join(path, item)
-        relative_path = os.path.relpath(item_path, base_path)
-        if os.path.isdir(item_path):
-            structure.append({
-                "name": item,
-                "type": "folder",
-                "path": relative_path,
-                "children": create_structure(item_path, base_path, gitignore_patterns)
-            })
-        else:
-            content = read_file_content(item_path)
-            structure.append({
-                "name": item,
-                "type": "file",
-                "path": relative_path,
-            })
-    return structure
+# babelモードで表示するリポジトリ直下の項目
+BABEL_STRUCTURE_ITEMS = ["src", "Dockerfile", "docker-compose.yml", "README.md"]
+
+def structure_root(path_type: str):
+    """
+    path_type に対応するディレクトリ構造のルートと、ルート直下で表示する項目（None なら全て）を返す関数
+    """
+    if path_type == "file_explorer":
+        return "../src/components/generated/", None
+    if path_type == "requirements_definition":
+        return "meta/1_domain_exp", None
+    if path_type == "babel":
+        return "../..", BABEL_STRUCTURE_ITEMS
+    return os.path.join(os.path.expanduser("~"), "babel_generated", path_type), None
+
+async def get_lazy_structure(path_type: str, path: str = "", depth: int = 1, cursor: str = None, limit: int = None):
+    """
+    path_type のルートからの相対パス path のフォルダの中身を depth 階層まで、ファイルの内容を読まずに返す関数
+
+    ファイルエクスプローラーはフォルダを開くたびに path を指定して呼び出し、next_cursor があれば続きを cursor に指定して取得します。
+    """
+    root, only = structure_root(path_type)
+    return await asyncio.to_thread(list_structure, root, path=path, depth=depth, cursor=cursor, limit=limit, only=only)
+
+class BabelStructure:
+    """
+    babelモードで表示する項目（BABEL_STRUCTURE_ITEMS）だけをまとめたディレクトリ構造
+
+    リポジトリ全体ではなく、ディレクトリの項目ごとに索引を作って監視し、ファイルの項目は存在だけを確認します。
+    WorkspaceIndex と同じく etag・version・structure() を持ちます。
+    """
+
+    def __init__(self, root: str, items):
+        self.root = root
+        # (項目名, 索引) の一覧（ファイルの項目は索引が None）
+        self.entries = []
+        for name in items:
+            path = os.path.join(root, name)
+            if os.path.isdir(path):
+                self.entries.append((name, get_workspace_index(path)))
+            elif os.path.isfile(path):
+                self.entries.append((name, None))
+
+    @property
+    def etag(self) -> str:
+        # 項目の有無と各索引のETagから作る
+        return '"babel-' + "-".join(index.etag.strip('"') if index is not None else name for name, index in self.entries) + '"'
+
+    @property
+    def version(self) -> int:
+        return sum(index.version for _, index in self.entries if index is not None)
+
+    def structure(self):
+        # src は src からの相対パスで、ファイルはリポジトリ直下からのパスで返す
+        structure = []
+        for name, index in self.entries:
+            if index is None:
+                structure.append({"name": name, "type": "file", "path": f"{self.root}/{name}"})
+            else:
+                structure.extend(index.structure())
+        return structure
+
+def structure_index(path_type: str):
+    """
+    path_type のディレクトリ構造を保持する共有の索引を返す関数（ディレクトリがない場合は None）
+
+    babelモードでは表示する項目ごとの索引をまとめた BabelStructure を返します。
+    """
+    base_path, items = structure_root(path_type)
+    if not os.path.isdir(base_path):
+        return None
+    if items is not None:
+        return BabelStructure(base_path, items)
+    return get_workspace_index(base_path)
+
+def generated_dirs_index():
+    base_path = os.path.join(os.path.expanduser("~"), "babel_generated")
+    if not os.path.isdir(base_path):
+        return None
+    return get_workspace_index(base_path, max_depth=1)
+
+def structure_etag(index) -> str:
+    # ディレクトリがない場合も、ある場合と区別できるETagにする
+    return index.etag if index is not None else '"missing"'
+
+def create_structure(index):
+    # ファイルの内容もディスクも読まず、ファイル変更のイベントで更新される索引から構造を組み立てる
+    return index.structure()
 
 def read_gitignore(path):
     # .gitignoreファイルを読み込む関数
@@ -0,0 +1,252 @@
+import logging
+import os
+import queue
+import threading
+from typing import Any, Callable, Dict, List, Optional, Set, Tuple
+
+from watchdog.events import FileSystemEventHandler
+from watchdog.observers import Observer
+
+logger = logging.getLogger(__name__)
+
+# 監視しないディレクトリ（中身が大きく、どの索引も除外するもの）
+WATCH_IGNORED_DIRS = {"node_modules", ".git", ".venv", "venv", ".next", ".babel_cache"}
+
+# 索引に渡すコールバック（イベントの種類, 変更元のパス, 移動先のパス, ディレクトリかどうか）
+WatchCallback = Callable[[str, str, Optional[str], bool], None]
+
+
+def _contains(root: str, path: Optional[str]) -> bool:
+    return bool(path) and (path == root or path.startswith(root + os.sep))
+
+
+def _is_ignored(root: str, path: str) -> bool:
+    # root から path までの途中に監視しないディレクトリがあるかどうか
+    relative = os.path.relpath(path, root)
+    return relative != "." and any(part in WATCH_IGNORED_DIRS for part in relative.split(os.sep))
+
+
+def plan_watches(root: str) -> List[Tuple[str, bool]]:
+    """
+    root 以下を監視するために登録する (ディレクトリ, 再帰するか) の一覧を返す関数
+
+    watchdogの再帰的な監視は配下のすべてのディレクトリに inotify の監視を追加するため、
+    監視しないディレクトリを含む部分木は再帰せずに監視し、その子のディレクトリを改めて調べます。
+    """
+    root = os.path.abspath(root)
+    children: Dict[str, List[str]] = {}
+    contains_ignored: Set[str] = set()
+    for directory, dirnames, _ in os.walk(root):
+        kept = [name for name in dirnames if name not in WATCH_IGNORED_DIRS and not os.path.islink(os.path.join(directory, name))]
+        if len(kept) != len(dirnames):
+            path = directory
+            while path not in contains_ignored:
+                contains_ignored.add(path)
+                if path == root:
+                    break
+                path = os.path.dirname(path)
+        dirnames[:] = kept
+        children[directory] = [os.path.join(directory, name) for name in kept]
+    plan = []
+    pending = [root]
+    while pending:
+        directory = pending.pop()
+        if directory in contains_ignored:
+            plan.append((directory, False))
+            pending.extend(children.get(directory, []))
+        else:
+            plan.append((directory, True))
+    return plan
+
+
+class _Tree:
+    """
+    監視している1つのルートと、その配下に登録したwatchdogの監視の一覧
+    """
+
+    def __init__(self, root: str):
+        self.root = root
+        self.watches: Dict[str, Tuple[Any, bool]] = {}  # ディレクトリ → (ObservedWatch, 再帰するか)
+
+
+class _TreeEventHandler(FileSystemEventHandler):
+    """
+    watchdogのイベントを振り分け用のキューに積むハンドラー
+
+    watchdogはロックを持ったままハンドラーを呼ぶため、ここでは索引の更新や監視の追加をせず、
+    別のスレッド（_dispatch_loop）で登録済みのコールバックに転送します。
+    """
+
+    def __init__(self, tree: _Tree):
+        super().__init__()
+        self.tree = tree
+
+    def dispatch(self, event):
+        dest_path = os.fsdecode(event.dest_path) if getattr(event, "dest_path", None) else None
+        _events.put((self.tree, event.event_type, os.fsdecode(event.src_path), dest_path, event.is_directory))
+
+
+_subscribers: Dict[str, List[WatchCallback]] = {}
+_trees: Dict[str, _Tree] = {}
+_observer: Optional[Any] = None
+_dispatcher: Optional[threading.Thread] = None
+_events: "queue.Queue" = queue.Queue()
+_registry_lock = threading.RLock()
+
+
+def _dispatch_loop(events: "queue.Queue"):
+    while True:
+        item = events.get()
+        if item is None:
+            return
+        tree, event_type, src_path, dest_path, is_directory = item
+        _fan_out(event_type, src_path, dest_path, is_directory, tree.root)
+        if is_directory:
+            try:
+                _follow_directory_change(tree, event_type, src_path, dest_path)
+            except Exception as e:
+                logger.error(f"ファイル変更の監視の更新に失敗しました: {src_path}: {str(e)}")
+
+
+def _fan_out(event_type: str, src_path: str, dest_path: Optional[str], is_directory: bool, tree_root: Optional[str] = None):
+    with _registry_lock:
+        targets = [
+            (root, callback)
+            for root, callbacks in _subscribers.items()
+            # 監視が重ならないよう、監視からのイベントはその監視に含まれる索引にだけ渡す
+            if tree_root is None or _contains(tree_root, root)
+            for callback in callbacks
+        ]
+    for root, callback in targets:
+        # 移動の場合は移動元・移動先のどちらかが索引の中にあれば反映する
+        if _contains(root, src_path) or _contains(root, dest_path):
+            try:
+                callback(event_type, src_path, dest_path, is_directory)
+            except Exception as e:
+                logger.error(f"ファイル変更の索引への反映に失敗しました: {src_path}: {str(e)}")
+
+
+def dispatch_event(event_type: str, src_path: str, dest_path: Optional[str] = None, is_directory: bool = False):
+    """
+    ファイル変更イベントを、そのパスを含む登録済みのすべての索引に反映する関数
+    """
+    src_path = os.path.abspath(os.fsdecode(src_path))
+    dest_path = os.path.abspath(os.fsdecode(dest_path)) if dest_path else None
+    _fan_out(event_type, src_path, dest_path, is_directory)
+
+
+def _schedule(tree: _Tree, directory: str, recursive: bool):
+    if directory in tree.watches:
+        return
+    try:
+        tree.watches[directory] = (_observer.schedule(_TreeEventHandler(tree), directory, recursive=recursive), recursive)
+    except OSError as e:
+        # 走査してから監視するまでの間に削除されたディレクトリは監視しない
+        logger.warning(f"ディレクトリを監視できませんでした: {directory}: {str(e)}")
+
+
+def _unschedule(tree: _Tree, directory: str):
+    # 削除・移動されたディレクトリとその配下の監視を外す
+    for path in [path for path in tree.watches if _contains(directory, path)]:
+        watch, _ = tree.watches.pop(path)
+        try:
+            _observer.unschedule(watch)
+        except Exception:
+            pass
+
+
+def _follow_directory_change(tree: _Tree, event_type: str, src_path: str, dest_path: Optional[str]):
+    # 再帰せずに監視しているディレクトリの直下に作られた（移動してきた）ディレクトリは、新たに監視に加える
+    with _registry_lock:
+        if _observer is None or _trees.get(tree.root) is not tree:
+            return
+        if event_type in ("deleted", "moved"):
+            _unschedule(tree, src_path)
+        created = dest_path if event_type == "moved" else src_path if event_type == "created" else None
+        if not created or not _contains(tree.root, created) or _is_ignored(tree.root, created):
+            return
+        parent = tree.watches.get(os.path.dirname(created))
+        if parent is None or parent[1] or not os.path.isdir(created):
+            return
+        for directory, recursive in plan_watches(created):
+            _schedule(tree, directory, recursive)
+    # 監視を加える前に作られた中身のイベントは届かないため、watchdogの再帰的な監視と同じく created として補う
+    for directory, dirnames, filenames in os.walk(created):
+        dirnames[:] = [name for name in dirnames if name not in WATCH_IGNORED_DIRS]
+        for name in dirnames:
+            _fan_out("created", os.path.join(directory, name), None, True, tree.root)
+        for name in filenames:
+            _fan_out("created", os.path.join(directory, name), None, False, tree.root)
+
+
+def subscribe(root: str, callback: WatchCallback):
+    """
+    root 以下のファイル変更イベントを callback に渡すよう登録する関数
+
+    同じディレクトリを複数の索引が使う場合も監視は1つだけで、イベントを各索引に振り分けます。
+    """
+    root = os.path.abspath(root)
+    with _registry_lock:
+        _subscribers.setdefault(root, []).append(callback)
+
+
+def start_watching(root: str):
+    """
+    root 以下のファイル変更の監視を始める関数（すでに監視されていれば何もしない）
+    """
+    global _observer, _dispatcher, _events
+    root = os.path.abspath(root)
+    with _registry_lock:
+        if is_watching(root):
+            return
+        if _observer is None:
+            _events = queue.Queue()
+            _dispatcher = threading.Thread(target=_dispatch_loop, args=(_events,), name="file-watch-dispatcher", daemon=True)
+            _dispatcher.start()
+            _observer = Observer()
+            _observer.daemon = True
+            _observer.start()
+        tree = _Tree(root)
+        for directory, recursive in plan_watches(root):
+            _schedule(tree, directory, recursive)
+        # 新しい監視に含まれる既存の監視は外し、同じイベントが2回届かないようにする
+        for other in [other for other in _trees if _contains(root, other)]:
+            old = _trees.pop(other)
+            _unschedule(old, old.root)
+        _trees[root] = tree
+    logger.info(f"ファイル変更の監視を開始しました: {root}（{len(tree.watches)}件）")
+
+
+def is_watching(root: str) -> bool:
+    """
+    root 以下の変更がすでに監視されているかどうか（監視しないディレクトリの中は監視されていない）
+    """
+    root = os.path.abspath(root)
+    with _registry_lock:
+        return any(_contains(tree_root, root) and not _is_ignored(tree_root, root) for tree_root in _trees)
+
+
+def stop_watching():
+    """
+    すべての監視を止める関数（登録されたコールバックは残り、dispatch_event からは引き続き反映される）
+    """
+    global _observer, _dispatcher
+    with _registry_lock:
+        observer, dispatcher = _observer, _dispatcher
+        _observer, _dispatcher = None, None
+        _trees.clear()
+    if observer is not None:
+        observer.stop()
+        observer.join()
+    if dispatcher is not None:
+        _events.put(None)
+        dispatcher.join()
+
+
+def get_watch_stats() -> Dict[str, Any]:
+    with _registry_lock:
+        return {
+            "roots": sorted(_trees),
+            "watches": sum(len(tree.watches) for tree in _trees.values()),
+            "subscribers": sum(len(callbacks) for callbacks in _subscribers.values()),
+        }
@@ -1,11 +1,17 @@
-import google.generativeai as genai
-import asyncio
+import json
 import logging
-from config.settings import GEMINI_API_KEY
+from config.settings import GEMINI_API_KEY, GEMINI_BASE_URL
+from services.http_client import http_client
+from services.llm_cache import cached_generate, cached_stream
+from services.rate_limiter import llm_scheduler
+from services.resilience import resilient_call, resilient_stream
+from services.telemetry import note_usage, track_llm_call, track_llm_stream
+from services.llm_transcript import transcript_generate, transcript_stream
+from utils.tokens import estimate_tokens
 
 logger = logging.getLogger(__name__)
 
-genai.configure(api_key=GEMINI_API_KEY)
+GEMINI_MODEL = "gemini-1.5-pro"
 
 generation_config = {
     "temperature": 1,
@@ -15,22 +21,117 @@ generation_config = {
     "response_mime_type": "text/plain",
 }
 
-gemini_model = genai.GenerativeModel(
-    model_name="gemini-1.5-pro",
-    generation_config=generation_config,
-)
+GEMINI_PROMPT_SUFFIX = "コードはコードブロックに入れる 例 ```html <h1>Hello, World!</h1> ```"
 
-async def generate_text_gemini(prompt: str):
-    logger.info(f"Geminiリクエストを受信: prompt={prompt}")
-    try:
-        chat = gemini_model.start_chat(history=[])
-        response = await asyncio.to_thread(
-            chat.send_message,
-            prompt + "コードはコードブロックに入れる 例 ```html <h1>Hello, World!</h1> ```"
-        )
+def build_gemini_request(prompt: str) -> dict:
+    """
+    Gemini REST API (generateContent) のリクエストボディを組み立てる関数
+    """
+    return {
+        "contents": [{"role": "user", "parts": [{"text": prompt + GEMINI_PROMPT_SUFFIX}]}],
+        "generationConfig": {
+            "temperature": generation_config["temperature"],
+            "topP": generation_config["top_p"],
+            "topK": generation_config["top_k"],
+            "maxOutputTokens": generation_config["max_output_tokens"],
+            "responseMimeType": generation_config["response_mime_type"],
+        },
+    }
+
+def split_usage(usage: dict):
+    """
+    GeminiのusageMetadataを (キャッシュ以外の入力, 出力, キャッシュ済み入力) のトークン数に分ける関数
+    """
+    cached = usage.get("cachedContentTokenCount", 0)
+    return usage.get("promptTokenCount", 0) - cached, usage.get("candidatesTokenCount", 0), cached
+
+def extract_gemini_text(data: dict) -> str:
+    """
+    Geminiのレスポンスから生成テキストを取り出す関数
+    """
+    candidates = data.get("candidates") or []
+    if not candidates:
+        return ""
+    parts = candidates[0].get("content", {}).get("parts", [])
+    return "".join(part.get("text", "") for part in parts)
+
+async def generate_text_gemini(prompt: str, use_cache: bool = True):
+    logger.debug(f"Geminiリクエストを受信: prompt={prompt}")
+
+    async def _generate():
+        # SDKのスレッド実行とチャットセッション生成を避け、共有プール上でREST APIを直接呼び出す
+        async def _post():
+            response = await http_client.post(
+                f"{GEMINI_BASE_URL}/v1beta/models/{GEMINI_MODEL}:generateContent",
+                headers={"x-goog-api-key": GEMINI_API_KEY or ""},
+                json=build_gemini_request(prompt),
+            )
+            response.raise_for_status()
+            return response.json()
+
+        data = await resilient_call("gemini", lambda: llm_scheduler.run("gemini", GEMINI_API_KEY, estimate_tokens(prompt), _post))
+        usage = data.get("usageMetadata") or {}
+        llm_scheduler.record_usage("gemini", GEMINI_API_KEY, usage.get("candidatesTokenCount", 0))
+        note_usage(*split_usage(usage))
+        text = extract_gemini_text(data)
         logger.info("Geminiでテキスト生成成功")
-        logger.info(response.text)
-        return {"generated_text": response.text}
+        logger.debug(text)
+        return {"generated_text": text}
+
+    try:
+        async with track_llm_call("gemini", GEMINI_MODEL) as trace:
+            result = await cached_generate(
+                "gemini", GEMINI_MODEL, generation_config["temperature"], generation_config["max_output_tokens"],
+                prompt, lambda: transcript_generate("gemini", GEMINI_MODEL, generation_config["temperature"], generation_config["max_output_tokens"], prompt, _generate),
+                use_cache=use_cache
+            )
+            trace.mark_result(result)
+            return result
     except Exception as e:
         logger.error(f"Geminiでのテキスト生成中にエラーが発生: {str(e)}")
-        raise
\ No newline at end of file
+        raise
+
+async def stream_text_gemini(prompt: str, use_cache: bool = True):
+    """
+    Geminiの生成結果をトークンが届き次第チャンク単位で返す非同期ジェネレータ
+    """
+    logger.debug(f"Geminiストリーミングリクエストを受信: prompt={prompt}")
+
+    async def _stream(trace):
+        trace.status = "ok"
+        usage = {}
+        async with http_client.stream(
+            "POST",
+            f"{GEMINI_BASE_URL}/v1beta/models/{GEMINI_MODEL}:streamGenerateContent",
+            params={"alt": "sse"},
+            headers={"x-goog-api-key": GEMINI_API_KEY or ""},
+            json=build_gemini_request(prompt),
+        ) as response:
+            response.raise_for_status()
+            async for line in response.aiter_lines():
+                if not line.startswith("data:"):
+                    continue
+                data = json.loads(line[len("data:"):])
+                # usageMetadataは各チャンクに累計値として含まれるので最後のものを使う
+                usage = data.get("usageMetadata") or usage
+                text = extract_gemini_text(data)
+                if text:
+                    yield text
+        llm_scheduler.record_usage("gemini", GEMINI_API_KEY, usage.get("candidatesTokenCount", 0))
+        trace.add_usage(*split_usage(usage))
+        logger.info("Geminiでストリーミング生成成功")
+
+    try:
+        async for chunk in track_llm_stream("gemini", GEMINI_MODEL, lambda trace: cached_stream(
+            "gemini", GEMINI_MODEL, generation_config["temperature"], generation_config["max_output_tokens"],
+            prompt, lambda: transcript_stream(
+                "gemini", GEMINI_MODEL, generation_config["temperature"], generation_config["max_output_tokens"],
+                prompt, lambda: resilient_stream("gemini", lambda: llm_scheduler.stream(
+                    "gemini", GEMINI_API_KEY, estimate_tokens(prompt), lambda: _stream(trace)
+                )), trace
+            ), use_cache=use_cache
+        )):
+            yield chunk
+    except Exception as e:
+        logger.error(f"Geminiでのストリーミング生成中にエラーが発生: {str(e)}")
+        raise
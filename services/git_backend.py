@@ -0,0 +1,263 @@
+import asyncio
+import logging
+import os
+import shutil
+import stat
+import subprocess
+import tempfile
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional
+
+from config.settings import GIT_BACKEND, GIT_REPO_CACHE_SIZE, VERSION_CONTROL_ADD_BATCH_SIZE
+from services.git_service import git_add, git_commit
+
+try:
+    import git
+    from git.index.fun import stat_mode_to_index_mode
+except ImportError:  # gitpython がない環境ではサブプロセスのバックエンドを使う
+    git = None
+
+logger = logging.getLogger(__name__)
+
+# 常駐する git hash-object に一度に送るパスの数
+HASH_PIPE_BATCH = 256
+
+
+class NothingToCommitError(Exception):
+    """
+    ステージした内容が HEAD と同じでコミットする変更がないことを示す例外
+    """
+
+
+if git is not None:
+    class PipedObjectDB(git.db.GitCmdObjectDB):
+        """
+        オブジェクトの書き込みを、種類ごとに1つの常駐する git hash-object --stdin-paths に送るオブジェクトDB
+
+        gitpython の既定のオブジェクトDBは書き込み（blob・tree・commit）のたびに git hash-object を起動します。
+        読み込みは既定どおり常駐する git cat-file --batch で行います。
+        """
+
+        def __init__(self, root_path, git_command):
+            super().__init__(root_path, git_command)
+            self._writers: Dict[str, Any] = {}
+
+        def _writer(self, object_type: Optional[str]):
+            # object_type が None の場合は作業ツリーのファイルをblobとして（.gitattributes のフィルタを適用して）書き込む
+            writer = self._writers.get(object_type)
+            if writer is None or writer.proc.poll() is not None:
+                options = ["-t", object_type, "--no-filters", "--literally"] if object_type else []
+                writer = self._git.hash_object(*options, "-w", "--stdin-paths", as_process=True, istream=subprocess.PIPE)
+                self._writers[object_type] = writer
+            return writer
+
+        def _hash_paths(self, writer, paths: List[str]) -> List[bytes]:
+            shas = []
+            # パイプが詰まらないよう、一定数ずつ書いてから読む
+            for start in range(0, len(paths), HASH_PIPE_BATCH):
+                chunk = paths[start:start + HASH_PIPE_BATCH]
+                writer.stdin.write("".join(f"{path}\n" for path in chunk).encode())
+                writer.stdin.flush()
+                for _ in chunk:
+                    hexsha = writer.stdout.readline().strip()
+                    if len(hexsha) != 40:
+                        raise RuntimeError(f"git hash-object からハッシュを読み取れませんでした: {hexsha!r}")
+                    shas.append(bytes.fromhex(hexsha.decode()))
+            return shas
+
+        def store_files(self, paths: List[str]) -> List[bytes]:
+            """
+            作業ツリーのファイルをblobとして書き込み、それぞれのハッシュを返す
+            """
+            return self._hash_paths(self._writer(None), paths)
+
+        def store(self, istream):
+            if istream.binsha is not None or self.ostream() is not None:
+                return super().store(istream)
+            object_type = istream.type.decode() if isinstance(istream.type, bytes) else istream.type
+            # --stdin-paths はパスしか受け取らないため、内容をオブジェクトDBの中の一時ファイルに書いて渡す
+            with tempfile.NamedTemporaryFile(dir=self.root_path(), prefix="tmp_babel_", delete=False) as temp:
+                shutil.copyfileobj(istream, temp)
+            try:
+                istream.binsha = self._hash_paths(self._writer(object_type), [temp.name])[0]
+            finally:
+                os.unlink(temp.name)
+            return istream
+
+        def close(self):
+            writers, self._writers = self._writers, {}
+            for writer in writers.values():
+                writer.stdin.close()
+                writer.proc.wait()
+
+
+class SubprocessGitBackend:
+    """
+    操作ごとに git コマンドを起動するバックエンド（git add を add_batch_size 件ずつ、その後 git commit）
+    """
+
+    name = "subprocess"
+
+    def __init__(self, add_batch_size: Optional[int] = None):
+        self.add_batch_size = max(1, add_batch_size or VERSION_CONTROL_ADD_BATCH_SIZE)
+
+    async def commit_paths(self, repo_path: str, paths: List[str], message: str) -> str:
+        await self.add(repo_path, paths)
+        try:
+            await git_commit(repo_path, message)
+        except Exception as e:
+            if "nothing to commit" in str(e) or "nothing added to commit" in str(e):
+                raise NothingToCommitError(str(e))
+            raise
+        return await self.head(repo_path)
+
+    async def add(self, repo_path: str, paths: List[str]):
+        for start in range(0, len(paths), self.add_batch_size):
+            await git_add(repo_path, *paths[start:start + self.add_batch_size])
+
+    async def head(self, repo_path: str) -> Optional[str]:
+        process = await asyncio.create_subprocess_exec(
+            'git', '-C', repo_path, 'rev-parse', '--verify', '-q', 'HEAD',
+            stdout=asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.PIPE
+        )
+        stdout, _ = await process.communicate()
+        return stdout.decode().strip() or None
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {"backend": self.name}
+
+
+class InProcessGitBackend:
+    """
+    gitpython でリポジトリを開いたまま保持し、ステージとコミットをプロセス内で行うバックエンド
+
+    操作ごとに git コマンドを起動しません。ファイルの内容はリポジトリごとに常駐する git hash-object にまとめて送ってblobにし、
+    インデックスの更新とコミットの作成はプロセス内で行います。
+    gitpython のリポジトリはスレッドセーフではないため、リポジトリごとのロックの中でワーカースレッドから操作します。
+    開いたリポジトリは最近使った順に cache_size 件まで保持します。
+    サブプロセスのバックエンドとの比較は scripts/git_backend_benchmark.py で計測できます。
+    """
+
+    name = "gitpython"
+
+    def __init__(self, cache_size: int = GIT_REPO_CACHE_SIZE):
+        if git is None:
+            raise RuntimeError("gitpython がインストールされていません")
+        self.cache_size = max(1, cache_size)
+        self._repos: "OrderedDict[str, Any]" = OrderedDict()
+        self._locks: Dict[str, threading.Lock] = {}
+        self._guard = threading.Lock()
+        self.stats = {"opened": 0, "commits": 0}
+
+    def _repo(self, repo_path: str):
+        repo_path = os.path.abspath(repo_path)
+        with self._guard:
+            repo = self._repos.get(repo_path)
+            if repo is None:
+                repo = git.Repo(repo_path, odbt=PipedObjectDB)
+                self._repos[repo_path] = repo
+                self.stats["opened"] += 1
+                while len(self._repos) > self.cache_size:
+                    _, evicted = self._repos.popitem(last=False)
+                    evicted.odb.close()
+                    evicted.close()
+            self._repos.move_to_end(repo_path)
+            lock = self._locks.setdefault(repo_path, threading.Lock())
+        return repo, lock
+
+    def _commit_paths(self, repo_path: str, paths: List[str], message: str) -> str:
+        repo, lock = self._repo(repo_path)
+        with lock:
+            index = repo.index
+            relative = [_relative(repo, path) for path in paths]
+            existing = [path for path in relative if os.path.lexists(os.path.join(repo.working_tree_dir, path))]
+            symlinks = []
+            for entry in self._index_entries(repo, existing):
+                if isinstance(entry, str):
+                    symlinks.append(entry)
+                else:
+                    index.entries[(entry.path, 0)] = git.IndexEntry.from_base(entry)
+            if symlinks:
+                index.add(symlinks, write=False)
+            # 削除されたファイルはインデックスからも取り除く
+            for path in relative:
+                if path not in existing:
+                    index.entries.pop((path, 0), None)
+            tree = index.write_tree()
+            if repo.head.is_valid() and repo.head.commit.tree.binsha == tree.binsha:
+                raise NothingToCommitError("nothing to commit")
+            index.write()
+            # index.commit は木を作り直しフックを探すため、書き込んだ木から直接コミットを作る（フックは実行しない）
+            commit = git.Commit.create_from_tree(repo, tree, message, head=True)
+            self.stats["commits"] += 1
+            return commit.hexsha
+
+    def _index_entries(self, repo, relative_paths: List[str]) -> List[Any]:
+        # 通常のファイルはまとめて常駐プロセスでハッシュしてエントリを作り、シンボリックリンクはパスのまま返す（gitpython に任せる）
+        entries: List[Any] = []
+        files = []
+        for path in relative_paths:
+            st = os.lstat(os.path.join(repo.working_tree_dir, path))
+            if stat.S_ISLNK(st.st_mode):
+                entries.append(path)
+            else:
+                files.append((path, st.st_mode))
+        shas = repo.odb.store_files([os.path.join(repo.working_tree_dir, path) for path, _ in files])
+        for (path, mode), binsha in zip(files, shas):
+            entries.append(git.BaseIndexEntry((stat_mode_to_index_mode(mode), binsha, 0, path)))
+        return entries
+
+    async def commit_paths(self, repo_path: str, paths: List[str], message: str) -> str:
+        """
+        paths をステージして1回のコミットにし、コミットのハッシュを返す
+        """
+        return await asyncio.to_thread(self._commit_paths, repo_path, paths, message)
+
+    async def add(self, repo_path: str, paths: List[str]):
+        def add():
+            repo, lock = self._repo(repo_path)
+            with lock:
+                repo.index.add([_relative(repo, path) for path in paths])
+        await asyncio.to_thread(add)
+
+    async def head(self, repo_path: str) -> Optional[str]:
+        def head():
+            repo, lock = self._repo(repo_path)
+            with lock:
+                return repo.head.commit.hexsha if repo.head.is_valid() else None
+        return await asyncio.to_thread(head)
+
+    def close(self):
+        with self._guard:
+            for repo in self._repos.values():
+                repo.odb.close()
+                repo.close()
+            self._repos.clear()
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {"backend": self.name, **self.stats, "open_repositories": len(self._repos)}
+
+
+def _relative(repo, path: str) -> str:
+    # インデックスのエントリはリポジトリのルートからの "/" 区切りのパス
+    return os.path.relpath(os.path.abspath(path), repo.working_tree_dir).replace(os.sep, "/")
+
+
+git_backend = None
+
+
+def get_git_backend():
+    """
+    GIT_BACKEND の設定に応じたバックエンドを返す（gitpython を使えない場合はサブプロセスに切り替える）
+    """
+    global git_backend
+    if git_backend is None:
+        if GIT_BACKEND == "gitpython" and git is not None:
+            git_backend = InProcessGitBackend()
+        else:
+            if GIT_BACKEND == "gitpython":
+                logger.warning("gitpython を読み込めないため、サブプロセスのgitバックエンドを使います")
+            git_backend = SubprocessGitBackend()
+    return git_backend
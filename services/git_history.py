@@ -0,0 +1,357 @@
+import asyncio
+import bisect
+import logging
+import os
+import threading
+import weakref
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Tuple
+
+from config.settings import (
+    GIT_HISTORY_CACHE_SIZE,
+    GIT_HISTORY_MAX_DIFF_BYTES,
+    GIT_HISTORY_MAX_PAGE_SIZE,
+    GIT_HISTORY_PAGE_SIZE,
+)
+from services.git_service import git_blame, git_diff, git_is_ancestor, git_log, git_rev_parse
+
+logger = logging.getLogger(__name__)
+
+# git log の1コミット分の見出し（\x1e で区切り、項目は \x1f で区切る）。続く行は変更されたファイル
+LOG_FORMAT = "%x1e%H%x1f%P%x1f%an%x1f%ae%x1f%at%x1f%s"
+
+
+def find_repository_root(path: str) -> Optional[str]:
+    """
+    path（ディレクトリ）を含むGitリポジトリのルートを返す関数（見つからない場合は None）
+    """
+    directory = os.path.abspath(path)
+    while True:
+        if os.path.exists(os.path.join(directory, ".git")):
+            return directory
+        parent = os.path.dirname(directory)
+        if parent == directory:
+            return None
+        directory = parent
+
+
+def read_head(repo_path: str) -> Optional[str]:
+    """
+    .git のファイルを直接読んで HEAD のコミットのハッシュを返す関数（コミットがない場合は None）
+
+    履歴の問い合わせのたびに git を起動しないためのもので、読み取れない形式の場合は None ではなく例外 LookupError を送出します。
+    """
+    git_dir = os.path.join(repo_path, ".git")
+    if os.path.isfile(git_dir):
+        # ワークツリーやサブモジュールの .git はgitディレクトリの場所を書いたファイル
+        raise LookupError(git_dir)
+    with open(os.path.join(git_dir, "HEAD")) as file:
+        head = file.read().strip()
+    if not head.startswith("ref: "):
+        return head
+    ref = head[5:]
+    try:
+        with open(os.path.join(git_dir, ref)) as file:
+            return file.read().strip()
+    except FileNotFoundError:
+        pass
+    try:
+        with open(os.path.join(git_dir, "packed-refs")) as file:
+            for line in file:
+                parts = line.split()
+                if len(parts) == 2 and parts[1] == ref:
+                    return parts[0]
+    except FileNotFoundError:
+        pass
+    return None
+
+
+def parse_log(output: str) -> List[Dict[str, Any]]:
+    commits = []
+    for record in output.split("\x1e")[1:]:
+        header, _, body = record.partition("\n")
+        sha, parents, author, email, timestamp, subject = header.split("\x1f", 5)
+        commits.append({
+            "sha": sha,
+            "parents": parents.split(),
+            "author": author,
+            "email": email,
+            "timestamp": int(timestamp),
+            "subject": subject,
+            "files": [line for line in body.split("\n") if line],
+        })
+    return commits
+
+
+def parse_blame(output: str) -> Tuple[Dict[str, Dict[str, Any]], List[Dict[str, Any]]]:
+    """
+    git blame --porcelain の出力を、コミットの情報と、同じコミットが続く行のまとまり（hunk）に分ける関数
+    """
+    commits: Dict[str, Dict[str, Any]] = {}
+    hunks: List[Dict[str, Any]] = []
+    current = None
+    line_number = 0
+    for line in output.split("\n"):
+        if line.startswith("\t"):
+            if hunks and hunks[-1]["sha"] == current and hunks[-1]["end_line"] == line_number - 1:
+                hunks[-1]["lines"].append(line[1:])
+                hunks[-1]["end_line"] = line_number
+            else:
+                hunks.append({"sha": current, "start_line": line_number, "end_line": line_number, "lines": [line[1:]]})
+            continue
+        key, _, value = line.partition(" ")
+        if len(key) == 40 and all(c in "0123456789abcdef" for c in key):
+            current = key
+            line_number = int(value.split()[1])
+            commits.setdefault(current, {"sha": current})
+        elif current is not None and key in ("author", "author-mail", "author-time", "summary"):
+            info = commits[current]
+            if key == "author-mail":
+                info["email"] = value.strip("<>")
+            elif key == "author-time":
+                info["timestamp"] = int(value)
+            else:
+                info["subject" if key == "summary" else key] = value
+    return commits, hunks
+
+
+def parse_diff(output: str, max_bytes: int) -> Dict[str, Any]:
+    numstat, _, patch = output.partition("\n\n")
+    files = []
+    for line in numstat.split("\n"):
+        if not line:
+            continue
+        additions, deletions, path = line.split("\t", 2)
+        # バイナリファイルの行数は "-" で出力される
+        files.append({
+            "path": path,
+            "additions": int(additions) if additions != "-" else None,
+            "deletions": int(deletions) if deletions != "-" else None,
+        })
+    encoded = patch.encode()
+    truncated = len(encoded) > max_bytes
+    if truncated:
+        patch = encoded[:max_bytes].decode(errors="ignore")
+    return {"files": files, "diff": patch, "truncated": truncated}
+
+
+def _check_revision(revision: str):
+    # オプションとして解釈されないよう、"-" で始まるリビジョンは受け付けない
+    if not revision or revision.startswith("-"):
+        raise ValueError(f"不正なリビジョンです: {revision!r}")
+
+
+class CommitGraph:
+    """
+    1つのリポジトリのコミット履歴のキャッシュ
+
+    コミットを古い順に並べて保持し、ファイルごとにそのファイルを変更したコミットの位置を昇順に持ちます。
+    問い合わせのたびに HEAD を .git から直接読み、前回から進んでいれば増えたコミットだけを git log で読み足します。
+    reset などで以前の HEAD が祖先でなくなった場合は全体を読み直します。
+    ページ送りのカーソルは前のページの最後のコミットのハッシュで、新しいコミットが増えてもずれません。
+    """
+
+    def __init__(self, repo_path: str):
+        self.repo_path = repo_path
+        self.head: Optional[str] = None
+        self._commits: List[Dict[str, Any]] = []
+        self._positions: Dict[str, int] = {}
+        self._files: Dict[str, List[int]] = {}
+        # asyncio.Lock はイベントループに結び付くため、ループごとに作る
+        self._locks: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, asyncio.Lock]" = weakref.WeakKeyDictionary()
+        self.stats = {"hits": 0, "incremental_updates": 0, "full_loads": 0, "commits_read": 0}
+
+    def _lock(self) -> asyncio.Lock:
+        return self._locks.setdefault(asyncio.get_running_loop(), asyncio.Lock())
+
+    def _reset(self):
+        self.head = None
+        self._commits = []
+        self._positions = {}
+        self._files = {}
+
+    def _append(self, commits: List[Dict[str, Any]]):
+        # git log は新しい順に出力するため、古い順にして末尾に足す
+        for commit in reversed(commits):
+            position = len(self._commits)
+            self._commits.append(commit)
+            self._positions[commit["sha"]] = position
+            for path in commit["files"]:
+                self._files.setdefault(path, []).append(position)
+
+    async def update(self) -> Optional[str]:
+        """
+        HEAD までのコミットを読み込み、HEAD のハッシュを返す
+        """
+        try:
+            head = read_head(self.repo_path)
+        except LookupError:
+            head = await git_rev_parse(self.repo_path, "HEAD") or None
+        if head == self.head:
+            self.stats["hits"] += 1
+            return head
+        async with self._lock():
+            if head == self.head:
+                self.stats["hits"] += 1
+                return head
+            if head is None:
+                self._reset()
+                return None
+            if self.head is not None and await git_is_ancestor(self.repo_path, self.head, head):
+                commits = parse_log(await git_log(self.repo_path, LOG_FORMAT, head, f"^{self.head}"))
+                self.stats["incremental_updates"] += 1
+            else:
+                commits = parse_log(await git_log(self.repo_path, LOG_FORMAT, head))
+                # 読み込み中の問い合わせには以前の履歴を返すよう、読み終えてから入れ替える
+                self._reset()
+                self.stats["full_loads"] += 1
+            self._append(commits)
+            self.head = head
+            self.stats["commits_read"] += len(commits)
+            logger.info(f"{len(commits)}件のコミットを履歴のキャッシュに読み込みました: {self.repo_path}")
+            return head
+
+    def _paths_under(self, prefix: str) -> List[str]:
+        return [path for path in self._files if path == prefix or path.startswith(prefix + "/")]
+
+    def _positions_for(self, path: Optional[str]) -> Optional[List[int]]:
+        # path が None ならすべてのコミット、ディレクトリなら配下のファイルを変更したコミット
+        if not path:
+            return None
+        if path in self._files:
+            return self._files[path]
+        return sorted({position for file in self._paths_under(path) for position in self._files[file]})
+
+    def page(self, path: Optional[str] = None, cursor: Optional[str] = None, limit: Optional[int] = None) -> Dict[str, Any]:
+        """
+        新しい順にコミットを1ページ分返す（path を指定した場合はそのファイル・ディレクトリを変更したコミットだけ）
+        """
+        limit = min(max(1, limit or GIT_HISTORY_PAGE_SIZE), GIT_HISTORY_MAX_PAGE_SIZE)
+        positions = self._positions_for(path)
+        total = len(self._commits) if positions is None else len(positions)
+        if cursor is None:
+            end = total
+        elif cursor in self._positions:
+            end = self._positions[cursor] if positions is None else bisect.bisect_left(positions, self._positions[cursor])
+        else:
+            raise ValueError(f"不明なカーソルです: {cursor}")
+        start = max(0, end - limit)
+        selected = range(end - 1, start - 1, -1) if positions is None else (positions[i] for i in range(end - 1, start - 1, -1))
+        commits = [self._commits[position] for position in selected]
+        return {
+            "head": self.head,
+            "path": path,
+            "total": total,
+            "commits": commits,
+            "next_cursor": commits[-1]["sha"] if commits and start > 0 else None,
+        }
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {**self.stats, "commits": len(self._commits), "files": len(self._files)}
+
+
+class GitHistoryService:
+    """
+    リポジトリごとのコミット履歴のキャッシュと、blame・差分の結果のキャッシュ
+
+    blame と差分はリビジョンをコミットのハッシュに解決してからキャッシュするため、HEAD が進んでも古い結果は返しません。
+    """
+
+    def __init__(self, cache_size: int = GIT_HISTORY_CACHE_SIZE, max_diff_bytes: int = GIT_HISTORY_MAX_DIFF_BYTES):
+        self.cache_size = max(1, cache_size)
+        self.max_diff_bytes = max_diff_bytes
+        self._graphs: Dict[str, CommitGraph] = {}
+        self._results: "OrderedDict[Tuple, Dict[str, Any]]" = OrderedDict()
+        self._guard = threading.Lock()
+        self.stats = {"hits": 0, "misses": 0}
+
+    def graph(self, repo_path: str) -> CommitGraph:
+        repo_path = os.path.abspath(repo_path)
+        with self._guard:
+            if repo_path not in self._graphs:
+                self._graphs[repo_path] = CommitGraph(repo_path)
+            return self._graphs[repo_path]
+
+    async def log(self, repo_path: str, path: Optional[str] = None, cursor: Optional[str] = None, limit: Optional[int] = None) -> Dict[str, Any]:
+        """
+        プロジェクト全体、またはファイル・ディレクトリ（リポジトリのルートからの "/" 区切りのパス）の履歴を1ページ分返す
+        """
+        graph = self.graph(repo_path)
+        await graph.update()
+        return graph.page(path.strip("/") if path else None, cursor, limit)
+
+    async def _resolve(self, repo_path: str, revision: Optional[str]) -> str:
+        if revision is None:
+            head = await self.graph(repo_path).update()
+            if head is None:
+                raise ValueError("コミットがありません")
+            return head
+        _check_revision(revision)
+        sha = await git_rev_parse(repo_path, revision)
+        if not sha:
+            raise ValueError(f"不明なリビジョンです: {revision}")
+        return sha
+
+    def _cached(self, key: Tuple) -> Optional[Dict[str, Any]]:
+        with self._guard:
+            result = self._results.get(key)
+            if result is None:
+                self.stats["misses"] += 1
+                return None
+            self._results.move_to_end(key)
+            self.stats["hits"] += 1
+            return result
+
+    def _store(self, key: Tuple, result: Dict[str, Any]):
+        with self._guard:
+            self._results[key] = result
+            while len(self._results) > self.cache_size:
+                self._results.popitem(last=False)
+
+    async def blame(self, repo_path: str, path: str, revision: Optional[str] = None) -> Dict[str, Any]:
+        """
+        revision（省略時は HEAD）の時点のファイルの各行を最後に変更したコミットを返す
+        """
+        if not path:
+            raise ValueError("blame にはファイルのパスが必要です")
+        repo_path = os.path.abspath(repo_path)
+        sha = await self._resolve(repo_path, revision)
+        key = ("blame", repo_path, sha, path)
+        result = self._cached(key)
+        if result is None:
+            try:
+                output = await git_blame(repo_path, sha, path)
+            except Exception as e:
+                raise FileNotFoundError(f"{path} は {sha[:7]} の時点で存在しません") from e
+            commits, hunks = parse_blame(output)
+            result = {"path": path, "revision": sha, "commits": commits, "hunks": hunks}
+            self._store(key, result)
+        return result
+
+    async def diff(self, repo_path: str, base: str, target: Optional[str] = None, path: Optional[str] = None) -> Dict[str, Any]:
+        """
+        base から target（省略時は HEAD）までの差分を返す（path を指定した場合はそのファイル・ディレクトリだけ）
+        """
+        repo_path = os.path.abspath(repo_path)
+        base_sha = await self._resolve(repo_path, base)
+        target_sha = await self._resolve(repo_path, target)
+        key = ("diff", repo_path, base_sha, target_sha, path)
+        result = self._cached(key)
+        if result is None:
+            output = await git_diff(repo_path, base_sha, target_sha, *([path] if path else []))
+            result = {"base": base_sha, "target": target_sha, "path": path, **parse_diff(output, self.max_diff_bytes)}
+            self._store(key, result)
+        return result
+
+    def clear(self):
+        with self._guard:
+            self._graphs.clear()
+            self._results.clear()
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._guard:
+            graphs = {path: graph.get_stats() for path, graph in self._graphs.items()}
+            return {**self.stats, "cached_results": len(self._results), "repositories": graphs}
+
+
+git_history = GitHistoryService()
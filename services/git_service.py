@@ -1,9 +1,9 @@
 import asyncio
 import subprocess
 
-async def git_add(repo_path: str, file_path: str):
+async def git_add(repo_path: str, *file_paths: str):
     process = await asyncio.create_subprocess_exec(
-        'git', '-C', repo_path, 'add', file_path,
+        'git', '-C', repo_path, 'add', '--', *file_paths,
         stdout=asyncio.subprocess.PIPE,
         stderr=asyncio.subprocess.PIPE
     )
@@ -20,5 +20,44 @@ async def git_commit(repo_path: str, message: str):
     )
     stdout, stderr = await process.communicate()
     if process.returncode != 0:
-        raise Exception(f"Git commit failed: {stderr.decode()}")
-    return stdout.decode()
\ No newline at end of file
+        # 「nothing to commit」は標準出力に出るため、標準エラーが空の場合は標準出力を含める
+        raise Exception(f"Git commit failed: {stderr.decode() or stdout.decode()}")
+    return stdout.decode()
+
+async def git_output(repo_path: str, *args: str, check: bool = True) -> str:
+    """
+    gitコマンドを実行して標準出力を返す関数（パスは引用符で囲まずそのまま出力させる）
+    """
+    process = await asyncio.create_subprocess_exec(
+        'git', '-C', repo_path, '-c', 'core.quotepath=off', *args,
+        stdout=asyncio.subprocess.PIPE,
+        stderr=asyncio.subprocess.PIPE
+    )
+    stdout, stderr = await process.communicate()
+    if check and process.returncode != 0:
+        raise Exception(f"Git {args[0]} failed: {stderr.decode().strip()}")
+    return stdout.decode(errors="replace")
+
+async def git_log(repo_path: str, log_format: str, *revisions: str):
+    # マージの取り込みでも親より先に子が並ぶよう --topo-order、名前の変更は削除と追加の両方のパスとして出力する
+    return await git_output(repo_path, 'log', '--topo-order', '--no-renames', '--name-only', f'--format={log_format}', *revisions, '--')
+
+async def git_is_ancestor(repo_path: str, ancestor: str, descendant: str) -> bool:
+    process = await asyncio.create_subprocess_exec(
+        'git', '-C', repo_path, 'merge-base', '--is-ancestor', ancestor, descendant,
+        stdout=asyncio.subprocess.PIPE,
+        stderr=asyncio.subprocess.PIPE
+    )
+    await process.communicate()
+    return process.returncode == 0
+
+async def git_rev_parse(repo_path: str, revision: str) -> str:
+    # 解決できない場合は空文字列を返す
+    return (await git_output(repo_path, 'rev-parse', '--verify', '-q', f'{revision}^{{commit}}', check=False)).strip()
+
+async def git_blame(repo_path: str, revision: str, file_path: str):
+    return await git_output(repo_path, 'blame', '--porcelain', revision, '--', file_path)
+
+async def git_diff(repo_path: str, base: str, target: str, *file_paths: str):
+    # 先頭にファイルごとの追加・削除行数（--numstat）、空行のあとにパッチが続く
+    return await git_output(repo_path, 'diff', '--no-renames', '--numstat', '-p', base, target, '--', *file_paths)
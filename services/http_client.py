@@ -0,0 +1,27 @@
+import logging
+import httpx
+from config.settings import (
+    LLM_HTTP_MAX_CONNECTIONS, LLM_HTTP_MAX_KEEPALIVE_CONNECTIONS, LLM_HTTP_KEEPALIVE_EXPIRY,
+    LLM_HTTP_CONNECT_TIMEOUT, LLM_HTTP_TIMEOUT
+)
+
+logger = logging.getLogger(__name__)
+
+# 全プロバイダーで共有するkeep-aliveコネクションプール
+# 接続数の上限とタイムアウトはSDKの既定値に頼らず、すべて設定から明示する
+http_client = httpx.AsyncClient(
+    limits=httpx.Limits(
+        max_connections=LLM_HTTP_MAX_CONNECTIONS,
+        max_keepalive_connections=LLM_HTTP_MAX_KEEPALIVE_CONNECTIONS,
+        keepalive_expiry=LLM_HTTP_KEEPALIVE_EXPIRY,
+    ),
+    timeout=httpx.Timeout(LLM_HTTP_TIMEOUT, connect=LLM_HTTP_CONNECT_TIMEOUT),
+)
+
+async def close_http_client():
+    """
+    共有コネクションプールを閉じる関数（アプリケーション終了時に呼び出す）
+    """
+    if not http_client.is_closed:
+        await http_client.aclose()
+        logger.info("LLM用HTTPコネクションプールを閉じました")
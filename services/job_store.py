@@ -0,0 +1,199 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from typing import Any, Dict, List, Optional
+
+# ジョブの状態。queued と running 以外は終了状態
+JOB_STATUSES = ("queued", "running", "succeeded", "failed", "cancelled")
+FINISHED_STATUSES = ("succeeded", "failed", "cancelled")
+
+_COLUMNS = "id, kind, status, params, result, error, done, total, cancel_requested, created_at, started_at, finished_at, owner, heartbeat_at"
+
+
+class JobStore:
+    """
+    バックグラウンドジョブを永続化するSQLiteのストア
+
+    ジョブの引数・結果はJSONで保存します。同じストアを使う複数のワーカー・プロセスが
+    同じジョブを二重に取り出さないよう、取り出し（claim_next）は状態が queued のままの場合だけ更新する条件付きのUPDATEで行います。
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.row_factory = sqlite3.Row
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS jobs ("
+            "id TEXT PRIMARY KEY, kind TEXT NOT NULL, status TEXT NOT NULL, params TEXT NOT NULL, "
+            "result TEXT, error TEXT, done INTEGER NOT NULL DEFAULT 0, total INTEGER NOT NULL DEFAULT 0, "
+            "cancel_requested INTEGER NOT NULL DEFAULT 0, created_at REAL NOT NULL, started_at REAL, finished_at REAL)"
+        )
+        # 実行しているワーカーの識別子と、生存を示す最終更新時刻（以前のスキーマのストアには列を追加する）
+        columns = {row["name"] for row in self._conn.execute("PRAGMA table_info(jobs)")}
+        for column, column_type in (("owner", "TEXT"), ("heartbeat_at", "REAL")):
+            if column not in columns:
+                self._conn.execute(f"ALTER TABLE jobs ADD COLUMN {column} {column_type}")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_jobs_status ON jobs (status, created_at)")
+        self._conn.commit()
+
+    def _to_dict(self, row: sqlite3.Row) -> Dict[str, Any]:
+        return {
+            "id": row["id"],
+            "kind": row["kind"],
+            "status": row["status"],
+            "params": json.loads(row["params"]),
+            "result": json.loads(row["result"]) if row["result"] is not None else None,
+            "error": row["error"],
+            "progress": {"done": row["done"], "total": row["total"]},
+            "cancel_requested": bool(row["cancel_requested"]),
+            "created_at": row["created_at"],
+            "started_at": row["started_at"],
+            "finished_at": row["finished_at"],
+            "owner": row["owner"],
+            "heartbeat_at": row["heartbeat_at"],
+        }
+
+    def create(self, kind: str, params: Dict[str, Any], total: int = 0) -> Dict[str, Any]:
+        job_id = uuid.uuid4().hex
+        with self._lock:
+            self._conn.execute(
+                "INSERT INTO jobs (id, kind, status, params, total, created_at) VALUES (?, ?, 'queued', ?, ?, ?)",
+                (job_id, kind, json.dumps(params, ensure_ascii=False), total, time.time())
+            )
+            self._conn.commit()
+        return self.get(job_id)
+
+    def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            row = self._conn.execute(f"SELECT {_COLUMNS} FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        return self._to_dict(row) if row is not None else None
+
+    def list(self, status: Optional[str] = None, limit: int = 50) -> List[Dict[str, Any]]:
+        query = f"SELECT {_COLUMNS} FROM jobs"
+        args: List[Any] = []
+        if status is not None:
+            query += " WHERE status = ?"
+            args.append(status)
+        query += " ORDER BY created_at DESC LIMIT ?"
+        args.append(limit)
+        with self._lock:
+            rows = self._conn.execute(query, args).fetchall()
+        return [self._to_dict(row) for row in rows]
+
+    def claim_next(self, owner: Optional[str] = None) -> Optional[Dict[str, Any]]:
+        """
+        最も古い待機中のジョブを owner が実行中のジョブにして返す（待機中のジョブがなければNone）
+        """
+        with self._lock:
+            while True:
+                row = self._conn.execute(
+                    "SELECT id FROM jobs WHERE status = 'queued' ORDER BY created_at LIMIT 1"
+                ).fetchone()
+                if row is None:
+                    return None
+                # 他のプロセスが同じジョブを先に取り出した場合は更新されないため、次の待機中のジョブを探す
+                now = time.time()
+                cursor = self._conn.execute(
+                    "UPDATE jobs SET status = 'running', started_at = ?, owner = ?, heartbeat_at = ? WHERE id = ? AND status = 'queued'",
+                    (now, owner, now, row["id"])
+                )
+                self._conn.commit()
+                if cursor.rowcount == 1:
+                    break
+        return self.get(row["id"])
+
+    def heartbeat(self, owner: str, job_ids: List[str]):
+        """
+        owner が実行中のジョブの生存時刻を更新する（更新が途絶えたジョブは fail_interrupted で失敗扱いになる）
+        """
+        if not job_ids:
+            return
+        with self._lock:
+            self._conn.execute(
+                f"UPDATE jobs SET heartbeat_at = ? WHERE owner = ? AND status = 'running' AND id IN ({', '.join('?' * len(job_ids))})",
+                (time.time(), owner, *job_ids)
+            )
+            self._conn.commit()
+
+    def cancel_requested(self, job_ids: List[str]) -> List[str]:
+        """
+        job_ids のうち中止が要求されているジョブのIDを返す（他のプロセスからの要求も含む）
+        """
+        if not job_ids:
+            return []
+        with self._lock:
+            rows = self._conn.execute(
+                f"SELECT id FROM jobs WHERE cancel_requested = 1 AND id IN ({', '.join('?' * len(job_ids))})", job_ids
+            ).fetchall()
+        return [row["id"] for row in rows]
+
+    def update_progress(self, job_id: str, done: int, total: int):
+        with self._lock:
+            self._conn.execute("UPDATE jobs SET done = ?, total = ? WHERE id = ?", (done, total, job_id))
+            self._conn.commit()
+
+    def finish(self, job_id: str, status: str, result: Any = None, error: Optional[str] = None):
+        with self._lock:
+            self._conn.execute(
+                "UPDATE jobs SET status = ?, result = ?, error = ?, finished_at = ? WHERE id = ?",
+                (status, json.dumps(result, ensure_ascii=False) if result is not None else None, error, time.time(), job_id)
+            )
+            self._conn.commit()
+
+    def request_cancel(self, job_id: str) -> Optional[str]:
+        """
+        ジョブの中止を要求し、要求後の状態を返す（ジョブが存在しなければNone）
+
+        待機中のジョブはその場で cancelled になり、実行中のジョブには中止要求の印を付けます。
+        """
+        with self._lock:
+            row = self._conn.execute("SELECT status FROM jobs WHERE id = ?", (job_id,)).fetchone()
+            if row is None:
+                return None
+            status = row["status"]
+            if status == "queued":
+                status = "cancelled"
+                self._conn.execute(
+                    "UPDATE jobs SET status = 'cancelled', cancel_requested = 1, finished_at = ? WHERE id = ?",
+                    (time.time(), job_id)
+                )
+            elif status == "running":
+                self._conn.execute("UPDATE jobs SET cancel_requested = 1 WHERE id = ?", (job_id,))
+            self._conn.commit()
+        return status
+
+    def fail_interrupted(self, lease_seconds: float) -> int:
+        """
+        実行中のまま lease_seconds 秒以上生存時刻が更新されていないジョブを失敗扱いにする
+
+        実行していたプロセスが停止したジョブが対象で、他の動いているプロセスが実行中のジョブは生存時刻が更新されるため対象になりません。
+        ファイルを書き換える処理を二重に実行しないため、再実行はしません。
+        """
+        now = time.time()
+        with self._lock:
+            cursor = self._conn.execute(
+                "UPDATE jobs SET status = 'failed', error = ?, finished_at = ? "
+                "WHERE status = 'running' AND COALESCE(heartbeat_at, started_at, 0) < ?",
+                ("サーバーの停止により中断されました", now, now - lease_seconds)
+            )
+            self._conn.commit()
+        return cursor.rowcount
+
+    def get_stats(self) -> Dict[str, int]:
+        with self._lock:
+            rows = self._conn.execute("SELECT status, COUNT(*) FROM jobs GROUP BY status").fetchall()
+        counts = {status: 0 for status in JOB_STATUSES}
+        counts.update({row[0]: row[1] for row in rows})
+        return counts
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
@@ -0,0 +1,280 @@
+import asyncio
+import json
+import logging
+import os
+import socket
+import uuid
+from functools import partial
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Sequence
+
+from config.settings import JOB_STORE_PATH, JOB_WORKERS, JOB_POLL_INTERVAL, JOB_HEARTBEAT_INTERVAL, JOB_LEASE_SECONDS
+from api.websocket import send_to_frontend
+from services.ai_service import (
+    ai_process, multi_ai_analyze, multi_ai_reply, multi_ai_rewrite, multi_ai_append, multi_ai_process,
+    multi_ai_analyze_dependencies,
+)
+from services.code_execution import execution_output
+from services.job_store import JobStore
+from services.resilience import llm_deadline
+from services.task_executor import summarize_results
+from services.telemetry import llm_project
+from utils.file_utils import get_file_path
+
+logger = logging.getLogger(__name__)
+
+
+class JobCancelledError(Exception):
+    """
+    実行中のジョブが中止要求により打ち切られたことを示す例外
+    """
+
+
+class JobContext:
+    """
+    実行中のジョブからマネージャーへ進捗を伝え、中止要求を受け取るためのオブジェクト
+    """
+
+    def __init__(self, manager: "JobManager", job: Dict[str, Any]):
+        self.manager = manager
+        self.job_id = job["id"]
+        self.kind = job["kind"]
+        self.cancel_event = asyncio.Event()
+
+    @property
+    def cancel_requested(self) -> bool:
+        return self.cancel_event.is_set()
+
+    async def progress(self, done: int, total: int, detail: Optional[Dict[str, Any]] = None):
+        await asyncio.to_thread(self.manager.store.update_progress, self.job_id, done, total)
+        # 他のプロセスで受け付けた中止要求はストアにしか記録されないため、ファイルごとの進捗のたびに確認する
+        if not self.cancel_requested and await asyncio.to_thread(self.manager.store.cancel_requested, [self.job_id]):
+            self.cancel_event.set()
+        await self.manager.notify("job_progress", {"job_id": self.job_id, "kind": self.kind, "done": done, "total": total, **(detail or {})})
+
+    async def output(self, detail: Dict[str, Any]):
+        """
+        ジョブ内で実行中のスクリプトの出力を1行ずつ通知する
+        """
+        await self.manager.notify("job_output", {"job_id": self.job_id, "kind": self.kind, **detail})
+
+    async def cancellable(self, awaitable: Awaitable[Any]) -> Any:
+        """
+        中止要求があった時点で awaitable をキャンセルし、JobCancelledError を送出する
+        """
+        task = asyncio.ensure_future(awaitable)
+        waiter = asyncio.ensure_future(self.cancel_event.wait())
+        try:
+            await asyncio.wait([task, waiter], return_when=asyncio.FIRST_COMPLETED)
+        finally:
+            waiter.cancel()
+            if not task.done():
+                task.cancel()
+                await asyncio.gather(task, return_exceptions=True)
+        if task.cancelled():
+            raise JobCancelledError("ジョブが中止されました")
+        return task.result()
+
+
+JobHandler = Callable[[Dict[str, Any], JobContext], Awaitable[Any]]
+
+
+class JobManager:
+    """
+    永続化されたジョブを取り出して実行するワーカープール
+
+    同時に実行するジョブは workers 件までで、それを超えるジョブはストアで待機します。
+    ジョブはリクエストを送ったクライアントとは独立に実行されるため、クライアントが切断しても処理は続きます。
+    状態の変化と進捗は notify（既定では WebSocket の send_to_frontend）で通知します。
+    実行中のジョブは一定間隔で生存時刻を更新し、更新が途絶えたジョブ（停止したプロセスのもの）だけを失敗扱いにします。
+    """
+
+    def __init__(
+        self,
+        store: JobStore,
+        handlers: Dict[str, JobHandler],
+        workers: int = JOB_WORKERS,
+        poll_interval: float = JOB_POLL_INTERVAL,
+        notify: Optional[Callable[[str, str], Awaitable[None]]] = None,
+        heartbeat_interval: float = JOB_HEARTBEAT_INTERVAL,
+        lease_seconds: float = JOB_LEASE_SECONDS,
+    ):
+        self.store = store
+        self.handlers = handlers
+        self.workers = max(1, workers)
+        self.poll_interval = poll_interval
+        self._send = notify or send_to_frontend
+        self._running: Dict[str, JobContext] = {}
+        self._worker_tasks: List[asyncio.Task] = []
+        self._wakeup: Optional[asyncio.Event] = None
+        self.heartbeat_interval = heartbeat_interval
+        self.lease_seconds = max(lease_seconds, heartbeat_interval * 2)
+        # ストアを共有する他のプロセスのワーカーと区別するための識別子
+        self.owner = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+
+    async def notify(self, message_type: str, payload: Dict[str, Any]):
+        try:
+            await self._send(json.dumps(payload, ensure_ascii=False), message_type=message_type)
+        except Exception as e:
+            logger.error(f"ジョブの通知に失敗しました: {str(e)}")
+
+    def start(self):
+        if self._worker_tasks:
+            return
+        self._fail_interrupted()
+        self._wakeup = asyncio.Event()
+        self._worker_tasks = [asyncio.ensure_future(self._worker()) for _ in range(self.workers)]
+        self._worker_tasks.append(asyncio.ensure_future(self._heartbeat()))
+        logger.info(f"ジョブワーカーを起動しました: {self.workers}件")
+
+    async def stop(self):
+        tasks, self._worker_tasks = self._worker_tasks, []
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    def submit(self, kind: str, params: Dict[str, Any], total: int = 0) -> Dict[str, Any]:
+        if kind not in self.handlers:
+            raise ValueError(f"未対応のジョブの種類です: {kind}")
+        job = self.store.create(kind, params, total)
+        logger.info(f"ジョブを登録しました: id={job['id']}, kind={kind}")
+        self.start()
+        self._wakeup.set()
+        return job
+
+    async def cancel(self, job_id: str) -> Optional[str]:
+        status = await asyncio.to_thread(self.store.request_cancel, job_id)
+        context = self._running.get(job_id)
+        if status == "running" and context is not None:
+            context.cancel_event.set()
+        elif status == "cancelled":
+            await self.notify("job_status", {"job_id": job_id, "status": "cancelled"})
+        return status
+
+    def _fail_interrupted(self):
+        interrupted = self.store.fail_interrupted(self.lease_seconds)
+        if interrupted:
+            logger.warning(f"停止したプロセスで実行中だったジョブを失敗扱いにしました: {interrupted}件")
+
+    async def _heartbeat(self):
+        while True:
+            await asyncio.sleep(self.heartbeat_interval)
+            try:
+                job_ids = list(self._running)
+                # SQLiteへの書き込みでイベントループを止めないよう、ストアの操作はスレッドで行う
+                await asyncio.to_thread(self.store.heartbeat, self.owner, job_ids)
+                for job_id in await asyncio.to_thread(self.store.cancel_requested, job_ids):
+                    context = self._running.get(job_id)
+                    if context is not None:
+                        context.cancel_event.set()
+                # 実行中に停止した他のプロセスのジョブも、起動を待たずに失敗扱いにする
+                await asyncio.to_thread(self._fail_interrupted)
+            except Exception as e:
+                logger.error(f"ジョブの生存時刻の更新に失敗しました: {str(e)}")
+
+    async def _worker(self):
+        while True:
+            job = await asyncio.to_thread(self.store.claim_next, self.owner)
+            if job is None:
+                self._wakeup.clear()
+                try:
+                    # 他のプロセスから登録されたジョブも拾えるよう、通知がなくても一定間隔でストアを確認する
+                    await asyncio.wait_for(self._wakeup.wait(), self.poll_interval)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+            await self._run(job)
+
+    async def _run(self, job: Dict[str, Any]):
+        context = JobContext(self, job)
+        self._running[job["id"]] = context
+        await self.notify("job_status", {"job_id": job["id"], "kind": job["kind"], "status": "running"})
+        try:
+            result = await self.handlers[job["kind"]](job["params"], context)
+            # 中止要求で残りを打ち切った場合も、完了済みの分の結果は保存する
+            status = "cancelled" if context.cancel_requested else "succeeded"
+            await asyncio.to_thread(self.store.finish, job["id"], status, result=result)
+            error = None
+        except JobCancelledError as e:
+            status, error = "cancelled", str(e)
+            await asyncio.to_thread(self.store.finish, job["id"], status, error=error)
+        except asyncio.CancelledError:
+            # 停止中は確実に記録するため、スレッドに渡さずその場で書き込む
+            self.store.finish(job["id"], "failed", error="サーバーの停止により中断されました")
+            raise
+        except Exception as e:
+            logger.error(f"ジョブの実行に失敗しました: id={job['id']}, kind={job['kind']}: {str(e)}")
+            status, error = "failed", str(e)
+            await asyncio.to_thread(self.store.finish, job["id"], status, error=error)
+        finally:
+            self._running.pop(job["id"], None)
+        await self.notify("job_status", {"job_id": job["id"], "kind": job["kind"], "status": status, "error": error})
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {"workers": self.workers, "running": len(self._running), "jobs": self.store.get_stats()}
+
+
+async def _run_multi_job(function: Callable[..., Awaitable[Any]], option_fields: Sequence[str], params: Dict[str, Any], context: JobContext):
+    file_paths = [get_file_path(params["project_id"], file_path, "") for file_path in params["file_paths"]]
+    results = []
+    with llm_deadline(params.get("deadline_seconds")), llm_project(params["project_id"]), execution_output(context.output):
+        records = await function(
+            file_paths,
+            version_control=params["version_control"],
+            execution_mode=params["execution_mode"],
+            use_cache=params["use_cache"],
+            max_concurrency=params.get("max_concurrency"),
+            file_timeout=params.get("file_timeout_seconds"),
+            fail_fast=params.get("fail_fast", False),
+            cancel_event=context.cancel_event,
+            stream=True,
+            **{field: params.get(field) for field in option_fields},
+        )
+        try:
+            async for record in records:
+                record = {**record, "file_path": params["file_paths"][record["index"]]}
+                results.append(record)
+                await context.progress(len(results), len(file_paths), {"file_path": record["file_path"], "file_status": record["status"]})
+        finally:
+            await records.aclose()
+    results.sort(key=lambda record: record["index"])
+    return {"result": results, "summary": summarize_results(results)}
+
+
+async def _run_ai_process_job(params: Dict[str, Any], context: JobContext):
+    file_path = get_file_path(params["project_id"], params["file_path"], "")
+    with llm_deadline(params.get("deadline_seconds")), llm_project(params["project_id"]), execution_output(context.output):
+        result = await context.cancellable(
+            ai_process(file_path, params["version_control"], params["change_type"], params["feature_request"], use_cache=params["use_cache"], edit_mode=params.get("edit_mode"))
+        )
+    await context.progress(1, 1)
+    return {"result": result}
+
+
+async def _run_dependencies_job(params: Dict[str, Any], context: JobContext):
+    file_paths = [get_file_path(params["project_id"], file_path, "") for file_path in params["file_paths"]]
+    with llm_deadline(params.get("deadline_seconds")), llm_project(params["project_id"]):
+        result = await context.cancellable(
+            multi_ai_analyze_dependencies(file_paths, params["version_control"], params["analysis_scope"], params["execution_mode"], use_cache=params["use_cache"])
+        )
+    await context.progress(1, 1)
+    return {"result": result}
+
+
+JOB_HANDLERS: Dict[str, JobHandler] = {
+    "ai_process": _run_ai_process_job,
+    "multi_ai_analyze": partial(_run_multi_job, multi_ai_analyze, ("analysis_depth",)),
+    "multi_ai_reply": partial(_run_multi_job, multi_ai_reply, ("change_type", "feature_request")),
+    "multi_ai_process": partial(_run_multi_job, multi_ai_process, ("change_type", "feature_request", "edit_mode")),
+    "multi_ai_rewrite": partial(_run_multi_job, multi_ai_rewrite, ("rewrite_style",)),
+    "multi_ai_append": partial(_run_multi_job, multi_ai_append, ("append_location",)),
+    "multi_ai_dependencies": _run_dependencies_job,
+}
+
+job_manager: Optional[JobManager] = None
+
+
+def get_job_manager() -> JobManager:
+    global job_manager
+    if job_manager is None:
+        job_manager = JobManager(JobStore(JOB_STORE_PATH), JOB_HANDLERS)
+    return job_manager
@@ -0,0 +1,267 @@
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, Optional
+
+from config.settings import (
+    LLM_CACHE_ENABLED, LLM_CACHE_DIR, LLM_CACHE_TTL_SECONDS,
+    LLM_CACHE_MEMORY_ENTRIES, LLM_CACHE_MAX_BYTES, LLM_SINGLEFLIGHT_ENABLED
+)
+from services.singleflight import llm_singleflight
+
+logger = logging.getLogger(__name__)
+
+# サイズ超過時に1回のクエリで読む、削除候補のエントリ数
+EVICTION_BATCH_SIZE = 64
+
+
+def make_cache_key(provider: str, model: str, temperature: float, max_tokens: int, prompt: str) -> str:
+    """
+    (provider, model, temperature, max_tokens, プロンプトのハッシュ) からキャッシュキーを生成する関数
+    """
+    prompt_hash = hashlib.sha256(prompt.encode("utf-8")).hexdigest()
+    raw_key = json.dumps([provider, model, temperature, max_tokens, prompt_hash])
+    return hashlib.sha256(raw_key.encode("utf-8")).hexdigest()
+
+
+class LLMCache:
+    """
+    メモリ上のLRUとディスク上のSQLiteストアからなる2段のLLMレスポンスキャッシュ
+
+    ディスク側はTTLと合計サイズの上限で古いエントリを削除します。合計サイズは書き込みのたびに集計せず、増減を保持します。
+    イベントループからは get_async / set_async を使い、ディスクの読み書きをスレッドで行います。
+    """
+
+    def __init__(self, cache_dir: str, ttl_seconds: int, memory_entries: int, max_bytes: int):
+        self.ttl_seconds = ttl_seconds
+        self.memory_entries = memory_entries
+        self.max_bytes = max_bytes
+        self._memory: "OrderedDict[str, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.stats = {"memory_hits": 0, "disk_hits": 0, "misses": 0, "bypasses": 0, "writes": 0, "evictions": 0}
+
+        os.makedirs(cache_dir, exist_ok=True)
+        self.db_path = os.path.join(cache_dir, "llm_cache.sqlite3")
+        self._conn = sqlite3.connect(self.db_path, check_same_thread=False)
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS entries ("
+            "key TEXT PRIMARY KEY, value TEXT NOT NULL, size INTEGER NOT NULL, "
+            "created_at REAL NOT NULL, accessed_at REAL NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_entries_accessed ON entries (accessed_at)")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_entries_created ON entries (created_at)")
+        self._conn.commit()
+        # ディスク上のエントリの合計サイズ（起動時に1回だけ集計し、以降は書き込み・削除のたびに増減させる）
+        self.total_bytes = self._conn.execute("SELECT COALESCE(SUM(size), 0) FROM entries").fetchone()[0]
+
+    def _get_memory(self, key: str, now: float) -> Optional[Dict[str, Any]]:
+        entry = self._memory.get(key)
+        if entry is None:
+            return None
+        created_at, value = entry
+        if now - created_at <= self.ttl_seconds:
+            self._memory.move_to_end(key)
+            self.stats["memory_hits"] += 1
+            return value
+        del self._memory[key]
+        return None
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        now = time.time()
+        with self._lock:
+            value = self._get_memory(key, now)
+            if value is not None:
+                return value
+
+            row = self._conn.execute(
+                "SELECT value, created_at, size FROM entries WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None or now - row[1] > self.ttl_seconds:
+                if row is not None:
+                    self._conn.execute("DELETE FROM entries WHERE key = ?", (key,))
+                    self._conn.commit()
+                    self.total_bytes -= row[2]
+                self.stats["misses"] += 1
+                return None
+
+            self._conn.execute("UPDATE entries SET accessed_at = ? WHERE key = ?", (now, key))
+            self._conn.commit()
+            value = json.loads(row[0])
+            self._remember(key, row[1], value)
+            self.stats["disk_hits"] += 1
+            return value
+
+    def set(self, key: str, value: Dict[str, Any]):
+        now = time.time()
+        serialized = json.dumps(value, ensure_ascii=False)
+        size = len(serialized.encode("utf-8"))
+        with self._lock:
+            self._remember(key, now, value)
+            previous = self._conn.execute("SELECT size FROM entries WHERE key = ?", (key,)).fetchone()
+            self._conn.execute(
+                "INSERT OR REPLACE INTO entries (key, value, size, created_at, accessed_at) VALUES (?, ?, ?, ?, ?)",
+                (key, serialized, size, now, now)
+            )
+            self.total_bytes += size - (previous[0] if previous else 0)
+            self._evict(now)
+            self._conn.commit()
+            self.stats["writes"] += 1
+
+    async def get_async(self, key: str) -> Optional[Dict[str, Any]]:
+        """
+        イベントループから呼び出す get（メモリにあればそのまま返し、ディスクの読み込みはスレッドで行う）
+        """
+        with self._lock:
+            value = self._get_memory(key, time.time())
+        if value is not None:
+            return value
+        return await asyncio.to_thread(self.get, key)
+
+    async def set_async(self, key: str, value: Dict[str, Any]):
+        """
+        イベントループから呼び出す set（ディスクへの書き込みはスレッドで行う）
+        """
+        await asyncio.to_thread(self.set, key, value)
+
+    def note_bypass(self):
+        with self._lock:
+            self.stats["bypasses"] += 1
+
+    def clear(self):
+        with self._lock:
+            self._memory.clear()
+            self._conn.execute("DELETE FROM entries")
+            self._conn.commit()
+            self.total_bytes = 0
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._lock:
+            entries = self._conn.execute("SELECT COUNT(*) FROM entries").fetchone()[0]
+            hits = self.stats["memory_hits"] + self.stats["disk_hits"]
+            lookups = hits + self.stats["misses"]
+            return {
+                **self.stats,
+                "hits": hits,
+                "hit_rate": hits / lookups if lookups else 0.0,
+                "memory_entries": len(self._memory),
+                "disk_entries": entries,
+                "disk_bytes": self.total_bytes,
+            }
+
+    def _remember(self, key: str, created_at: float, value: Dict[str, Any]):
+        self._memory[key] = (created_at, value)
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.memory_entries:
+            self._memory.popitem(last=False)
+
+    def _evict(self, now: float):
+        # TTL切れのエントリを削除（created_at の索引で期限切れの分だけを読む）
+        expired = self._conn.execute(
+            "DELETE FROM entries WHERE created_at < ? RETURNING size", (now - self.ttl_seconds,)
+        ).fetchall()
+        self.total_bytes -= sum(size for size, in expired)
+        self.stats["evictions"] += len(expired)
+
+        # 合計サイズが上限を超えている場合、最終アクセスが古い順に上限を下回るまで少しずつ削除
+        while self.total_bytes > self.max_bytes:
+            rows = self._conn.execute(
+                "SELECT key, size FROM entries ORDER BY accessed_at ASC LIMIT ?", (EVICTION_BATCH_SIZE,)
+            ).fetchall()
+            if not rows:
+                self.total_bytes = 0
+                return
+            for key, size in rows:
+                if self.total_bytes <= self.max_bytes:
+                    break
+                self._conn.execute("DELETE FROM entries WHERE key = ?", (key,))
+                self._memory.pop(key, None)
+                self.total_bytes -= size
+                self.stats["evictions"] += 1
+
+
+llm_cache = LLMCache(LLM_CACHE_DIR, LLM_CACHE_TTL_SECONDS, LLM_CACHE_MEMORY_ENTRIES, LLM_CACHE_MAX_BYTES)
+
+
+async def cached_generate(
+    provider: str,
+    model: str,
+    temperature: float,
+    max_tokens: int,
+    prompt: str,
+    generate: Callable[[], Awaitable[Dict[str, Any]]],
+    use_cache: bool = True,
+) -> Dict[str, Any]:
+    """
+    キャッシュを確認し、ヒットしなければ generate を呼び出して結果を保存する関数
+
+    use_cache=False の場合はキャッシュを読まずにプロバイダーへ問い合わせ、結果でキャッシュを更新します。
+    キャッシュの有無にかかわらず、同じパラメータで実行中の呼び出しがあればそれに相乗りします。
+    """
+    key = make_cache_key(provider, model, temperature, max_tokens, prompt)
+    if LLM_CACHE_ENABLED:
+        if use_cache:
+            cached = await llm_cache.get_async(key)
+            if cached is not None:
+                logger.info(f"LLMキャッシュにヒットしました: provider={provider}, model={model}")
+                return {**cached, "cached": True}
+        else:
+            llm_cache.note_bypass()
+
+    async def generate_and_store() -> Dict[str, Any]:
+        result = await generate()
+        if LLM_CACHE_ENABLED:
+            await llm_cache.set_async(key, result)
+        return result
+
+    if not LLM_SINGLEFLIGHT_ENABLED:
+        return await generate_and_store()
+    # 相乗りした呼び出しは先頭の呼び出しの結果をそのまま受け取るため、キャッシュと同じく完全に同じプロンプトだけを相乗りさせる
+    return await llm_singleflight.do(key, generate_and_store)
+
+
+async def cached_stream(
+    provider: str,
+    model: str,
+    temperature: float,
+    max_tokens: int,
+    prompt: str,
+    stream: Callable[[], AsyncIterator[str]],
+    use_cache: bool = True,
+) -> AsyncIterator[str]:
+    """
+    ストリーミング生成用のキャッシュラッパー
+
+    キャッシュにヒットした場合は保存済みのテキストを1チャンクで返し、
+    ミスした場合はストリームをそのまま流しつつ、完了後に全文をキャッシュへ保存します。
+    """
+    key = make_cache_key(provider, model, temperature, max_tokens, prompt)
+    if LLM_CACHE_ENABLED:
+        if use_cache:
+            cached = await llm_cache.get_async(key)
+            if cached is not None:
+                logger.info(f"LLMキャッシュにヒットしました（ストリーミング）: provider={provider}, model={model}")
+                yield cached["generated_text"]
+                return
+        else:
+            llm_cache.note_bypass()
+
+    async def stream_and_store() -> AsyncIterator[str]:
+        chunks = []
+        async for chunk in stream():
+            chunks.append(chunk)
+            yield chunk
+        if LLM_CACHE_ENABLED:
+            await llm_cache.set_async(key, {"generated_text": "".join(chunks)})
+
+    if not LLM_SINGLEFLIGHT_ENABLED:
+        async for chunk in stream_and_store():
+            yield chunk
+        return
+    async for chunk in llm_singleflight.stream(key, stream_and_store):
+        yield chunk
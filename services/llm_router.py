@@ -0,0 +1,263 @@
+import asyncio
+import logging
+import time
+from collections import deque
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+
+from config.settings import (
+    LLM_ROUTER_PROVIDERS, LLM_ROUTER_WINDOW_SIZE, LLM_ROUTER_WINDOW_SECONDS,
+    LLM_ROUTER_MIN_SAMPLES, LLM_ROUTER_ERROR_THRESHOLD,
+    LLM_HEDGE_OPERATIONS, LLM_HEDGE_DEFAULT_DELAY, LLM_WHOLE_FILE_OPERATIONS, LLM_CONTEXT_TOKEN_BUDGET
+)
+from services.anthropic_service import generate_text_anthropic, ANTHROPIC_MODEL, ANTHROPIC_MAX_TOKENS
+from services.openai_service import generate_text_gpt4o, OPENAI_MODEL, OPENAI_MAX_TOKENS
+from services.gemini_service import generate_text_gemini, GEMINI_MODEL, generation_config as gemini_generation_config
+from services.telemetry import llm_operation
+from utils.tokens import estimate_tokens
+
+logger = logging.getLogger(__name__)
+
+GenerateFunc = Callable[..., Awaitable[Dict[str, Any]]]
+
+
+class PromptTooLargeError(ValueError):
+    """
+    プロンプトがコンテキストの上限を超えているため送信しなかったことを示す例外
+    """
+
+
+class ProviderStats:
+    """
+    プロバイダー・モデル・操作ごとの直近のレイテンシとエラー率を保持するクラス
+    """
+
+    def __init__(self, window_size: int, window_seconds: float):
+        self.window_seconds = window_seconds
+        self.samples: deque = deque(maxlen=window_size)  # (時刻, レイテンシ, 成功したか)
+
+    def record(self, latency: float, ok: bool):
+        self.samples.append((time.monotonic(), latency, ok))
+
+    def _recent(self) -> List[Tuple[float, float, bool]]:
+        cutoff = time.monotonic() - self.window_seconds
+        return [sample for sample in self.samples if sample[0] >= cutoff]
+
+    def latency_percentile(self, percentile: float) -> Optional[float]:
+        latencies = sorted(latency for _, latency, ok in self._recent() if ok)
+        if not latencies:
+            return None
+        index = min(len(latencies) - 1, int(round(percentile / 100 * (len(latencies) - 1))))
+        return latencies[index]
+
+    def error_rate(self) -> float:
+        recent = self._recent()
+        if not recent:
+            return 0.0
+        return sum(1 for _, _, ok in recent if not ok) / len(recent)
+
+    def sample_count(self) -> int:
+        return len(self._recent())
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "samples": self.sample_count(),
+            "error_rate": self.error_rate(),
+            "p50": self.latency_percentile(50),
+            "p95": self.latency_percentile(95),
+        }
+
+
+class ProviderRouter:
+    """
+    直近のレイテンシとエラー率をもとに、操作ごとに最速かつ健全なプロバイダーを選択するルーター
+
+    ヘッジ対象の操作では、プライマリがp95レイテンシを超えた時点で次点のプロバイダーに
+    バックアップリクエストを送り、先に完了した方を採用して残りをキャンセルします。
+    ファイル全体を出力する操作は、出力トークンの上限が最も大きいプロバイダーの中からだけ選びます。
+    """
+
+    def __init__(
+        self,
+        providers: Dict[str, Tuple[str, GenerateFunc]],
+        window_size: int = LLM_ROUTER_WINDOW_SIZE,
+        window_seconds: float = LLM_ROUTER_WINDOW_SECONDS,
+        min_samples: int = LLM_ROUTER_MIN_SAMPLES,
+        error_threshold: float = LLM_ROUTER_ERROR_THRESHOLD,
+        hedge_operations: Optional[List[str]] = None,
+        hedge_default_delay: float = LLM_HEDGE_DEFAULT_DELAY,
+        output_limits: Optional[Dict[str, int]] = None,
+        whole_file_operations: Optional[List[str]] = None,
+    ):
+        self.providers = providers
+        self.window_size = window_size
+        self.window_seconds = window_seconds
+        self.min_samples = min_samples
+        self.error_threshold = error_threshold
+        self.hedge_operations = set(hedge_operations if hedge_operations is not None else LLM_HEDGE_OPERATIONS)
+        self.hedge_default_delay = hedge_default_delay
+        self.output_limits = output_limits or {}
+        self.whole_file_operations = set(whole_file_operations if whole_file_operations is not None else LLM_WHOLE_FILE_OPERATIONS)
+        self.stats: Dict[Tuple[str, str, str], ProviderStats] = {}
+
+    def _stats_for(self, provider: str, operation: str) -> ProviderStats:
+        model = self.providers[provider][0]
+        key = (provider, model, operation)
+        if key not in self.stats:
+            self.stats[key] = ProviderStats(self.window_size, self.window_seconds)
+        return self.stats[key]
+
+    def is_healthy(self, provider: str, operation: str) -> bool:
+        stats = self._stats_for(provider, operation)
+        if stats.sample_count() < self.min_samples:
+            return True
+        return stats.error_rate() < self.error_threshold
+
+    def candidates(self, operation: str) -> List[str]:
+        """
+        操作を任せられるプロバイダーを設定順で返す関数
+
+        ファイル全体を出力する操作では、出力が途中で切れないよう出力トークンの上限が最大のものに限ります。
+        """
+        providers = list(self.providers)
+        if operation not in self.whole_file_operations or not self.output_limits:
+            return providers
+        largest = max(self.output_limits.get(provider, 0) for provider in providers)
+        return [provider for provider in providers if self.output_limits.get(provider, 0) >= largest]
+
+    def rank(self, operation: str) -> List[str]:
+        """
+        操作に対するプロバイダーの優先順位を返す関数
+
+        健全なものを先に、その中ではp50レイテンシの小さい順に並べます。
+        計測データが足りないプロバイダーは設定順を保ったまま計測済みのものの後ろに置きます。
+        """
+        def sort_key(item):
+            order, provider = item
+            stats = self._stats_for(provider, operation)
+            p50 = stats.latency_percentile(50)
+            measured = p50 is not None and stats.sample_count() >= self.min_samples
+            return (not self.is_healthy(provider, operation), not measured, p50 if measured else 0.0, order)
+
+        return [provider for _, provider in sorted(enumerate(self.candidates(operation)), key=sort_key)]
+
+    def _hedge_delay(self, provider: str, operation: str) -> float:
+        stats = self._stats_for(provider, operation)
+        p95 = stats.latency_percentile(95)
+        if p95 is None or stats.sample_count() < self.min_samples:
+            return self.hedge_default_delay
+        return p95
+
+    async def _call(self, provider: str, operation: str, prompt: str, use_cache: bool) -> Dict[str, Any]:
+        generate = self.providers[provider][1]
+        start = time.monotonic()
+        try:
+            result = await generate(prompt, use_cache=use_cache)
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            self._stats_for(provider, operation).record(time.monotonic() - start, False)
+            raise
+        # キャッシュヒットや相乗りした呼び出しはプロバイダーのレイテンシを表さないので記録しない
+        if not result.get("cached") and not result.get("coalesced"):
+            self._stats_for(provider, operation).record(time.monotonic() - start, True)
+        return {**result, "provider": provider, "model": self.providers[provider][0]}
+
+    async def _hedged_call(self, primary: str, backup: str, operation: str, prompt: str, use_cache: bool) -> Dict[str, Any]:
+        primary_task = asyncio.create_task(self._call(primary, operation, prompt, use_cache))
+        tasks = [primary_task]
+        try:
+            delay = self._hedge_delay(primary, operation)
+            done, _ = await asyncio.wait({primary_task}, timeout=delay)
+            if done:
+                if primary_task.exception() is None:
+                    return primary_task.result()
+                primary_error = primary_task.exception()
+                logger.warning(f"{primary}での生成に失敗したため{backup}を試します: operation={operation}, エラー={str(primary_error)}")
+                try:
+                    return await self._call(backup, operation, prompt, use_cache)
+                except Exception as e:
+                    primary_error.add_note(f"{backup}でも失敗しました: {type(e).__name__}: {e}")
+                    raise primary_error
+
+            logger.info(f"{primary}が{delay:.1f}秒以内に応答しないため、{backup}にヘッジリクエストを送信します: operation={operation}")
+            tasks.append(asyncio.create_task(self._call(backup, operation, prompt, use_cache)))
+            pending = set(tasks)
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        return task.result()
+            # 両方失敗した場合はプライマリのエラーを送出する
+            primary_error = primary_task.exception()
+            backup_error = tasks[1].exception()
+            primary_error.add_note(f"{backup}でも失敗しました: {type(backup_error).__name__}: {backup_error}")
+            raise primary_error
+        finally:
+            # 負けた側（または呼び出し元のキャンセル時は両方）のリクエストをキャンセルする
+            for task in tasks:
+                if not task.done():
+                    task.cancel()
+
+    async def generate(self, prompt: str, operation: str, use_cache: bool = True) -> Dict[str, Any]:
+        """
+        ルーティングしてテキストを生成する関数
+
+        選択したプロバイダーが失敗した場合は次の候補へフェイルオーバーします。
+        すべて失敗した場合は最初のプロバイダーのエラーを送出し、後続のエラーは注記として添えます。
+        """
+        ranked = self.rank(operation)
+        hedge = operation in self.hedge_operations and len(ranked) > 1
+        first_error: Optional[Exception] = None
+        index = 0
+        while index < len(ranked):
+            provider = ranked[index]
+            try:
+                if hedge and index == 0:
+                    # ヘッジ呼び出しは上位2つのプロバイダーをまとめて試す
+                    index = 2
+                    return await self._hedged_call(provider, ranked[1], operation, prompt, use_cache)
+                index += 1
+                return await self._call(provider, operation, prompt, use_cache)
+            except Exception as e:
+                logger.warning(f"{provider}での生成に失敗したため次のプロバイダーを試します: operation={operation}, エラー={str(e)}")
+                if first_error is None:
+                    first_error = e
+                else:
+                    first_error.add_note(f"{provider}でも失敗しました: {type(e).__name__}: {e}")
+        raise first_error
+
+    def get_stats(self) -> List[Dict[str, Any]]:
+        return [
+            {"provider": provider, "model": model, "operation": operation,
+             "healthy": self.is_healthy(provider, operation), **stats.to_dict()}
+            for (provider, model, operation), stats in self.stats.items()
+        ]
+
+
+AVAILABLE_PROVIDERS: Dict[str, Tuple[str, GenerateFunc]] = {
+    "anthropic": (ANTHROPIC_MODEL, generate_text_anthropic),
+    "openai": (OPENAI_MODEL, generate_text_gpt4o),
+    "gemini": (GEMINI_MODEL, generate_text_gemini),
+}
+
+# 各プロバイダーに指定している出力トークンの上限
+OUTPUT_LIMITS: Dict[str, int] = {
+    "anthropic": ANTHROPIC_MAX_TOKENS,
+    "openai": OPENAI_MAX_TOKENS,
+    "gemini": gemini_generation_config["max_output_tokens"],
+}
+
+llm_router = ProviderRouter({name: AVAILABLE_PROVIDERS[name] for name in LLM_ROUTER_PROVIDERS}, output_limits=OUTPUT_LIMITS)
+
+
+async def generate_text(prompt: str, operation: str, use_cache: bool = True) -> Dict[str, Any]:
+    """
+    ai_serviceの各関数から呼び出す、プロバイダー非依存のテキスト生成関数
+
+    送信前にトークン数を見積もり、上限を超えるプロンプトは長時間待たせずに即座にエラーにします。
+    """
+    tokens = estimate_tokens(prompt)
+    if tokens > LLM_CONTEXT_TOKEN_BUDGET:
+        raise PromptTooLargeError(f"プロンプトが上限を超えています: 約{tokens}トークン（上限 {LLM_CONTEXT_TOKEN_BUDGET}）, operation={operation}")
+    with llm_operation(operation):
+        return await llm_router.generate(prompt, operation, use_cache=use_cache)
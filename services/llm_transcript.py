@@ -0,0 +1,133 @@
+import asyncio
+import logging
+import time
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, List, Optional
+
+from config.settings import LLM_TRANSCRIPT_MODE, LLM_TRANSCRIPT_PATH, LLM_REPLAY_TIME_SCALE
+from services.transcript_store import TranscriptStore, make_request_key
+from services.telemetry import CallTrace, current_operation, current_trace, note_usage
+
+logger = logging.getLogger(__name__)
+
+
+class TranscriptMissError(LookupError):
+    """
+    再生モードでトランスクリプトに該当するリクエストが記録されていないことを示す例外
+    """
+
+
+transcript_store: Optional[TranscriptStore] = None
+
+
+def get_transcript_store() -> TranscriptStore:
+    global transcript_store
+    if transcript_store is None:
+        transcript_store = TranscriptStore(LLM_TRANSCRIPT_PATH)
+    return transcript_store
+
+
+def _usage_of(trace: Optional[CallTrace]) -> List[int]:
+    if trace is None:
+        return [0, 0, 0]
+    return [trace.input_tokens, trace.output_tokens, trace.cached_tokens]
+
+
+def _request(provider: str, model: str, temperature: float, max_tokens: int, prompt: str) -> Dict[str, Any]:
+    return {"provider": provider, "model": model, "temperature": temperature, "max_tokens": max_tokens, "prompt": prompt}
+
+
+async def transcript_generate(
+    provider: str,
+    model: str,
+    temperature: float,
+    max_tokens: int,
+    prompt: str,
+    generate: Callable[[], Awaitable[Dict[str, Any]]],
+) -> Dict[str, Any]:
+    """
+    LLM_TRANSCRIPT_MODE に応じて、上流への呼び出しを記録（record）または記録からの再生（replay）に切り替える関数
+
+    再生時は記録時のレイテンシに LLM_REPLAY_TIME_SCALE を掛けた時間だけ待ってから応答を返します（0なら待たない）。
+    キャッシュや相乗りより内側で動作するため、再生による計測ではキャッシュを無効にしてください。
+    """
+    if LLM_TRANSCRIPT_MODE == "off":
+        return await generate()
+
+    key = make_request_key(provider, model, temperature, max_tokens, prompt)
+    store = get_transcript_store()
+    if LLM_TRANSCRIPT_MODE == "replay":
+        started_at = time.monotonic()
+        # SQLiteの読み込みと展開はイベントループを止めないようスレッドで行う（計測するレイテンシを歪めないため）
+        entry = await asyncio.to_thread(store.next_for, key)
+        if entry is None:
+            raise TranscriptMissError(f"トランスクリプトに記録されていないリクエストです: provider={provider}, model={model}")
+        # 読み込みにかかった時間も記録時のレイテンシに含める
+        delay = started_at + entry["latency"] * LLM_REPLAY_TIME_SCALE - time.monotonic()
+        if delay > 0:
+            await asyncio.sleep(delay)
+        note_usage(*entry["usage"])
+        return entry["response"]
+
+    trace = current_trace.get()
+    usage_before = _usage_of(trace)
+    started_at = time.monotonic()
+    result = await generate()
+    latency = time.monotonic() - started_at
+    usage = [after - before for after, before in zip(_usage_of(trace), usage_before)]
+    await asyncio.to_thread(store.append, key, provider, model, current_operation.get(), False, latency, {
+        "request": _request(provider, model, temperature, max_tokens, prompt),
+        "response": result,
+        "usage": usage,
+    })
+    return result
+
+
+async def transcript_stream(
+    provider: str,
+    model: str,
+    temperature: float,
+    max_tokens: int,
+    prompt: str,
+    stream: Callable[[], AsyncIterator[str]],
+    trace: CallTrace,
+) -> AsyncIterator[str]:
+    """
+    ストリーミング呼び出し用の記録・再生
+
+    各チャンクは呼び出し開始からの経過時間とともに記録され、再生時は同じ間隔（を LLM_REPLAY_TIME_SCALE 倍したもの）で返します。
+    """
+    if LLM_TRANSCRIPT_MODE == "off":
+        async for chunk in stream():
+            yield chunk
+        return
+
+    key = make_request_key(provider, model, temperature, max_tokens, prompt)
+    store = get_transcript_store()
+    if LLM_TRANSCRIPT_MODE == "replay":
+        entry = await asyncio.to_thread(store.next_for, key)
+        if entry is None:
+            raise TranscriptMissError(f"トランスクリプトに記録されていないストリームです: provider={provider}, model={model}")
+        trace.status = "ok"
+        started_at = time.monotonic()
+        for offset, chunk in entry["chunks"]:
+            delay = started_at + offset * LLM_REPLAY_TIME_SCALE - time.monotonic()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            yield chunk
+        trace.add_usage(*entry["usage"])
+        return
+
+    usage_before = _usage_of(trace)
+    started_at = time.monotonic()
+    chunks = []
+    async for chunk in stream():
+        chunks.append([time.monotonic() - started_at, chunk])
+        yield chunk
+    latency = time.monotonic() - started_at
+    usage = [after - before for after, before in zip(_usage_of(trace), usage_before)]
+    await asyncio.to_thread(store.append, key, provider, model, current_operation.get(), True, latency, {
+        "request": _request(provider, model, temperature, max_tokens, prompt),
+        "response": {"generated_text": "".join(chunk for _, chunk in chunks)},
+        "chunks": chunks,
+        "usage": usage,
+    })
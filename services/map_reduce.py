@@ -0,0 +1,74 @@
+import asyncio
+import logging
+from typing import Any, Callable, Dict, List
+
+from config.settings import LLM_CONTEXT_TOKEN_BUDGET, LLM_CHUNK_TOKENS
+from services.llm_router import generate_text
+from utils.tokens import estimate_tokens
+
+logger = logging.getLogger(__name__)
+
+
+def fits_budget(prompt: str) -> bool:
+    return estimate_tokens(prompt) <= LLM_CONTEXT_TOKEN_BUDGET
+
+
+async def map_chunks(chunks: List[str], build_prompt: Callable[[int, int, str], str], operation: str, use_cache: bool = True) -> List[Dict[str, Any]]:
+    """
+    各チャンクに対するプロンプトを並列に送信し、チャンクと同じ順序で結果を返す関数
+
+    build_prompt は (チャンク番号(1始まり), チャンク数, チャンク) を受け取ってプロンプトを返します。
+    """
+    total = len(chunks)
+    logger.info(f"{operation}: 入力を{total}個のチャンクに分割して並列に処理します")
+    return await asyncio.gather(*[
+        generate_text(build_prompt(index + 1, total, chunk), operation=operation, use_cache=use_cache)
+        for index, chunk in enumerate(chunks)
+    ])
+
+
+async def reduce_results(texts: List[str], build_prompt: Callable[[List[str]], str], operation: str, use_cache: bool = True) -> Dict[str, Any]:
+    """
+    部分ごとの結果を1つに統合する関数
+
+    統合用のプロンプトが上限を超える場合は、上限に収まるグループごとに統合してから再度統合します。
+    """
+    prompt = build_prompt(texts)
+    if fits_budget(prompt) or len(texts) <= 1:
+        return await generate_text(prompt, operation=operation, use_cache=use_cache)
+
+    groups, current, current_tokens = [], [], 0
+    for text in texts:
+        tokens = estimate_tokens(text)
+        if current and current_tokens + tokens > LLM_CHUNK_TOKENS:
+            groups.append(current)
+            current, current_tokens = [], 0
+        current.append(text)
+        current_tokens += tokens
+    if current:
+        groups.append(current)
+    if len(groups) == len(texts):
+        # これ以上まとめられない場合は2件ずつ統合して段数を減らす
+        groups = [texts[i:i + 2] for i in range(0, len(texts), 2)]
+
+    partials = await asyncio.gather(*[
+        generate_text(build_prompt(group), operation=operation, use_cache=use_cache) for group in groups
+    ])
+    return await reduce_results([partial["generated_text"] for partial in partials], build_prompt, operation, use_cache)
+
+
+async def map_reduce(
+    chunks: List[str],
+    map_prompt: Callable[[int, int, str], str],
+    reduce_prompt: Callable[[List[str]], str],
+    operation: str,
+    use_cache: bool = True,
+) -> Dict[str, Any]:
+    """
+    チャンクごとの分析を並列に行い（map）、その結果を統合する（reduce）関数
+
+    全体の待ち時間は入力全体の大きさではなく、最も遅いチャンクと統合処理の時間で決まります。
+    """
+    results = await map_chunks(chunks, map_prompt, operation, use_cache)
+    reduced = await reduce_results([result["generated_text"] for result in results], reduce_prompt, operation, use_cache)
+    return {**reduced, "chunks": len(chunks)}
@@ -0,0 +1,358 @@
+"""
+Anthropic / OpenAI / Gemini のAPIを模したローカルのモックLLMサーバー
+
+APIキーや課金なしで ai_service・api/ai_operations・domain_exe を動かし、
+スループットや並列度の設定をオフラインで再現性のある形でベンチマークするために使います。
+
+使い方:
+    python -m services.mock_llm_server --port 8020 --latency-median 1.5 --latency-sigma 0.5 --error-429 0.05
+    ANTHROPIC_BASE_URL=http://127.0.0.1:8020 \\
+    OPENAI_BASE_URL=http://127.0.0.1:8020/v1 \\
+    GEMINI_BASE_URL=http://127.0.0.1:8020 uvicorn main:app
+
+実行中の設定は GET/POST /mock/config で確認・変更でき、受信件数は GET /mock/stats で確認できます。
+"""
+import argparse
+import asyncio
+import hashlib
+import json
+import math
+import random
+import socket
+import threading
+import time
+import uuid
+from typing import Any, AsyncIterator, Dict, List, Optional
+
+import uvicorn
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+
+
+class MockConfig:
+    """
+    モックサーバーの応答特性
+
+    レイテンシは中央値 latency_median 秒・形状 latency_sigma の対数正規分布に従います。
+    ストリーミング時は同じ分布から最初のトークンまでの時間を決め、その後 chunk_interval 秒ごとにチャンクを送ります。
+    """
+
+    FIELDS = (
+        "latency_median", "latency_sigma", "chunk_interval", "chunk_words",
+        "response_words", "error_429_rate", "error_5xx_rate", "retry_after", "seed",
+    )
+
+    def __init__(
+        self,
+        latency_median: float = 1.0,
+        latency_sigma: float = 0.5,
+        chunk_interval: float = 0.02,
+        chunk_words: int = 5,
+        response_words: int = 200,
+        error_429_rate: float = 0.0,
+        error_5xx_rate: float = 0.0,
+        retry_after: float = 1.0,
+        seed: Optional[int] = None,
+    ):
+        self.latency_median = latency_median
+        self.latency_sigma = latency_sigma
+        self.chunk_interval = chunk_interval
+        self.chunk_words = chunk_words
+        self.response_words = response_words
+        self.error_429_rate = error_429_rate
+        self.error_5xx_rate = error_5xx_rate
+        self.retry_after = retry_after
+        self.seed = seed
+        self.random = random.Random(seed)
+
+    def update(self, values: Dict[str, Any]):
+        for field in self.FIELDS:
+            if field in values:
+                setattr(self, field, values[field])
+        if "seed" in values:
+            self.random = random.Random(self.seed)
+
+    def sample_latency(self) -> float:
+        if self.latency_median <= 0:
+            return 0.0
+        return self.random.lognormvariate(math.log(self.latency_median), self.latency_sigma)
+
+    def sample_error(self) -> Optional[int]:
+        roll = self.random.random()
+        if roll < self.error_429_rate:
+            return 429
+        if roll < self.error_429_rate + self.error_5xx_rate:
+            return self.random.choice([500, 502, 503])
+        return None
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {field: getattr(self, field) for field in self.FIELDS}
+
+
+def mock_text(prompt: str, words: int) -> str:
+    """
+    プロンプトから決定的に応答テキストを作る（同じプロンプトには常に同じ応答を返す）
+    """
+    digest = hashlib.sha256(prompt.encode("utf-8")).hexdigest()
+    body = " ".join(f"token{digest[i % len(digest)]}{i}" for i in range(max(0, words - 1)))
+    return f"```\n# mock {digest[:12]}\n{body}\n```"
+
+
+def split_words(text: str, chunk_words: int) -> List[str]:
+    words = text.split(" ")
+    chunks = []
+    for i in range(0, len(words), max(1, chunk_words)):
+        chunk = " ".join(words[i:i + chunk_words])
+        chunks.append(chunk if i == 0 else " " + chunk)
+    return chunks
+
+
+def count_tokens(text: str) -> int:
+    return max(1, len(text) // 4)
+
+
+def sse(data: Any, event: Optional[str] = None) -> str:
+    prefix = f"event: {event}\n" if event else ""
+    return f"{prefix}data: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+
+def anthropic_prompt(body: Dict[str, Any]) -> str:
+    parts = []
+    for message in body.get("messages", []):
+        content = message.get("content")
+        if isinstance(content, str):
+            parts.append(content)
+        else:
+            parts.extend(block.get("text", "") for block in content or [])
+    return "\n".join(parts)
+
+
+def openai_prompt(body: Dict[str, Any]) -> str:
+    return "\n".join(str(message.get("content", "")) for message in body.get("messages", []))
+
+
+def gemini_prompt(body: Dict[str, Any]) -> str:
+    return "\n".join(
+        part.get("text", "")
+        for content in body.get("contents", [])
+        for part in content.get("parts", [])
+    )
+
+
+def error_response(provider: str, status_code: int, retry_after: float) -> JSONResponse:
+    message = "mock rate limit" if status_code == 429 else "mock server error"
+    if provider == "anthropic":
+        error_type = "rate_limit_error" if status_code == 429 else "api_error"
+        body = {"type": "error", "error": {"type": error_type, "message": message}}
+    elif provider == "openai":
+        body = {"error": {"message": message, "type": "rate_limit_exceeded" if status_code == 429 else "server_error", "code": None}}
+    else:
+        body = {"error": {"code": status_code, "message": message, "status": "RESOURCE_EXHAUSTED" if status_code == 429 else "INTERNAL"}}
+    headers = {"retry-after": str(retry_after)} if status_code == 429 else {}
+    return JSONResponse(body, status_code=status_code, headers=headers)
+
+
+def create_app(config: Optional[MockConfig] = None) -> FastAPI:
+    config = config or MockConfig()
+    app = FastAPI(title="Mock LLM Server")
+    app.state.config = config
+    app.state.stats = {"requests": 0, "streams": 0, "errors": 0, "by_provider": {}}
+
+    async def begin(provider: str, stream: bool) -> Optional[JSONResponse]:
+        stats = app.state.stats
+        stats["requests"] += 1
+        stats["by_provider"][provider] = stats["by_provider"].get(provider, 0) + 1
+        if stream:
+            stats["streams"] += 1
+        status_code = config.sample_error()
+        if status_code is not None:
+            stats["errors"] += 1
+            # エラーも実際のAPIと同様にある程度待たせてから返す
+            await asyncio.sleep(config.sample_latency() / 4)
+            return error_response(provider, status_code, config.retry_after)
+        return None
+
+    async def paced(chunks: List[str]) -> AsyncIterator[str]:
+        await asyncio.sleep(config.sample_latency())
+        for index, chunk in enumerate(chunks):
+            if index:
+                await asyncio.sleep(config.chunk_interval)
+            yield chunk
+
+    @app.get("/mock/config")
+    async def get_config():
+        return config.to_dict()
+
+    @app.post("/mock/config")
+    async def update_config(request: Request):
+        config.update(await request.json())
+        return config.to_dict()
+
+    @app.get("/mock/stats")
+    async def get_stats():
+        return app.state.stats
+
+    @app.post("/v1/messages")
+    async def anthropic_messages(request: Request):
+        body = await request.json()
+        stream = bool(body.get("stream"))
+        error = await begin("anthropic", stream)
+        if error is not None:
+            return error
+        prompt = anthropic_prompt(body)
+        text = mock_text(prompt, config.response_words)
+        model = body.get("model", "mock")
+        message_id = f"msg_mock_{uuid.uuid4().hex[:16]}"
+        usage = {"input_tokens": count_tokens(prompt), "output_tokens": count_tokens(text),
+                 "cache_creation_input_tokens": 0, "cache_read_input_tokens": 0}
+
+        if not stream:
+            await asyncio.sleep(config.sample_latency())
+            return {
+                "id": message_id, "type": "message", "role": "assistant", "model": model,
+                "content": [{"type": "text", "text": text}],
+                "stop_reason": "end_turn", "stop_sequence": None, "usage": usage,
+            }
+
+        async def events():
+            yield sse({"type": "message_start", "message": {
+                "id": message_id, "type": "message", "role": "assistant", "model": model, "content": [],
+                "stop_reason": None, "stop_sequence": None, "usage": {**usage, "output_tokens": 1},
+            }}, "message_start")
+            yield sse({"type": "content_block_start", "index": 0, "content_block": {"type": "text", "text": ""}}, "content_block_start")
+            async for chunk in paced(split_words(text, config.chunk_words)):
+                yield sse({"type": "content_block_delta", "index": 0, "delta": {"type": "text_delta", "text": chunk}}, "content_block_delta")
+            yield sse({"type": "content_block_stop", "index": 0}, "content_block_stop")
+            yield sse({"type": "message_delta", "delta": {"stop_reason": "end_turn", "stop_sequence": None},
+                       "usage": {"output_tokens": usage["output_tokens"]}}, "message_delta")
+            yield sse({"type": "message_stop"}, "message_stop")
+
+        return StreamingResponse(events(), media_type="text/event-stream")
+
+    @app.post("/v1/chat/completions")
+    async def openai_chat_completions(request: Request):
+        body = await request.json()
+        stream = bool(body.get("stream"))
+        error = await begin("openai", stream)
+        if error is not None:
+            return error
+        prompt = openai_prompt(body)
+        text = mock_text(prompt, config.response_words)
+        model = body.get("model", "mock")
+        completion_id = f"chatcmpl-mock{uuid.uuid4().hex[:16]}"
+        created = int(time.time())
+        usage = {"prompt_tokens": count_tokens(prompt), "completion_tokens": count_tokens(text),
+                 "total_tokens": count_tokens(prompt) + count_tokens(text),
+                 "prompt_tokens_details": {"cached_tokens": 0}}
+
+        if not stream:
+            await asyncio.sleep(config.sample_latency())
+            return {
+                "id": completion_id, "object": "chat.completion", "created": created, "model": model,
+                "choices": [{"index": 0, "message": {"role": "assistant", "content": text}, "finish_reason": "stop", "logprobs": None}],
+                "usage": usage,
+            }
+
+        include_usage = bool((body.get("stream_options") or {}).get("include_usage"))
+
+        async def events():
+            base = {"id": completion_id, "object": "chat.completion.chunk", "created": created, "model": model}
+            async for chunk in paced(split_words(text, config.chunk_words)):
+                yield sse({**base, "choices": [{"index": 0, "delta": {"content": chunk}, "finish_reason": None}]})
+            yield sse({**base, "choices": [{"index": 0, "delta": {}, "finish_reason": "stop"}]})
+            if include_usage:
+                yield sse({**base, "choices": [], "usage": usage})
+            yield "data: [DONE]\n\n"
+
+        return StreamingResponse(events(), media_type="text/event-stream")
+
+    @app.post("/v1beta/models/{target}")
+    async def gemini_generate(target: str, request: Request):
+        model, _, action = target.partition(":")
+        body = await request.json()
+        stream = action == "streamGenerateContent"
+        error = await begin("gemini", stream)
+        if error is not None:
+            return error
+        prompt = gemini_prompt(body)
+        text = mock_text(prompt, config.response_words)
+        usage = {"promptTokenCount": count_tokens(prompt), "candidatesTokenCount": count_tokens(text),
+                 "totalTokenCount": count_tokens(prompt) + count_tokens(text)}
+
+        def response(part: str, finished: bool) -> Dict[str, Any]:
+            candidate = {"content": {"role": "model", "parts": [{"text": part}]}, "index": 0}
+            if finished:
+                candidate["finishReason"] = "STOP"
+            return {"candidates": [candidate], "usageMetadata": usage, "modelVersion": model}
+
+        if not stream:
+            await asyncio.sleep(config.sample_latency())
+            return response(text, True)
+
+        async def events():
+            chunks = split_words(text, config.chunk_words)
+            index = 0
+            async for chunk in paced(chunks):
+                index += 1
+                yield sse(response(chunk, index == len(chunks)))
+
+        return StreamingResponse(events(), media_type="text/event-stream")
+
+    return app
+
+
+class MockLLMServer:
+    """
+    モックサーバーをバックグラウンドスレッドで起動するためのラッパー（テスト・ベンチマーク用）
+    """
+
+    def __init__(self, config: Optional[MockConfig] = None, host: str = "127.0.0.1", port: int = 0):
+        self.config = config or MockConfig()
+        self.app = create_app(self.config)
+        self.socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self.socket.bind((host, port))
+        self.server = uvicorn.Server(uvicorn.Config(self.app, log_level="warning"))
+        self.thread: Optional[threading.Thread] = None
+
+    @property
+    def base_url(self) -> str:
+        host, port = self.socket.getsockname()[:2]
+        return f"http://{host}:{port}"
+
+    def start(self) -> "MockLLMServer":
+        self.thread = threading.Thread(target=self.server.run, kwargs={"sockets": [self.socket]}, daemon=True)
+        self.thread.start()
+        deadline = time.monotonic() + 10
+        while not self.server.started and time.monotonic() < deadline:
+            time.sleep(0.01)
+        return self
+
+    def stop(self):
+        self.server.should_exit = True
+        if self.thread is not None:
+            self.thread.join(timeout=10)
+        self.socket.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Anthropic / OpenAI / Gemini 互換のモックLLMサーバー")
+    parser.add_argument("--host", default="127.0.0.1", help="待ち受けアドレス")
+    parser.add_argument("--port", type=int, default=8020, help="待ち受けポート")
+    parser.add_argument("--latency-median", type=float, default=1.0, help="レイテンシの中央値（秒）")
+    parser.add_argument("--latency-sigma", type=float, default=0.5, help="対数正規分布の形状パラメータ")
+    parser.add_argument("--chunk-interval", type=float, default=0.02, help="ストリーミング時のチャンク間隔（秒）")
+    parser.add_argument("--response-words", type=int, default=200, help="応答の単語数")
+    parser.add_argument("--error-429", type=float, default=0.0, help="429を返す割合")
+    parser.add_argument("--error-5xx", type=float, default=0.0, help="5xxを返す割合")
+    parser.add_argument("--retry-after", type=float, default=1.0, help="429に付けるretry-after（秒）")
+    parser.add_argument("--seed", type=int, default=None, help="乱数シード（指定すると再現可能になる）")
+    args = parser.parse_args()
+
+    mock_config = MockConfig(
+        latency_median=args.latency_median, latency_sigma=args.latency_sigma, chunk_interval=args.chunk_interval,
+        response_words=args.response_words, error_429_rate=args.error_429, error_5xx_rate=args.error_5xx,
+        retry_after=args.retry_after, seed=args.seed,
+    )
+    print(f"モックLLMサーバーを起動します: http://{args.host}:{args.port}")
+    uvicorn.run(create_app(mock_config), host=args.host, port=args.port, log_level="warning")
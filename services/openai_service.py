@@ -1,29 +1,110 @@
 from openai import AsyncOpenAI
 import logging
-from config.settings import OPENAI_API_KEY
+from config.settings import OPENAI_API_KEY, OPENAI_BASE_URL
+from services.http_client import http_client
+from services.llm_cache import cached_generate, cached_stream
+from services.rate_limiter import llm_scheduler
+from services.resilience import resilient_call, resilient_stream
+from services.telemetry import note_usage, track_llm_call, track_llm_stream
+from services.llm_transcript import transcript_generate, transcript_stream
+from utils.tokens import estimate_tokens
 
 logger = logging.getLogger(__name__)
 
-openai_client = AsyncOpenAI(api_key=OPENAI_API_KEY)
+# レート制限はスケジューラーが待ち行列に戻し、接続エラーなどの一時的な失敗は resilient_call が再試行するため、SDK内部のリトライは無効にする
+openai_client = AsyncOpenAI(api_key=OPENAI_API_KEY, base_url=OPENAI_BASE_URL, http_client=http_client, max_retries=0)
+
+OPENAI_MODEL = "gpt-4o"
+OPENAI_MAX_TOKENS = 4000
+OPENAI_TEMPERATURE = 1
+
+def split_usage(usage):
+    """
+    OpenAIの使用量を (キャッシュ以外の入力, 出力, キャッシュ済み入力) のトークン数に分ける関数
+    """
+    cached = getattr(getattr(usage, "prompt_tokens_details", None), "cached_tokens", None) or 0
+    return usage.prompt_tokens - cached, usage.completion_tokens, cached
+
+async def generate_text_gpt4o(prompt: str, use_cache: bool = True):
+    logger.debug(f"GPT-4oリクエストを受信: prompt={prompt}")
+
+    async def _generate():
+        response = await resilient_call("openai", lambda: llm_scheduler.run(
+            "openai", OPENAI_API_KEY, estimate_tokens(prompt),
+            lambda: openai_client.chat.completions.create(
+                model=OPENAI_MODEL,
+                messages=[
+                    {"role": "user", "content": prompt}
+                ],
+                temperature=OPENAI_TEMPERATURE,
+                max_tokens=OPENAI_MAX_TOKENS,
+                top_p=1,
+                frequency_penalty=0,
+                presence_penalty=0
+            )
+        ))
+        if response.usage:
+            llm_scheduler.record_usage("openai", OPENAI_API_KEY, response.usage.completion_tokens)
+            note_usage(*split_usage(response.usage))
+        generated_text = response.choices[0].message.content.strip()
+        logger.info("GPT-4oでテキスト生成成功")
+        logger.debug(generated_text)
+        return {"generated_text": generated_text}
 
-async def generate_text_gpt4o(prompt: str):
-    logger.info(f"GPT-4oリクエストを受信: prompt={prompt}")
     try:
-        response = await openai_client.chat.completions.create(
-            model="gpt-4o",
+        async with track_llm_call("openai", OPENAI_MODEL) as trace:
+            result = await cached_generate(
+                "openai", OPENAI_MODEL, OPENAI_TEMPERATURE, OPENAI_MAX_TOKENS,
+                prompt, lambda: transcript_generate("openai", OPENAI_MODEL, OPENAI_TEMPERATURE, OPENAI_MAX_TOKENS, prompt, _generate),
+                use_cache=use_cache
+            )
+            trace.mark_result(result)
+            return result
+    except Exception as e:
+        logger.error(f"GPT-4oでのテキスト生成中にエラーが発生: {str(e)}")
+        raise
+
+async def stream_text_gpt4o(prompt: str, use_cache: bool = True):
+    """
+    GPT-4oの生成結果をトークンが届き次第チャンク単位で返す非同期ジェネレータ
+    """
+    logger.debug(f"GPT-4oストリーミングリクエストを受信: prompt={prompt}")
+
+    async def _stream(trace):
+        trace.status = "ok"
+        stream = await openai_client.chat.completions.create(
+            model=OPENAI_MODEL,
             messages=[
                 {"role": "user", "content": prompt}
             ],
-            temperature=1,
-            max_tokens=4000,
+            temperature=OPENAI_TEMPERATURE,
+            max_tokens=OPENAI_MAX_TOKENS,
             top_p=1,
             frequency_penalty=0,
-            presence_penalty=0
+            presence_penalty=0,
+            stream=True,
+            stream_options={"include_usage": True}
         )
-        generated_text = response.choices[0].message.content.strip()
-        logger.info("GPT-4oでテキスト生成成功")
-        logger.info(generated_text)
-        return {"generated_text": generated_text}
+        async for chunk in stream:
+            if chunk.usage:
+                # 使用量は choices が空の最後のチャンクで届く
+                llm_scheduler.record_usage("openai", OPENAI_API_KEY, chunk.usage.completion_tokens)
+                trace.add_usage(*split_usage(chunk.usage))
+            if chunk.choices and chunk.choices[0].delta.content:
+                yield chunk.choices[0].delta.content
+        logger.info("GPT-4oでストリーミング生成成功")
+
+    try:
+        async for chunk in track_llm_stream("openai", OPENAI_MODEL, lambda trace: cached_stream(
+            "openai", OPENAI_MODEL, OPENAI_TEMPERATURE, OPENAI_MAX_TOKENS,
+            prompt, lambda: transcript_stream(
+                "openai", OPENAI_MODEL, OPENAI_TEMPERATURE, OPENAI_MAX_TOKENS,
+                prompt, lambda: resilient_stream("openai", lambda: llm_scheduler.stream(
+                    "openai", OPENAI_API_KEY, estimate_tokens(prompt), lambda: _stream(trace)
+                )), trace
+            ), use_cache=use_cache
+        )):
+            yield chunk
     except Exception as e:
-        logger.error(f"GPT-4oでのテキスト生成中にエラーが発生: {str(e)}")
-        raise
\ No newline at end of file
+        logger.error(f"GPT-4oでのストリーミング生成中にエラーが発生: {str(e)}")
+        raise
@@ -0,0 +1,281 @@
+import asyncio
+import contextvars
+import hashlib
+import heapq
+import itertools
+import logging
+import time
+from contextlib import contextmanager
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, Optional, Tuple
+
+from config.settings import (
+    LLM_RATE_LIMITS, LLM_AIMD_INCREASE, LLM_AIMD_DECREASE, LLM_AIMD_MIN_FACTOR,
+    LLM_RATE_LIMIT_MAX_REQUEUE
+)
+from services.telemetry import note_retry
+
+logger = logging.getLogger(__name__)
+
+# 優先度（値が小さいほど先に処理される）
+PRIORITY_INTERACTIVE = 0
+PRIORITY_BATCH = 10
+
+# 429（レート制限）と529/503（過負荷）をスロットリングとして扱う
+THROTTLE_STATUS_CODES = {429, 503, 529}
+
+current_priority: contextvars.ContextVar = contextvars.ContextVar("llm_priority", default=PRIORITY_INTERACTIVE)
+
+
+@contextmanager
+def llm_priority(priority: int):
+    """
+    ブロック内で発行されるLLM呼び出しの優先度を設定するコンテキストマネージャ
+    """
+    token = current_priority.set(priority)
+    try:
+        yield
+    finally:
+        current_priority.reset(token)
+
+
+def get_status_code(error: Exception) -> Optional[int]:
+    """
+    SDKやhttpxの例外からHTTPステータスコードを取り出す関数
+    """
+    status_code = getattr(error, "status_code", None)
+    if status_code is None:
+        status_code = getattr(getattr(error, "response", None), "status_code", None)
+    return status_code
+
+
+def get_retry_after(error: Exception) -> Optional[float]:
+    """
+    例外に含まれるretry-afterヘッダーの秒数を返す関数
+    """
+    headers = getattr(getattr(error, "response", None), "headers", None)
+    if not headers:
+        return None
+    try:
+        return float(headers.get("retry-after"))
+    except (TypeError, ValueError):
+        return None
+
+
+def is_throttle_error(error: Exception) -> bool:
+    return get_status_code(error) in THROTTLE_STATUS_CODES
+
+
+class TokenBucket:
+    """
+    1分あたりの上限から補充速度を決めるトークンバケット
+    """
+
+    def __init__(self, per_minute: int):
+        self.capacity = float(per_minute)
+        self.rate = per_minute / 60.0
+        self.tokens = float(per_minute)
+        self.updated_at = time.monotonic()
+
+    def refill(self, now: float, factor: float):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.rate * factor)
+        self.updated_at = now
+
+    def time_until(self, amount: float, factor: float) -> float:
+        amount = min(amount, self.capacity)
+        if self.tokens >= amount:
+            return 0.0
+        return (amount - self.tokens) / (self.rate * factor)
+
+    def consume(self, amount: float):
+        # 実使用量の精算で負になることを許し、その分だけ後続のリクエストを待たせる
+        self.tokens -= amount
+
+
+class ProviderLimiter:
+    """
+    1つのプロバイダー・APIキーに対するRPM/TPMの制限と優先度付き待ち行列
+
+    スロットリングを受けると補充速度を乗算的に下げ（MD）、成功するたびに加算的に戻します（AI）。
+    """
+
+    def __init__(self, rpm: int, tpm: int):
+        self.requests = TokenBucket(rpm)
+        self.tokens = TokenBucket(tpm)
+        self.factor = 1.0
+        self.paused_until = 0.0
+        self._queue: list = []
+        self._seq = itertools.count()
+        self._condition = asyncio.Condition()
+        self.stats = {"granted": 0, "throttled": 0, "max_queue_length": 0}
+
+    def _wait_time(self, amount: int) -> float:
+        now = time.monotonic()
+        self.requests.refill(now, self.factor)
+        self.tokens.refill(now, self.factor)
+        return max(
+            self.paused_until - now,
+            self.requests.time_until(1, self.factor),
+            self.tokens.time_until(amount, self.factor),
+        )
+
+    async def acquire(self, amount: int, priority: int):
+        entry = (priority, next(self._seq), amount)
+        async with self._condition:
+            heapq.heappush(self._queue, entry)
+            self.stats["max_queue_length"] = max(self.stats["max_queue_length"], len(self._queue))
+            try:
+                while True:
+                    wait = None
+                    if self._queue[0] is entry:
+                        wait = self._wait_time(amount)
+                        if wait <= 0:
+                            heapq.heappop(self._queue)
+                            self.requests.consume(1)
+                            self.tokens.consume(min(amount, self.tokens.capacity))
+                            self.stats["granted"] += 1
+                            self._condition.notify_all()
+                            return
+                    try:
+                        await asyncio.wait_for(self._condition.wait(), timeout=wait)
+                    except asyncio.TimeoutError:
+                        pass
+            except asyncio.CancelledError:
+                if entry in self._queue:
+                    self._queue.remove(entry)
+                    heapq.heapify(self._queue)
+                    self._condition.notify_all()
+                raise
+
+    def record_usage(self, amount: int):
+        self.tokens.consume(amount)
+
+    def on_success(self):
+        self.factor = min(1.0, self.factor + LLM_AIMD_INCREASE)
+
+    def on_throttle(self, retry_after: Optional[float]):
+        self.factor = max(LLM_AIMD_MIN_FACTOR, self.factor * LLM_AIMD_DECREASE)
+        # 溜まっていたバーストを捨て、retry-afterが指定されていればその間は新規発行を止める
+        self.requests.tokens = min(self.requests.tokens, 0.0)
+        if retry_after:
+            self.paused_until = max(self.paused_until, time.monotonic() + retry_after)
+        self.stats["throttled"] += 1
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            **self.stats,
+            "queue_length": len(self._queue),
+            "rate_factor": self.factor,
+            "effective_rpm": self.requests.capacity * self.factor,
+            "effective_tpm": self.tokens.capacity * self.factor,
+        }
+
+
+class RateLimitScheduler:
+    """
+    全てのプロバイダー呼び出しが通過する中央スケジューラー
+    """
+
+    def __init__(self, limits: Dict[str, Dict[str, int]]):
+        self.limits = limits
+        self.limiters: Dict[Tuple[str, str], ProviderLimiter] = {}
+
+    def _limiter(self, provider: str, api_key: Optional[str]) -> ProviderLimiter:
+        # APIキーそのものは保持せず、ハッシュの先頭だけを識別子に使う
+        key_id = hashlib.sha256((api_key or "").encode("utf-8")).hexdigest()[:12]
+        key = (provider, key_id)
+        if key not in self.limiters:
+            limit = self.limits[provider]
+            self.limiters[key] = ProviderLimiter(limit["rpm"], limit["tpm"])
+        return self.limiters[key]
+
+    async def acquire(self, provider: str, api_key: Optional[str], estimated_tokens: int, priority: Optional[int] = None):
+        if priority is None:
+            priority = current_priority.get()
+        await self._limiter(provider, api_key).acquire(estimated_tokens, priority)
+
+    def record_usage(self, provider: str, api_key: Optional[str], tokens: int):
+        """
+        事前の見積もりに含まれていない実使用トークン（出力トークンなど）をバケットから差し引く
+        """
+        self._limiter(provider, api_key).record_usage(tokens)
+
+    def report_success(self, provider: str, api_key: Optional[str]):
+        self._limiter(provider, api_key).on_success()
+
+    def report_error(self, provider: str, api_key: Optional[str], error: Exception) -> bool:
+        """
+        エラーを報告し、スロットリングであればAIMDの減速を行ってTrueを返す関数
+        """
+        if not is_throttle_error(error):
+            return False
+        retry_after = get_retry_after(error)
+        logger.warning(f"{provider}からスロットリングを受けました: status={get_status_code(error)}, retry_after={retry_after}")
+        self._limiter(provider, api_key).on_throttle(retry_after)
+        return True
+
+    async def run(
+        self,
+        provider: str,
+        api_key: Optional[str],
+        estimated_tokens: int,
+        call: Callable[[], Awaitable[Any]],
+        priority: Optional[int] = None,
+    ) -> Any:
+        """
+        レート制限の枠を確保してから call を実行する関数
+
+        スロットリングで拒否された場合は減速した上で待ち行列に戻し、最大 LLM_RATE_LIMIT_MAX_REQUEUE 回まで再投入します。
+        """
+        attempt = 0
+        while True:
+            await self.acquire(provider, api_key, estimated_tokens, priority)
+            try:
+                result = await call()
+            except Exception as e:
+                if self.report_error(provider, api_key, e) and attempt < LLM_RATE_LIMIT_MAX_REQUEUE:
+                    attempt += 1
+                    note_retry()
+                    continue
+                raise
+            self.report_success(provider, api_key)
+            return result
+
+    async def stream(
+        self,
+        provider: str,
+        api_key: Optional[str],
+        estimated_tokens: int,
+        open_stream: Callable[[], AsyncIterator[Any]],
+        priority: Optional[int] = None,
+    ) -> AsyncIterator[Any]:
+        """
+        レート制限の枠を確保してからストリームを流す非同期ジェネレータ
+
+        run と同じく成功・スロットリングを報告してAIMDに反映します。
+        最初のチャンクを返す前にスロットリングされた場合だけ待ち行列に戻します（返した後に再送すると出力が重複するため）。
+        """
+        attempt = 0
+        while True:
+            await self.acquire(provider, api_key, estimated_tokens, priority)
+            started = False
+            try:
+                async for chunk in open_stream():
+                    started = True
+                    yield chunk
+            except Exception as e:
+                if self.report_error(provider, api_key, e) and not started and attempt < LLM_RATE_LIMIT_MAX_REQUEUE:
+                    attempt += 1
+                    note_retry()
+                    continue
+                raise
+            self.report_success(provider, api_key)
+            return
+
+    def get_stats(self):
+        return [
+            {"provider": provider, "key_id": key_id, **limiter.to_dict()}
+            for (provider, key_id), limiter in self.limiters.items()
+        ]
+
+
+llm_scheduler = RateLimitScheduler(LLM_RATE_LIMITS)
@@ -0,0 +1,229 @@
+import asyncio
+import contextvars
+import logging
+import random
+import time
+from contextlib import contextmanager
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, Optional
+
+import anthropic
+import httpx
+import openai
+
+from config.settings import (
+    LLM_RETRY_MAX_ATTEMPTS, LLM_RETRY_BASE_DELAY, LLM_RETRY_MAX_DELAY,
+    LLM_BREAKER_FAILURE_THRESHOLD, LLM_BREAKER_RESET_TIMEOUT, LLM_DEFAULT_DEADLINE
+)
+from services.rate_limiter import get_status_code, get_retry_after, is_throttle_error
+from services.telemetry import note_retry
+
+logger = logging.getLogger(__name__)
+
+# 接続エラーやタイムアウトなど、再試行すれば成功しうる例外
+TRANSIENT_EXCEPTIONS = (
+    anthropic.APIConnectionError,
+    openai.APIConnectionError,
+    httpx.TransportError,
+    asyncio.TimeoutError,
+    ConnectionError,
+)
+
+# 呼び出し全体の締め切り（time.monotonic() 基準の絶対時刻）
+current_deadline: contextvars.ContextVar = contextvars.ContextVar("llm_deadline", default=None)
+
+
+class CircuitOpenError(Exception):
+    """
+    サーキットブレーカーが開いているため呼び出しを行わなかったことを示す例外
+    """
+
+
+class DeadlineExceededError(asyncio.TimeoutError):
+    """
+    呼び出し元から引き継いだ締め切りを過ぎたことを示す例外
+    """
+
+
+@contextmanager
+def llm_deadline(seconds: Optional[float]):
+    """
+    ブロック内のLLM呼び出しに締め切りを設定するコンテキストマネージャ
+
+    既に外側で締め切りが設定されている場合は、より早い方が使われます。
+    """
+    if seconds is None:
+        yield
+        return
+    deadline = time.monotonic() + seconds
+    outer = current_deadline.get()
+    token = current_deadline.set(deadline if outer is None else min(outer, deadline))
+    try:
+        yield
+    finally:
+        current_deadline.reset(token)
+
+
+def remaining_time() -> float:
+    deadline = current_deadline.get()
+    if deadline is None:
+        return LLM_DEFAULT_DEADLINE
+    return deadline - time.monotonic()
+
+
+def _deadline_expired(error: Exception) -> bool:
+    # タイムアウトが呼び出し元の締め切りを過ぎたことによるものかどうか
+    return isinstance(error, asyncio.TimeoutError) and not isinstance(error, DeadlineExceededError) and remaining_time() <= 0
+
+
+def classify_error(error: Exception) -> str:
+    """
+    例外を "throttle"（レート制限・過負荷）, "transient"（再試行可能）, "fatal"（再試行しても無駄）に分類する関数
+    """
+    if isinstance(error, (CircuitOpenError, DeadlineExceededError)):
+        return "fatal"
+    if is_throttle_error(error):
+        return "throttle"
+    if isinstance(error, TRANSIENT_EXCEPTIONS):
+        return "transient"
+    status_code = get_status_code(error)
+    if status_code is not None and (status_code >= 500 or status_code in (408, 409)):
+        return "transient"
+    return "fatal"
+
+
+class CircuitBreaker:
+    """
+    プロバイダーごとのサーキットブレーカー
+
+    連続して failure_threshold 回失敗すると開き、reset_timeout 秒の間は呼び出しを即座に失敗させます。
+    その後は1件だけ試験的に通し（半開状態）、成功すれば閉じ、失敗すれば再び開きます。
+    """
+
+    def __init__(self, failure_threshold: int = LLM_BREAKER_FAILURE_THRESHOLD, reset_timeout: float = LLM_BREAKER_RESET_TIMEOUT):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = "closed"
+        self.consecutive_failures = 0
+        self.opened_at = 0.0
+        self.probe_in_flight = False
+
+    def before_call(self):
+        if self.state == "open":
+            if time.monotonic() - self.opened_at < self.reset_timeout:
+                raise CircuitOpenError("サーキットブレーカーが開いています")
+            self.state = "half_open"
+            self.probe_in_flight = False
+        if self.state == "half_open":
+            if self.probe_in_flight:
+                raise CircuitOpenError("サーキットブレーカーが半開状態で試験呼び出しの結果待ちです")
+            self.probe_in_flight = True
+
+    def on_success(self):
+        self.state = "closed"
+        self.consecutive_failures = 0
+        self.probe_in_flight = False
+
+    def on_failure(self):
+        self.consecutive_failures += 1
+        self.probe_in_flight = False
+        if self.state == "half_open" or self.consecutive_failures >= self.failure_threshold:
+            self.state = "open"
+            self.opened_at = time.monotonic()
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {"state": self.state, "consecutive_failures": self.consecutive_failures}
+
+
+breakers: Dict[str, CircuitBreaker] = {}
+
+
+def get_breaker(provider: str) -> CircuitBreaker:
+    if provider not in breakers:
+        breakers[provider] = CircuitBreaker()
+    return breakers[provider]
+
+
+def backoff_delay(attempt: int, error: Exception) -> float:
+    """
+    フルジッター付き指数バックオフの待ち時間を返す関数（retry-afterがあればそれ以上待つ）
+    """
+    delay = random.uniform(0, min(LLM_RETRY_MAX_DELAY, LLM_RETRY_BASE_DELAY * (2 ** attempt)))
+    retry_after = get_retry_after(error)
+    return max(delay, retry_after or 0.0)
+
+
+async def resilient_call(provider: str, call: Callable[[], Awaitable[Any]], max_attempts: int = LLM_RETRY_MAX_ATTEMPTS) -> Any:
+    """
+    分類付きリトライ・サーキットブレーカー・締め切りを適用して call を実行する関数
+
+    レート制限（throttle）はスケジューラー側で待ち行列に戻されるため、ここでは再試行しません。
+    """
+    breaker = get_breaker(provider)
+    attempt = 0
+    while True:
+        remaining = remaining_time()
+        if remaining <= 0:
+            raise DeadlineExceededError(f"{provider}の呼び出しが締め切りを過ぎました")
+        breaker.before_call()
+        try:
+            result = await asyncio.wait_for(call(), timeout=remaining)
+        except asyncio.CancelledError:
+            breaker.probe_in_flight = False
+            raise
+        except Exception as e:
+            if _deadline_expired(e):
+                # 呼び出し元の締め切りによる打ち切りはプロバイダーの障害ではないため、ブレーカーの判定に含めない
+                breaker.probe_in_flight = False
+                raise DeadlineExceededError(f"{provider}の呼び出しが締め切りを過ぎました") from e
+            kind = classify_error(e)
+            if kind == "transient":
+                breaker.on_failure()
+            else:
+                # 4xxやレート制限はプロバイダー障害ではないため、ブレーカーの判定には含めない
+                breaker.probe_in_flight = False
+            attempt += 1
+            if kind != "transient" or attempt >= max_attempts:
+                raise
+            delay = backoff_delay(attempt, e)
+            if delay >= remaining_time():
+                raise
+            logger.warning(f"{provider}の呼び出しに失敗したため{delay:.1f}秒後に再試行します（{attempt}/{max_attempts - 1}）: {str(e)}")
+            note_retry()
+            await asyncio.sleep(delay)
+            continue
+        breaker.on_success()
+        return result
+
+
+async def resilient_stream(provider: str, stream: Callable[[], AsyncIterator[str]]) -> AsyncIterator[str]:
+    """
+    ストリーミング呼び出し用のラッパー
+
+    途中まで送信した出力を重複させないよう再試行は行わず、ブレーカーの判定と締め切りのみ適用します。
+    """
+    breaker = get_breaker(provider)
+    if remaining_time() <= 0:
+        raise DeadlineExceededError(f"{provider}の呼び出しが締め切りを過ぎました")
+    breaker.before_call()
+    try:
+        async for chunk in stream():
+            if remaining_time() <= 0:
+                raise DeadlineExceededError(f"{provider}のストリーミングが締め切りを過ぎました")
+            yield chunk
+    except (asyncio.CancelledError, GeneratorExit):
+        breaker.probe_in_flight = False
+        raise
+    except Exception as e:
+        if _deadline_expired(e):
+            breaker.probe_in_flight = False
+            raise DeadlineExceededError(f"{provider}のストリーミングが締め切りを過ぎました") from e
+        if classify_error(e) == "transient":
+            breaker.on_failure()
+        else:
+            breaker.probe_in_flight = False
+        raise
+    breaker.on_success()
+
+
+def get_breaker_stats():
+    return {provider: breaker.to_dict() for provider, breaker in breakers.items()}
@@ -0,0 +1,120 @@
+import asyncio
+import logging
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+
+class _Flight:
+    def __init__(self, task: asyncio.Task):
+        self.task = task
+        self.waiters = 0
+
+
+class _StreamFlight:
+    def __init__(self):
+        self.chunks: List[str] = []
+        self.done = False
+        self.error: Optional[BaseException] = None
+        self.subscribers = 0
+        self.condition = asyncio.Condition()
+        self.task: Optional[asyncio.Task] = None
+
+
+class SingleFlight:
+    """
+    同じキーの実行中の呼び出しを1つにまとめるクラス
+
+    後から来た呼び出しは実行中の上流呼び出しに相乗りして同じ結果（ストリームの場合は同じチャンク列）を受け取ります。
+    相乗りしている全員がキャンセルした場合にのみ上流の呼び出しをキャンセルします。
+    """
+
+    def __init__(self):
+        self._flights: Dict[str, _Flight] = {}
+        self._streams: Dict[str, _StreamFlight] = {}
+        self.stats = {"leaders": 0, "coalesced": 0, "stream_leaders": 0, "stream_coalesced": 0}
+
+    def _forget(self, table: Dict[str, Any], key: str, flight: Any):
+        if table.get(key) is flight:
+            del table[key]
+
+    async def do(self, key: str, call: Callable[[], Awaitable[Dict[str, Any]]]) -> Dict[str, Any]:
+        flight = self._flights.get(key)
+        if flight is None:
+            flight = _Flight(asyncio.ensure_future(call()))
+            self._flights[key] = flight
+            flight.task.add_done_callback(lambda _: self._forget(self._flights, key, flight))
+            self.stats["leaders"] += 1
+            leader = True
+        else:
+            self.stats["coalesced"] += 1
+            leader = False
+            logger.info(f"実行中の同一リクエストに相乗りします: key={key[:12]}")
+
+        flight.waiters += 1
+        try:
+            result = await asyncio.shield(flight.task)
+        finally:
+            flight.waiters -= 1
+            if flight.waiters == 0 and not flight.task.done():
+                self._forget(self._flights, key, flight)
+                flight.task.cancel()
+        return dict(result) if leader else {**result, "coalesced": True}
+
+    async def _pump(self, key: str, flight: _StreamFlight, stream: Callable[[], AsyncIterator[str]]):
+        try:
+            async for chunk in stream():
+                async with flight.condition:
+                    flight.chunks.append(chunk)
+                    flight.condition.notify_all()
+        except asyncio.CancelledError:
+            flight.error = asyncio.CancelledError()
+            raise
+        except Exception as e:
+            flight.error = e
+        finally:
+            self._forget(self._streams, key, flight)
+            flight.done = True
+            async with flight.condition:
+                flight.condition.notify_all()
+
+    async def stream(self, key: str, stream: Callable[[], AsyncIterator[str]]) -> AsyncIterator[str]:
+        """
+        ストリーミング呼び出し用の相乗り
+
+        途中から相乗りした場合も、それまでに受信したチャンクを先頭から受け取ります。
+        """
+        flight = self._streams.get(key)
+        if flight is None:
+            flight = _StreamFlight()
+            self._streams[key] = flight
+            flight.task = asyncio.create_task(self._pump(key, flight, stream))
+            self.stats["stream_leaders"] += 1
+        else:
+            self.stats["stream_coalesced"] += 1
+            logger.info(f"実行中の同一ストリームに相乗りします: key={key[:12]}")
+
+        flight.subscribers += 1
+        index = 0
+        try:
+            while True:
+                while index < len(flight.chunks):
+                    yield flight.chunks[index]
+                    index += 1
+                if flight.done:
+                    if flight.error is not None:
+                        raise flight.error
+                    return
+                async with flight.condition:
+                    await flight.condition.wait_for(lambda: index < len(flight.chunks) or flight.done)
+        finally:
+            flight.subscribers -= 1
+            if flight.subscribers == 0 and not flight.task.done():
+                self._forget(self._streams, key, flight)
+                flight.task.cancel()
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {**self.stats, "in_flight": len(self._flights), "streams_in_flight": len(self._streams)}
+
+
+llm_singleflight = SingleFlight()
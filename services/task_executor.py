@@ -0,0 +1,164 @@
+import asyncio
+import contextvars
+import logging
+import time
+from collections import deque
+from contextlib import contextmanager
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, Iterator, List, Optional
+
+from config.settings import MULTI_AI_MAX_CONCURRENCY, MULTI_AI_FILE_TIMEOUT
+
+logger = logging.getLogger(__name__)
+
+STATUSES = ("ok", "error", "timeout", "cancelled")
+
+# batch_id ごとの実行中バッチの中止フラグ（/multi-ai-cancel から参照する）
+running_batches: Dict[str, asyncio.Event] = {}
+
+
+def _record(index: int, file_path: str, status: str, result: Any = None, error: Optional[str] = None, elapsed: float = 0.0) -> Dict[str, Any]:
+    return {
+        "index": index,
+        "file_path": file_path,
+        "status": status,
+        "result": result,
+        "error": error,
+        "elapsed": round(elapsed, 4),
+    }
+
+
+async def iter_file_tasks(
+    file_paths: List[str],
+    worker: Callable[[str], Awaitable[Any]],
+    max_concurrency: Optional[int] = None,
+    timeout: Optional[float] = None,
+    cancel_event: Optional[asyncio.Event] = None,
+    fail_fast: bool = False,
+    context: Optional[contextvars.Context] = None,
+) -> AsyncIterator[Dict[str, Any]]:
+    """
+    ファイルごとの処理を最大 max_concurrency 件ずつ並行に実行し、完了した順に結果を返す非同期ジェネレータ
+
+    各結果は index（入力順の位置）・file_path・status（ok / error / timeout / cancelled）・result・error・elapsed を持ちます。
+    1件の失敗やタイムアウトで他のファイルの処理は止まりません。cancel_event がセットされた場合（fail_fast 時は最初の失敗時も）
+    実行中の処理をキャンセルし、未着手のファイルも含めて cancelled として返します。
+    ジェネレータを途中で閉じた場合も残りの処理はキャンセルされます。
+
+    各ファイルの処理は context（省略時は最初に結果を取り出したときのコンテキスト）を引き継いで実行されます。
+    """
+    max_concurrency = max(1, max_concurrency or MULTI_AI_MAX_CONCURRENCY)
+    timeout = timeout if timeout is not None else (MULTI_AI_FILE_TIMEOUT or None)
+    pending = deque(enumerate(file_paths))
+    running: Dict[asyncio.Task, None] = {}
+    finished: asyncio.Queue = asyncio.Queue()
+    stop = asyncio.Event()
+
+    def halt():
+        stop.set()
+        for task in list(running):
+            task.cancel()
+
+    async def run_one(file_path: str) -> Any:
+        if timeout:
+            return await asyncio.wait_for(worker(file_path), timeout)
+        return await worker(file_path)
+
+    async def lane():
+        while pending and not stop.is_set():
+            index, file_path = pending.popleft()
+            started_at = time.monotonic()
+            task = asyncio.ensure_future(run_one(file_path))
+            running[task] = None
+            try:
+                # キャンセルされたタスクを await すると呼び出し側にも CancelledError が伝わるため wait で完了だけを待つ
+                await asyncio.wait([task])
+            finally:
+                running.pop(task, None)
+            elapsed = time.monotonic() - started_at
+            if task.cancelled():
+                record = _record(index, file_path, "cancelled", elapsed=elapsed)
+            elif isinstance(task.exception(), asyncio.TimeoutError):
+                record = _record(index, file_path, "timeout", error=str(task.exception()) or "タイムアウトしました", elapsed=elapsed)
+            elif task.exception() is not None:
+                logger.error(f"ファイルの処理に失敗しました: {file_path}: {task.exception()}")
+                record = _record(index, file_path, "error", error=str(task.exception()), elapsed=elapsed)
+            else:
+                record = _record(index, file_path, "ok", result=task.result(), elapsed=elapsed)
+            finished.put_nowait(record)
+            if fail_fast and record["status"] in ("error", "timeout"):
+                logger.info("失敗したファイルがあるため残りの処理を中止します")
+                halt()
+
+    async def watch_cancel():
+        await cancel_event.wait()
+        logger.info("バッチの中止が要求されたため残りの処理を中止します")
+        halt()
+
+    async def supervise():
+        await asyncio.gather(*[lane() for _ in range(min(max_concurrency, len(file_paths)))])
+        # 全レーンが止まった後に残っているのは中止により未着手のまま終わったファイル
+        while pending:
+            index, file_path = pending.popleft()
+            finished.put_nowait(_record(index, file_path, "cancelled"))
+
+    context = context or contextvars.copy_context()
+    background = [context.run(asyncio.ensure_future, supervise())]
+    if cancel_event is not None:
+        background.append(asyncio.ensure_future(watch_cancel()))
+    try:
+        for _ in range(len(file_paths)):
+            yield await finished.get()
+    finally:
+        halt()
+        for task in background:
+            task.cancel()
+        await asyncio.gather(*background, return_exceptions=True)
+
+
+async def run_file_tasks(
+    file_paths: List[str],
+    worker: Callable[[str], Awaitable[Any]],
+    max_concurrency: Optional[int] = None,
+    timeout: Optional[float] = None,
+    cancel_event: Optional[asyncio.Event] = None,
+    fail_fast: bool = False,
+    context: Optional[contextvars.Context] = None,
+) -> List[Dict[str, Any]]:
+    """
+    iter_file_tasks の結果をすべて集め、入力順に並べて返す関数
+    """
+    records = [record async for record in iter_file_tasks(file_paths, worker, max_concurrency, timeout, cancel_event, fail_fast, context)]
+    return sorted(records, key=lambda record: record["index"])
+
+
+def summarize_results(records: List[Dict[str, Any]]) -> Dict[str, int]:
+    summary = {"total": len(records), **{status: 0 for status in STATUSES}}
+    for record in records:
+        summary[record["status"]] += 1
+    return summary
+
+
+@contextmanager
+def register_batch(batch_id: Optional[str]) -> Iterator[Optional[asyncio.Event]]:
+    """
+    batch_id で中止できるバッチとして登録するコンテキストマネージャ（batch_id が None の場合は登録しない）
+    """
+    if batch_id is None:
+        yield None
+        return
+    if batch_id in running_batches:
+        raise ValueError(f"同じbatch_idのバッチが実行中です: {batch_id}")
+    event = asyncio.Event()
+    running_batches[batch_id] = event
+    try:
+        yield event
+    finally:
+        running_batches.pop(batch_id, None)
+
+
+def cancel_batch(batch_id: str) -> bool:
+    event = running_batches.get(batch_id)
+    if event is None:
+        return False
+    event.set()
+    return True
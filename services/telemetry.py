@@ -0,0 +1,307 @@
+import asyncio
+import contextvars
+import json
+import logging
+import threading
+import time
+from collections import deque
+from contextlib import asynccontextmanager, contextmanager
+from typing import Any, AsyncIterator, Callable, Dict, List, Optional, Tuple
+
+from config.settings import LLM_TELEMETRY_WINDOW_SIZE
+
+logger = logging.getLogger(__name__)
+
+QUANTILES = (0.5, 0.9, 0.99)
+
+# 呼び出し元の操作名（ai_analyze など）とプロジェクトID。/generate_* から直接呼ばれた場合は "direct"
+current_operation: contextvars.ContextVar = contextvars.ContextVar("llm_operation", default="direct")
+current_project: contextvars.ContextVar = contextvars.ContextVar("llm_project", default=None)
+# 実行中の1回分の呼び出しの記録（リトライ回数や使用トークンを下位の層から書き込む）
+current_trace: contextvars.ContextVar = contextvars.ContextVar("llm_trace", default=None)
+
+
+@contextmanager
+def llm_operation(operation: str):
+    token = current_operation.set(operation)
+    try:
+        yield
+    finally:
+        current_operation.reset(token)
+
+
+@contextmanager
+def llm_project(project_id: Optional[str]):
+    token = current_project.set(project_id)
+    try:
+        yield
+    finally:
+        current_project.reset(token)
+
+
+class CallTrace:
+    """
+    1回のLLM呼び出しの記録
+
+    status は ok / error / cancelled / cached（キャッシュまたは実行中の同一リクエストから取得）/ coalesced のいずれかです。
+    """
+
+    def __init__(self, provider: str, model: str, stream: bool = False):
+        self.provider = provider
+        self.model = model
+        self.stream = stream
+        self.operation = current_operation.get()
+        self.project_id = current_project.get()
+        self.started_at = time.monotonic()
+        self.first_token_at: Optional[float] = None
+        self.finished_at: Optional[float] = None
+        self.input_tokens = 0
+        self.output_tokens = 0
+        self.cached_tokens = 0
+        self.retries = 0
+        self.status = "ok"
+
+    def add_usage(self, input_tokens: int, output_tokens: int, cached_tokens: int = 0):
+        self.input_tokens += input_tokens or 0
+        self.output_tokens += output_tokens or 0
+        self.cached_tokens += cached_tokens or 0
+
+    def mark_first_token(self):
+        if self.first_token_at is None:
+            self.first_token_at = time.monotonic()
+
+    def mark_result(self, result: Dict[str, Any]):
+        if result.get("cached"):
+            self.status = "cached"
+        elif result.get("coalesced"):
+            self.status = "coalesced"
+
+    @property
+    def latency(self) -> float:
+        return (self.finished_at or time.monotonic()) - self.started_at
+
+    @property
+    def ttft(self) -> Optional[float]:
+        if self.first_token_at is None:
+            return None
+        return self.first_token_at - self.started_at
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "provider": self.provider,
+            "model": self.model,
+            "operation": self.operation,
+            "project_id": self.project_id,
+            "stream": self.stream,
+            "status": self.status,
+            "input_tokens": self.input_tokens,
+            "output_tokens": self.output_tokens,
+            "cached_tokens": self.cached_tokens,
+            "retries": self.retries,
+            "latency": round(self.latency, 4),
+            "ttft": round(self.ttft, 4) if self.ttft is not None else None,
+        }
+
+
+def note_retry():
+    """
+    実行中の呼び出しのリトライ回数を1増やす（リトライ層・スケジューラーから呼び出す）
+    """
+    trace = current_trace.get()
+    if trace is not None:
+        trace.retries += 1
+
+
+def note_usage(input_tokens: int, output_tokens: int, cached_tokens: int = 0):
+    """
+    実行中の呼び出しにプロバイダーが返した使用トークン数を記録する
+    """
+    trace = current_trace.get()
+    if trace is not None:
+        trace.add_usage(input_tokens, output_tokens, cached_tokens)
+
+
+def percentile(values: List[float], q: float) -> Optional[float]:
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(q * (len(ordered) - 1))))]
+
+
+class _Aggregate:
+    def __init__(self, window_size: int):
+        self.statuses: Dict[str, int] = {}
+        self.input_tokens = 0
+        self.output_tokens = 0
+        self.cached_tokens = 0
+        self.retries = 0
+        self.latency_sum = 0.0
+        self.latency_count = 0
+        self.ttft_sum = 0.0
+        self.ttft_count = 0
+        self.latencies: deque = deque(maxlen=window_size)
+        self.ttfts: deque = deque(maxlen=window_size)
+
+    def add(self, trace: CallTrace):
+        self.statuses[trace.status] = self.statuses.get(trace.status, 0) + 1
+        self.input_tokens += trace.input_tokens
+        self.output_tokens += trace.output_tokens
+        self.cached_tokens += trace.cached_tokens
+        self.retries += trace.retries
+        # キャッシュ・相乗り・失敗はプロバイダーのレイテンシを表さないので分位点には含めない
+        if trace.status == "ok":
+            self.latency_sum += trace.latency
+            self.latency_count += 1
+            self.latencies.append(trace.latency)
+            if trace.ttft is not None:
+                self.ttft_sum += trace.ttft
+                self.ttft_count += 1
+                self.ttfts.append(trace.ttft)
+
+    def to_dict(self) -> Dict[str, Any]:
+        latencies, ttfts = list(self.latencies), list(self.ttfts)
+        return {
+            "requests": sum(self.statuses.values()),
+            "statuses": dict(self.statuses),
+            "input_tokens": self.input_tokens,
+            "output_tokens": self.output_tokens,
+            "cached_tokens": self.cached_tokens,
+            "retries": self.retries,
+            "latency": {f"p{int(q * 100)}": percentile(latencies, q) for q in QUANTILES},
+            "ttft": {f"p{int(q * 100)}": percentile(ttfts, q) for q in QUANTILES},
+        }
+
+
+GroupKey = Tuple[str, str, str, str]
+
+
+def _escape_label(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n")
+
+
+class LLMTelemetry:
+    """
+    呼び出しごとの記録を (provider, model, operation, project_id) 単位で集計するクラス
+
+    レイテンシとTTFTの分位点は直近 window_size 件から計算します。
+    """
+
+    def __init__(self, window_size: int = LLM_TELEMETRY_WINDOW_SIZE):
+        self.window_size = window_size
+        self.groups: Dict[GroupKey, _Aggregate] = {}
+        self.recent: deque = deque(maxlen=window_size)
+        self._lock = threading.Lock()
+
+    def record(self, trace: CallTrace):
+        if trace.finished_at is None:
+            trace.finished_at = time.monotonic()
+        key = (trace.provider, trace.model, trace.operation, trace.project_id or "")
+        with self._lock:
+            if key not in self.groups:
+                self.groups[key] = _Aggregate(self.window_size)
+            self.groups[key].add(trace)
+            self.recent.append(trace.to_dict())
+        logger.info(f"LLM呼び出し: {json.dumps(trace.to_dict(), ensure_ascii=False)}")
+
+    def reset(self):
+        with self._lock:
+            self.groups.clear()
+            self.recent.clear()
+
+    def summary(self) -> Dict[str, Any]:
+        with self._lock:
+            groups = [
+                {"provider": provider, "model": model, "operation": operation, "project_id": project_id or None, **aggregate.to_dict()}
+                for (provider, model, operation, project_id), aggregate in self.groups.items()
+            ]
+        totals: Dict[str, int] = {"requests": 0, "input_tokens": 0, "output_tokens": 0, "cached_tokens": 0, "retries": 0}
+        for group in groups:
+            for field in totals:
+                totals[field] += group[field]
+        return {"totals": totals, "groups": groups}
+
+    def prometheus(self) -> str:
+        """
+        Prometheusのテキスト形式で集計値を出力する
+        """
+        with self._lock:
+            items = list(self.groups.items())
+        lines = [
+            "# HELP llm_requests_total LLM calls by status",
+            "# TYPE llm_requests_total counter",
+        ]
+
+        def labels(key: GroupKey, **extra: str) -> str:
+            provider, model, operation, project_id = key
+            pairs = {"provider": provider, "model": model, "operation": operation, "project_id": project_id, **extra}
+            return "{" + ",".join(f'{name}="{_escape_label(str(value))}"' for name, value in pairs.items()) + "}"
+
+        for key, aggregate in items:
+            for status, count in aggregate.statuses.items():
+                lines.append(f"llm_requests_total{labels(key, status=status)} {count}")
+        lines += ["# HELP llm_tokens_total Tokens reported by the providers", "# TYPE llm_tokens_total counter"]
+        for key, aggregate in items:
+            for kind in ("input", "output", "cached"):
+                lines.append(f"llm_tokens_total{labels(key, type=kind)} {getattr(aggregate, kind + '_tokens')}")
+        lines += ["# HELP llm_retries_total Retries and rate-limit requeues", "# TYPE llm_retries_total counter"]
+        for key, aggregate in items:
+            lines.append(f"llm_retries_total{labels(key)} {aggregate.retries}")
+        for name, help_text, values_attr, sum_attr, count_attr in (
+            ("llm_latency_seconds", "Total latency of successful upstream calls", "latencies", "latency_sum", "latency_count"),
+            ("llm_ttft_seconds", "Time to first token of successful upstream streams", "ttfts", "ttft_sum", "ttft_count"),
+        ):
+            lines += [f"# HELP {name} {help_text}", f"# TYPE {name} summary"]
+            for key, aggregate in items:
+                values = list(getattr(aggregate, values_attr))
+                for q in QUANTILES:
+                    value = percentile(values, q)
+                    lines.append(f"{name}{labels(key, quantile=str(q))} {value if value is not None else 'NaN'}")
+                lines.append(f"{name}_sum{labels(key)} {getattr(aggregate, sum_attr)}")
+                lines.append(f"{name}_count{labels(key)} {getattr(aggregate, count_attr)}")
+        return "\n".join(lines) + "\n"
+
+
+llm_telemetry = LLMTelemetry()
+
+
+@asynccontextmanager
+async def track_llm_call(provider: str, model: str) -> AsyncIterator[CallTrace]:
+    """
+    ブロック内のLLM呼び出しを1件として記録するコンテキストマネージャ（非ストリーミング用）
+    """
+    trace = CallTrace(provider, model)
+    token = current_trace.set(trace)
+    try:
+        yield trace
+    except asyncio.CancelledError:
+        trace.status = "cancelled"
+        raise
+    except Exception:
+        trace.status = "error"
+        raise
+    finally:
+        current_trace.reset(token)
+        llm_telemetry.record(trace)
+
+
+async def track_llm_stream(provider: str, model: str, stream: Callable[[CallTrace], AsyncIterator[str]]) -> AsyncIterator[str]:
+    """
+    ストリーミング呼び出しを1件として記録するラッパー
+
+    stream には記録用の CallTrace が渡されます。上流へ問い合わせた場合は stream 側で status を "ok" にし、
+    使用トークンを add_usage で記録します。キャッシュや実行中の同一ストリームから返した場合は "cached" のままになります。
+    """
+    trace = CallTrace(provider, model, stream=True)
+    trace.status = "cached"
+    try:
+        async for chunk in stream(trace):
+            trace.mark_first_token()
+            yield chunk
+    except (asyncio.CancelledError, GeneratorExit):
+        trace.status = "cancelled"
+        raise
+    except Exception:
+        trace.status = "error"
+        raise
+    finally:
+        llm_telemetry.record(trace)
@@ -0,0 +1,92 @@
+"""
+プロバイダーとのやり取りを記録する、圧縮・索引付きのトランスクリプトストア
+
+標準ライブラリのみに依存するため、grimoires/meta/domain_exe.py のような単体のCLIからも読み込めます。
+"""
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+import zlib
+from typing import Any, Dict, Optional
+
+
+def make_request_key(provider: str, model: str, temperature: float, max_tokens: int, prompt: str) -> str:
+    """
+    (provider, model, temperature, max_tokens, プロンプトのハッシュ) から記録・再生の照合キーを生成する関数
+    """
+    prompt_hash = hashlib.sha256(prompt.encode("utf-8")).hexdigest()
+    raw_key = json.dumps([provider, model, temperature, max_tokens, prompt_hash])
+    return hashlib.sha256(raw_key.encode("utf-8")).hexdigest()
+
+
+class TranscriptStore:
+    """
+    プロバイダーとのやり取りを記録する、圧縮・索引付きのトランスクリプトストア
+
+    リクエスト・レスポンス本体はzlibで圧縮してSQLiteに保存し、リクエストキーで索引します。
+    同じリクエストが複数回記録されている場合は、再生時に記録順に順番に返します。
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        self._cursors: Dict[str, int] = {}
+        self.stats = {"recorded": 0, "replayed": 0, "misses": 0}
+
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS exchanges ("
+            "id INTEGER PRIMARY KEY AUTOINCREMENT, key TEXT NOT NULL, provider TEXT NOT NULL, "
+            "model TEXT NOT NULL, operation TEXT, stream INTEGER NOT NULL, recorded_at REAL NOT NULL, "
+            "latency REAL NOT NULL, payload BLOB NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_exchanges_key ON exchanges (key, id)")
+        self._conn.commit()
+
+    def append(self, key: str, provider: str, model: str, operation: Optional[str], stream: bool,
+               latency: float, payload: Dict[str, Any]):
+        blob = zlib.compress(json.dumps(payload, ensure_ascii=False).encode("utf-8"))
+        with self._lock:
+            self._conn.execute(
+                "INSERT INTO exchanges (key, provider, model, operation, stream, recorded_at, latency, payload) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (key, provider, model, operation, int(stream), time.time(), latency, blob)
+            )
+            self._conn.commit()
+            self.stats["recorded"] += 1
+
+    def next_for(self, key: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            # 記録済みの件数だけを数え、カーソルの位置の1件だけを読み込む（(key, id) の索引で引ける）
+            (count,) = self._conn.execute("SELECT COUNT(*) FROM exchanges WHERE key = ?", (key,)).fetchone()
+            if not count:
+                self.stats["misses"] += 1
+                return None
+            index = self._cursors.get(key, 0)
+            self._cursors[key] = index + 1
+            latency, blob = self._conn.execute(
+                "SELECT latency, payload FROM exchanges WHERE key = ? ORDER BY id LIMIT 1 OFFSET ?", (key, index % count)
+            ).fetchone()
+            self.stats["replayed"] += 1
+        return {"latency": latency, **json.loads(zlib.decompress(blob).decode("utf-8"))}
+
+    def rewind(self):
+        with self._lock:
+            self._cursors.clear()
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._lock:
+            exchanges, compressed_bytes = self._conn.execute(
+                "SELECT COUNT(*), COALESCE(SUM(LENGTH(payload)), 0) FROM exchanges"
+            ).fetchone()
+        return {**self.stats, "path": self.path, "exchanges": exchanges, "compressed_bytes": compressed_bytes}
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
@@ -0,0 +1,368 @@
+import bisect
+import fnmatch
+import logging
+import os
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Tuple
+
+from config.settings import (
+    TREE_MAX_DEPTH,
+    TREE_MAX_ENTRIES,
+    TREE_MAX_BYTES,
+    TREE_CACHE_SIZE,
+    STRUCTURE_PAGE_SIZE,
+    STRUCTURE_MAX_PAGE_SIZE,
+    STRUCTURE_MAX_DEPTH,
+    STRUCTURE_LISTING_CACHE_SIZE,
+)
+
+logger = logging.getLogger(__name__)
+
+# .gitignore の有無にかかわらず常に除外するディレクトリ・ファイル
+DEFAULT_IGNORES = ["node_modules/", ".git/", ".next/", "__pycache__/", ".venv/", "venv/", ".babel_cache/", ".DS_Store"]
+
+
+class IgnoreRules:
+    """
+    .gitignore 形式のパターンによる除外ルール
+
+    "/" で終わるパターンはディレクトリだけに、"/" を含むパターンはルートからの相対パスに、
+    それ以外は名前に一致させます。"!" で始まるパターンは除外を取り消し、後に書かれたものが優先されます。
+    """
+
+    def __init__(self, patterns: List[str]):
+        self.patterns = tuple(patterns)
+        self._rules: List[Tuple[str, bool, bool, bool]] = []
+        for pattern in patterns:
+            pattern = pattern.strip()
+            if not pattern or pattern.startswith("#"):
+                continue
+            negated = pattern.startswith("!")
+            pattern = pattern[1:] if negated else pattern
+            directory_only = pattern.endswith("/")
+            pattern = pattern.rstrip("/")
+            anchored = "/" in pattern
+            self._rules.append((pattern.lstrip("/"), negated, directory_only, anchored))
+
+    def ignores(self, relative_path: str, is_dir: bool) -> bool:
+        relative_path = relative_path.replace(os.sep, "/")
+        name = relative_path.rsplit("/", 1)[-1]
+        ignored = False
+        for pattern, negated, directory_only, anchored in self._rules:
+            if directory_only and not is_dir:
+                continue
+            if fnmatch.fnmatch(relative_path if anchored else name, pattern):
+                ignored = not negated
+        return ignored
+
+
+def read_ignore_patterns(root: str) -> List[str]:
+    path = os.path.join(root, ".gitignore")
+    if not os.path.exists(path):
+        return []
+    with open(path, "r", encoding="utf-8", errors="replace") as file:
+        return [line.rstrip("\n") for line in file if line.strip() and not line.startswith("#")]
+
+
+class DirectoryTree:
+    """
+    1回の走査結果。テキストのツリーとJSONの構造のどちらにも描画できます
+
+    nodes は (相対パス, 名前, ディレクトリかどうか, 深さ) の列（親が子より先に並ぶ順）で、
+    上限により中身を省略したディレクトリの相対パスは truncated に入ります。
+    """
+
+    def __init__(self, root: str, nodes: List[Tuple[str, str, bool, int]], truncated: Dict[str, str], dir_mtimes: Dict[str, Optional[int]]):
+        self.root = root
+        self.nodes = nodes
+        self.truncated = truncated
+        self.dir_mtimes = dir_mtimes
+
+    def text(self, max_bytes: Optional[int] = None) -> str:
+        """
+        ├── 形式のテキストのツリー（max_bytes を超える分は省略する）
+        """
+        max_bytes = max_bytes if max_bytes is not None else TREE_MAX_BYTES
+        lines: List[str] = []
+        size = 0
+        # 各深さで「まだ後続の兄弟がいるか」を覚えておき、罫線を組み立てる
+        last_flags = self._last_sibling_flags()
+        open_levels: List[bool] = []
+        for (relative, name, is_dir, depth), is_last in zip(self.nodes, last_flags):
+            open_levels = open_levels[:depth]
+            prefix = "".join("    " if closed else "│   " for closed in open_levels)
+            line = f"{prefix}{'└── ' if is_last else '├── '}{name}{'/' if is_dir else ''}"
+            if relative in self.truncated:
+                line += f"  （{self.truncated[relative]}）"
+            open_levels.append(is_last)
+            size += len(line.encode("utf-8")) + 1
+            if max_bytes and size > max_bytes:
+                lines.append(f"...（出力が{max_bytes}バイトを超えたため以降を省略）")
+                break
+            lines.append(line)
+        if "" in self.truncated:
+            lines.append(f"...（{self.truncated['']}）")
+        return "\n".join(lines)
+
+    def _last_sibling_flags(self) -> List[bool]:
+        flags = [True] * len(self.nodes)
+        last_index_at_depth: Dict[int, int] = {}
+        for index, (_, _, _, depth) in enumerate(self.nodes):
+            # 同じ深さの直前のノードは、間に浅いノードを挟まなければ兄弟
+            previous = last_index_at_depth.get(depth)
+            if previous is not None:
+                flags[previous] = False
+            last_index_at_depth[depth] = index
+            for deeper in [d for d in last_index_at_depth if d > depth]:
+                del last_index_at_depth[deeper]
+        return flags
+
+    def structure(self) -> List[Dict[str, Any]]:
+        """
+        {"name", "type": "folder" / "file", "path", "children"} 形式のJSONの構造
+        """
+        top: List[Dict[str, Any]] = []
+        stack: List[List[Dict[str, Any]]] = [top]
+        for relative, name, is_dir, depth in self.nodes:
+            del stack[depth + 1:]
+            item: Dict[str, Any] = {"name": name, "type": "folder" if is_dir else "file", "path": relative}
+            if is_dir:
+                item["children"] = []
+                if relative in self.truncated:
+                    item["truncated"] = True
+            stack[depth].append(item)
+            if is_dir:
+                stack.append(item["children"])
+        return top
+
+
+class TreeService:
+    """
+    除外ルール・深さ・件数の上限付きでディレクトリを走査し、結果をキャッシュするサービス
+
+    キャッシュは走査したディレクトリ（と .gitignore）の更新日時が1つでも変わると無効になります。
+    ディレクトリの更新日時はエントリの追加・削除・名前の変更で変わるため、ツリーの形が変わったことを検出できます。
+    """
+
+    def __init__(self, cache_size: int = TREE_CACHE_SIZE):
+        self.cache_size = cache_size
+        self._cache: "OrderedDict[Tuple, DirectoryTree]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.stats = {"hits": 0, "misses": 0}
+
+    def get_tree(
+        self,
+        root: str,
+        max_depth: Optional[int] = None,
+        max_entries: Optional[int] = None,
+        ignore_patterns: Optional[List[str]] = None,
+    ) -> DirectoryTree:
+        """
+        ディレクトリのツリーを返す（ignore_patterns を省略した場合は root の .gitignore を使う）
+        """
+        root = os.path.abspath(root)
+        max_depth = max_depth if max_depth is not None else TREE_MAX_DEPTH
+        max_entries = max_entries if max_entries is not None else TREE_MAX_ENTRIES
+        gitignore_path = os.path.join(root, ".gitignore") if ignore_patterns is None else None
+        key = (root, max_depth, max_entries, tuple(ignore_patterns) if ignore_patterns is not None else None)
+        with self._lock:
+            cached = self._cache.get(key)
+            if cached is not None and self._is_fresh(cached):
+                self._cache.move_to_end(key)
+                self.stats["hits"] += 1
+                return cached
+        self.stats["misses"] += 1
+        patterns = read_ignore_patterns(root) if ignore_patterns is None else ignore_patterns
+        tree = self._scan(root, IgnoreRules(DEFAULT_IGNORES + list(patterns)), max_depth, max_entries)
+        if gitignore_path is not None:
+            tree.dir_mtimes[gitignore_path] = _mtime(gitignore_path)
+        with self._lock:
+            self._cache[key] = tree
+            self._cache.move_to_end(key)
+            while len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+        return tree
+
+    def _is_fresh(self, tree: DirectoryTree) -> bool:
+        return all(_mtime(path) == mtime for path, mtime in tree.dir_mtimes.items())
+
+    def _scan(self, root: str, rules: IgnoreRules, max_depth: int, max_entries: int) -> DirectoryTree:
+        nodes: List[Tuple[str, str, bool, int]] = []
+        truncated: Dict[str, str] = {}
+        dir_mtimes: Dict[str, Optional[int]] = {}
+
+        def walk(directory: str, relative: str, depth: int):
+            dir_mtimes[directory] = _mtime(directory)
+            try:
+                with os.scandir(directory) as iterator:
+                    entries = sorted(iterator, key=lambda entry: entry.name)
+            except OSError as e:
+                logger.warning(f"ディレクトリを読み込めませんでした: {directory}: {str(e)}")
+                return
+            for entry in entries:
+                if len(nodes) >= max_entries:
+                    truncated[""] = f"エントリ数が上限の{max_entries}件に達したため以降を省略"
+                    return
+                is_dir = entry.is_dir(follow_symlinks=False)
+                entry_relative = os.path.join(relative, entry.name) if relative else entry.name
+                if rules.ignores(entry_relative, is_dir):
+                    continue
+                nodes.append((entry_relative, entry.name, is_dir, depth))
+                if is_dir:
+                    if max_depth and depth + 1 >= max_depth:
+                        truncated[entry_relative] = f"深さの上限{max_depth}のため省略"
+                    else:
+                        walk(entry.path, entry_relative, depth + 1)
+                if "" in truncated:
+                    return
+
+        walk(root, "", 0)
+        return DirectoryTree(root, nodes, truncated, dir_mtimes)
+
+    def clear(self):
+        with self._lock:
+            self._cache.clear()
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {**self.stats, "entries": len(self._cache)}
+
+
+def _mtime(path: str) -> Optional[int]:
+    try:
+        return os.stat(path).st_mtime_ns
+    except OSError:
+        return None
+
+
+class _Listing:
+    def __init__(self, mtime: Optional[int], entries: List[Tuple[str, bool]]):
+        self.mtime = mtime
+        # (名前, ディレクトリかどうか) の名前順の列と、カーソルを二分探索するための名前の列
+        self.entries = entries
+        self.names = [name for name, _ in entries]
+
+
+class StructureService:
+    """
+    ファイルエクスプローラーがフォルダを開くたびに必要な分だけ返す、遅延型のディレクトリ構造のサービス
+
+    ファイルの内容は読まず、os.scandir のエントリが持つ種類（d_type）だけでファイルかディレクトリかを判定します。
+    ディレクトリごとの一覧をキャッシュし、ディレクトリの更新日時が変わったときだけ読み直します。
+    1つのディレクトリの子は名前順に limit 件ずつ返し、続きは最後に返した名前をカーソルにして取得します。
+    """
+
+    def __init__(self, cache_size: int = STRUCTURE_LISTING_CACHE_SIZE):
+        self.cache_size = max(1, cache_size)
+        self._listings: "OrderedDict[str, _Listing]" = OrderedDict()
+        self._rules: "OrderedDict[Tuple, IgnoreRules]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.stats = {"hits": 0, "misses": 0}
+
+    def _listing(self, directory: str) -> _Listing:
+        mtime = _mtime(directory)
+        with self._lock:
+            listing = self._listings.get(directory)
+            if listing is not None and listing.mtime == mtime:
+                self._listings.move_to_end(directory)
+                self.stats["hits"] += 1
+                return listing
+        self.stats["misses"] += 1
+        try:
+            with os.scandir(directory) as iterator:
+                entries = sorted((entry.name, entry.is_dir(follow_symlinks=False)) for entry in iterator)
+        except OSError as e:
+            logger.warning(f"ディレクトリを読み込めませんでした: {directory}: {str(e)}")
+            entries = []
+        listing = _Listing(mtime, entries)
+        with self._lock:
+            self._listings[directory] = listing
+            self._listings.move_to_end(directory)
+            while len(self._listings) > self.cache_size:
+                self._listings.popitem(last=False)
+        return listing
+
+    def _ignore_rules(self, root: str, ignore_patterns: Optional[List[str]]) -> IgnoreRules:
+        # .gitignore を読むかどうかで、その更新日時もキーに含める
+        key = (root, _mtime(os.path.join(root, ".gitignore"))) if ignore_patterns is None else (root, tuple(ignore_patterns))
+        with self._lock:
+            rules = self._rules.get(key)
+            if rules is not None:
+                return rules
+        patterns = read_ignore_patterns(root) if ignore_patterns is None else ignore_patterns
+        rules = IgnoreRules(DEFAULT_IGNORES + list(patterns))
+        with self._lock:
+            self._rules[key] = rules
+            while len(self._rules) > self.cache_size:
+                self._rules.popitem(last=False)
+        return rules
+
+    def get_structure(
+        self,
+        root: str,
+        path: str = "",
+        depth: int = 1,
+        cursor: Optional[str] = None,
+        limit: Optional[int] = None,
+        ignore_patterns: Optional[List[str]] = None,
+        only: Optional[List[str]] = None,
+    ) -> Dict[str, Any]:
+        """
+        root からの相対パス path のディレクトリの子を depth 階層まで返す
+
+        各フォルダの children は名前順に limit 件までで、続きがある場合はそのフォルダに next_cursor が付きます。
+        depth の外のフォルダは children を持たず、開くときに path を指定して取得します。
+        only を指定した場合は root 直下の項目をその名前に限ります。
+        """
+        root = os.path.abspath(root)
+        relative = path.replace(os.sep, "/").strip("/")
+        directory = os.path.normpath(os.path.join(root, relative))
+        if os.path.commonpath([root, directory]) != root:
+            raise ValueError(f"ルートの外のパスです: {path}")
+        if not os.path.isdir(directory):
+            raise FileNotFoundError(f"ディレクトリ {path} が見つかりません")
+        relative = "" if directory == root else os.path.relpath(directory, root).replace(os.sep, "/")
+        depth = min(max(1, depth), STRUCTURE_MAX_DEPTH)
+        limit = min(max(1, limit or STRUCTURE_PAGE_SIZE), STRUCTURE_MAX_PAGE_SIZE)
+        rules = self._ignore_rules(root, ignore_patterns)
+        children, next_cursor = self._children(directory, relative, depth, cursor, limit, rules, only)
+        return {"path": relative, "children": children, "next_cursor": next_cursor}
+
+    def _children(self, directory, relative, depth, cursor, limit, rules, only=None):
+        listing = self._listing(directory)
+        start = bisect.bisect_right(listing.names, cursor) if cursor else 0
+        children: List[Dict[str, Any]] = []
+        for index in range(start, len(listing.entries)):
+            name, is_dir = listing.entries[index]
+            entry_relative = f"{relative}/{name}" if relative else name
+            if (only is not None and not relative and name not in only) or rules.ignores(entry_relative, is_dir):
+                continue
+            if len(children) >= limit:
+                return children, children[-1]["name"]
+            item: Dict[str, Any] = {"name": name, "type": "folder" if is_dir else "file", "path": entry_relative}
+            if is_dir and depth > 1:
+                item["children"], item["next_cursor"] = self._children(
+                    os.path.join(directory, name), entry_relative, depth - 1, None, limit, rules
+                )
+            children.append(item)
+        return children, None
+
+    def clear(self):
+        with self._lock:
+            self._listings.clear()
+            self._rules.clear()
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {**self.stats, "listings": len(self._listings)}
+
+
+tree_service = TreeService()
+structure_service = StructureService()
+
+
+def get_tree(root: str, **options) -> DirectoryTree:
+    return tree_service.get_tree(root, **options)
+
+
+def list_structure(root: str, **options) -> Dict[str, Any]:
+    return structure_service.get_structure(root, **options)
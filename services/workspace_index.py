@@ -0,0 +1,258 @@
+import logging
+import os
+import threading
+import uuid
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Tuple
+
+from config.settings import TREE_MAX_DEPTH, TREE_MAX_ENTRIES, WORKSPACE_INDEX_WATCH, WORKSPACE_INDEX_RENDER_CACHE_SIZE
+from services.file_watch import is_watching, start_watching, subscribe
+from services.tree_service import DEFAULT_IGNORES, DirectoryTree, IgnoreRules, read_ignore_patterns
+
+logger = logging.getLogger(__name__)
+
+# 構造を変えるイベント（opened / closed などの内容へのアクセスや modified は構造を変えない）
+STRUCTURE_EVENTS = ("created", "deleted", "moved")
+
+
+class WorkspaceIndex:
+    """
+    プロジェクトのディレクトリ構造をメモリ上に保持する索引
+
+    初回に1回だけ走査し、以降はファイル変更のイベント（created / deleted / moved）で変わった部分だけを更新します。
+    構造が変わるたびに version を1つ進め、ETag はインスタンスごとの識別子と version から作ります。
+    同じ version の間は描画した構造をキャッシュから返します。
+    同じイベントを2回受け取っても構造が変わらなければ version は進みません。
+    watchdogのスレッドからも更新されるため、操作はすべてロック内で行います。
+    """
+
+    def __init__(self, root: str, max_depth: Optional[int] = None):
+        self.root = os.path.abspath(root)
+        # max_depth を指定した場合はその深さまでのディレクトリだけを保持する（より深いイベントは無視される）
+        self.max_depth = max_depth
+        self._lock = threading.RLock()
+        # ディレクトリの相対パス（ルートは ""）ごとの、子の名前とディレクトリかどうか
+        self._children: Dict[str, Dict[str, bool]] = {}
+        self._rules = IgnoreRules(DEFAULT_IGNORES)
+        self._rendered: "OrderedDict[Tuple, List[Dict[str, Any]]]" = OrderedDict()
+        self._generation = uuid.uuid4().hex[:8]
+        self.version = 0
+        self.stats = {"events": 0, "changes": 0, "rebuilds": 0, "render_hits": 0, "render_misses": 0}
+
+    @property
+    def etag(self) -> str:
+        return f'"{self._generation}-{self.version}"'
+
+    def rebuild(self) -> bool:
+        """
+        ディレクトリ全体を走査し直す（戻り値は構造が変わったかどうか）
+        """
+        with self._lock:
+            self.stats["rebuilds"] += 1
+            self._rules = IgnoreRules(DEFAULT_IGNORES + read_ignore_patterns(self.root))
+            children: Dict[str, Dict[str, bool]] = {}
+            self._scan(self.root, "", children, 1)
+            if children == self._children:
+                return False
+            self._children = children
+            self._changed()
+            return True
+
+    def _scan(self, directory: str, relative: str, children: Dict[str, Dict[str, bool]], depth: int):
+        entries: Dict[str, bool] = {}
+        children[relative] = entries
+        try:
+            with os.scandir(directory) as iterator:
+                found = [(entry.name, entry.is_dir(follow_symlinks=False)) for entry in iterator]
+        except OSError as e:
+            logger.warning(f"ディレクトリを読み込めませんでした: {directory}: {str(e)}")
+            return
+        for name, is_dir in found:
+            entry_relative = f"{relative}/{name}" if relative else name
+            if self._rules.ignores(entry_relative, is_dir):
+                continue
+            entries[name] = is_dir
+            if is_dir and (not self.max_depth or depth < self.max_depth):
+                self._scan(os.path.join(directory, name), entry_relative, children, depth + 1)
+
+    def _changed(self):
+        self.version += 1
+        self.stats["changes"] += 1
+        self._rendered.clear()
+
+    def _relative(self, path: str) -> Optional[str]:
+        path = os.path.abspath(path)
+        if path == self.root or os.path.commonpath([self.root, path]) != self.root:
+            return None
+        return os.path.relpath(path, self.root).replace(os.sep, "/")
+
+    def _is_ignored(self, relative: str, is_dir: bool) -> bool:
+        # 除外されたディレクトリの中のイベントも無視する
+        parts = relative.split("/")
+        for index in range(1, len(parts)):
+            if self._rules.ignores("/".join(parts[:index]), True):
+                return True
+        return self._rules.ignores(relative, is_dir)
+
+    def _add(self, relative: str) -> bool:
+        path = os.path.join(self.root, relative)
+        if not os.path.lexists(path):
+            return False
+        is_dir = os.path.isdir(path) and not os.path.islink(path)
+        parent, _, name = relative.rpartition("/")
+        siblings = self._children.get(parent)
+        if siblings is None or self._is_ignored(relative, is_dir):
+            return False
+        depth = relative.count("/") + 1
+        scan = is_dir and (not self.max_depth or depth < self.max_depth)
+        if siblings.get(name) == is_dir and (not scan or relative in self._children):
+            return False
+        if name in siblings:
+            self._remove(relative)
+        siblings[name] = is_dir
+        if scan:
+            # 監視を始める前に中身が作られていることがあるため、新しいディレクトリは中身も走査する
+            self._scan(path, relative, self._children, depth + 1)
+        return True
+
+    def _remove(self, relative: str) -> bool:
+        parent, _, name = relative.rpartition("/")
+        siblings = self._children.get(parent)
+        if siblings is None or name not in siblings:
+            return False
+        if siblings.pop(name):
+            pending = [relative]
+            while pending:
+                directory = pending.pop()
+                for child, is_dir in self._children.pop(directory, {}).items():
+                    if is_dir:
+                        pending.append(f"{directory}/{child}")
+        return True
+
+    def apply_event(self, event_type: str, src_path: str, dest_path: Optional[str] = None):
+        """
+        ファイル変更イベント（created / deleted / moved）を構造に反映する（内容の変更は .gitignore の場合だけ除外ルールの読み直しとして扱う）
+        """
+        with self._lock:
+            self.stats["events"] += 1
+            # 内容の変更は .gitignore の場合だけ扱う
+            if event_type not in STRUCTURE_EVENTS and event_type != "modified":
+                return
+            relative = self._relative(src_path)
+            if ".gitignore" in (relative, self._relative(dest_path) if dest_path else None):
+                # 除外ルールが変わった場合は全体を走査し直す
+                self.rebuild()
+                return
+            changed = False
+            if event_type == "modified":
+                return
+            if event_type == "deleted" and relative is not None:
+                changed = self._remove(relative)
+            elif event_type == "moved":
+                if relative is not None:
+                    changed = self._remove(relative)
+                destination = self._relative(dest_path) if dest_path else None
+                if destination is not None:
+                    changed = self._add(destination) or changed
+            elif event_type == "created" and relative is not None:
+                changed = self._add(relative)
+            if changed:
+                self._changed()
+
+    def structure(self, path: str = "", max_depth: Optional[int] = None, max_entries: Optional[int] = None, only: Optional[List[str]] = None) -> List[Dict[str, Any]]:
+        """
+        path（ルートからの相対パス）以下の構造を、tree_service と同じ {"name", "type", "path", "children"} 形式で返す
+
+        tree_service で path のディレクトリを走査した場合と同じく、各項目の path は path からの相対パスです。
+        """
+        max_depth = max_depth if max_depth is not None else TREE_MAX_DEPTH
+        max_entries = max_entries if max_entries is not None else TREE_MAX_ENTRIES
+        path = path.replace(os.sep, "/").strip("/")
+        key = (path, max_depth, max_entries, tuple(only) if only is not None else None)
+        with self._lock:
+            rendered = self._rendered.get(key)
+            if rendered is not None:
+                self._rendered.move_to_end(key)
+                self.stats["render_hits"] += 1
+                return rendered
+            self.stats["render_misses"] += 1
+            if path not in self._children:
+                raise FileNotFoundError(f"ディレクトリ {path} が見つかりません")
+            rendered = self._render(path, max_depth, max_entries, only).structure()
+            self._rendered[key] = rendered
+            while len(self._rendered) > WORKSPACE_INDEX_RENDER_CACHE_SIZE:
+                self._rendered.popitem(last=False)
+            return rendered
+
+    def _render(self, path: str, max_depth: int, max_entries: int, only: Optional[List[str]]) -> DirectoryTree:
+        # 走査の代わりに索引から tree_service と同じ順序・上限でノードを組み立てる
+        nodes: List[Tuple[str, str, bool, int]] = []
+        truncated: Dict[str, str] = {}
+        prefix = f"{path}/" if path else ""
+
+        def walk(relative: str, depth: int):
+            for name, is_dir in sorted(self._children.get(prefix + relative if relative else path, {}).items()):
+                if only is not None and not relative and name not in only:
+                    continue
+                if len(nodes) >= max_entries:
+                    truncated[""] = f"エントリ数が上限の{max_entries}件に達したため以降を省略"
+                    return
+                entry_relative = f"{relative}/{name}" if relative else name
+                nodes.append((entry_relative, name, is_dir, depth))
+                if is_dir:
+                    if max_depth and depth + 1 >= max_depth:
+                        truncated[entry_relative] = f"深さの上限{max_depth}のため省略"
+                    else:
+                        walk(entry_relative, depth + 1)
+                if "" in truncated:
+                    return
+
+        walk("", 0)
+        return DirectoryTree(os.path.join(self.root, path), nodes, truncated, {})
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                **self.stats,
+                "root": self.root,
+                "version": self.version,
+                "directories": len(self._children),
+                "entries": sum(len(entries) for entries in self._children.values()),
+            }
+
+
+_indexes: Dict[Tuple[str, Optional[int]], WorkspaceIndex] = {}
+_registry_lock = threading.Lock()
+
+
+def get_workspace_index(root: str, max_depth: Optional[int] = None, watch: bool = WORKSPACE_INDEX_WATCH) -> WorkspaceIndex:
+    """
+    プロジェクトごとの共有の索引を返す関数
+
+    初回は全体を走査して索引を作ります。watch が有効な場合は共有の監視（services/file_watch）でファイル変更を受け取って差分だけを反映し、
+    無効な場合は呼び出しごとに走査し直し、構造が変わったときだけ version を進めます。
+    """
+    root = os.path.abspath(root)
+    key = (root, max_depth)
+    with _registry_lock:
+        index = _indexes.get(key)
+        created = index is None
+        if created:
+            if not os.path.isdir(root):
+                raise FileNotFoundError(f"ディレクトリ {root} が見つかりません")
+            index = WorkspaceIndex(root, max_depth)
+            _indexes[key] = index
+            subscribe(root, lambda event_type, src_path, dest_path, is_directory: index.apply_event(event_type, src_path, dest_path))
+    watching = is_watching(root)
+    if watch and not watching:
+        # 走査中の変更を取りこぼさないよう、監視を始めてから走査する
+        start_watching(root)
+    if created or not watching:
+        index.rebuild()
+    return index
+
+
+def get_workspace_index_stats() -> List[Dict[str, Any]]:
+    with _registry_lock:
+        indexes = list(_indexes.values())
+    return [index.get_stats() for index in indexes]
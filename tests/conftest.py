@@ -0,0 +1,7 @@
+# テスト共通の設定
+import os
+
+# プロバイダークライアントの初期化に必要なAPIキーをダミー値で補う
+os.environ.setdefault("ANTHROPIC_API_KEY", "test")
+os.environ.setdefault("OPENAI_API_KEY", "test")
+os.environ.setdefault("GEMINI_API_KEY", "test")
@@ -0,0 +1,87 @@
+# 大きな入力の分割とmap-reduce処理のテスト
+import asyncio
+
+import services.ai_service as ai_service
+from services import map_reduce as map_reduce_module
+from utils.chunking import pack_files, split_into_chunks
+from utils.tokens import estimate_tokens
+
+
+def make_python_source(functions):
+    return "".join(
+        f"@decorator\ndef func_{i}():\n" + "".join(f"    value_{j} = {j}\n" for j in range(20)) + "\n"
+        for i in range(functions)
+    )
+
+
+def test_python_is_split_on_top_level_definitions():
+    source = make_python_source(10)
+    chunks = split_into_chunks(source, 200, "module.py")
+    assert len(chunks) > 1
+    assert "".join(chunks) == source
+    for chunk in chunks:
+        assert chunk.startswith("@decorator\ndef func_")
+        assert estimate_tokens(chunk) <= 200
+
+
+def test_oversized_block_falls_back_to_lines():
+    source = "function big() {\n" + "".join(f"  const v{i} = {i};\n" for i in range(200)) + "}\n"
+    chunks = split_into_chunks(source, 100, "big.js")
+    assert len(chunks) > 1
+    assert "".join(chunks) == source
+    assert all(estimate_tokens(chunk) <= 100 for chunk in chunks)
+
+
+def test_pack_files_groups_small_files():
+    files = [("a.js", "a" * 100), ("b.js", "b" * 100), ("c.js", "c" * 400)]
+    groups = pack_files(files, 60)
+    assert [name for name, _ in groups[0]] == ["a.js", "b.js"]
+    assert groups[1][0][0].startswith("c.js (部分1/")
+
+
+def test_map_reduce_runs_chunks_concurrently(monkeypatch):
+    in_flight = []
+    max_in_flight = []
+
+    async def fake_generate_text(prompt, operation, use_cache=True):
+        in_flight.append(1)
+        max_in_flight.append(len(in_flight))
+        await asyncio.sleep(0.01)
+        in_flight.pop()
+        return {"generated_text": f"[{prompt}]"}
+
+    monkeypatch.setattr(map_reduce_module, "generate_text", fake_generate_text)
+    result = asyncio.run(map_reduce_module.map_reduce(
+        ["one", "two", "three"],
+        lambda index, total, chunk: f"{index}/{total}:{chunk}",
+        lambda texts: "merge:" + ",".join(texts),
+        operation="ai_analyze",
+    ))
+    assert result["chunks"] == 3
+    assert result["generated_text"] == "[merge:[1/3:one],[2/3:two],[3/3:three]]"
+    assert max(max_in_flight) == 3
+
+
+def test_chunked_rewrite_joins_only_the_code_of_each_chunk(tmp_path, monkeypatch):
+    path = tmp_path / "module.py"
+    path.write_text(make_python_source(10))
+    replies = {}
+
+    async def fake_generate_text(prompt, operation, use_cache=True):
+        index = prompt.split("（", 1)[1].split("/", 1)[0]
+        # コードブロックの前後に説明がある応答と、コードブロックのない応答を混ぜる
+        if index == "1":
+            text = "書き直しました。\n```python\ndef part_1():\n    pass\n```\n以上です。"
+        else:
+            text = f"def part_{index}():\n    pass\n"
+        replies[index] = text
+        return {"generated_text": text}
+
+    monkeypatch.setattr(map_reduce_module, "generate_text", fake_generate_text)
+    monkeypatch.setattr(ai_service, "fits_budget", lambda prompt: False)
+    monkeypatch.setattr(ai_service, "LLM_CHUNK_TOKENS", 200)
+    result = asyncio.run(ai_service.ai_rewrite(str(path), False, "簡潔"))
+    assert result["chunks"] == len(replies) > 1
+    assert "```" not in result["generated_text"]
+    assert "書き直しました" not in result["generated_text"]
+    assert result["generated_text"].split("\n")[:3] == ["def part_1():", "    pass", "def part_2():"]
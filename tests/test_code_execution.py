@@ -0,0 +1,150 @@
+# 生成されたスクリプトの実行（作業ディレクトリとその削除・カレントディレクトリ・タイムアウト・rlimit・同時実行数・出力の通知）のテスト
+import asyncio
+import os
+import sys
+import time
+
+import pytest
+
+import services.ai_service as ai_service
+from services.code_execution import CodeExecutor, execution_output
+
+
+def make_executor(tmp_path, **options):
+    return CodeExecutor(workspace_dir=str(tmp_path / "executions"), **options)
+
+
+def test_parallel_runs_get_their_own_workspaces(tmp_path):
+    executor = make_executor(tmp_path, max_concurrency=4)
+    code = "import os\nopen('out.txt', 'w').write(os.getcwd())\nprint('done')\n"
+
+    async def run():
+        return await asyncio.gather(*[executor.run_python(code) for _ in range(4)])
+
+    results = asyncio.run(run())
+    assert len({result["workspace"] for result in results}) == 4
+    for result in results:
+        assert result["returncode"] == 0
+        assert result["output"] == "done\n"
+        with open(os.path.join(result["workspace"], "out.txt")) as file:
+            assert file.read() == result["workspace"]
+        assert os.path.exists(os.path.join(result["workspace"], "script.py"))
+
+
+def test_long_running_script_is_killed_without_blocking_the_loop(tmp_path):
+    executor = make_executor(tmp_path, timeout=0.5)
+    ticks = 0
+
+    async def ticker():
+        nonlocal ticks
+        while True:
+            await asyncio.sleep(0.05)
+            ticks += 1
+
+    async def run():
+        task = asyncio.ensure_future(ticker())
+        result = await executor.run_python("import time\nprint('start', flush=True)\ntime.sleep(30)\n")
+        task.cancel()
+        return result
+
+    start = time.monotonic()
+    result = asyncio.run(run())
+    assert time.monotonic() - start < 5
+    assert result["limit"] == "timeout"
+    assert result["output"] == "start\n"
+    # 実行中もイベントループは他の処理を進められる
+    assert ticks >= 5
+    assert executor.stats["timeouts"] == 1
+
+
+@pytest.mark.skipif(sys.platform != "linux", reason="rlimit の挙動はLinuxで確認する")
+def test_resource_limits_are_applied(tmp_path):
+    executor = make_executor(tmp_path, cpu_seconds=1, memory_mb=256, timeout=30)
+
+    memory = asyncio.run(executor.run_python("b = bytearray(512 * 1024 * 1024)\n"))
+    assert memory["returncode"] != 0
+    assert "MemoryError" in memory["output"]
+
+    cpu = asyncio.run(executor.run_python("while True:\n    pass\n"))
+    assert cpu["limit"] == "cpu"
+
+    # CPU時間を使い切っていない SIGKILL（メモリ不足や外部からの終了）はCPU時間の上限として報告しない
+    killed = asyncio.run(executor.run_python("import os, signal\nos.kill(os.getpid(), signal.SIGKILL)\n"))
+    assert killed["returncode"] == -9
+    assert killed["limit"] is None
+
+
+def test_concurrency_cap_and_output_streaming(tmp_path):
+    executor = make_executor(tmp_path, max_concurrency=1)
+    received = []
+    code = "import time\nfor i in range(2):\n    print(i, flush=True)\n    time.sleep(0.1)\n"
+
+    async def handler(detail):
+        received.append((detail["label"], detail["output"], executor.get_stats()["running"]))
+
+    async def run():
+        with execution_output(handler):
+            return await asyncio.gather(executor.run_python(code, label="a.py"), executor.run_python(code, label="b.py"))
+
+    results = asyncio.run(run())
+    assert [result["output"] for result in results] == ["0\n1\n", "0\n1\n"]
+    # 同時に実行されるのは1件だけなので、出力が交互に混ざらない
+    assert [(label, output) for label, output, _ in received] == [("a.py", "0\n"), ("a.py", "1\n"), ("b.py", "0\n"), ("b.py", "1\n")]
+    assert all(running == 1 for _, _, running in received)
+
+
+def test_output_beyond_the_limit_is_truncated(tmp_path):
+    executor = make_executor(tmp_path, max_output_bytes=100)
+    result = asyncio.run(executor.run_python("for i in range(1000):\n    print('x' * 10)\n"))
+    assert result["returncode"] == 0
+    assert result["truncated"]
+    assert result["output"].count("xxxxxxxxxx") == 9
+
+
+def test_only_the_newest_workspaces_are_kept(tmp_path):
+    executor = make_executor(tmp_path, keep_runs=2)
+    old = tmp_path / "executions" / "20000101_000000_000000_00000000"
+    old.mkdir(parents=True)
+
+    async def run():
+        return [await executor.run_python("print('ok')\n") for _ in range(3)]
+
+    results = asyncio.run(run())
+    kept = sorted(os.listdir(tmp_path / "executions"))
+    assert kept == sorted(result["run_id"] for result in results[1:])
+    assert executor.stats["removed_workspaces"] == 2
+
+
+def test_cwd_is_used_instead_of_the_workspace(tmp_path):
+    executor = make_executor(tmp_path)
+    target = tmp_path / "repo"
+    target.mkdir()
+    result = asyncio.run(executor.run_python("import os\nprint(os.getcwd())\n", cwd=str(target)))
+    assert result["output"] == f"{target}\n"
+    # スクリプトは引き続き実行ごとの作業ディレクトリに保存される
+    assert os.path.exists(os.path.join(result["workspace"], "script.py"))
+
+
+def test_ai_process_runs_the_script_in_the_target_repository(tmp_path, monkeypatch):
+    repo = tmp_path / "repo"
+    (repo / ".git").mkdir(parents=True)
+    (repo / "src").mkdir()
+    target = repo / "src" / "app.py"
+    target.write_text("print('hello')\n")
+    outside = tmp_path / "plain"
+    outside.mkdir()
+    calls = []
+
+    async def fake_generate_text(prompt, operation="direct", use_cache=True):
+        return {"generated_text": "```python\nprint('ok')\n```"}
+
+    async def fake_run_python(code, **options):
+        calls.append(options["cwd"])
+        return {"run_id": "run", "workspace": "", "returncode": 0, "output": "", "limit": None, "elapsed": 0}
+
+    monkeypatch.setattr(ai_service, "generate_text", fake_generate_text)
+    monkeypatch.setattr(ai_service, "run_python", fake_run_python)
+    asyncio.run(ai_service.ai_process(str(target), False, "smart", "変更", edit_mode="script"))
+    asyncio.run(ai_service.ai_process(str(outside), False, "smart", "変更", edit_mode="script"))
+    # リポジトリの外にある対象は、そのディレクトリで実行する
+    assert calls == [str(repo), str(outside)]
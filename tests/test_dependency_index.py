@@ -0,0 +1,120 @@
+# import関係の索引（Pythonのast解析・JS/TSのimport/require解析・差分更新）のテスト
+import asyncio
+import os
+
+import services.ai_service as ai_service
+import services.dependency_index as dependency_index
+from services.dependency_index import DependencyIndex, render_subgraph
+from utils.import_graph import parse_js_imports, parse_python_imports
+
+
+def write(root, relative, content):
+    path = os.path.join(root, relative)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "w") as file:
+        file.write(content)
+    return path
+
+
+def test_parse_js_imports_including_react_lazy():
+    source = """
+import React, { lazy, Suspense } from 'react';
+import {
+  Header,
+} from './components/Common/Header';
+// import Unused from './Unused';
+export * from "./utils";
+const Chat = lazy(() => import('./components/CollaborationHub/ChatInterface'));
+const fs = require("fs");
+const url = "http://example.com/import('x')";
+"""
+    assert sorted(parse_js_imports(source)) == sorted([
+        ("react", "static"),
+        ("./components/Common/Header", "static"),
+        ("./utils", "export"),
+        ("./components/CollaborationHub/ChatInterface", "dynamic"),
+        ("fs", "require"),
+    ])
+
+
+def test_parse_python_imports_with_relative_modules():
+    source = "import os\nfrom . import sibling\nfrom ..pkg.mod import name\n\ndef f():\n    import json\n"
+    refs = parse_python_imports(source)
+    assert ("os", "import") in refs
+    assert (".sibling", "name") in refs
+    assert ("..pkg.mod", "from") in refs
+    assert ("json", "import") in refs
+
+
+def make_project(root):
+    write(root, "app/main.py", "from app import service\nimport requests\n")
+    write(root, "app/__init__.py", "")
+    write(root, "app/service.py", "from .models import User\n")
+    write(root, "app/models.py", "import app.service\n")
+    write(root, "frontend/DynamicComponent.js", "import React, { lazy } from 'react';\nconst A = lazy(() => import('./components/A'));\n")
+    write(root, "frontend/components/A.jsx", "export default function A() { return null; }\n")
+    write(root, "node_modules/react/index.js", "module.exports = {};\n")
+
+
+def test_index_answers_structural_questions(tmp_path):
+    root = str(tmp_path)
+    make_project(root)
+    index = DependencyIndex(root)
+    index.refresh()
+
+    assert index.get_stats()["files"] == 6
+    assert index.dependencies("app/main.py") == ["app/__init__.py", "app/service.py"]
+    assert index.dependencies("app/main.py", depth=None) == ["app/__init__.py", "app/models.py", "app/service.py"]
+    assert index.dependents("frontend/components/A.jsx") == ["frontend/DynamicComponent.js"]
+    assert index.cycles() == [["app/models.py", "app/service.py"]]
+
+    graph = index.subgraph(["app/main.py"], depth=1)
+    assert graph["files"] == ["app/__init__.py", "app/main.py", "app/service.py"]
+    assert graph["external"] == {"app/main.py": ["requests"]}
+    text = render_subgraph(index, graph)
+    assert "app/main.py -> app/service.py (name)" in text
+    assert "DynamicComponent" not in text
+
+
+def test_index_is_updated_from_file_events(tmp_path):
+    root = str(tmp_path)
+    make_project(root)
+    index = DependencyIndex(root)
+    index.refresh()
+    parsed = index.stats["parsed"]
+
+    # 未解決だったimportが、新しいファイルの作成で解決される
+    path = write(root, "frontend/DynamicComponent.js", "import B from './components/B';\n")
+    index.apply_event("modified", path)
+    assert index.dependencies("frontend/DynamicComponent.js") == []
+    index.apply_event("created", write(root, "frontend/components/B.js", ""))
+    assert index.dependencies("frontend/DynamicComponent.js") == ["frontend/components/B.js"]
+    assert index.stats["parsed"] == parsed + 2
+
+    os.remove(os.path.join(root, "app/models.py"))
+    index.apply_event("deleted", os.path.join(root, "app/models.py"))
+    assert index.cycles() == []
+    # 監視対象外のディレクトリのイベントは無視する
+    index.apply_event("created", write(root, "node_modules/x/index.js", ""))
+    assert not index.has_file("node_modules/x/index.js")
+
+
+def test_ai_analyze_dependencies_sends_only_the_subgraph(tmp_path, monkeypatch):
+    root = str(tmp_path / "project")
+    make_project(root)
+    write(root, "requirements.txt", "requests\n")
+    write(root, "app/unrelated.py", "SECRET_BODY = '" + "x" * 1000 + "'\n")
+    prompts = []
+
+    async def fake_generate_text(prompt, operation="direct", use_cache=True):
+        prompts.append(prompt)
+        return {"generated_text": "analysis"}
+
+    monkeypatch.setattr(ai_service, "generate_text", fake_generate_text)
+    monkeypatch.setattr(ai_service, "get_dependency_index", lambda path: dependency_index.get_dependency_index(path, watch=False))
+
+    result = asyncio.run(ai_service.ai_analyze_dependencies([os.path.join(root, "app/service.py")], False, "direct"))
+    assert result["generated_text"] == "analysis"
+    assert result["dependency_graph"]["files"] == ["app/main.py", "app/models.py", "app/service.py"]
+    assert "app/service.py -> app/models.py" in prompts[0]
+    assert "SECRET_BODY" not in prompts[0]
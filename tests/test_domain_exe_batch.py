@@ -0,0 +1,138 @@
+# domain_exe.py の --batch モードのテスト（ローカルのバッチスタブサーバーを使用）
+import importlib.util
+import json
+import os
+import subprocess
+import sys
+import textwrap
+
+import pytest
+
+META_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "grimoires", "meta")
+
+
+def load_stub_server():
+    # grimoires/meta/utils はトップレベルの utils パッケージと名前が衝突するため、ファイルパスから読み込む
+    spec = importlib.util.spec_from_file_location(
+        "batch_stub_server", os.path.join(META_DIR, "utils", "batch_stub_server.py")
+    )
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+@pytest.fixture
+def grimoire(tmp_path):
+    package = tmp_path / "stubsaas"
+    package.mkdir()
+    output_dir = tmp_path / "generated"
+    (package / "def_concept.py").write_text('concept = "コンセプト"\ndir_frontend = "ディレクトリ構成"\n', encoding="utf-8")
+    (package / "def_constraints.py").write_text('constraints = "制約"\n', encoding="utf-8")
+    (package / "def_domain.py").write_text(textwrap.dedent(f"""
+        root_dir = {str(output_dir)!r}
+        files = [
+            ("frontend", "App.js", "App.jsを作成"),
+            ("frontend/components", "Header.js", "Header.jsを作成"),
+            ("frontend/components", "Footer.js", "Footer.jsを作成"),
+        ]
+    """), encoding="utf-8")
+    return tmp_path, output_dir
+
+
+def run_domain_exe(tmp_path, server):
+    env = {**os.environ, "PYTHONPATH": str(tmp_path), "ANTHROPIC_BASE_URL": server.base_url, "ANTHROPIC_API_KEY": "test"}
+    return subprocess.run(
+        [sys.executable, "domain_exe.py", "-s", "stubsaas", "--batch", "--poll-interval", "0.01"],
+        cwd=META_DIR, env=env, capture_output=True, text=True, timeout=60,
+    )
+
+
+def test_batch_mode_writes_all_files(grimoire):
+    tmp_path, output_dir = grimoire
+    server = load_stub_server().start_server(polls_until_ended=2)
+    try:
+        result = run_domain_exe(tmp_path, server)
+    finally:
+        server.shutdown()
+
+    assert result.returncode == 0, result.stderr
+    assert len(server.batches) == 1
+    assert "file-0001" in (output_dir / "frontend" / "App.js").read_text(encoding="utf-8")
+    assert (output_dir / "frontend" / "components" / "Footer.js").exists()
+    # 全てのファイルを書き込んだら状態ファイルは残さない
+    assert not (output_dir / ".batch_state.json").exists()
+
+
+def test_batch_mode_regenerates_everything_on_the_next_run(grimoire):
+    tmp_path, output_dir = grimoire
+    server = load_stub_server().start_server()
+    try:
+        first = run_domain_exe(tmp_path, server)
+        second = run_domain_exe(tmp_path, server)
+    finally:
+        server.shutdown()
+
+    assert first.returncode == 0 and second.returncode == 0, first.stderr + second.stderr
+    assert "生成済み" not in second.stdout
+    assert [len(batch["requests"]) for batch in server.batches.values()] == [3, 3]
+
+
+def test_batch_mode_resumes_and_resubmits_failures(grimoire):
+    tmp_path, output_dir = grimoire
+    stub = load_stub_server()
+    server = stub.start_server(fail_custom_ids=["file-0002"])
+    try:
+        first = run_domain_exe(tmp_path, server)
+        server.fail_custom_ids.clear()
+        second = run_domain_exe(tmp_path, server)
+    finally:
+        server.shutdown()
+
+    assert first.returncode == 0 and second.returncode == 0, first.stderr + second.stderr
+    # 2回目は失敗した1ファイルだけを新しいバッチとして送信する
+    assert len(server.batches) == 2
+    resubmitted = [batch for batch in server.batches.values() if len(batch["requests"]) == 1]
+    assert resubmitted[0]["requests"][0]["custom_id"] == "file-0002"
+    assert (output_dir / "frontend" / "components" / "Header.js").exists()
+    assert not (output_dir / ".batch_state.json").exists()
+
+
+def test_batch_mode_resumes_pending_batch(grimoire):
+    tmp_path, output_dir = grimoire
+    server = load_stub_server().start_server()
+    try:
+        # ポーリング中にプロセスが落ちた状態を再現する
+        first = run_domain_exe(tmp_path, server)
+        assert first.returncode == 0, first.stderr
+        batch_id = next(iter(server.batches))
+        state_path = output_dir / ".batch_state.json"
+        state_path.write_text(json.dumps({"batch_id": batch_id, "written": ["file-0001"]}), encoding="utf-8")
+        (output_dir / "frontend" / "components" / "Header.js").unlink()
+
+        second = run_domain_exe(tmp_path, server)
+    finally:
+        server.shutdown()
+
+    assert second.returncode == 0, second.stderr
+    assert len(server.batches) == 1
+    assert (output_dir / "frontend" / "components" / "Header.js").exists()
+
+
+def test_batch_mode_regenerates_deleted_files_recorded_as_written(grimoire):
+    tmp_path, output_dir = grimoire
+    server = load_stub_server().start_server()
+    try:
+        first = run_domain_exe(tmp_path, server)
+        assert first.returncode == 0, first.stderr
+        # 状態ファイルが書き込み済みとしていても、出力が消えたファイルは送信し直す
+        state_path = output_dir / ".batch_state.json"
+        state_path.write_text(json.dumps({"batch_id": None, "written": ["file-0001", "file-0002", "file-0003"]}), encoding="utf-8")
+        (output_dir / "frontend" / "components" / "Header.js").unlink()
+        second = run_domain_exe(tmp_path, server)
+    finally:
+        server.shutdown()
+
+    assert second.returncode == 0, second.stderr
+    assert [len(batch["requests"]) for batch in server.batches.values()] == [3, 1]
+    assert (output_dir / "frontend" / "components" / "Header.js").exists()
+    assert not state_path.exists()
@@ -0,0 +1,70 @@
+# 索引で共有するファイル変更の監視（除外ディレクトリを避けた監視の登録・複数の索引への振り分け）のテスト
+import os
+import time
+
+import pytest
+
+from services import dependency_index, file_watch, workspace_index
+
+
+def write(root, relative, content=""):
+    path = os.path.join(root, relative)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "w") as file:
+        file.write(content)
+    return path
+
+
+def wait_for(condition, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if condition():
+            return True
+        time.sleep(0.02)
+    return False
+
+
+@pytest.fixture
+def registry(monkeypatch):
+    monkeypatch.setattr(file_watch, "_subscribers", {})
+    monkeypatch.setattr(file_watch, "_trees", {})
+    monkeypatch.setattr(workspace_index, "_indexes", {})
+    monkeypatch.setattr(dependency_index, "_indexes", {})
+    yield
+    file_watch.stop_watching()
+
+
+def test_plan_skips_ignored_directories(tmp_path):
+    root = str(tmp_path)
+    for directory in ("src/components", "frontend/src", "frontend/node_modules/react", ".git/objects", "docs"):
+        os.makedirs(os.path.join(root, directory))
+    plan = dict(file_watch.plan_watches(root))
+    # 除外するディレクトリを含むディレクトリは再帰せず、その子は再帰して監視する
+    assert plan == {
+        root: False,
+        os.path.join(root, "frontend"): False,
+        os.path.join(root, "frontend", "src"): True,
+        os.path.join(root, "src"): True,
+        os.path.join(root, "docs"): True,
+    }
+
+
+def test_one_watch_feeds_both_indexes(tmp_path, registry):
+    root = str(tmp_path)
+    write(root, "app/main.py", "import app.models\n")
+    write(root, "node_modules/react/index.js")
+    structure = workspace_index.get_workspace_index(root)
+    dependencies = dependency_index.get_dependency_index(root)
+    stats = file_watch.get_watch_stats()
+    assert stats["roots"] == [root]
+    assert stats["subscribers"] == 2
+
+    write(root, "app/models.py", "X = 1\n")
+    assert wait_for(lambda: dependencies.has_file("app/models.py"))
+    assert wait_for(lambda: "models.py" in [item["name"] for item in structure.structure(path="app")])
+
+    # 再帰せずに監視しているディレクトリの直下に新しく作られたディレクトリも監視に加わる
+    write(root, "lib/util.py", "Y = 2\n")
+    assert wait_for(lambda: dependencies.has_file("lib/util.py"))
+    write(root, "lib/extra.py", "Z = 3\n")
+    assert wait_for(lambda: dependencies.has_file("lib/extra.py"))
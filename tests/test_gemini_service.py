@@ -0,0 +1,66 @@
+# Gemini REST API呼び出し（リクエストの組み立て・応答の解析・エラー応答）と共有HTTPクライアントのテスト
+import asyncio
+
+import httpx
+import pytest
+
+from config.settings import LLM_HTTP_CONNECT_TIMEOUT, LLM_HTTP_MAX_CONNECTIONS, LLM_HTTP_TIMEOUT
+from services import gemini_service
+from services.gemini_service import GEMINI_PROMPT_SUFFIX, build_gemini_request, extract_gemini_text, split_usage
+from services.http_client import http_client
+
+
+def test_shared_client_is_plain_httpx_with_configured_limits():
+    assert type(http_client) is httpx.AsyncClient
+    assert http_client.timeout == httpx.Timeout(LLM_HTTP_TIMEOUT, connect=LLM_HTTP_CONNECT_TIMEOUT)
+    assert http_client._transport._pool._max_connections == LLM_HTTP_MAX_CONNECTIONS
+
+
+def test_build_gemini_request():
+    body = build_gemini_request("hello")
+    assert body["contents"] == [{"role": "user", "parts": [{"text": "hello" + GEMINI_PROMPT_SUFFIX}]}]
+    assert body["generationConfig"] == {
+        "temperature": 1, "topP": 0.95, "topK": 64, "maxOutputTokens": 8192, "responseMimeType": "text/plain",
+    }
+
+
+def test_extract_gemini_text():
+    data = {"candidates": [{"content": {"parts": [{"text": "a"}, {"text": "b"}, {}]}}, {"content": {"parts": [{"text": "other"}]}}]}
+    assert extract_gemini_text(data) == "ab"
+    assert extract_gemini_text({"candidates": []}) == ""
+    assert extract_gemini_text({"promptFeedback": {"blockReason": "SAFETY"}}) == ""
+    assert extract_gemini_text({"candidates": [{"finishReason": "STOP"}]}) == ""
+
+
+def test_split_usage():
+    assert split_usage({"promptTokenCount": 100, "candidatesTokenCount": 20, "cachedContentTokenCount": 30}) == (70, 20, 30)
+    assert split_usage({"promptTokenCount": 5}) == (5, 0, 0)
+    assert split_usage({}) == (0, 0, 0)
+
+
+def test_generate_posts_to_the_rest_api_and_raises_on_error_status(monkeypatch):
+    requests = []
+
+    def handler(request):
+        requests.append(request)
+        if b"fail" in request.content:
+            return httpx.Response(400, json={"error": {"code": 400, "message": "API key not valid"}})
+        return httpx.Response(200, json={
+            "candidates": [{"content": {"parts": [{"text": "generated"}]}}],
+            "usageMetadata": {"promptTokenCount": 10, "candidatesTokenCount": 3},
+        })
+
+    monkeypatch.setattr(gemini_service, "http_client", httpx.AsyncClient(transport=httpx.MockTransport(handler)))
+    monkeypatch.setattr(gemini_service, "GEMINI_BASE_URL", "http://gemini.test")
+    monkeypatch.setattr(gemini_service, "GEMINI_API_KEY", "secret")
+
+    result = asyncio.run(gemini_service.generate_text_gemini("ok", use_cache=False))
+    assert result["generated_text"] == "generated"
+    assert str(requests[0].url) == f"http://gemini.test/v1beta/models/{gemini_service.GEMINI_MODEL}:generateContent"
+    assert requests[0].headers["x-goog-api-key"] == "secret"
+
+    with pytest.raises(httpx.HTTPStatusError) as error:
+        asyncio.run(gemini_service.generate_text_gemini("fail", use_cache=False))
+    assert error.value.response.status_code == 400
+    # 400はリトライしない
+    assert len(requests) == 2
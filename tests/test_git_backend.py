@@ -0,0 +1,67 @@
+# プロセス内でステージ・コミットするgitバックエンドのテスト
+import asyncio
+import subprocess
+
+import pytest
+
+from services.git_backend import InProcessGitBackend, NothingToCommitError, SubprocessGitBackend
+
+
+def git(repo, *args):
+    return subprocess.run(["git", "-C", str(repo), *args], check=True, capture_output=True, text=True).stdout
+
+
+@pytest.fixture
+def repo(tmp_path):
+    repo = tmp_path / "proj"
+    repo.mkdir()
+    git(repo, "init", "-q")
+    git(repo, "config", "user.email", "test@example.com")
+    git(repo, "config", "user.name", "test")
+    (repo / "keep.txt").write_text("keep\n")
+    (repo / "old.txt").write_text("old\n")
+    git(repo, "add", ".")
+    git(repo, "commit", "-q", "-m", "init")
+    return repo
+
+
+@pytest.mark.parametrize("backend_class", [InProcessGitBackend, SubprocessGitBackend])
+def test_backends_commit_added_changed_and_deleted_files(repo, backend_class):
+    backend = backend_class()
+    (repo / "src").mkdir()
+    (repo / "src" / "new.py").write_text("print('new')\n")
+    (repo / "keep.txt").write_text("changed\n")
+    (repo / "old.txt").unlink()
+    paths = [str(repo / "src" / "new.py"), str(repo / "keep.txt"), str(repo / "old.txt")]
+
+    async def run():
+        sha = await backend.commit_paths(str(repo), paths, "AI 3件の変更")
+        assert await backend.head(str(repo)) == sha
+        with pytest.raises(NothingToCommitError):
+            await backend.commit_paths(str(repo), paths[:2], "変更なし")
+        return sha
+
+    sha = asyncio.run(run())
+    assert git(repo, "rev-parse", "HEAD").strip() == sha
+    assert git(repo, "log", "-1", "--format=%s").strip() == "AI 3件の変更"
+    assert git(repo, "ls-files").split() == ["keep.txt", "src/new.py"]
+    assert git(repo, "status", "--porcelain") == ""
+    if isinstance(backend, InProcessGitBackend):
+        backend.close()
+
+
+def test_repository_handles_are_kept_open_and_evicted(tmp_path, repo):
+    other = tmp_path / "other"
+    other.mkdir()
+    git(other, "init", "-q")
+    backend = InProcessGitBackend(cache_size=1)
+
+    async def run():
+        for _ in range(3):
+            await backend.head(str(repo))
+        await backend.head(str(other))
+
+    asyncio.run(run())
+    assert backend.get_stats()["opened"] == 2
+    assert backend.get_stats()["open_repositories"] == 1
+    backend.close()
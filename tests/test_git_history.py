@@ -0,0 +1,134 @@
+# コミット履歴のキャッシュ（増えたコミットだけの読み足し・カーソルによるページ送り）と blame・差分のテスト
+import asyncio
+import subprocess
+
+import pytest
+
+import services.git_history as git_history_module
+from services.git_history import GitHistoryService, read_head
+
+
+def git(repo, *args):
+    return subprocess.run(["git", "-C", str(repo), *args], check=True, capture_output=True, text=True).stdout
+
+
+def commit(repo, files, message):
+    for name, content in files.items():
+        path = repo / name
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_text(content)
+    git(repo, "add", "-A")
+    git(repo, "commit", "-q", "-m", message)
+    return git(repo, "rev-parse", "HEAD").strip()
+
+
+@pytest.fixture
+def repo(tmp_path):
+    repo = tmp_path / "repo"
+    repo.mkdir()
+    git(repo, "init", "-q")
+    git(repo, "config", "user.email", "test@example.com")
+    git(repo, "config", "user.name", "test")
+    commit(repo, {"README.md": "readme\n"}, "init")
+    for i in range(5):
+        commit(repo, {"src/app.py": f"value = {i}\n", f"src/file{i}.py": "x = 1\n"}, f"AI 更新 {i}")
+    return repo
+
+
+def test_read_head_matches_git(repo):
+    assert read_head(str(repo)) == git(repo, "rev-parse", "HEAD").strip()
+    git(repo, "pack-refs", "--all")
+    assert read_head(str(repo)) == git(repo, "rev-parse", "HEAD").strip()
+
+
+def test_pages_follow_the_cursor_for_the_project_and_a_file(repo):
+    service = GitHistoryService()
+
+    async def run():
+        first = await service.log(str(repo), limit=4)
+        second = await service.log(str(repo), cursor=first["next_cursor"], limit=4)
+        by_file = await service.log(str(repo), "src/app.py", limit=3)
+        by_file_next = await service.log(str(repo), "src/app.py", cursor=by_file["next_cursor"], limit=3)
+        by_directory = await service.log(str(repo), "src/")
+        return first, second, by_file, by_file_next, by_directory
+
+    first, second, by_file, by_file_next, by_directory = asyncio.run(run())
+    assert first["total"] == 6
+    assert [c["subject"] for c in first["commits"]] == ["AI 更新 4", "AI 更新 3", "AI 更新 2", "AI 更新 1"]
+    assert [c["subject"] for c in second["commits"]] == ["AI 更新 0", "init"]
+    assert second["next_cursor"] is None
+    assert first["commits"][0]["files"] == ["src/app.py", "src/file4.py"]
+    assert [c["subject"] for c in by_file["commits"] + by_file_next["commits"]] == [f"AI 更新 {i}" for i in range(4, -1, -1)]
+    assert by_file_next["next_cursor"] is None
+    assert by_directory["total"] == 5
+
+
+def test_only_new_commits_are_read_and_rewritten_history_is_reloaded(repo, monkeypatch):
+    service = GitHistoryService()
+    calls = []
+    original = git_history_module.git_log
+
+    async def counting_git_log(*args):
+        calls.append(args)
+        return await original(*args)
+
+    monkeypatch.setattr(git_history_module, "git_log", counting_git_log)
+
+    async def run():
+        await service.log(str(repo))
+        await service.log(str(repo), "src/app.py")
+        assert len(calls) == 1
+        cursor = (await service.log(str(repo), limit=1))["next_cursor"]
+        commit(repo, {"src/app.py": "value = 99\n"}, "AI 更新 99")
+        page = await service.log(str(repo), "src/app.py", limit=1)
+        # 新しいコミットが増えても、前に受け取ったカーソルの続きは変わらない
+        following = await service.log(str(repo), cursor=cursor, limit=1)
+        git(repo, "reset", "-q", "--hard", "HEAD~3")
+        after_reset = await service.log(str(repo))
+        return page, following, after_reset
+
+    page, following, after_reset = asyncio.run(run())
+    assert len(calls) == 3
+    assert calls[1][-1].startswith("^")
+    assert page["commits"][0]["subject"] == "AI 更新 99"
+    assert page["total"] == 6
+    assert following["commits"][0]["subject"] == "AI 更新 3"
+    assert after_reset["total"] == 4
+    stats = service.get_stats()["repositories"][str(repo)]
+    assert (stats["full_loads"], stats["incremental_updates"]) == (2, 1)
+
+
+def test_blame_and_diff_are_cached_by_commit(repo):
+    service = GitHistoryService()
+    base = git(repo, "rev-parse", "HEAD~2").strip()
+
+    async def run():
+        blame = await service.blame(str(repo), "src/app.py")
+        again = await service.blame(str(repo), "src/app.py")
+        diff = await service.diff(str(repo), base)
+        only_app = await service.diff(str(repo), base, path="src/app.py")
+        return blame, again, diff, only_app
+
+    blame, again, diff, only_app = asyncio.run(run())
+    assert blame is again
+    assert service.stats["hits"] == 1
+    hunk = blame["hunks"][0]
+    assert hunk["lines"] == ["value = 4"]
+    assert blame["commits"][hunk["sha"]]["subject"] == "AI 更新 4"
+    assert [f["path"] for f in diff["files"]] == ["src/app.py", "src/file3.py", "src/file4.py"]
+    assert "+value = 4" in diff["diff"]
+    assert only_app["files"] == [{"path": "src/app.py", "additions": 1, "deletions": 1}]
+
+
+def test_invalid_revisions_and_cursors_are_rejected(repo):
+    service = GitHistoryService()
+
+    async def run(coroutine):
+        with pytest.raises(ValueError):
+            await coroutine
+
+    asyncio.run(run(service.diff(str(repo), "--output=/tmp/x")))
+    asyncio.run(run(service.diff(str(repo), "no-such-branch")))
+    asyncio.run(run(service.log(str(repo), cursor="0" * 40)))
+    with pytest.raises(FileNotFoundError):
+        asyncio.run(service.blame(str(repo), "missing.py"))
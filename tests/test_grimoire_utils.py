@@ -0,0 +1,82 @@
+# grimoires/meta/utils/utils.py のプロンプトキャッシュ付き生成とトークン使用量の集計のテスト
+import importlib.util
+import os
+from types import SimpleNamespace
+
+import pytest
+
+META_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "grimoires", "meta")
+
+
+@pytest.fixture
+def utils(monkeypatch):
+    # grimoires/meta/utils はトップレベルの utils パッケージと名前が衝突するため、ファイルパスから読み込む
+    spec = importlib.util.spec_from_file_location("grimoire_utils", os.path.join(META_DIR, "utils", "utils.py"))
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+class StubAnthropic:
+    """
+    anthropic.Anthropic の代わりに、送られたリクエストを記録してキャッシュの書き込み・読み込みを模した使用量を返すスタブ
+    """
+
+    requests = []
+
+    def __init__(self, api_key=None, max_retries=None):
+        self.max_retries = max_retries
+        self.messages = self
+
+    def create(self, **request):
+        StubAnthropic.requests.append(request)
+        # キャッシュ対象のブロックは初回に書き込まれ、2回目以降は読み込まれる
+        cached = "cache_control" in request["messages"][0]["content"][0]
+        first = len(StubAnthropic.requests) == 1
+        usage = SimpleNamespace(
+            input_tokens=20,
+            output_tokens=5,
+            cache_creation_input_tokens=1000 if cached and first else 0,
+            cache_read_input_tokens=1000 if cached and not first else 0,
+        )
+        return SimpleNamespace(content=[SimpleNamespace(text="  応答  ")], usage=usage)
+
+
+def test_cached_prefix_is_sent_as_an_ephemeral_block_and_usage_is_tracked(utils, monkeypatch):
+    StubAnthropic.requests = []
+    monkeypatch.setattr(utils.anthropic, "Anthropic", StubAnthropic)
+    tracker = utils.UsageTracker()
+
+    for prompt in ("App.jsを作成", "Header.jsを作成"):
+        assert utils.generate_response("claude", prompt, 100, 0.5, cached_prefix="共通の前提", usage_tracker=tracker) == "応答"
+    utils.generate_response("claude", "単独", 100, 0.5, usage_tracker=tracker)
+
+    first, second, plain = StubAnthropic.requests
+    assert first["messages"][0]["content"] == [
+        {"type": "text", "text": "共通の前提", "cache_control": {"type": "ephemeral"}},
+        {"type": "text", "text": "App.jsを作成"},
+    ]
+    assert second["messages"][0]["content"][0] == first["messages"][0]["content"][0]
+    assert "prompt-caching-2024-07-31" in first["extra_headers"]["anthropic-beta"].split(",")
+    # cached_prefix を指定しなければキャッシュ用のブロックは付けない
+    assert plain["messages"][0]["content"] == [{"type": "text", "text": "単独"}]
+
+    assert tracker.requests == 3
+    assert tracker.totals == {
+        "input_tokens": 60,
+        "output_tokens": 15,
+        "cache_creation_input_tokens": 1000,
+        "cache_read_input_tokens": 1000,
+    }
+    assert len(tracker.latencies) == 3
+
+
+def test_usage_summary(utils):
+    tracker = utils.UsageTracker()
+    assert tracker.summary() == "リクエスト数: 0, キャッシュ書き込み: 0 tokens, キャッシュ読み込み: 0 tokens, 通常入力: 0 tokens, 出力: 0 tokens"
+    tracker.add(SimpleNamespace(input_tokens=10, output_tokens=2, cache_creation_input_tokens=None, cache_read_input_tokens=300), latency=1.0)
+    tracker.add(SimpleNamespace(input_tokens=5, output_tokens=1), latency=3.0)
+    assert tracker.summary() == (
+        "リクエスト数: 2, キャッシュ書き込み: 0 tokens, キャッシュ読み込み: 300 tokens, 通常入力: 15 tokens, 出力: 3 tokens"
+        ", レイテンシ p50: 1.0秒 / p95: 3.0秒"
+    )
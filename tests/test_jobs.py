@@ -0,0 +1,253 @@
+# バックグラウンドジョブ（ジョブストア・ワーカープール・ジョブAPI）のテスト
+import asyncio
+import json
+import threading
+import time
+
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+import services.ai_service as ai_service
+import services.jobs as jobs
+from api import ai_operations
+from services.job_store import JobStore
+from services.jobs import JobManager, JOB_HANDLERS
+
+
+class Notifications:
+    def __init__(self):
+        self.messages = []
+
+    async def __call__(self, message, message_type):
+        self.messages.append((message_type, json.loads(message)))
+
+    def of(self, message_type):
+        return [payload for kind, payload in self.messages if kind == message_type]
+
+
+def test_store_claims_jobs_in_order_and_fails_interrupted_ones(tmp_path):
+    store = JobStore(str(tmp_path / "jobs.sqlite3"))
+    first = store.create("kind", {"n": 1})
+    second = store.create("kind", {"n": 2})
+    assert store.claim_next("worker-a")["owner"] == "worker-a"
+    assert store.request_cancel(second["id"]) == "cancelled"
+    assert store.claim_next() is None
+
+    # 他のプロセスが実行中（生存時刻が新しい）のジョブは失敗扱いにしない
+    reopened = JobStore(str(tmp_path / "jobs.sqlite3"))
+    assert reopened.fail_interrupted(60) == 0
+    assert reopened.get(first["id"])["status"] == "running"
+
+    # 生存時刻の更新が途絶えた場合は、実行していたプロセスが停止したとみなす
+    time.sleep(0.1)
+    assert reopened.fail_interrupted(0.05) == 1
+    assert reopened.get(first["id"])["status"] == "failed"
+    assert reopened.get_stats()["cancelled"] == 1
+
+
+def test_stores_in_separate_processes_never_claim_the_same_job(tmp_path):
+    path = str(tmp_path / "jobs.sqlite3")
+    created = [JobStore(path).create("kind", {"n": i})["id"] for i in range(40)]
+    claimed = []
+
+    def claim_all():
+        # プロセスごとに別の接続を持つのと同じく、スレッドごとにストアを開く
+        store = JobStore(path)
+        while True:
+            job = store.claim_next()
+            if job is None:
+                return
+            claimed.append(job["id"])
+
+    threads = [threading.Thread(target=claim_all) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert sorted(claimed) == sorted(created)
+
+
+def test_jobs_beyond_the_worker_budget_wait_in_the_queue(tmp_path):
+    notifications = Notifications()
+    active = 0
+    peak = 0
+
+    async def handler(params, context):
+        nonlocal active, peak
+        active += 1
+        peak = max(peak, active)
+        await asyncio.sleep(0.02)
+        await context.progress(1, 1)
+        active -= 1
+        return {"value": params["value"] * 2}
+
+    async def run():
+        manager = JobManager(JobStore(str(tmp_path / "jobs.sqlite3")), {"double": handler}, workers=2, notify=notifications)
+        submitted = [manager.submit("double", {"value": i}) for i in range(5)]
+        while any(manager.store.get(job["id"])["status"] != "succeeded" for job in submitted):
+            await asyncio.sleep(0.01)
+        await manager.stop()
+        return [manager.store.get(job["id"]) for job in submitted]
+
+    finished = asyncio.run(run())
+    assert peak == 2
+    assert [job["result"] for job in finished] == [{"value": i * 2} for i in range(5)]
+    assert all(job["progress"] == {"done": 1, "total": 1} for job in finished)
+    assert len(notifications.of("job_progress")) == 5
+    assert [payload["status"] for payload in notifications.of("job_status")].count("succeeded") == 5
+
+
+def test_cancelling_a_running_job(tmp_path):
+    async def handler(params, context):
+        return await context.cancellable(asyncio.sleep(10))
+
+    async def run():
+        manager = JobManager(JobStore(str(tmp_path / "jobs.sqlite3")), {"sleep": handler}, workers=1, notify=Notifications())
+        job = manager.submit("sleep", {})
+        while manager.store.get(job["id"])["status"] != "running":
+            await asyncio.sleep(0.01)
+        assert await manager.cancel(job["id"]) == "running"
+        while manager.store.get(job["id"])["status"] == "running":
+            await asyncio.sleep(0.01)
+        await manager.stop()
+        return manager.store.get(job["id"])
+
+    assert asyncio.run(run())["status"] == "cancelled"
+
+
+def test_cancel_requested_from_another_process_stops_the_job_between_files(tmp_path):
+    path = str(tmp_path / "jobs.sqlite3")
+    processed = []
+
+    async def handler(params, context):
+        for index in range(100):
+            if context.cancel_requested:
+                break
+            await asyncio.sleep(0.01)
+            processed.append(index)
+            await context.progress(index + 1, 100)
+        return {"processed": len(processed)}
+
+    async def run():
+        manager = JobManager(JobStore(path), {"files": handler}, workers=1, notify=Notifications(), heartbeat_interval=60)
+        job = manager.submit("files", {})
+        while manager.store.get(job["id"])["status"] != "running":
+            await asyncio.sleep(0.01)
+        # 別のプロセスのストアから中止を要求する（このマネージャーの cancel は呼ばない）
+        assert JobStore(path).request_cancel(job["id"]) == "running"
+        while manager.store.get(job["id"])["status"] == "running":
+            await asyncio.sleep(0.01)
+        await manager.stop()
+        return manager.store.get(job["id"])
+
+    job = asyncio.run(run())
+    assert job["status"] == "cancelled"
+    assert len(processed) < 100
+
+
+def test_heartbeat_keeps_the_lease_of_running_jobs(tmp_path):
+    store = JobStore(str(tmp_path / "jobs.sqlite3"))
+
+    async def handler(params, context):
+        await asyncio.sleep(0.3)
+        return {}
+
+    async def run():
+        manager = JobManager(store, {"slow": handler}, workers=1, notify=Notifications(), heartbeat_interval=0.02, lease_seconds=0.05)
+        job = manager.submit("slow", {})
+        while store.get(job["id"])["status"] != "succeeded":
+            await asyncio.sleep(0.01)
+        await manager.stop()
+        return store.get(job["id"])
+
+    # 生存時刻が更新され続けるため、リースより長く実行しても失敗扱いにならない
+    assert asyncio.run(run())["status"] == "succeeded"
+
+
+@pytest.fixture
+def client(tmp_path, monkeypatch):
+    monkeypatch.setenv("HOME", str(tmp_path))
+    project_dir = tmp_path / "babel_generated" / "proj"
+    project_dir.mkdir(parents=True)
+    for name in ("a.py", "b.py"):
+        (project_dir / name).write_text("print('hello')\n")
+
+    async def fake_analyze(file_path, version_control, analysis_depth, use_cache=True):
+        await asyncio.sleep(0.01)
+        return f"{file_path.rsplit('/', 1)[-1]}: {analysis_depth}"
+
+    monkeypatch.setattr(ai_service, "ai_analyze", fake_analyze)
+    notifications = Notifications()
+    monkeypatch.setattr(jobs, "job_manager", JobManager(JobStore(str(tmp_path / "jobs.sqlite3")), JOB_HANDLERS, notify=notifications))
+    app = FastAPI()
+    app.include_router(ai_operations.router)
+    with TestClient(app) as test_client:
+        test_client.notifications = notifications
+        yield test_client
+
+
+def test_background_request_returns_job_id_and_results_can_be_fetched(client):
+    response = client.post("/multi-ai-analyze", json={"project_id": "proj", "file_paths": ["a.py", "b.py"], "background": True})
+    assert response.status_code == 202
+    job_id = response.json()["job_id"]
+
+    for _ in range(200):
+        status = client.get(f"/jobs/{job_id}").json()
+        if status["status"] == "succeeded":
+            break
+        time.sleep(0.01)
+    assert status["progress"] == {"done": 2, "total": 2}
+
+    result = client.get(f"/jobs/{job_id}/result").json()
+    assert [record["file_path"] for record in result["result"]] == ["a.py", "b.py"]
+    assert result["summary"]["ok"] == 2
+    assert {payload["file_path"] for payload in client.notifications.of("job_progress")} == {"a.py", "b.py"}
+    assert client.post("/jobs/unknown/cancel").status_code == 404
+
+
+def test_background_is_rejected_by_endpoints_that_do_not_support_it(client):
+    # 同期実行しかないエンドポイントでは、黙って待たせずに検証エラーを返す
+    response = client.post("/ai-analyze", json={"project_id": "proj", "file_path": "a.py", "background": True})
+    assert response.status_code == 422
+    assert client.post("/ai-analyze", json={"project_id": "proj", "file_path": "a.py", "background": False}).status_code != 422
+    assert client.post("/ai-process", json={"project_id": "proj", "file_path": "a.py", "feature_request": "x", "background": True}).status_code == 202
+
+
+def test_per_file_options_are_rejected_by_multi_ai_dependencies(client):
+    # 依存関係の分析はファイルごとに実行しないため、ファイル単位のオプションやストリーミングは受け付けない
+    base = {"project_id": "proj", "file_paths": ["a.py"]}
+    for field, value in [("stream", True), ("max_concurrency", 2), ("file_timeout_seconds", 1.0), ("fail_fast", True), ("batch_id", "b")]:
+        response = client.post("/multi-ai-dependencies", json={**base, field: value})
+        assert response.status_code == 422
+        assert field in response.text
+    assert client.post("/multi-ai-dependencies", json={**base, "stream": False, "background": True}).status_code == 202
+
+
+def test_worker_store_access_runs_off_the_event_loop(tmp_path):
+    store = JobStore(str(tmp_path / "jobs.sqlite3"))
+    threads = {}
+    for name in ("claim_next", "update_progress", "finish"):
+        original = getattr(store, name)
+
+        def recording(*args, name=name, original=original, **kwargs):
+            threads.setdefault(name, set()).add(threading.get_ident())
+            return original(*args, **kwargs)
+
+        setattr(store, name, recording)
+
+    async def handler(params, context):
+        await context.progress(1, 1)
+        return {}
+
+    async def run():
+        manager = JobManager(store, {"noop": handler}, workers=1, notify=Notifications())
+        job = manager.submit("noop", {})
+        while store.get(job["id"])["status"] != "succeeded":
+            await asyncio.sleep(0.01)
+        await manager.stop()
+        return threading.get_ident()
+
+    loop_thread = asyncio.run(run())
+    assert set(threads) == {"claim_next", "update_progress", "finish"}
+    assert all(loop_thread not in idents for idents in threads.values())
@@ -0,0 +1,116 @@
+# LLMレスポンスキャッシュのテスト
+import asyncio
+import threading
+
+from services import llm_cache as llm_cache_module
+from services.llm_cache import LLMCache, make_cache_key
+
+
+def test_cache_key_depends_on_all_parameters():
+    base = make_cache_key("anthropic", "claude", 0.7, 8192, "hello")
+    assert base == make_cache_key("anthropic", "claude", 0.7, 8192, "hello")
+    assert base != make_cache_key("openai", "claude", 0.7, 8192, "hello")
+    assert base != make_cache_key("anthropic", "claude", 0.5, 8192, "hello")
+    assert base != make_cache_key("anthropic", "claude", 0.7, 4000, "hello")
+    assert base != make_cache_key("anthropic", "claude", 0.7, 8192, "hello!")
+
+
+def test_memory_and_disk_hits(tmp_path):
+    cache = LLMCache(str(tmp_path), ttl_seconds=60, memory_entries=1, max_bytes=1024 * 1024)
+    cache.set("a", {"generated_text": "A"})
+    cache.set("b", {"generated_text": "B"})
+
+    # "a" はメモリから追い出されているのでディスクから読まれる
+    assert cache.get("a") == {"generated_text": "A"}
+    assert cache.get("a") == {"generated_text": "A"}
+    assert cache.get("missing") is None
+    stats = cache.get_stats()
+    assert stats["disk_hits"] == 1
+    assert stats["memory_hits"] == 1
+    assert stats["misses"] == 1
+
+
+def test_ttl_expiry(tmp_path):
+    cache = LLMCache(str(tmp_path), ttl_seconds=60, memory_entries=10, max_bytes=1024 * 1024)
+    cache.set("a", {"generated_text": "A"})
+    # 期限切れを再現するためにTTLを過去に設定する
+    cache.ttl_seconds = -1
+    assert cache.get("a") is None
+
+
+def test_size_based_eviction(tmp_path):
+    cache = LLMCache(str(tmp_path), ttl_seconds=60, memory_entries=10, max_bytes=100)
+    cache.set("a", {"generated_text": "x" * 60})
+    cache.set("b", {"generated_text": "y" * 60})
+    assert cache.get("a") is None
+    assert cache.get("b") == {"generated_text": "y" * 60}
+    assert cache.get_stats()["evictions"] == 1
+
+
+def test_cached_generate_and_bypass(tmp_path, monkeypatch):
+    cache = LLMCache(str(tmp_path), ttl_seconds=60, memory_entries=10, max_bytes=1024 * 1024)
+    monkeypatch.setattr(llm_cache_module, "llm_cache", cache)
+    monkeypatch.setattr(llm_cache_module, "LLM_CACHE_ENABLED", True)
+    calls = []
+
+    async def generate():
+        calls.append(1)
+        return {"generated_text": f"result {len(calls)}"}
+
+    async def run():
+        first = await llm_cache_module.cached_generate("anthropic", "m", 0.7, 10, "p", generate)
+        second = await llm_cache_module.cached_generate("anthropic", "m", 0.7, 10, "p", generate)
+        bypassed = await llm_cache_module.cached_generate("anthropic", "m", 0.7, 10, "p", generate, use_cache=False)
+        return first, second, bypassed
+
+    first, second, bypassed = asyncio.run(run())
+    assert first == {"generated_text": "result 1"}
+    assert second == {"generated_text": "result 1", "cached": True}
+    assert bypassed == {"generated_text": "result 2"}
+    assert len(calls) == 2
+    assert cache.get_stats()["bypasses"] == 1
+
+
+def test_running_byte_total_matches_the_disk(tmp_path):
+    cache = LLMCache(str(tmp_path), ttl_seconds=60, memory_entries=10, max_bytes=500)
+
+    def disk_bytes():
+        return cache._conn.execute("SELECT COALESCE(SUM(size), 0) FROM entries").fetchone()[0]
+
+    for i in range(30):
+        cache.set(f"k{i % 12}", {"generated_text": "x" * (10 + i * 3)})
+        assert cache.total_bytes == disk_bytes() <= 500
+    cache.ttl_seconds = -1
+    assert cache.get("k0") is None
+    cache.set("new", {"generated_text": "y"})
+    assert cache.total_bytes == disk_bytes()
+    # 再起動しても合計サイズを引き継ぐ
+    cache.ttl_seconds = 60
+    cache.set("other", {"generated_text": "z" * 40})
+    assert LLMCache(str(tmp_path), ttl_seconds=60, memory_entries=10, max_bytes=500).total_bytes == disk_bytes()
+
+
+def test_async_access_reads_the_disk_off_the_event_loop(tmp_path, monkeypatch):
+    cache = LLMCache(str(tmp_path), ttl_seconds=60, memory_entries=1, max_bytes=1024 * 1024)
+    threads = []
+    original_get = cache.get
+
+    def recording_get(key):
+        threads.append(threading.get_ident())
+        return original_get(key)
+
+    monkeypatch.setattr(cache, "get", recording_get)
+
+    async def run():
+        await cache.set_async("a", {"generated_text": "A"})
+        await cache.set_async("b", {"generated_text": "B"})
+        # "b" はメモリにあるのでスレッドに切り替えず、"a" はディスクからスレッドで読む
+        assert await cache.get_async("b") == {"generated_text": "B"}
+        assert threads == []
+        assert await cache.get_async("a") == {"generated_text": "A"}
+        return threading.get_ident()
+
+    loop_thread = asyncio.run(run())
+    assert len(threads) == 1 and threads[0] != loop_thread
+    stats = cache.get_stats()
+    assert (stats["memory_hits"], stats["disk_hits"]) == (1, 1)
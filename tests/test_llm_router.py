@@ -0,0 +1,88 @@
+# プロバイダールーターのテスト
+import asyncio
+
+from services.llm_router import ProviderRouter
+
+
+def make_provider(delay, calls, fail=False):
+    async def generate(prompt, use_cache=True):
+        calls.append(prompt)
+        await asyncio.sleep(delay)
+        if fail:
+            raise RuntimeError("provider error")
+        return {"generated_text": f"{delay}"}
+    return generate
+
+
+def test_rank_prefers_fastest_healthy_provider():
+    router = ProviderRouter({"a": ("model-a", None), "b": ("model-b", None)}, min_samples=2, hedge_operations=[])
+    assert router.rank("ai_analyze") == ["a", "b"]
+    for _ in range(3):
+        router._stats_for("a", "ai_analyze").record(5.0, True)
+        router._stats_for("b", "ai_analyze").record(1.0, True)
+    assert router.rank("ai_analyze") == ["b", "a"]
+    for _ in range(5):
+        router._stats_for("b", "ai_analyze").record(1.0, False)
+    assert router.rank("ai_analyze") == ["a", "b"]
+
+
+def test_failover_to_next_provider():
+    calls_a, calls_b = [], []
+    router = ProviderRouter({
+        "a": ("model-a", make_provider(0, calls_a, fail=True)),
+        "b": ("model-b", make_provider(0, calls_b)),
+    }, hedge_operations=[])
+    result = asyncio.run(router.generate("p", "ai_analyze"))
+    assert result["provider"] == "b"
+    assert len(calls_a) == 1 and len(calls_b) == 1
+
+
+def test_hedged_request_cancels_slow_primary():
+    calls_a, calls_b = [], []
+    router = ProviderRouter({
+        "a": ("model-a", make_provider(5, calls_a)),
+        "b": ("model-b", make_provider(0.01, calls_b)),
+    }, hedge_operations=["ai_reply"], hedge_default_delay=0.05)
+
+    async def run():
+        result = await router.generate("p", "ai_reply")
+        # キャンセルされたプライマリが後片付けされるのを待つ
+        await asyncio.sleep(0)
+        return result
+
+    result = asyncio.run(run())
+    assert result["provider"] == "b"
+    assert len(calls_a) == 1 and len(calls_b) == 1
+
+
+def test_failover_raises_the_first_provider_error_with_the_others_noted():
+    def fail_with(error):
+        async def generate(prompt, use_cache=True):
+            raise error
+        return generate
+
+    async def run():
+        router = ProviderRouter({
+            "a": ("model-a", fail_with(ValueError("primary error"))),
+            "b": ("model-b", fail_with(RuntimeError("backup error"))),
+        }, hedge_operations=[])
+        try:
+            await router.generate("p", "ai_analyze")
+        except ValueError as e:
+            return e
+
+    error = asyncio.run(run())
+    assert str(error) == "primary error"
+    assert error.__notes__ == ["bでも失敗しました: RuntimeError: backup error"]
+
+
+def test_whole_file_operations_skip_providers_with_smaller_output_limits():
+    router = ProviderRouter(
+        {"a": ("model-a", None), "b": ("model-b", None), "c": ("model-c", None)},
+        hedge_operations=[], output_limits={"a": 8192, "b": 4000, "c": 8192}, whole_file_operations=["ai_process"],
+    )
+    assert router.rank("ai_process") == ["a", "c"]
+    assert router.rank("ai_analyze") == ["a", "b", "c"]
+    # 上限の小さいプロバイダーしか設定されていなければ、それを使う
+    only_small = ProviderRouter({"b": ("model-b", None)}, hedge_operations=[], output_limits={"b": 4000}, whole_file_operations=["ai_process"])
+    assert only_small.rank("ai_process") == ["b"]
@@ -0,0 +1,209 @@
+# ストリーミング生成（/generate_*/stream のSSE・プロバイダーごとのストリーム・キャッシュからの再生）のテスト
+import asyncio
+import json
+import logging
+from types import SimpleNamespace
+
+import httpx
+import openai
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+from api import websocket
+from api.routes import router, stream_as_sse
+from services import anthropic_service, gemini_service, llm_cache as llm_cache_module, openai_service
+from services.llm_cache import LLMCache
+from services.mock_llm_server import MockConfig, MockLLMServer
+from utils.streaming import format_sse
+
+STREAM_ROUTES = {
+    "anthropic": "/api/files/generate_claude/stream",
+    "openai": "/api/files/generate_gpt4o/stream",
+    "gemini": "/api/files/generate_gemini/stream",
+}
+
+
+def parse_sse(body):
+    events = []
+    for message in body.strip().split("\n\n"):
+        lines = dict(line.split(": ", 1) for line in message.split("\n"))
+        events.append((lines.get("event", "message"), json.loads(lines["data"])))
+    return events
+
+
+class FakeAnthropicMessages:
+    """
+    anthropic_client.messages の代わりに、モックLLMサーバーと同じ形の応答を返すスタブ
+    """
+
+    def __init__(self):
+        self.calls = 0
+
+    def _reply(self, messages):
+        return f"```\n{messages[0]['content']}\n```"
+
+    async def create(self, messages, **options):
+        self.calls += 1
+        return SimpleNamespace(content=[SimpleNamespace(text=self._reply(messages))], usage=SimpleNamespace(input_tokens=3, output_tokens=5))
+
+    def stream(self, messages, **options):
+        self.calls += 1
+        reply = self._reply(messages)
+
+        class Stream:
+            async def __aenter__(self):
+                return self
+
+            async def __aexit__(self, *exc_info):
+                return False
+
+            @property
+            async def text_stream(self):
+                for start in range(0, len(reply), 4):
+                    yield reply[start:start + 4]
+
+            async def get_final_message(self):
+                return SimpleNamespace(usage=SimpleNamespace(input_tokens=3, output_tokens=5))
+
+        return Stream()
+
+
+@pytest.fixture
+def server():
+    server = MockLLMServer(MockConfig(latency_median=0.01, latency_sigma=0.1, chunk_interval=0, seed=0)).start()
+    yield server
+    server.stop()
+
+
+@pytest.fixture
+def client(server, tmp_path, monkeypatch):
+    # OpenAI・Geminiの接続先をモックLLMサーバーに、Anthropicはスタブにし、キャッシュは一時ディレクトリに置く
+    messages = FakeAnthropicMessages()
+    monkeypatch.setattr(anthropic_service, "anthropic_client", SimpleNamespace(messages=messages))
+    monkeypatch.setattr(openai_service, "openai_client", openai.AsyncOpenAI(api_key="test", base_url=f"{server.base_url}/v1", max_retries=0))
+    monkeypatch.setattr(gemini_service, "http_client", httpx.AsyncClient())
+    monkeypatch.setattr(gemini_service, "GEMINI_BASE_URL", server.base_url)
+    monkeypatch.setattr(llm_cache_module, "llm_cache", LLMCache(str(tmp_path / "cache"), ttl_seconds=60, memory_entries=10, max_bytes=1024 * 1024))
+    app = FastAPI()
+    app.include_router(router)
+    with TestClient(app) as test_client:
+        test_client.anthropic_messages = messages
+        yield test_client
+
+
+def provider_calls(client, server, provider):
+    # Anthropicはスタブの呼び出し回数、それ以外はモックLLMサーバーの受信件数
+    if provider == "anthropic":
+        return client.anthropic_messages.calls
+    with httpx.Client() as http:
+        return http.get(f"{server.base_url}/mock/stats").json()["by_provider"].get(provider, 0)
+
+
+def test_format_sse():
+    assert format_sse({"text": "こんにちは"}) == 'data: {"text": "こんにちは"}\n\n'
+    assert format_sse({}, event="done") == "event: done\ndata: {}\n\n"
+
+
+@pytest.mark.parametrize("provider", STREAM_ROUTES)
+def test_stream_routes_send_chunks_then_done(client, server, provider):
+    response = client.post(STREAM_ROUTES[provider], params={"prompt": f"hello {provider}"})
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/event-stream")
+    assert response.headers["x-accel-buffering"] == "no"
+    events = parse_sse(response.text)
+    chunks = [data["text"] for event, data in events if event == "message"]
+    assert len(chunks) > 1
+    assert "".join(chunks).startswith("```")
+    assert events[-1] == ("done", {})
+    assert provider_calls(client, server, provider) == 1
+
+
+@pytest.mark.parametrize("provider", STREAM_ROUTES)
+def test_cached_stream_is_replayed_without_calling_the_provider(client, server, provider):
+    route = STREAM_ROUTES[provider]
+    first = parse_sse(client.post(route, params={"prompt": "cached"}).text)
+    text = "".join(data["text"] for event, data in first if event == "message")
+    replayed = parse_sse(client.post(route, params={"prompt": "cached"}).text)
+    # キャッシュにヒットした場合は全文を1チャンクで返し、プロバイダーには送らない
+    assert replayed == [("message", {"text": text}), ("done", {})]
+    assert provider_calls(client, server, provider) == 1
+    assert llm_cache_module.llm_cache.get_stats()["memory_hits"] == 1
+    # use_cache=false ならキャッシュを使わずに生成し直す
+    client.post(route, params={"prompt": "cached", "use_cache": "false"})
+    assert provider_calls(client, server, provider) == 2
+
+
+def test_provider_streams_yield_the_same_text_as_generate(client):
+    async def run():
+        streamed = "".join([chunk async for chunk in anthropic_service.stream_text_anthropic("same", use_cache=False)])
+        generated = await anthropic_service.generate_text_anthropic("same", use_cache=False)
+        gemini_streamed = "".join([chunk async for chunk in gemini_service.stream_text_gemini("same", use_cache=False)])
+        gpt_streamed = "".join([chunk async for chunk in openai_service.stream_text_gpt4o("same", use_cache=False)])
+        return streamed, generated, gemini_streamed, gpt_streamed
+
+    streamed, generated, gemini_streamed, gpt_streamed = asyncio.run(run())
+    assert streamed == generated["generated_text"] == "```\nsame\n```"
+    assert gpt_streamed.startswith("```")
+    assert gemini_streamed.startswith("```")
+
+
+class FakeWebSocket:
+    def __init__(self):
+        self.sent = []
+
+    async def send_json(self, data):
+        self.sent.append(data)
+
+
+def test_forward_ws_sends_chunks_without_info_logs(monkeypatch, caplog):
+    connection = FakeWebSocket()
+    monkeypatch.setattr(websocket, "active_connections", [connection])
+
+    async def chunks():
+        for text in ("a", "b"):
+            yield text
+
+    async def run():
+        return [message async for message in stream_as_sse(chunks(), forward_ws=True)]
+
+    with caplog.at_level(logging.INFO, logger=websocket.logger.name):
+        messages = asyncio.run(run())
+    assert messages == [format_sse({"text": "a"}), format_sse({"text": "b"}), format_sse({}, event="done")]
+    assert connection.sent == [
+        {"type": "llm_stream", "content": "a"},
+        {"type": "llm_stream", "content": "b"},
+        {"type": "llm_stream_end", "content": ""},
+    ]
+    # トークンごとの送信はINFOでは記録しない
+    assert not [record for record in caplog.records if record.name == websocket.logger.name and record.levelno >= logging.INFO]
+
+
+def test_stream_errors_are_sent_as_an_error_event():
+    async def failing():
+        yield "partial"
+        raise RuntimeError("boom")
+
+    async def run():
+        return [message async for message in stream_as_sse(failing(), forward_ws=False)]
+
+    assert asyncio.run(run()) == [format_sse({"text": "partial"}), format_sse({"detail": "boom"}, event="error")]
+
+
+def test_stream_errors_end_the_forwarded_websocket_stream(monkeypatch):
+    connection = FakeWebSocket()
+    monkeypatch.setattr(websocket, "active_connections", [connection])
+
+    async def failing():
+        yield "partial"
+        raise RuntimeError("boom")
+
+    async def run():
+        return [message async for message in stream_as_sse(failing(), forward_ws=True)]
+
+    assert asyncio.run(run())[-1] == format_sse({"detail": "boom"}, event="error")
+    assert connection.sent == [
+        {"type": "llm_stream", "content": "partial"},
+        {"type": "llm_stream_error", "content": "boom"},
+        {"type": "llm_stream_end", "content": ""},
+    ]
@@ -0,0 +1,143 @@
+# プロバイダー通信の記録・再生のテスト
+import asyncio
+import os
+import subprocess
+import sys
+import threading
+import time
+
+from services import llm_transcript
+from services.telemetry import CallTrace, note_usage, track_llm_call
+from services.transcript_store import TranscriptStore
+from tests.test_domain_exe_batch import META_DIR, grimoire  # noqa: F401
+
+
+def use_store(monkeypatch, tmp_path, mode, time_scale=1.0):
+    monkeypatch.setattr(llm_transcript, "transcript_store", TranscriptStore(str(tmp_path / "transcript.sqlite3")))
+    monkeypatch.setattr(llm_transcript, "LLM_TRANSCRIPT_MODE", mode)
+    monkeypatch.setattr(llm_transcript, "LLM_REPLAY_TIME_SCALE", time_scale)
+
+
+def test_generate_is_recorded_and_replayed(monkeypatch, tmp_path):
+    calls = []
+
+    async def generate():
+        calls.append(1)
+        await asyncio.sleep(0.05)
+        note_usage(10, 20, 5)
+        return {"generated_text": f"answer {len(calls)}"}
+
+    async def call():
+        async with track_llm_call("anthropic", "claude") as trace:
+            result = await llm_transcript.transcript_generate("anthropic", "claude", 0.7, 100, "prompt", generate)
+        return result, trace
+
+    use_store(monkeypatch, tmp_path, "record")
+    recorded, _ = asyncio.run(call())
+    store = llm_transcript.transcript_store
+    assert store.get_stats()["exchanges"] == 1
+
+    monkeypatch.setattr(llm_transcript, "LLM_TRANSCRIPT_MODE", "replay")
+    monkeypatch.setattr(llm_transcript, "LLM_REPLAY_TIME_SCALE", 0.0)
+    started_at = time.monotonic()
+    replayed, trace = asyncio.run(call())
+    assert time.monotonic() - started_at < 0.05
+    assert replayed == recorded
+    assert len(calls) == 1
+    assert (trace.input_tokens, trace.output_tokens, trace.cached_tokens) == (10, 20, 5)
+
+
+def test_repeated_requests_are_replayed_in_recorded_order(tmp_path):
+    store = TranscriptStore(str(tmp_path / "transcript.sqlite3"))
+    for i in range(3):
+        store.append("key", "anthropic", "model", None, False, 0.1 * i, {"response": {"generated_text": f"reply {i}"}})
+    store.append("other", "anthropic", "model", None, False, 0.5, {"response": {"generated_text": "other"}})
+    replies = [store.next_for("key")["response"]["generated_text"] for _ in range(4)]
+    # 記録された件数を超えると最初から繰り返す
+    assert replies == ["reply 0", "reply 1", "reply 2", "reply 0"]
+    assert store.next_for("other")["latency"] == 0.5
+    assert store.next_for("missing") is None
+    store.rewind()
+    assert store.next_for("key")["response"]["generated_text"] == "reply 0"
+    assert (store.stats["replayed"], store.stats["misses"]) == (6, 1)
+
+
+def test_store_access_runs_off_the_event_loop(monkeypatch, tmp_path):
+    use_store(monkeypatch, tmp_path, "record", time_scale=0.0)
+    store = llm_transcript.transcript_store
+    threads = []
+    for name in ("append", "next_for"):
+        original = getattr(store, name)
+
+        def recording(*args, original=original):
+            threads.append(threading.get_ident())
+            return original(*args)
+
+        monkeypatch.setattr(store, name, recording)
+
+    async def generate():
+        return {"generated_text": "answer"}
+
+    async def stream():
+        yield "chunk"
+
+    async def run():
+        await llm_transcript.transcript_generate("anthropic", "claude", 0.7, 100, "prompt", generate)
+        [chunk async for chunk in llm_transcript.transcript_stream("openai", "gpt-4o", 1, 100, "prompt", stream, CallTrace("openai", "gpt-4o", stream=True))]
+        monkeypatch.setattr(llm_transcript, "LLM_TRANSCRIPT_MODE", "replay")
+        await llm_transcript.transcript_generate("anthropic", "claude", 0.7, 100, "prompt", generate)
+        [chunk async for chunk in llm_transcript.transcript_stream("openai", "gpt-4o", 1, 100, "prompt", stream, CallTrace("openai", "gpt-4o", stream=True))]
+        return threading.get_ident()
+
+    loop_thread = asyncio.run(run())
+    assert len(threads) == 4 and loop_thread not in threads
+
+
+def test_stream_replay_keeps_scaled_timing(monkeypatch, tmp_path):
+    async def stream():
+        for chunk in ["a", "b"]:
+            await asyncio.sleep(0.1)
+            yield chunk
+
+    async def consume():
+        trace = CallTrace("openai", "gpt-4o", stream=True)
+        started_at = time.monotonic()
+        chunks = [chunk async for chunk in llm_transcript.transcript_stream("openai", "gpt-4o", 1, 100, "prompt", stream, trace)]
+        return chunks, time.monotonic() - started_at
+
+    use_store(monkeypatch, tmp_path, "record")
+    recorded, recorded_elapsed = asyncio.run(consume())
+
+    monkeypatch.setattr(llm_transcript, "LLM_TRANSCRIPT_MODE", "replay")
+    monkeypatch.setattr(llm_transcript, "LLM_REPLAY_TIME_SCALE", 0.5)
+    replayed, replayed_elapsed = asyncio.run(consume())
+    assert replayed == recorded == ["a", "b"]
+    assert 0.08 < replayed_elapsed < recorded_elapsed * 0.75
+
+
+def test_domain_exe_replays_without_api(grimoire):  # noqa: F811
+    tmp_path, output_dir = grimoire
+    transcript_path = str(tmp_path / "domain.sqlite3")
+    env = {**os.environ, "PYTHONPATH": str(tmp_path), "ANTHROPIC_API_KEY": "test",
+           "ANTHROPIC_BASE_URL": "http://127.0.0.1:9"}
+
+    # 記録済みのトランスクリプトを用意する（共通部分 + ファイルごとのプロンプトをキーにする）
+    record = subprocess.run([sys.executable, "-c", "\n".join([
+        "from types import SimpleNamespace",
+        "from utils.transcript import TranscriptSession",
+        "session = TranscriptSession(%r, 'record')" % transcript_path,
+        "prefix = 'コンセプト\\nディレクトリ構成\\n制約\\n'",
+        "usage = SimpleNamespace(input_tokens=1, output_tokens=2, cache_read_input_tokens=3)",
+        "for name in ['App.js', 'Header.js', 'Footer.js']:",
+        "    session.record('claude-3-5-sonnet-20240620', 8192, 0.5, prefix + '上記の内容をもとにして' + name + 'を作成',",
+        "                   '```\\n// ' + name + '\\n```', usage, 0.01)",
+    ])], cwd=META_DIR, env=env, capture_output=True, text=True, timeout=60)
+    assert record.returncode == 0, record.stderr
+
+    result = subprocess.run(
+        [sys.executable, "domain_exe.py", "-s", "stubsaas", "--replay", transcript_path, "--replay-time-scale", "0"],
+        cwd=META_DIR, env=env, capture_output=True, text=True, timeout=60,
+    )
+    assert result.returncode == 0, result.stderr
+    assert (output_dir / "frontend" / "components" / "Header.js").read_text(encoding="utf-8") == "// Header.js"
+    assert "キャッシュ読み込み: 9 tokens" in result.stdout
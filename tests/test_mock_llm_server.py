@@ -0,0 +1,70 @@
+# モックLLMサーバーのテスト
+import asyncio
+import json
+
+import anthropic
+import httpx
+import openai
+import pytest
+
+from services.mock_llm_server import MockConfig, MockLLMServer
+
+
+@pytest.fixture
+def server():
+    server = MockLLMServer(MockConfig(latency_median=0.01, latency_sigma=0.1, chunk_interval=0, seed=0)).start()
+    yield server
+    server.stop()
+
+
+def test_latency_is_reproducible_with_seed():
+    first = MockConfig(latency_median=1.0, latency_sigma=0.5, seed=42)
+    second = MockConfig(latency_median=1.0, latency_sigma=0.5, seed=42)
+    samples = [first.sample_latency() for _ in range(100)]
+    assert samples == [second.sample_latency() for _ in range(100)]
+    assert 0.7 < sorted(samples)[50] < 1.4
+
+
+def test_anthropic_and_openai_sdks(server):
+    async def run():
+        claude = anthropic.AsyncAnthropic(api_key="test", base_url=server.base_url, max_retries=0)
+        message = await claude.messages.create(model="claude", max_tokens=10, messages=[{"role": "user", "content": "hi"}])
+        async with claude.messages.stream(model="claude", max_tokens=10, messages=[{"role": "user", "content": "hi"}]) as stream:
+            streamed = "".join([text async for text in stream.text_stream])
+
+        gpt = openai.AsyncOpenAI(api_key="test", base_url=f"{server.base_url}/v1", max_retries=0)
+        completion = await gpt.chat.completions.create(model="gpt-4o", messages=[{"role": "user", "content": "hi"}])
+        return message, streamed, completion
+
+    message, streamed, completion = asyncio.run(run())
+    assert message.content[0].text.startswith("```")
+    assert streamed == message.content[0].text
+    # 同じプロンプトにはプロバイダーによらず同じ応答を返す
+    assert completion.choices[0].message.content == message.content[0].text
+    assert completion.usage.completion_tokens > 0
+
+
+def test_gemini_stream(server):
+    body = {"contents": [{"role": "user", "parts": [{"text": "hi"}]}]}
+    with httpx.Client() as client:
+        data = client.post(f"{server.base_url}/v1beta/models/gemini-1.5-pro:generateContent", json=body).json()
+        with client.stream("POST", f"{server.base_url}/v1beta/models/gemini-1.5-pro:streamGenerateContent",
+                           params={"alt": "sse"}, json=body) as response:
+            chunks = [json.loads(line[len("data:"):]) for line in response.iter_lines() if line.startswith("data:")]
+    text = data["candidates"][0]["content"]["parts"][0]["text"]
+    assert "".join(chunk["candidates"][0]["content"]["parts"][0]["text"] for chunk in chunks) == text
+    assert chunks[-1]["candidates"][0]["finishReason"] == "STOP"
+
+
+def test_injected_rate_limit(server):
+    server.config.update({"error_429_rate": 1.0, "retry_after": 2})
+
+    async def run():
+        gpt = openai.AsyncOpenAI(api_key="test", base_url=f"{server.base_url}/v1", max_retries=0)
+        await gpt.chat.completions.create(model="gpt-4o", messages=[{"role": "user", "content": "hi"}])
+
+    with pytest.raises(openai.RateLimitError) as error:
+        asyncio.run(run())
+    assert error.value.response.headers["retry-after"] == "2"
+    with httpx.Client() as client:
+        assert client.get(f"{server.base_url}/mock/stats").json()["errors"] == 1
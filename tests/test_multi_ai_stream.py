@@ -0,0 +1,56 @@
+# 複数ファイル処理のNDJSONストリーミング応答のテスト
+import asyncio
+import json
+
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+import services.ai_service as ai_service
+from api import ai_operations
+
+
+@pytest.fixture
+def client(tmp_path, monkeypatch):
+    monkeypatch.setenv("HOME", str(tmp_path))
+    project_dir = tmp_path / "babel_generated" / "proj"
+    project_dir.mkdir(parents=True)
+    for name in ("slow.py", "fast.py", "bad.py"):
+        (project_dir / name).write_text("print('hello')\n")
+
+    async def fake_analyze(file_path, version_control, analysis_depth, use_cache=True):
+        name = file_path.rsplit("/", 1)[-1]
+        if name == "bad.py":
+            raise RuntimeError("analysis failed")
+        await asyncio.sleep(0.1 if name == "slow.py" else 0)
+        return f"{name}: {analysis_depth}"
+
+    monkeypatch.setattr(ai_service, "ai_analyze", fake_analyze)
+    app = FastAPI()
+    app.include_router(ai_operations.router)
+    return TestClient(app)
+
+
+def test_stream_emits_one_record_per_file_in_completion_order(client):
+    response = client.post("/multi-ai-analyze", json={
+        "project_id": "proj", "file_paths": ["slow.py", "fast.py", "bad.py"], "stream": True,
+    })
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("application/x-ndjson")
+    records = [json.loads(line) for line in response.text.splitlines()]
+
+    files = records[:-1]
+    assert [record["type"] for record in files] == ["file"] * 3
+    assert files[-1]["file_path"] == "slow.py"
+    assert {record["file_path"]: record["status"] for record in files} == {"slow.py": "ok", "fast.py": "ok", "bad.py": "error"}
+    assert records[-1]["type"] == "summary"
+    assert records[-1]["total"] == 3 and records[-1]["ok"] == 2 and records[-1]["error"] == 1
+
+
+def test_buffered_response_keeps_input_order_and_partial_results(client):
+    response = client.post("/multi-ai-analyze", json={"project_id": "proj", "file_paths": ["slow.py", "fast.py", "bad.py"]})
+    assert response.status_code == 200
+    body = response.json()
+    assert [record["file_path"] for record in body["result"]] == ["slow.py", "fast.py", "bad.py"]
+    assert body["result"][0]["result"] == "slow.py: standard"
+    assert body["summary"] == {"total": 3, "ok": 2, "error": 1, "timeout": 0, "cancelled": 0}
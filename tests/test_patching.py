@@ -0,0 +1,189 @@
+# 変更箇所だけを受け取る編集（SEARCH/REPLACE・unified diff の解析と、あいまい一致による適用）のテスト
+import asyncio
+
+import pytest
+
+import services.ai_service as ai_service
+from utils.patching import PatchError, apply_edits, parse_edits, verify_content
+
+SOURCE = """def greet(name):
+    message = "Hello, " + name
+    print(message)
+
+
+def farewell(name):
+    print("Bye, " + name)
+"""
+
+
+def test_search_replace_blocks_are_applied_exactly():
+    text = """説明
+```python
+<<<<<<< SEARCH
+    message = "Hello, " + name
+=======
+    message = f"Hello, {name}!"
+>>>>>>> REPLACE
+```
+<<<<<<< SEARCH
+=======
+# end
+>>>>>>> REPLACE
+"""
+    edit_format, edits = parse_edits(text)
+    updated, report = apply_edits(SOURCE, edits)
+    assert edit_format == "search_replace"
+    assert '    message = f"Hello, {name}!"\n' in updated
+    assert updated.endswith("# end\n")
+    assert [(edit["method"], edit["line"]) for edit in report] == [("exact", 2), ("append", 8)]
+
+
+def test_whitespace_and_fuzzy_matches_keep_the_file_indentation():
+    # インデントが崩れ、1文字違う SEARCH
+    text = """<<<<<<< SEARCH
+def farewell(name):
+  print("Bye, " + name)
+=======
+def farewell(name):
+  print("Goodbye, " + name)
+>>>>>>> REPLACE
+<<<<<<< SEARCH
+message = "Helo, " + name
+=======
+message = "Hi, " + name
+>>>>>>> REPLACE
+"""
+    updated, report = apply_edits(SOURCE, parse_edits(text)[1])
+    assert '    print("Goodbye, " + name)\n' in updated
+    assert '    message = "Hi, " + name\n' in updated
+    assert [edit["method"] for edit in report] == ["whitespace", "fuzzy"]
+    assert report[1]["similarity"] < 1
+
+
+def test_unified_diff_with_shifted_lines_and_stale_context():
+    diff = """--- a/greet.py
++++ b/greet.py
+@@ -1,3 +1,4 @@
++import sys
+ def greet(name):
+     message = "Hello, " + name
+     print(message)
+@@ -6,2 +7,2 @@
+ def farewell(name):
+-    print("Bye, " + name)
++    sys.stdout.write("Bye, " + name)
+ # コメント（実際のファイルにはない文脈行）
+"""
+    edit_format, edits = parse_edits(diff)
+    updated, report = apply_edits(SOURCE, edits)
+    assert edit_format == "unified_diff"
+    assert updated.startswith("import sys\ndef greet(name):")
+    assert '    sys.stdout.write("Bye, " + name)\n' in updated
+    assert report[1]["status"] == "applied"
+    assert report[1]["method"].endswith("fuzz1")
+
+
+def test_zero_context_insertions_go_to_the_hunk_position():
+    source = "a\nb\nc\nd\n"
+    # diff -U0 の出力（先頭・途中への挿入と、先の挿入で行がずれた後の置き換え）
+    diff = "@@ -0,0 +1 @@\n+top\n@@ -1,0 +3 @@\n+X\n@@ -3 +5 @@\n-c\n+C\n"
+    updated, report = apply_edits(source, parse_edits(diff)[1])
+    assert updated == "top\na\nX\nb\nC\nd\n"
+    assert [entry["method"] for entry in report] == ["insert", "insert", "exact"]
+    # 空の SEARCH/REPLACE ブロックは従来どおり末尾に追記する
+    updated, report = apply_edits(source, parse_edits("<<<<<<< SEARCH\n=======\nX\n>>>>>>> REPLACE\n")[1])
+    assert updated == "a\nb\nc\nd\nX\n"
+    assert report[0]["method"] == "append"
+
+
+def test_ambiguous_or_missing_changes_are_reported():
+    source = "x = 1\nx = 1\n"
+    updated, report = apply_edits(source, parse_edits("<<<<<<< SEARCH\nx = 1\n=======\nx = 2\n>>>>>>> REPLACE\n")[1])
+    assert updated == source
+    assert report[0]["status"] == "failed"
+    assert "2か所" in report[0]["error"]
+
+    _, report = apply_edits(source, parse_edits("<<<<<<< SEARCH\nunrelated()\n=======\n\n>>>>>>> REPLACE\n")[1])
+    assert report[0]["error"] == "変更箇所が見つかりませんでした"
+
+    with pytest.raises(PatchError):
+        parse_edits("ファイル全体を書き直しました")
+
+
+def test_verify_content():
+    assert verify_content("a.py", "def f():\n    return 1\n") is None
+    assert "構文エラー" in verify_content("a.py", "def f(:\n")
+    assert verify_content("a.json", "{") is not None
+    assert verify_content("a.js", "function (") is None
+
+
+def test_ai_process_in_diff_mode_edits_the_file_without_running_code(tmp_path, monkeypatch):
+    path = tmp_path / "greet.py"
+    path.write_text(SOURCE)
+    responses = iter([
+        "<<<<<<< SEARCH\n    print(message)\n=======\n    print(message.upper())\n>>>>>>> REPLACE\n",
+        "<<<<<<< SEARCH\n    print(message.upper())\n=======\n    print(message.upper()\n>>>>>>> REPLACE\n",
+    ])
+
+    async def fake_generate_text(prompt, operation="direct", use_cache=True):
+        return {"generated_text": next(responses)}
+
+    async def fail_run_python(code, **options):
+        raise AssertionError("diff方式ではコードを実行しない")
+
+    monkeypatch.setattr(ai_service, "generate_text", fake_generate_text)
+    monkeypatch.setattr(ai_service, "run_python", fail_run_python)
+
+    result = asyncio.run(ai_service.ai_process(str(path), False, "smart", "大文字で表示する", edit_mode="diff"))["result"]
+    assert result["applied"]
+    assert "+    print(message.upper())" in result["diff"]
+    assert "print(message.upper())" in path.read_text()
+
+    # 構文エラーになる変更は書き込まない
+    before = path.read_text()
+    result = asyncio.run(ai_service.ai_process(str(path), False, "smart", "大文字で表示する", edit_mode="diff"))["result"]
+    assert not result["applied"]
+    assert "構文エラー" in result["execution_error"]
+    assert path.read_text() == before
+
+
+def test_concurrent_diff_edits_do_not_overwrite_each_other(tmp_path, monkeypatch):
+    path = tmp_path / "greet.py"
+    path.write_text(SOURCE)
+    path.chmod(0o755)
+    responses = iter([
+        "<<<<<<< SEARCH\n    print(message)\n=======\n    print(message.upper())\n>>>>>>> REPLACE\n",
+        "<<<<<<< SEARCH\n    print(message)\n=======\n    print(message.lower())\n>>>>>>> REPLACE\n",
+    ])
+
+    async def fake_generate_text(prompt, operation="direct", use_cache=True):
+        await asyncio.sleep(0.01)
+        return {"generated_text": next(responses)}
+
+    monkeypatch.setattr(ai_service, "generate_text", fake_generate_text)
+
+    async def run():
+        return await asyncio.gather(*[
+            ai_service.ai_process(str(path), False, "smart", "表示を変える", edit_mode="diff") for _ in range(2)
+        ])
+
+    first, second = [response["result"] for response in asyncio.run(run())]
+    # 後から適用する編集は、生成中に先の編集でファイルが変わったことを検知して書き込まない
+    assert first["applied"] and not second["applied"]
+    assert "更新" in second["execution_error"]
+    assert "print(message.upper())" in path.read_text()
+    assert [entry.name for entry in tmp_path.iterdir()] == ["greet.py"]
+    assert path.stat().st_mode & 0o777 == 0o755
+
+
+def test_ai_process_in_diff_mode_keeps_crlf_line_endings(tmp_path, monkeypatch):
+    path = tmp_path / "greet.py"
+    path.write_bytes(SOURCE.replace("\n", "\r\n").encode("utf-8"))
+
+    async def fake_generate_text(prompt, operation="direct", use_cache=True):
+        return {"generated_text": "<<<<<<< SEARCH\n    print(message)\n=======\n    print(message.upper())\n>>>>>>> REPLACE\n"}
+
+    monkeypatch.setattr(ai_service, "generate_text", fake_generate_text)
+    result = asyncio.run(ai_service.ai_process(str(path), False, "smart", "大文字で表示する", edit_mode="diff"))["result"]
+    assert result["applied"]
+    assert path.read_bytes() == SOURCE.replace("print(message)", "print(message.upper())").replace("\n", "\r\n").encode("utf-8")
@@ -0,0 +1,95 @@
+# レート制限スケジューラーのテスト
+import asyncio
+
+from services.rate_limiter import (
+    ProviderLimiter, RateLimitScheduler, TokenBucket, PRIORITY_BATCH, PRIORITY_INTERACTIVE
+)
+
+
+class ThrottleError(Exception):
+    status_code = 429
+
+
+def test_token_bucket_wait_time():
+    bucket = TokenBucket(60)
+    assert bucket.time_until(1, 1.0) == 0.0
+    bucket.consume(60)
+    # 1秒あたり1トークン補充されるので、2トークンには2秒、半分の速度なら4秒かかる
+    assert abs(bucket.time_until(2, 1.0) - 2.0) < 1e-6
+    assert abs(bucket.time_until(2, 0.5) - 4.0) < 1e-6
+
+
+def test_higher_priority_is_granted_first():
+    async def run():
+        limiter = ProviderLimiter(rpm=600, tpm=100000)
+        limiter.requests.tokens = 0
+        order = []
+
+        async def request(name, priority):
+            await limiter.acquire(10, priority)
+            order.append(name)
+
+        batch = asyncio.create_task(request("batch", PRIORITY_BATCH))
+        await asyncio.sleep(0)
+        interactive = asyncio.create_task(request("interactive", PRIORITY_INTERACTIVE))
+        await asyncio.gather(batch, interactive)
+        return order
+
+    assert asyncio.run(run()) == ["interactive", "batch"]
+
+
+def test_throttle_requeues_and_backs_off():
+    scheduler = RateLimitScheduler({"test": {"rpm": 6000, "tpm": 1000000}})
+    attempts = []
+
+    async def call():
+        attempts.append(1)
+        if len(attempts) == 1:
+            raise ThrottleError()
+        return "ok"
+
+    async def run():
+        result = await scheduler.run("test", "key", 10, call)
+        return result, scheduler.get_stats()[0]
+
+    result, stats = asyncio.run(run())
+    assert result == "ok"
+    assert len(attempts) == 2
+    assert stats["throttled"] == 1
+    # 乗算的に半分へ下げた後、成功1回分だけ加算的に回復している
+    assert abs(stats["rate_factor"] - 0.55) < 1e-6
+
+
+def test_stream_reports_throttles_and_success():
+    scheduler = RateLimitScheduler({"test": {"rpm": 6000, "tpm": 1000000}})
+    attempts = []
+
+    async def open_stream():
+        attempts.append(1)
+        if len(attempts) == 1:
+            raise ThrottleError()
+        yield "a"
+        yield "b"
+
+    async def failing_midway():
+        yield "a"
+        raise ThrottleError()
+
+    async def run():
+        chunks = [chunk async for chunk in scheduler.stream("test", "key", 10, open_stream)]
+        stats = scheduler.get_stats()[0]
+        # チャンクを返した後のスロットリングは減速だけして、再送せずに送出する
+        try:
+            async for _ in scheduler.stream("test", "key", 10, failing_midway):
+                pass
+        except ThrottleError:
+            pass
+        return chunks, stats, scheduler.get_stats()[0]
+
+    chunks, stats, after_midway = asyncio.run(run())
+    assert chunks == ["a", "b"]
+    assert len(attempts) == 2
+    assert stats["throttled"] == 1
+    assert abs(stats["rate_factor"] - 0.55) < 1e-6
+    assert after_midway["throttled"] == 2
+    assert after_midway["granted"] == 3
@@ -0,0 +1,132 @@
+# リトライ・サーキットブレーカー・締め切りのテスト
+import asyncio
+
+import pytest
+
+from services import resilience
+from services.resilience import (
+    CircuitBreaker, CircuitOpenError, DeadlineExceededError,
+    classify_error, llm_deadline, resilient_call, resilient_stream
+)
+
+
+class ServerError(Exception):
+    status_code = 500
+
+
+class BadRequestError(Exception):
+    status_code = 400
+
+
+class ThrottleError(Exception):
+    status_code = 429
+
+
+@pytest.fixture(autouse=True)
+def fresh_breakers(monkeypatch):
+    monkeypatch.setattr(resilience, "breakers", {})
+    monkeypatch.setattr(resilience, "backoff_delay", lambda attempt, error: 0.0)
+
+
+def test_classify_error():
+    assert classify_error(ServerError()) == "transient"
+    assert classify_error(ThrottleError()) == "throttle"
+    assert classify_error(BadRequestError()) == "fatal"
+    assert classify_error(ConnectionError()) == "transient"
+
+
+def test_transient_errors_are_retried():
+    attempts = []
+
+    async def call():
+        attempts.append(1)
+        if len(attempts) < 3:
+            raise ServerError()
+        return "ok"
+
+    assert asyncio.run(resilient_call("test", call, max_attempts=4)) == "ok"
+    assert len(attempts) == 3
+
+
+def test_fatal_errors_are_not_retried():
+    attempts = []
+
+    async def call():
+        attempts.append(1)
+        raise BadRequestError()
+
+    with pytest.raises(BadRequestError):
+        asyncio.run(resilient_call("test", call, max_attempts=4))
+    assert len(attempts) == 1
+
+
+def test_breaker_opens_and_half_opens():
+    breaker = CircuitBreaker(failure_threshold=2, reset_timeout=0.05)
+    breaker.on_failure()
+    breaker.on_failure()
+    with pytest.raises(CircuitOpenError):
+        breaker.before_call()
+
+    asyncio.run(asyncio.sleep(0.06))
+    breaker.before_call()
+    assert breaker.state == "half_open"
+    # 試験呼び出しの結果待ちの間は他の呼び出しを通さない
+    with pytest.raises(CircuitOpenError):
+        breaker.before_call()
+    breaker.on_success()
+    assert breaker.state == "closed"
+
+
+def test_deadline_is_enforced():
+    async def call():
+        await asyncio.sleep(1)
+
+    async def run():
+        with llm_deadline(0.05):
+            await resilient_call("test", call)
+
+    with pytest.raises(asyncio.TimeoutError):
+        asyncio.run(run())
+
+    async def expired():
+        with llm_deadline(-1):
+            await resilient_call("test", call)
+
+    with pytest.raises(DeadlineExceededError):
+        asyncio.run(expired())
+
+
+def test_deadline_timeouts_do_not_count_as_provider_failures():
+    resilience.breakers["test"] = CircuitBreaker(failure_threshold=1)
+
+    async def slow_call():
+        await asyncio.sleep(1)
+
+    async def slow_stream():
+        yield "a"
+        # 上流が締め切りを待って打ち切った場合と同じく TimeoutError を送出する
+        await asyncio.sleep(0.1)
+        raise asyncio.TimeoutError()
+
+    async def run_call():
+        with llm_deadline(0.05):
+            await resilient_call("test", slow_call)
+
+    async def run_stream():
+        with llm_deadline(0.05):
+            return [chunk async for chunk in resilient_stream("test", slow_stream)]
+
+    with pytest.raises(DeadlineExceededError):
+        asyncio.run(run_call())
+    with pytest.raises(DeadlineExceededError):
+        asyncio.run(run_stream())
+    assert resilience.breakers["test"].to_dict() == {"state": "closed", "consecutive_failures": 0}
+
+    # 締め切りより前のタイムアウトは従来どおりプロバイダーの障害として扱う
+    async def timing_out():
+        raise asyncio.TimeoutError()
+
+    with pytest.raises(asyncio.TimeoutError) as error:
+        asyncio.run(resilient_call("test", timing_out, max_attempts=1))
+    assert not isinstance(error.value, DeadlineExceededError)
+    assert resilience.breakers["test"].state == "open"
@@ -0,0 +1,118 @@
+# 実行中の同一リクエストへの相乗り（シングルフライト）のテスト
+import asyncio
+
+import pytest
+
+import services.llm_cache as llm_cache_module
+from services.llm_cache import cached_generate
+from services.singleflight import SingleFlight
+
+
+def test_only_identical_prompts_share_a_call(monkeypatch):
+    monkeypatch.setattr(llm_cache_module, "LLM_CACHE_ENABLED", False)
+    monkeypatch.setattr(llm_cache_module, "LLM_SINGLEFLIGHT_ENABLED", True)
+    monkeypatch.setattr(llm_cache_module, "llm_singleflight", SingleFlight())
+    calls = []
+
+    def generate(prompt):
+        async def call():
+            calls.append(prompt)
+            await asyncio.sleep(0.02)
+            return {"generated_text": f"reply to {prompt!r}"}
+        return call
+
+    async def run():
+        return await asyncio.gather(*[
+            cached_generate("anthropic", "model", 0.0, 100, prompt, generate(prompt))
+            for prompt in ["hello\n", "hello\n", "  hello  \r\n"]
+        ])
+
+    results = asyncio.run(run())
+    # 空白だけが違うプロンプトも別のリクエストとして送り、それぞれの応答を返す
+    assert calls == ["hello\n", "  hello  \r\n"]
+    assert results[1] == {"generated_text": "reply to 'hello\\n'", "coalesced": True}
+    assert results[2] == {"generated_text": "reply to '  hello  \\r\\n'"}
+
+
+def test_concurrent_calls_share_one_upstream_call():
+    flight = SingleFlight()
+    calls = []
+
+    async def call():
+        calls.append(1)
+        await asyncio.sleep(0.02)
+        return {"generated_text": "result"}
+
+    async def run():
+        return await asyncio.gather(*[flight.do("key", call) for _ in range(5)])
+
+    results = asyncio.run(run())
+    assert len(calls) == 1
+    assert results[0] == {"generated_text": "result"}
+    assert all(result == {"generated_text": "result", "coalesced": True} for result in results[1:])
+    assert flight.get_stats()["coalesced"] == 4
+    assert flight.get_stats()["in_flight"] == 0
+
+
+def test_errors_are_shared():
+    flight = SingleFlight()
+
+    async def call():
+        await asyncio.sleep(0.01)
+        raise RuntimeError("upstream failure")
+
+    async def run():
+        return await asyncio.gather(flight.do("key", call), flight.do("key", call), return_exceptions=True)
+
+    results = asyncio.run(run())
+    assert all(isinstance(result, RuntimeError) for result in results)
+
+
+def test_upstream_is_cancelled_only_when_all_waiters_cancel():
+    flight = SingleFlight()
+    cancelled = []
+
+    async def call():
+        try:
+            await asyncio.sleep(1)
+        except asyncio.CancelledError:
+            cancelled.append(1)
+            raise
+        return {"generated_text": "result"}
+
+    async def run():
+        first = asyncio.create_task(flight.do("key", call))
+        second = asyncio.create_task(flight.do("key", call))
+        await asyncio.sleep(0.01)
+        first.cancel()
+        await asyncio.sleep(0.01)
+        assert not cancelled
+        second.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await second
+        await asyncio.sleep(0.01)
+
+    asyncio.run(run())
+    assert cancelled == [1]
+
+
+def test_late_stream_subscriber_receives_all_chunks():
+    flight = SingleFlight()
+    calls = []
+
+    async def stream():
+        calls.append(1)
+        for chunk in ["a", "b", "c"]:
+            await asyncio.sleep(0.01)
+            yield chunk
+
+    async def consume(delay):
+        await asyncio.sleep(delay)
+        return [chunk async for chunk in flight.stream("key", stream)]
+
+    async def run():
+        return await asyncio.gather(consume(0), consume(0.015))
+
+    first, late = asyncio.run(run())
+    assert first == late == ["a", "b", "c"]
+    assert len(calls) == 1
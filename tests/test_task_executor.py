@@ -0,0 +1,82 @@
+# 複数ファイル処理の実行器（同時実行数・タイムアウト・部分結果・中止）のテスト
+import asyncio
+
+from services.task_executor import iter_file_tasks, run_file_tasks, summarize_results, register_batch, cancel_batch
+
+
+def test_concurrency_is_bounded_and_results_keep_input_order():
+    active = 0
+    peak = 0
+
+    async def worker(file_path):
+        nonlocal active, peak
+        active += 1
+        peak = max(peak, active)
+        await asyncio.sleep(0.01)
+        active -= 1
+        return file_path.upper()
+
+    records = asyncio.run(run_file_tasks([f"f{i}" for i in range(10)], worker, max_concurrency=3))
+    assert peak == 3
+    assert [record["result"] for record in records] == [f"F{i}" for i in range(10)]
+    assert all(record["status"] == "ok" for record in records)
+
+
+def test_failures_and_timeouts_do_not_lose_other_files():
+    async def worker(file_path):
+        if file_path == "bad":
+            raise RuntimeError("broken")
+        if file_path == "slow":
+            await asyncio.sleep(1)
+        return "done"
+
+    records = asyncio.run(run_file_tasks(["a", "bad", "slow", "b"], worker, max_concurrency=4, timeout=0.05))
+    assert [record["status"] for record in records] == ["ok", "error", "timeout", "ok"]
+    assert records[1]["error"] == "broken"
+    assert summarize_results(records) == {"total": 4, "ok": 2, "error": 1, "timeout": 1, "cancelled": 0}
+
+
+def test_results_are_yielded_in_completion_order():
+    async def worker(file_path):
+        await asyncio.sleep({"slow": 0.05, "fast": 0.0}[file_path])
+        return file_path
+
+    async def run():
+        return [record["file_path"] async for record in iter_file_tasks(["slow", "fast"], worker, max_concurrency=2)]
+
+    assert asyncio.run(run()) == ["fast", "slow"]
+
+
+def test_cancel_batch_cancels_running_and_pending_files():
+    async def worker(file_path):
+        if file_path == "first":
+            return "done"
+        await asyncio.sleep(1)
+        return "late"
+
+    async def run():
+        with register_batch("batch-1") as cancel_event:
+            async def cancel_soon():
+                await asyncio.sleep(0.02)
+                assert cancel_batch("batch-1")
+
+            asyncio.ensure_future(cancel_soon())
+            return await run_file_tasks(["first", "second", "third", "fourth"], worker, max_concurrency=2, cancel_event=cancel_event)
+
+    records = asyncio.run(run())
+    assert [record["status"] for record in records] == ["ok", "cancelled", "cancelled", "cancelled"]
+    assert not cancel_batch("batch-1")
+
+
+def test_fail_fast_stops_remaining_files():
+    started = []
+
+    async def worker(file_path):
+        started.append(file_path)
+        if file_path == "bad":
+            raise ValueError("invalid")
+        return "done"
+
+    records = asyncio.run(run_file_tasks(["bad", "a", "b"], worker, max_concurrency=1, fail_fast=True))
+    assert started == ["bad"]
+    assert [record["status"] for record in records] == ["error", "cancelled", "cancelled"]
@@ -0,0 +1,55 @@
+# LLM呼び出しテレメトリのテスト
+import asyncio
+
+from services import telemetry
+from services.telemetry import (
+    LLMTelemetry, llm_operation, llm_project, note_retry, note_usage, track_llm_call, track_llm_stream
+)
+
+
+def test_call_is_recorded_with_context(monkeypatch):
+    recorder = LLMTelemetry(window_size=10)
+    monkeypatch.setattr(telemetry, "llm_telemetry", recorder)
+
+    async def run():
+        with llm_operation("ai_analyze"), llm_project("demo"):
+            async with track_llm_call("anthropic", "claude") as trace:
+                note_retry()
+                note_usage(100, 20, 50)
+                trace.mark_result({"generated_text": "ok"})
+            async with track_llm_call("anthropic", "claude") as trace:
+                trace.mark_result({"generated_text": "ok", "cached": True})
+
+    asyncio.run(run())
+    summary = recorder.summary()
+    group = summary["groups"][0]
+    assert (group["operation"], group["project_id"]) == ("ai_analyze", "demo")
+    assert group["statuses"] == {"ok": 1, "cached": 1}
+    assert (group["input_tokens"], group["output_tokens"], group["cached_tokens"], group["retries"]) == (100, 20, 50, 1)
+    assert group["latency"]["p50"] is not None
+    assert summary["totals"]["requests"] == 2
+
+
+def test_stream_records_ttft_and_prometheus_output(monkeypatch):
+    recorder = LLMTelemetry(window_size=10)
+    monkeypatch.setattr(telemetry, "llm_telemetry", recorder)
+
+    async def upstream(trace):
+        trace.status = "ok"
+        await asyncio.sleep(0.01)
+        yield "a"
+        yield "b"
+        trace.add_usage(5, 2)
+
+    async def run():
+        return [chunk async for chunk in track_llm_stream("openai", "gpt-4o", upstream)]
+
+    assert asyncio.run(run()) == ["a", "b"]
+    group = recorder.summary()["groups"][0]
+    assert group["operation"] == "direct"
+    assert group["ttft"]["p50"] >= 0.01
+
+    metrics = recorder.prometheus()
+    assert 'llm_requests_total{provider="openai",model="gpt-4o",operation="direct",project_id="",status="ok"} 1' in metrics
+    assert 'llm_tokens_total{provider="openai",model="gpt-4o",operation="direct",project_id="",type="output"} 2' in metrics
+    assert "# TYPE llm_ttft_seconds summary" in metrics
@@ -0,0 +1,144 @@
+# ディレクトリツリー（除外ルール・深さ/件数/バイト数の上限・キャッシュ）と遅延型のディレクトリ構造のテスト
+import builtins
+import os
+
+import pytest
+
+from services.tree_service import IgnoreRules, StructureService, TreeService
+
+
+def write(root, relative, content=""):
+    path = os.path.join(root, relative)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "w") as file:
+        file.write(content)
+    return path
+
+
+def make_project(root):
+    write(root, "frontend/App.js")
+    write(root, "frontend/components/Header.js")
+    write(root, "frontend/node_modules/react/index.js")
+    write(root, "build/output.js")
+    write(root, "debug.log")
+    write(root, "keep.log")
+    write(root, ".gitignore", "build/\n*.log\n!keep.log\n")
+
+
+def test_ignore_rules_follow_gitignore_semantics():
+    rules = IgnoreRules(["build/", "*.log", "!keep.log", "docs/private"])
+    assert rules.ignores("build", True)
+    assert not rules.ignores("build", False)
+    assert rules.ignores("src/debug.log", False)
+    assert not rules.ignores("keep.log", False)
+    assert rules.ignores("docs/private", True)
+    assert not rules.ignores("other/docs/private", True)
+
+
+def test_text_and_structure_come_from_one_scan(tmp_path):
+    root = str(tmp_path)
+    make_project(root)
+    tree = TreeService().get_tree(root)
+
+    assert tree.text() == "\n".join([
+        "├── .gitignore",
+        "├── frontend/",
+        "│   ├── App.js",
+        "│   └── components/",
+        "│       └── Header.js",
+        "└── keep.log",
+    ])
+    frontend = tree.structure()[1]
+    assert frontend["path"] == "frontend"
+    assert [child["name"] for child in frontend["children"]] == ["App.js", "components"]
+    assert frontend["children"][1]["children"][0]["path"] == os.path.join("frontend", "components", "Header.js")
+
+
+def test_limits_truncate_the_tree(tmp_path):
+    root = str(tmp_path)
+    make_project(root)
+    service = TreeService()
+
+    shallow = service.get_tree(root, max_depth=1)
+    assert "Header.js" not in shallow.text()
+    assert shallow.structure()[1] == {"name": "frontend", "type": "folder", "path": "frontend", "children": [], "truncated": True}
+
+    limited = service.get_tree(root, max_entries=2)
+    assert len(limited.nodes) == 2
+    assert "エントリ数が上限の2件" in limited.text()
+
+    text = service.get_tree(root).text(max_bytes=45)
+    assert len(text.splitlines()) == 3
+    assert "45バイト" in text
+
+
+def test_cache_is_invalidated_when_the_tree_changes(tmp_path):
+    root = str(tmp_path)
+    make_project(root)
+    service = TreeService()
+
+    first = service.get_tree(root)
+    assert service.get_tree(root) is first
+    assert service.stats == {"hits": 1, "misses": 1}
+
+    write(root, "frontend/components/Footer.js")
+    second = service.get_tree(root)
+    assert second is not first
+    assert "Footer.js" in second.text()
+
+    os.remove(os.path.join(root, "frontend/App.js"))
+    assert "App.js" not in service.get_tree(root).text()
+
+    # .gitignore の変更でも作り直す
+    write(root, ".gitignore", "")
+    assert "debug.log" in service.get_tree(root).text()
+    assert service.stats["misses"] == 4
+
+
+def test_lazy_structure_expands_one_folder_at_a_time(tmp_path, monkeypatch):
+    make_project(str(tmp_path))
+    for i in range(5):
+        write(str(tmp_path), f"frontend/pages/page{i}.js")
+    service = StructureService()
+
+    def no_reads(*args, **kwargs):
+        raise AssertionError("ファイルの内容を読まない")
+
+    top = service.get_structure(str(tmp_path))
+    # .gitignore の読み込みが終わってからは、ファイルを開かない
+    monkeypatch.setattr(builtins, "open", no_reads)
+    assert [(item["name"], item["type"]) for item in top["children"]] == [(".gitignore", "file"), ("frontend", "folder"), ("keep.log", "file")]
+    assert "children" not in top["children"][1]
+
+    nested = service.get_structure(str(tmp_path), path="frontend", depth=2, limit=2)
+    assert [item["name"] for item in nested["children"]] == ["App.js", "components"]
+    assert nested["next_cursor"] == "components"
+    assert nested["children"][1]["children"][0]["path"] == "frontend/components/Header.js"
+
+    rest = service.get_structure(str(tmp_path), path="frontend", cursor=nested["next_cursor"], limit=2)
+    assert [item["name"] for item in rest["children"]] == ["pages"]
+    assert rest["next_cursor"] is None
+
+    pages = service.get_structure(str(tmp_path), path="frontend/pages", limit=3)
+    more = service.get_structure(str(tmp_path), path="frontend/pages", cursor=pages["next_cursor"], limit=3)
+    assert [item["name"] for item in pages["children"] + more["children"]] == [f"page{i}.js" for i in range(5)]
+
+
+def test_lazy_structure_listing_cache_and_path_checks(tmp_path):
+    make_project(str(tmp_path))
+    service = StructureService()
+    service.get_structure(str(tmp_path), path="frontend")
+    service.get_structure(str(tmp_path), path="frontend")
+    assert service.stats == {"hits": 1, "misses": 1}
+
+    write(str(tmp_path), "frontend/New.js")
+    names = [item["name"] for item in service.get_structure(str(tmp_path), path="frontend")["children"]]
+    assert "New.js" in names
+    assert service.stats["misses"] == 2
+
+    only = service.get_structure(str(tmp_path), only=["frontend"])
+    assert [item["name"] for item in only["children"]] == ["frontend"]
+    with pytest.raises(ValueError):
+        service.get_structure(str(tmp_path), path="../")
+    with pytest.raises(FileNotFoundError):
+        service.get_structure(str(tmp_path), path="missing")
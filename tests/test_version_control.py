@@ -0,0 +1,85 @@
+# バージョン管理のコミットキュー（リポジトリごとの直列化・時間枠とバッチによるコミットのまとめ）のテスト
+import asyncio
+import subprocess
+
+import pytest
+
+import services.ai_service as ai_service
+import utils.version_control as version_control_module
+from services.git_backend import InProcessGitBackend, SubprocessGitBackend
+from utils.version_control import find_repository, version_control
+
+
+def git(repo, *args):
+    return subprocess.run(["git", "-C", str(repo), *args], check=True, capture_output=True, text=True).stdout
+
+
+@pytest.fixture
+def repo(tmp_path, monkeypatch):
+    repo = tmp_path / "repo"
+    (repo / "src").mkdir(parents=True)
+    git(repo, "init", "-q")
+    git(repo, "config", "user.email", "test@example.com")
+    git(repo, "config", "user.name", "test")
+    (repo / "README.md").write_text("readme\n")
+    git(repo, "add", "README.md")
+    git(repo, "commit", "-q", "-m", "init")
+    monkeypatch.setattr(version_control_module, "VERSION_CONTROL_COMMIT_WINDOW", 0.05)
+    return repo
+
+
+def commits(repo):
+    return int(git(repo, "rev-list", "--count", "HEAD"))
+
+
+def write_files(repo, count):
+    paths = []
+    for i in range(count):
+        path = repo / "src" / f"file{i}.py"
+        path.write_text(f"value = {i}\n")
+        paths.append(str(path))
+    return paths
+
+
+@pytest.mark.parametrize("backend", [SubprocessGitBackend(add_batch_size=2), InProcessGitBackend()], ids=["subprocess", "gitpython"])
+def test_concurrent_calls_within_the_window_become_one_commit(repo, monkeypatch, backend):
+    monkeypatch.setattr(version_control_module, "get_git_backend", lambda: backend)
+    paths = write_files(repo, 5)
+
+    async def run():
+        await asyncio.gather(*[version_control(path, "更新") for path in paths])
+
+    asyncio.run(run())
+    assert find_repository(paths[0]) == str(repo)
+    assert commits(repo) == 2
+    message = git(repo, "log", "-1", "--format=%B")
+    assert message.startswith("AI 5件の変更")
+    assert "- AI 更新 on src/file4.py" in message
+    assert git(repo, "status", "--porcelain") == ""
+
+
+def test_unchanged_files_do_not_fail(repo):
+    asyncio.run(version_control(str(repo / "README.md"), "分析"))
+    assert commits(repo) == 1
+
+
+@pytest.mark.parametrize("stream", [False, True])
+def test_multi_file_operation_is_committed_once(repo, stream):
+    paths = write_files(repo, 4)
+
+    async def worker(file_path):
+        await asyncio.sleep(0.01)
+        await ai_service.record_version(file_path, "書き直し")
+        return file_path
+
+    async def run():
+        results = await ai_service._run_multi(paths, "parallel", worker, 4, None, None, False, stream=stream)
+        if stream:
+            results = [record async for record in results]
+        # 時間枠を待たずに、処理の終了時点でコミットされている
+        return results, commits(repo)
+
+    results, count = asyncio.run(run())
+    assert len(results) == 4
+    assert count == 2
+    assert git(repo, "log", "-1", "--format=%s") == "AI 4件の変更\n"
@@ -0,0 +1,194 @@
+# ディレクトリ構造の索引（ファイル変更イベントによる差分更新・version・ETag による304）のテスト
+import asyncio
+import os
+import shutil
+
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+import services.file_service as file_service
+from api import routes
+from api.routes import router
+from services import file_watch, workspace_index
+from services.workspace_index import WorkspaceIndex
+
+
+def write(root, relative, content=""):
+    path = os.path.join(root, relative)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "w") as file:
+        file.write(content)
+    return path
+
+
+def test_events_update_only_the_changed_entries(tmp_path):
+    root = str(tmp_path)
+    write(root, "frontend/App.js")
+    write(root, "frontend/node_modules/react/index.js")
+    write(root, ".gitignore", "*.log\n")
+    index = WorkspaceIndex(root)
+    index.rebuild()
+    version = index.version
+    assert [item["path"] for item in index.structure()] == [".gitignore", "frontend"]
+
+    # 追加・2回目の同じイベント・除外されるファイル
+    added = write(root, "frontend/components/Header.js")
+    index.apply_event("created", os.path.dirname(added))
+    index.apply_event("created", added)
+    index.apply_event("created", write(root, "debug.log"))
+    index.apply_event("created", write(root, "frontend/node_modules/react/other.js"))
+    index.apply_event("modified", added)
+    assert index.version == version + 1
+    structure = index.structure(path="frontend")
+    assert [item["path"] for item in structure] == ["App.js", "components"]
+    assert structure[1]["children"][0]["path"] == "components/Header.js"
+
+    # ディレクトリの移動と削除は配下もまとめて反映する
+    os.rename(os.path.join(root, "frontend/components"), os.path.join(root, "frontend/parts"))
+    index.apply_event("moved", os.path.join(root, "frontend/components"), os.path.join(root, "frontend/parts"))
+    assert [item["path"] for item in index.structure(path="frontend/parts")] == ["Header.js"]
+    shutil.rmtree(os.path.join(root, "frontend/parts"))
+    index.apply_event("deleted", os.path.join(root, "frontend/parts"))
+    assert index.get_stats()["directories"] == 2
+    assert index.version == version + 3
+
+    # .gitignore が変わると除外ルールを読み直す
+    write(root, ".gitignore", "*.log\nfrontend/\n")
+    index.apply_event("modified", os.path.join(root, ".gitignore"))
+    assert [item["path"] for item in index.structure()] == [".gitignore"]
+
+
+def test_structure_is_served_from_the_render_cache_until_the_version_changes(tmp_path):
+    root = str(tmp_path)
+    write(root, "a/b/c.txt")
+    index = WorkspaceIndex(root)
+    index.rebuild()
+    first = index.structure()
+    assert index.structure() is first
+    assert index.stats["render_hits"] == 1
+    etag = index.etag
+    index.apply_event("created", write(root, "a/d.txt"))
+    assert index.etag != etag
+    assert index.structure() is not first
+    # 深さの上限は tree_service と同じく truncated で示す
+    assert index.structure(max_depth=1)[0]["truncated"]
+
+
+def test_shallow_index_ignores_deeper_events(tmp_path):
+    root = str(tmp_path)
+    write(root, "project/frontend/App.js")
+    index = WorkspaceIndex(root, max_depth=1)
+    index.rebuild()
+    version = index.version
+    index.apply_event("created", write(root, "project/frontend/New.js"))
+    assert index.version == version
+    os.makedirs(os.path.join(root, "other"))
+    index.apply_event("created", os.path.join(root, "other"))
+    assert [item["name"] for item in index.structure(max_depth=1)] == ["other", "project"]
+
+
+def test_dispatch_event_reaches_registered_indexes(tmp_path, monkeypatch):
+    root = str(tmp_path)
+    monkeypatch.setattr(workspace_index, "_indexes", {})
+    monkeypatch.setattr(file_watch, "_subscribers", {})
+    index = workspace_index.get_workspace_index(root, watch=False)
+    file_watch.dispatch_event("created", write(root, "new.txt"))
+    file_watch.dispatch_event("created", write(str(tmp_path.parent), "outside.txt"))
+    assert [item["name"] for item in index.structure()] == ["new.txt"]
+
+
+def test_routes_return_304_for_a_matching_etag(tmp_path, monkeypatch):
+    monkeypatch.setenv("HOME", str(tmp_path))
+    monkeypatch.setattr(workspace_index, "_indexes", {})
+    monkeypatch.setattr(file_watch, "_subscribers", {})
+    monkeypatch.setattr(file_service, "get_workspace_index", lambda root, **options: workspace_index.get_workspace_index(root, watch=False, **options))
+    project = os.path.join(str(tmp_path), "babel_generated", "demo")
+    write(project, "frontend/App.js")
+    app = FastAPI()
+    app.include_router(router)
+    client = TestClient(app)
+
+    response = client.get("/api/files/directory_structure", params={"path_type": "demo"})
+    assert response.status_code == 200
+    etag = response.headers["etag"]
+    assert [item["name"] for item in response.json()["structure"]] == ["frontend"]
+    assert client.get("/api/files/directory_structure", params={"path_type": "demo"}, headers={"If-None-Match": etag}).status_code == 304
+
+    dirs = client.get("/api/files/generated-dirs")
+    assert dirs.json() == [{"name": "demo", "path": "../generated/demo/frontend/App"}]
+    assert client.get("/api/files/generated-dirs", headers={"If-None-Match": dirs.headers["etag"]}).status_code == 304
+
+    # 監視の代わりにイベントを渡すと、ETagが変わり本文を返す
+    file_watch.dispatch_event("created", write(project, "README.md"))
+    changed = client.get("/api/files/directory_structure", params={"path_type": "demo"}, headers={"If-None-Match": etag})
+    assert changed.status_code == 200
+    assert changed.headers["etag"] != etag
+    assert changed.json()["version"] > response.json()["version"]
+
+
+def test_babel_mode_indexes_only_the_listed_items(tmp_path, monkeypatch):
+    repo = str(tmp_path / "repo")
+    write(repo, "src/App.js")
+    write(repo, "README.md")
+    write(repo, "backend/huge/file.py")
+    monkeypatch.setattr(workspace_index, "_indexes", {})
+    monkeypatch.setattr(file_watch, "_subscribers", {})
+    monkeypatch.setattr(file_service, "get_workspace_index", lambda root, **options: workspace_index.get_workspace_index(root, watch=False, **options))
+    monkeypatch.setattr(file_service, "structure_root", lambda path_type: (repo, file_service.BABEL_STRUCTURE_ITEMS))
+
+    index = file_service.structure_index("babel")
+    assert [root for root, _ in workspace_index._indexes] == [os.path.join(repo, "src")]
+    assert [(item["name"], item["path"]) for item in index.structure()] == [("App.js", "App.js"), ("README.md", f"{repo}/README.md")]
+
+    # 項目が増えるとETagが変わる
+    etag = index.etag
+    write(repo, "Dockerfile")
+    assert file_service.structure_index("babel").etag != etag
+
+
+def test_route_resolves_the_index_once(tmp_path, monkeypatch):
+    monkeypatch.setenv("HOME", str(tmp_path))
+    monkeypatch.setattr(workspace_index, "_indexes", {})
+    monkeypatch.setattr(file_watch, "_subscribers", {})
+    monkeypatch.setattr(file_service, "get_workspace_index", lambda root, **options: workspace_index.get_workspace_index(root, watch=False, **options))
+    write(os.path.join(str(tmp_path), "babel_generated", "demo"), "App.js")
+    app = FastAPI()
+    app.include_router(router)
+    client = TestClient(app)
+
+    client.get("/api/files/directory_structure", params={"path_type": "demo"})
+    index = next(iter(workspace_index._indexes.values()))
+    rebuilds = index.stats["rebuilds"]
+    # 監視が無効な場合は解決のたびに走査し直すため、1回のリクエストで1回だけ走査する
+    client.get("/api/files/directory_structure", params={"path_type": "demo"})
+    assert index.stats["rebuilds"] == rebuilds + 1
+
+
+def test_routes_resolve_the_index_off_the_event_loop(tmp_path, monkeypatch):
+    monkeypatch.setenv("HOME", str(tmp_path))
+    monkeypatch.setattr(workspace_index, "_indexes", {})
+    monkeypatch.setattr(file_watch, "_subscribers", {})
+    monkeypatch.setattr(file_service, "get_workspace_index", lambda root, **options: workspace_index.get_workspace_index(root, watch=False, **options))
+    write(os.path.join(str(tmp_path), "babel_generated", "demo"), "App.js")
+    threads = []
+
+    def recording(resolve):
+        def resolve_in_thread(*args):
+            try:
+                asyncio.get_running_loop()
+                threads.append("event loop")
+            except RuntimeError:
+                threads.append("worker")
+            return resolve(*args)
+        return resolve_in_thread
+
+    monkeypatch.setattr(routes, "structure_index", recording(file_service.structure_index))
+    monkeypatch.setattr(routes, "generated_dirs_index", recording(file_service.generated_dirs_index))
+    app = FastAPI()
+    app.include_router(router)
+    client = TestClient(app)
+
+    assert client.get("/api/files/directory_structure", params={"path_type": "demo"}).status_code == 200
+    assert client.get("/api/files/generated-dirs").status_code == 200
+    # 走査はイベントループのスレッドではなく、ワーカースレッドで行う
+    assert threads == ["worker", "worker"]
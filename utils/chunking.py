@@ -0,0 +1,153 @@
+import ast
+import os
+from typing import List, Tuple
+
+from utils.tokens import estimate_tokens
+
+
+def _python_boundaries(lines: List[str]) -> List[int]:
+    """
+    Pythonのソースをトップレベルの文（関数・クラス定義など）の開始行で区切る
+    """
+    tree = ast.parse("".join(lines))
+    boundaries = []
+    for node in tree.body:
+        start = node.lineno
+        # デコレーターは定義と同じチャンクに含める
+        for decorator in getattr(node, "decorator_list", []):
+            start = min(start, decorator.lineno)
+        boundaries.append(start - 1)
+    return boundaries
+
+
+def _generic_boundaries(lines: List[str]) -> List[int]:
+    """
+    JS/TS/CSSなどのソースを、空行または閉じ括弧の直後にあるインデントなしの行で区切る
+    """
+    boundaries = []
+    previous = ""
+    for index, line in enumerate(lines):
+        stripped = previous.strip()
+        starts_top_level = line.strip() and not line[0].isspace() and not line.lstrip().startswith(("}", ")", "]"))
+        if starts_top_level and (not stripped or stripped in ("}", "};", "});", ")", ");", "]", "];")):
+            boundaries.append(index)
+        previous = line
+    return boundaries
+
+
+class _ChunkBuilder:
+    """
+    文字種ごとの文字数を積み上げ、連結後のテキストに対する estimate_tokens と同じ見積もりで上限を判定する
+    """
+
+    def __init__(self, max_tokens: int):
+        self.max_tokens = max_tokens
+        self.chunks: List[str] = []
+        self._reset()
+
+    def _reset(self):
+        self.parts: List[str] = []
+        self.ascii_chars = 0
+        self.other_chars = 0
+
+    @staticmethod
+    def count(text: str) -> Tuple[int, int]:
+        ascii_chars = sum(1 for char in text if ord(char) < 128)
+        return ascii_chars, len(text) - ascii_chars
+
+    def fits(self, counts: Tuple[int, int]) -> bool:
+        ascii_chars, other_chars = counts
+        return (self.ascii_chars + ascii_chars) // 4 + self.other_chars + other_chars <= self.max_tokens
+
+    def add(self, text: str, counts: Tuple[int, int]):
+        if self.parts and not self.fits(counts):
+            self.flush()
+        self.parts.append(text)
+        self.ascii_chars += counts[0]
+        self.other_chars += counts[1]
+
+    def flush(self):
+        if self.parts:
+            self.chunks.append("".join(self.parts))
+        self._reset()
+
+
+def _split_lines(builder: _ChunkBuilder, lines: List[str]):
+    """
+    1つのまとまりが上限を超える場合の最終手段として、行単位（1行が上限を超える場合は文字単位）で詰めて分割する
+    """
+    builder.flush()
+    for line in lines:
+        counts = builder.count(line)
+        if estimate_tokens(line) <= builder.max_tokens:
+            builder.add(line, counts)
+            continue
+        # 圧縮済みのJSなど1行が極端に長い場合は、必ず上限に収まる文字数（1文字は最大1トークン）で切る
+        for start in range(0, len(line), builder.max_tokens):
+            piece = line[start:start + builder.max_tokens]
+            builder.add(piece, builder.count(piece))
+    builder.flush()
+
+
+def split_into_chunks(content: str, max_tokens: int, file_path: str = "") -> List[str]:
+    """
+    テキストを構文上の区切りで max_tokens 以下のチャンクに分割する関数
+
+    Pythonファイルはトップレベルの文ごと、その他のファイルはトップレベルの宣言ごとに区切り、
+    隣り合うまとまりを上限に収まる範囲でまとめます。1つのまとまりが上限を超える場合のみ行単位で分割します。
+
+    Args:
+        content (str): 分割するテキスト
+        max_tokens (int): 1チャンクあたりの最大トークン数（概算）
+        file_path (str): 区切り方の判定に使うファイルパス
+
+    Returns:
+        List[str]: 分割されたチャンクのリスト（連結すると元のテキストに戻る）
+    """
+    if estimate_tokens(content) <= max_tokens:
+        return [content]
+
+    lines = content.splitlines(keepends=True)
+    boundaries = None
+    if os.path.splitext(file_path)[1] == ".py":
+        try:
+            boundaries = _python_boundaries(lines)
+        except SyntaxError:
+            boundaries = None
+    if boundaries is None:
+        boundaries = _generic_boundaries(lines)
+
+    starts = sorted(set([0] + [b for b in boundaries if 0 < b < len(lines)]))
+    segments = [lines[start:end] for start, end in zip(starts, starts[1:] + [len(lines)])]
+
+    builder = _ChunkBuilder(max_tokens)
+    for segment in segments:
+        text = "".join(segment)
+        if estimate_tokens(text) > max_tokens:
+            _split_lines(builder, segment)
+            continue
+        builder.add(text, builder.count(text))
+    builder.flush()
+    return builder.chunks
+
+
+def pack_files(files: List[Tuple[str, str]], max_tokens: int) -> List[List[Tuple[str, str]]]:
+    """
+    (ファイルパス, 内容) のリストを、合計が max_tokens 以下になるグループにまとめる関数
+
+    上限を超えるファイルは split_into_chunks で分割し、各部分を "パス (部分i/n)" として扱います。
+    """
+    groups, current, current_tokens = [], [], 0
+    for file_path, content in files:
+        parts = split_into_chunks(content, max_tokens, file_path)
+        for index, part in enumerate(parts):
+            name = file_path if len(parts) == 1 else f"{file_path} (部分{index + 1}/{len(parts)})"
+            tokens = estimate_tokens(part)
+            if current and current_tokens + tokens > max_tokens:
+                groups.append(current)
+                current, current_tokens = [], 0
+            current.append((name, part))
+            current_tokens += tokens
+    if current:
+        groups.append(current)
+    return groups
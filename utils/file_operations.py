@@ -40,6 +40,7 @@ async def execute_python(code: str):
 # # ファイル操作ユーティリティ
 # ファイル操作ユーティリティ
 import os
+from services.tree_service import get_tree
 
 def get_file_size(file_path: str) -> int:
     return os.path.getsize(file_path)
@@ -69,31 +70,19 @@ def read_file(file_path: str) -> str:
         # ファイルもディレクトリも存在しない場合
         raise FileNotFoundError(f"指定されたパスが見つかりません: {file_path}")
 
-def generate_tree(directory: str, prefix: str = '') -> str:
+def generate_tree(directory: str) -> str:
     """
     ディレクトリのツリー構造を生成する関数
 
+    node_modules などの除外・深さと件数の上限・キャッシュは tree_service が扱います。
+
     Args:
         directory (str): ツリー構造を生成するディレクトリのパス
-        prefix (str): 各行の接頭辞（再帰呼び出し用）
 
     Returns:
         str: ディレクトリのツリー構造
     """
-    tree = []
-    contents = os.listdir(directory)
-    contents.sort()
-    for i, item in enumerate(contents):
-        path = os.path.join(directory, item)
-        if i == len(contents) - 1:
-            tree.append(f"{prefix}└── {item}")
-            if os.path.isdir(path):
-                tree.append(generate_tree(path, prefix + "    "))
-        else:
-            tree.append(f"{prefix}├── {item}")
-            if os.path.isdir(path):
-                tree.append(generate_tree(path, prefix + "│   "))
-    return "\n".join(tree)
+    return get_tree(directory).text()
 
 def write_file(file_path: str, content: str):
     with open(file_path, 'w') as file:
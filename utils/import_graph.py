@@ -0,0 +1,171 @@
+import ast
+import os
+import posixpath
+import re
+import sys
+from typing import Callable, List, Optional, Tuple
+
+PYTHON_EXTENSIONS = (".py",)
+JS_EXTENSIONS = (".js", ".jsx", ".ts", ".tsx", ".mjs", ".cjs")
+SUPPORTED_EXTENSIONS = PYTHON_EXTENSIONS + JS_EXTENSIONS
+
+# (指定子, 種類) の組。Pythonの相対importは指定子の先頭に "." を付ける
+# 種類: import / from / name（from X import Y の Y がモジュールである可能性）/ static / dynamic / require / export
+ImportRef = Tuple[str, str]
+
+_STDLIB_MODULES = set(getattr(sys, "stdlib_module_names", ()))
+
+_JS_STRING_OR_COMMENT = re.compile(
+    r"(\"(?:\\.|[^\"\\\n])*\"|'(?:\\.|[^'\\\n])*'|`(?:\\.|[^`\\])*`)|(//[^\n]*|/\*[\s\S]*?\*/)"
+)
+_JS_PATTERNS = (
+    ("static", re.compile(r"(?:^|[;\n}])\s*import\s+(?:type\s+)?(?:[\w*${}\s,]+?\s+from\s+)?['\"]([^'\"\n]+)['\"]")),
+    ("export", re.compile(r"(?:^|[;\n}])\s*export\s+(?:type\s+)?(?:\*(?:\s+as\s+[\w$]+)?|\{[^}]*\})\s+from\s+['\"]([^'\"\n]+)['\"]")),
+    # React.lazy(() => import('./X')) などの動的import
+    ("dynamic", re.compile(r"\bimport\s*\(\s*['\"`]([^'\"`\n]+)['\"`]\s*\)")),
+    ("require", re.compile(r"\brequire\s*\(\s*['\"]([^'\"\n]+)['\"]\s*\)")),
+)
+
+
+def is_supported(path: str) -> bool:
+    return path.endswith(SUPPORTED_EXTENSIONS)
+
+
+def parse_python_imports(source: str) -> List[ImportRef]:
+    """
+    PythonのソースからimportをASTで抽出する関数（関数内のimportも含む）
+    """
+    refs: List[ImportRef] = []
+    for node in ast.walk(ast.parse(source)):
+        if isinstance(node, ast.Import):
+            refs.extend((alias.name, "import") for alias in node.names)
+        elif isinstance(node, ast.ImportFrom):
+            module = "." * node.level + (node.module or "")
+            refs.append((module, "from"))
+            for alias in node.names:
+                if alias.name != "*":
+                    separator = "." if node.module else ""
+                    refs.append((f"{module}{separator}{alias.name}", "name"))
+    return refs
+
+
+def _strip_js_comments(source: str) -> str:
+    return _JS_STRING_OR_COMMENT.sub(lambda m: m.group(1) or ("\n" * m.group(2).count("\n")), source)
+
+
+def _mask_js_strings(source: str) -> Tuple[str, List[str]]:
+    """
+    コメントを除き、文字列リテラルの中身を番号に置き換える（文字列中の "import(" などを誤検出しないため）
+    """
+    strings: List[str] = []
+
+    def replace(match: "re.Match[str]") -> str:
+        if match.group(1) is None:
+            return "\n" * match.group(2).count("\n")
+        literal = match.group(1)
+        strings.append(literal[1:-1])
+        return f"{literal[0]}{len(strings) - 1}{literal[-1]}"
+
+    return _JS_STRING_OR_COMMENT.sub(replace, source), strings
+
+
+def parse_js_imports(source: str) -> List[ImportRef]:
+    """
+    JS/TSのソースから import / export from / 動的import / require の指定子を抽出する関数
+    """
+    code, strings = _mask_js_strings(source)
+    refs: List[ImportRef] = []
+    for kind, pattern in _JS_PATTERNS:
+        refs.extend((strings[int(match.group(1))], kind) for match in pattern.finditer(code))
+    return refs
+
+
+def parse_imports(path: str, source: str) -> List[ImportRef]:
+    if path.endswith(PYTHON_EXTENSIONS):
+        return parse_python_imports(source)
+    return parse_js_imports(source)
+
+
+def resolve_import(spec: str, kind: str, importer: str, exists: Callable[[str], bool]) -> Tuple[Optional[str], Optional[str]]:
+    """
+    指定子をプロジェクト内のファイル（ルートからの相対パス、"/" 区切り）に解決する関数
+
+    Returns:
+        (プロジェクト内のファイル, 外部パッケージ名) のいずれか一方。どちらにも当てはまらない場合は (None, None)
+    """
+    if importer.endswith(PYTHON_EXTENSIONS):
+        return _resolve_python(spec, kind, importer, exists)
+    return _resolve_js(spec, importer, exists)
+
+
+def _resolve_python(spec: str, kind: str, importer: str, exists: Callable[[str], bool]) -> Tuple[Optional[str], Optional[str]]:
+    level = len(spec) - len(spec.lstrip("."))
+    name = spec[level:]
+    importer_dir = posixpath.dirname(importer)
+    if level:
+        base = importer_dir
+        for _ in range(level - 1):
+            base = posixpath.dirname(base)
+        bases = [base]
+    else:
+        # プロジェクトのルートからのimportと、スクリプトとして実行される同じディレクトリからのimportの両方を試す
+        bases = ["", importer_dir] if importer_dir else [""]
+    for base in bases:
+        path = posixpath.join(base, *name.split(".")) if name else base
+        for candidate in (path + ".py", posixpath.join(path, "__init__.py")):
+            candidate = candidate.lstrip("/")
+            if candidate != importer and exists(candidate):
+                return candidate, None
+    top = name.split(".")[0]
+    if level or kind == "name" or not top or top in _STDLIB_MODULES:
+        return None, None
+    return None, top
+
+
+def _resolve_js(spec: str, importer: str, exists: Callable[[str], bool]) -> Tuple[Optional[str], Optional[str]]:
+    if spec.startswith("."):
+        bases = [posixpath.normpath(posixpath.join(posixpath.dirname(importer), spec))]
+    elif spec.startswith("@/") or spec.startswith("~/"):
+        # Next.jsなどで使われるプロジェクトルート（またはsrc）へのエイリアス
+        bases = [spec[2:], posixpath.join("src", spec[2:])]
+    elif spec.startswith("/"):
+        bases = [spec.lstrip("/")]
+    else:
+        parts = spec.split("/")
+        return None, "/".join(parts[:2]) if spec.startswith("@") else parts[0]
+    for base in bases:
+        candidates = [base] + [base + ext for ext in JS_EXTENSIONS] + [posixpath.join(base, "index" + ext) for ext in JS_EXTENSIONS]
+        for candidate in candidates:
+            if not candidate.startswith("..") and exists(candidate):
+                return candidate, None
+    return None, None
+
+
+def outline(path: str, source: str, max_lines: int = 40) -> List[str]:
+    """
+    依存関係の分析に必要な部分（import文とトップレベルの定義・export）だけを抜き出す関数
+    """
+    lines: List[str] = []
+    if path.endswith(PYTHON_EXTENSIONS):
+        source_lines = source.splitlines()
+        for node in ast.parse(source).body:
+            if isinstance(node, (ast.Import, ast.ImportFrom)):
+                lines.extend(source_lines[node.lineno - 1:node.end_lineno])
+            elif isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef)):
+                prefix = "async def" if isinstance(node, ast.AsyncFunctionDef) else "def"
+                lines.append(f"{prefix} {node.name}({', '.join(arg.arg for arg in node.args.args)})")
+            elif isinstance(node, ast.ClassDef):
+                lines.append(f"class {node.name}")
+    else:
+        code = _strip_js_comments(source)
+        for line in code.splitlines():
+            stripped = line.strip()
+            if stripped.startswith(("import ", "export ")) or "require(" in stripped or re.search(r"\bimport\s*\(", stripped):
+                lines.append(stripped)
+    if len(lines) > max_lines:
+        lines = lines[:max_lines] + [f"...（残り{len(lines) - max_lines}行を省略）"]
+    return lines
+
+
+def to_relative(root: str, path: str) -> str:
+    return os.path.relpath(path, root).replace(os.sep, "/")
@@ -0,0 +1,273 @@
+import ast
+import difflib
+import json
+import re
+from typing import Any, Dict, List, Optional, Tuple
+
+from config.settings import PATCH_FUZZY_THRESHOLD
+
+_SEARCH_MARKER = re.compile(r"^<{5,9} ?SEARCH\s*$")
+_DIVIDER_MARKER = re.compile(r"^={5,9}\s*$")
+_REPLACE_MARKER = re.compile(r"^>{5,9} ?REPLACE\s*$")
+_HUNK_HEADER = re.compile(r"^@@ -(\d+)(?:,(\d+))? \+(\d+)(?:,(\d+))? @@")
+
+# unified diff の文脈行が合わない場合に、前後から削ってよい文脈行の数（patch コマンドの fuzz に相当）
+MAX_CONTEXT_FUZZ = 2
+
+
+class PatchError(Exception):
+    """
+    モデルの出力を編集として解釈できない、または適用できないことを示す例外
+    """
+
+
+class Edit:
+    """
+    1つの編集（search の行を replace の行に置き換える）
+
+    hint は unified diff のハンクに書かれた元の開始行（0始まり）で、同じ内容が複数箇所にある場合の手がかりにします。
+    文脈行のない挿入だけのハンク（search が空）では、挿入する位置そのものを表します。
+    """
+
+    def __init__(self, search: List[str], replace: List[str], hint: Optional[int] = None, context: Tuple[int, int] = (0, 0)):
+        self.search = search
+        self.replace = replace
+        self.hint = hint
+        # unified diff の場合の (先頭の文脈行数, 末尾の文脈行数)
+        self.context = context
+
+
+def parse_search_replace(text: str) -> List[Edit]:
+    """
+    <<<<<<< SEARCH / ======= / >>>>>>> REPLACE 形式のブロックを抽出する関数
+    """
+    edits: List[Edit] = []
+    search: List[str] = []
+    replace: List[str] = []
+    state = None
+    for line in text.splitlines():
+        if state is None:
+            if _SEARCH_MARKER.match(line):
+                state, search, replace = "search", [], []
+        elif state == "search":
+            if _DIVIDER_MARKER.match(line):
+                state = "replace"
+            else:
+                search.append(line)
+        elif _REPLACE_MARKER.match(line):
+            edits.append(Edit(search, replace))
+            state = None
+        else:
+            replace.append(line)
+    if state is not None:
+        raise PatchError("SEARCH/REPLACE ブロックが閉じられていません")
+    return edits
+
+
+def parse_unified_diff(text: str) -> List[Edit]:
+    """
+    unified diff のハンクを抽出する関数（ファイルのヘッダーは無視し、1ファイル分として扱う）
+    """
+    edits: List[Edit] = []
+    hunk: Optional[Dict[str, Any]] = None
+
+    def close():
+        if hunk is not None and (hunk["search"] or hunk["replace"]):
+            lines = hunk["lines"]
+            leading = next((i for i, (kind, _) in enumerate(lines) if kind != " "), len(lines))
+            trailing = next((i for i, (kind, _) in enumerate(reversed(lines)) if kind != " "), len(lines))
+            edits.append(Edit(hunk["search"], hunk["replace"], hunk["hint"], (leading, trailing)))
+
+    for line in text.splitlines():
+        header = _HUNK_HEADER.match(line)
+        if header:
+            close()
+            # 元の行数が0のハンク（diff -U0 の挿入）の開始行は「この行の後に挿入する」という意味になる
+            start = int(header.group(1))
+            hint = start if header.group(2) == "0" else max(start - 1, 0)
+            hunk = {"hint": hint, "search": [], "replace": [], "lines": []}
+            continue
+        if hunk is None:
+            continue
+        if line.startswith("```") or line.startswith("--- ") or line.startswith("diff "):
+            close()
+            hunk = None
+            continue
+        if line.startswith("\\"):
+            # "\ No newline at end of file"
+            continue
+        # 空行は先頭の空白が落ちた文脈行とみなす
+        kind, body = (line[0], line[1:]) if line else (" ", "")
+        if kind not in " -+":
+            kind, body = " ", line
+        hunk["lines"].append((kind, body))
+        if kind != "+":
+            hunk["search"].append(body)
+        if kind != "-":
+            hunk["replace"].append(body)
+    close()
+    return edits
+
+
+def parse_edits(text: str) -> Tuple[str, List[Edit]]:
+    """
+    モデルの出力から編集の形式を判別して抽出する関数
+
+    Returns:
+        (形式（"search_replace" / "unified_diff"）, 編集のリスト)
+    """
+    if any(_SEARCH_MARKER.match(line) for line in text.splitlines()):
+        return "search_replace", parse_search_replace(text)
+    edits = parse_unified_diff(text)
+    if edits:
+        return "unified_diff", edits
+    raise PatchError("出力に SEARCH/REPLACE ブロックも unified diff のハンクも見つかりませんでした")
+
+
+def _indent(line: str) -> str:
+    return line[:len(line) - len(line.lstrip())]
+
+
+def _find(lines: List[str], search: List[str], hint: Optional[int], threshold: float) -> Tuple[int, str, float]:
+    """
+    search に一致する位置を、完全一致 → 空白の違いを無視 → 類似度の順に探す
+
+    Returns:
+        (開始行, 一致の方法, 類似度)
+    """
+    size = len(search)
+    windows = range(len(lines) - size + 1)
+
+    def choose(candidates: List[int], method: str) -> Optional[Tuple[int, str, float]]:
+        if not candidates:
+            return None
+        if len(candidates) > 1:
+            if hint is None:
+                raise PatchError(f"変更箇所が{len(candidates)}か所に一致したため特定できません（前後の行を含めてください）")
+            candidates = sorted(candidates, key=lambda start: abs(start - hint))
+        return candidates[0], method, 1.0
+
+    found = choose([i for i in windows if lines[i:i + size] == search], "exact")
+    if found:
+        return found
+    stripped = [line.strip() for line in search]
+    found = choose([i for i in windows if [line.strip() for line in lines[i:i + size]] == stripped], "whitespace")
+    if found:
+        return found
+
+    target = "\n".join(stripped)
+    best: Optional[Tuple[float, int, int]] = None
+    for i in windows:
+        matcher = difflib.SequenceMatcher(None, "\n".join(line.strip() for line in lines[i:i + size]), target, autojunk=False)
+        if matcher.real_quick_ratio() < threshold or matcher.quick_ratio() < threshold:
+            continue
+        ratio = matcher.ratio()
+        # 類似度が同じなら hint に近い方を選ぶ
+        distance = abs(i - hint) if hint is not None else 0
+        if ratio >= threshold and (best is None or (ratio, -distance) > (best[0], -best[2])):
+            best = (ratio, i, distance)
+    if best is None:
+        raise PatchError("変更箇所が見つかりませんでした")
+    return best[1], "fuzzy", round(best[0], 4)
+
+
+def _reindent(replace: List[str], search: List[str], matched: List[str]) -> List[str]:
+    # 空白を無視して一致した場合、置き換え後の行のインデントを実際のファイルに合わせる
+    # SEARCH と実際の行の対応から「SEARCH でのインデント → 実際のインデント」の対応表を作る
+    mapping: Dict[str, str] = {}
+    for expected, actual in zip(search, matched):
+        if expected.strip() and actual.strip():
+            mapping.setdefault(_indent(expected), _indent(actual))
+    if all(expected == actual for expected, actual in mapping.items()):
+        return replace
+    reindented = []
+    for line in replace:
+        indent = _indent(line)
+        # 対応表にないインデントは、前方一致する最も長いインデントを置き換える
+        prefix = max((key for key in mapping if indent.startswith(key)), key=len, default=None)
+        if prefix is None or not line.strip():
+            reindented.append(line)
+        else:
+            reindented.append(mapping[prefix] + line[len(prefix):])
+    return reindented
+
+
+def apply_edits(content: str, edits: List[Edit], threshold: Optional[float] = None) -> Tuple[str, List[Dict[str, Any]]]:
+    """
+    編集を順番に適用する関数（適用できなかった編集は飛ばし、レポートに理由を記録する）
+
+    Returns:
+        (適用後の内容, 編集ごとのレポート)
+    """
+    threshold = PATCH_FUZZY_THRESHOLD if threshold is None else threshold
+    newline = "\r\n" if "\r\n" in content else "\n"
+    trailing_newline = content.endswith(("\n", "\r"))
+    lines = content.splitlines()
+    report: List[Dict[str, Any]] = []
+    # 先に適用したハンクによる行のずれ
+    offset = 0
+    for index, edit in enumerate(edits):
+        hint = edit.hint + offset if edit.hint is not None else None
+        try:
+            start, method, similarity, search, replace = _locate(lines, edit, hint, threshold)
+        except PatchError as e:
+            report.append({"index": index, "status": "failed", "error": str(e)})
+            continue
+        if method != "exact":
+            replace = _reindent(replace, search, lines[start:start + len(search)])
+        lines[start:start + len(search)] = replace
+        offset += len(replace) - len(search)
+        report.append({"index": index, "status": "applied", "method": method, "line": start + 1, "similarity": similarity,
+                       "removed": len(search), "added": len(replace)})
+    result = newline.join(lines)
+    if lines and (trailing_newline or not content):
+        result += newline
+    return result, report
+
+
+def _locate(lines: List[str], edit: Edit, hint: Optional[int], threshold: float):
+    if not edit.search:
+        if hint is not None:
+            # unified diff の文脈行のない挿入は、ハンクに書かれた位置に挿入する
+            return min(hint, len(lines)), "insert", 1.0, [], edit.replace
+        # 空の SEARCH はファイル末尾への追記（空のファイルなら全体）として扱う
+        return len(lines), "append", 1.0, [], edit.replace
+    leading, trailing = edit.context
+    error: Optional[PatchError] = None
+    # unified diff は文脈行が合わない場合、前後の文脈行を減らして再試行する
+    for fuzz in range(min(MAX_CONTEXT_FUZZ, max(leading, trailing)) + 1):
+        cut_head, cut_tail = min(fuzz, leading), min(fuzz, trailing)
+        search = edit.search[cut_head:len(edit.search) - cut_tail]
+        replace = edit.replace[cut_head:len(edit.replace) - cut_tail]
+        if not search:
+            break
+        try:
+            start, method, similarity = _find(lines, search, hint + cut_head if hint is not None else None, threshold)
+        except PatchError as e:
+            error = error or e
+            continue
+        return start, method if not fuzz else f"{method}+fuzz{fuzz}", similarity, search, replace
+    raise error or PatchError("変更箇所が見つかりませんでした")
+
+
+def verify_content(path: str, content: str) -> Optional[str]:
+    """
+    適用後の内容が構文として正しいかを確認する関数（確認できない形式は None を返す）
+
+    Returns:
+        問題があればその説明、なければ None
+    """
+    try:
+        if path.endswith(".py"):
+            ast.parse(content)
+        elif path.endswith(".json"):
+            json.loads(content)
+    except SyntaxError as e:
+        return f"構文エラー（{e.lineno}行目）: {e.msg}"
+    except ValueError as e:
+        return f"JSONの解析に失敗しました: {str(e)}"
+    return None
+
+
+def unified_diff(before: str, after: str, path: str) -> str:
+    return "".join(difflib.unified_diff(before.splitlines(True), after.splitlines(True), f"a/{path}", f"b/{path}"))
@@ -0,0 +1,27 @@
+import json
+from typing import Any, Optional
+
+def format_sse(data: Any, event: Optional[str] = None) -> str:
+    """
+    Server-Sent Events形式の1メッセージを組み立てる関数
+
+    Args:
+        data: JSONとして送信するデータ
+        event (str): イベント名（省略時はデフォルトのmessageイベント）
+
+    Returns:
+        str: SSEのメッセージ文字列
+    """
+    message = f"event: {event}\n" if event else ""
+    return message + f"data: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+# プロキシでのバッファリングを抑止し、チャンクを即座にクライアントへ届けるためのヘッダー
+SSE_HEADERS = {"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+
+NDJSON_MEDIA_TYPE = "application/x-ndjson"
+
+def format_ndjson(data: Any) -> str:
+    """
+    NDJSON（1行1レコードのJSON）の1行を組み立てる関数
+    """
+    return json.dumps(data, ensure_ascii=False) + "\n"
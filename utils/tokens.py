@@ -0,0 +1,14 @@
+def estimate_tokens(text: str) -> int:
+    """
+    テキストのトークン数を概算する関数
+
+    ASCII文字はおよそ4文字で1トークン、日本語などの非ASCII文字はおよそ1文字で1トークンとして数えます。
+
+    Args:
+        text (str): 対象のテキスト
+
+    Returns:
+        int: 概算トークン数
+    """
+    ascii_chars = sum(1 for char in text if ord(char) < 128)
+    return max(1, ascii_chars // 4 + (len(text) - ascii_chars))
@@ -1,21 +1,175 @@
 import asyncio
-from services.git_service import git_add, git_commit
+import contextvars
+import logging
+import os
+import weakref
+from contextlib import contextmanager
+from typing import Dict, List, Optional, Tuple
+
+from config.settings import VERSION_CONTROL_COMMIT_WINDOW
+from services.git_backend import NothingToCommitError, get_git_backend
+
+logger = logging.getLogger(__name__)
+
+# (ファイルパス, 操作の説明) の組
+Change = Tuple[str, str]
+
+current_commit_batch: contextvars.ContextVar = contextvars.ContextVar("commit_batch", default=None)
+
+
+def find_repository(file_path: str) -> str:
+    """
+    ファイルを含むGitリポジトリのルートを探す関数（見つからない場合はカレントディレクトリ）
+    """
+    directory = os.path.dirname(os.path.abspath(file_path))
+    while True:
+        if os.path.exists(os.path.join(directory, ".git")):
+            return directory
+        parent = os.path.dirname(directory)
+        if parent == directory:
+            return os.path.abspath(".")
+        directory = parent
+
+
+def commit_message(changes: List[Change], repo_path: str) -> str:
+    lines = [f"AI {operation} on {os.path.relpath(path, repo_path)}" for path, operation in changes]
+    if len(lines) == 1:
+        return lines[0]
+    return f"AI {len(lines)}件の変更\n\n" + "\n".join(f"- {line}" for line in lines)
+
+
+class CommitQueue:
+    """
+    1つのリポジトリへのコミットを直列化し、まとめて行うキュー
+
+    ステージとコミットはリポジトリごとのロックの中で行うため、.git/index.lock を奪い合いません。
+    submit された変更は window 秒待ってから、その間に届いた変更と合わせて1回のコミットにします。
+    """
+
+    def __init__(self, repo_path: str, window: Optional[float] = None):
+        self.repo_path = repo_path
+        self.window = VERSION_CONTROL_COMMIT_WINDOW if window is None else window
+        self._lock = asyncio.Lock()
+        self._pending: List[Tuple[str, str, asyncio.Future]] = []
+        self._flush_task: Optional[asyncio.Task] = None
+        self.stats = {"commits": 0, "changes": 0, "failures": 0}
+
+    def submit(self, file_path: str, operation: str) -> asyncio.Future:
+        """
+        変更をキューに入れ、それを含むコミットが終わると完了する Future を返す
+        """
+        future = asyncio.get_running_loop().create_future()
+        self._pending.append((file_path, operation, future))
+        if self._flush_task is None:
+            self._flush_task = asyncio.ensure_future(self._flush_later())
+        return future
+
+    async def _flush_later(self):
+        await asyncio.sleep(self.window)
+        # コミット中に届いた変更は次の時間枠で扱う
+        self._flush_task = None
+        await self.flush()
+
+    async def flush(self):
+        pending, self._pending = self._pending, []
+        if not pending:
+            return
+        try:
+            await self.commit([(path, operation) for path, operation, _ in pending])
+            error = None
+        except Exception as e:
+            error = e
+        for _, _, future in pending:
+            if future.done():
+                continue
+            if error is None:
+                future.set_result(None)
+            else:
+                future.set_exception(error)
+
+    async def commit(self, changes: List[Change]):
+        """
+        変更をまとめて1回のコミットにする（ステージとコミットは GIT_BACKEND のバックエンドで行う）
+        """
+        paths = list(dict.fromkeys(path for path, _ in changes))
+        async with self._lock:
+            try:
+                await get_git_backend().commit_paths(self.repo_path, paths, commit_message(changes, self.repo_path))
+            except NothingToCommitError:
+                # 分析のみの操作などで変更がない場合はコミットしない
+                logger.info(f"コミットする変更がありませんでした: {self.repo_path}")
+                return
+            except Exception:
+                self.stats["failures"] += 1
+                raise
+        self.stats["commits"] += 1
+        self.stats["changes"] += len(changes)
+        logger.info(f"{len(changes)}件の変更をコミットしました: {self.repo_path}")
+
+
+# asyncio.Lock はイベントループに結び付くため、キューはループごと・リポジトリごとに作る
+_queues: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, Dict[str, CommitQueue]]" = weakref.WeakKeyDictionary()
+
+
+def get_commit_queue(repo_path: str) -> CommitQueue:
+    queues = _queues.setdefault(asyncio.get_running_loop(), {})
+    repo_path = os.path.abspath(repo_path)
+    if repo_path not in queues:
+        queues[repo_path] = CommitQueue(repo_path)
+    return queues[repo_path]
+
+
+class CommitBatch:
+    """
+    1つのジョブ・複数ファイル処理の中で記録された変更を、終了時にまとめてコミットするためのバッチ
+    """
+
+    def __init__(self):
+        self.changes: List[Change] = []
+
+    def add(self, file_path: str, operation: str):
+        self.changes.append((file_path, operation))
+
+    async def flush(self):
+        changes, self.changes = self.changes, []
+        by_repository: Dict[str, List[Change]] = {}
+        for change in changes:
+            by_repository.setdefault(find_repository(change[0]), []).append(change)
+        for repo_path, repo_changes in by_repository.items():
+            try:
+                await get_commit_queue(repo_path).commit(repo_changes)
+            except Exception as e:
+                logger.error(f"変更のコミットに失敗しました: {repo_path}: {str(e)}")
+
+
+@contextmanager
+def commit_batch(batch: CommitBatch):
+    """
+    ブロック内の version_control の呼び出しを batch に集めるコンテキストマネージャ（コミットは batch.flush() で行う）
+    """
+    token = current_commit_batch.set(batch)
+    try:
+        yield batch
+    finally:
+        current_commit_batch.reset(token)
+
 
 async def version_control(file_path: str, operation: str):
     """
     ファイルの変更をバージョン管理システム（Git）に記録します。
-    
+
+    バッチの中で呼ばれた場合はバッチの終了時に、それ以外は同じリポジトリへの近い時刻の変更とまとめてコミットします。
+
     :param file_path: バージョン管理対象のファイルパス
     :param operation: 実行された操作の説明
     """
+    batch = current_commit_batch.get()
+    if batch is not None:
+        batch.add(file_path, operation)
+        return
     try:
-        repo_path = '.'  # リポジトリのルートパスを指定。必要に応じて変更してください。
-        await git_add(repo_path, file_path)
-        commit_message = f"AI {operation} on {file_path}"
-        await git_commit(repo_path, commit_message)
-        print(f"Version control: {commit_message}")
+        await get_commit_queue(find_repository(file_path)).submit(file_path, operation)
+        logger.info(f"Version control: AI {operation} on {file_path}")
     except Exception as e:
-        print(f"Error in version control: {str(e)}")
+        logger.error(f"Error in version control: {str(e)}")
         # エラーが発生しても処理を続行するため、例外は再発生させません
-
-# 必要に応じて、他のバージョン管理関連の関数をここに追加できます
\ No newline at end of file